@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Генератор нагрузки, имитирующий терминалы Hikvision, для endpoint /api/v1/camera-events/.
+
+Отправляет события в тех форматах, которые разбирает CameraEventViewSet.create:
+- multipart/form-data с event_log (JSON) и изображением Picture;
+- application/json с вложенным AccessControllerEvent;
+- heartbeat (eventType=heartBeat);
+- служебные события без данных о сотруднике (открытие двери и т.п.).
+
+Нагрузка открытая (open-loop): запросы планируются с заданной частотой
+независимо от времени ответа, поэтому задержка считается от запланированного
+момента отправки и не скрывает очередь на сервере. Поддерживаются всплески
+на пересменке (--burst-every / --burst-duration / --burst-factor) и повторная
+отправка уже отправленных событий (--duplicate-ratio), как делают камеры при
+таймаутах.
+
+Использование:
+  python benchmarks/camera_load.py [--url URL] [--rate R] [--duration S] [--concurrency C]
+                                   [--employees N] [--entry-ratio 0.5]
+                                   [--mix multipart=0.6,json=0.2,heartbeat=0.15,junk=0.05]
+                                   [--output результаты.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+# Настройка кодировки для Windows консоли
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        # Для старых версий Python
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+DEFAULT_URL = 'http://localhost:8000/api/v1/camera-events/'
+DEFAULT_MIX = 'multipart=0.6,json=0.2,heartbeat=0.15,junk=0.05'
+EVENT_KINDS = ('multipart', 'json', 'heartbeat', 'junk')
+
+# IP адреса терминалов: по ним CameraEventViewSet определяет вход/выход
+ENTRY_CAMERA = {'ip': '192.168.1.124', 'device': 'Вход 1', 'mac': 'bc:5e:33:00:01:24'}
+EXIT_CAMERA = {'ip': '192.168.1.143', 'device': 'Выход 1', 'mac': 'bc:5e:33:00:01:43'}
+
+# Часовой пояс, в котором терминалы передают dateTime
+CAMERA_TZ = timezone(timedelta(hours=5))
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_mix(value):
+    """Разбирает строку вида "multipart=0.6,json=0.2" в нормированные веса."""
+    weights = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in EVENT_KINDS:
+            raise argparse.ArgumentTypeError(f"Неизвестный тип события '{kind}', допустимые: {', '.join(EVENT_KINDS)}")
+        try:
+            weights[kind] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Некорректный вес '{weight}' для '{kind}'")
+    total = sum(weights.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("Сумма весов должна быть больше нуля")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+class EventFactory:
+    """Создает тела запросов в форматах терминалов Hikvision."""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.employees = args.employees
+        self.id_offset = args.id_offset
+        self.entry_ratio = args.entry_ratio
+        self.duplicate_ratio = args.duplicate_ratio
+        self.kinds = list(args.mix)
+        self.weights = [args.mix[kind] for kind in self.kinds]
+        # Одно изображение на все запросы: содержимое не важно, важен размер
+        self.picture = b'\xff\xd8\xff\xe0' + os.urandom(max(0, args.picture_size - 6)) + b'\xff\xd9'
+        self.serial_numbers = {ENTRY_CAMERA['ip']: 0, EXIT_CAMERA['ip']: 0}
+        self.recent = []
+        self.lock = threading.Lock()
+
+    def _next_serial(self, camera):
+        self.serial_numbers[camera['ip']] += 1
+        return self.serial_numbers[camera['ip']]
+
+    def _camera(self):
+        return ENTRY_CAMERA if self.rng.random() < self.entry_ratio else EXIT_CAMERA
+
+    def _outer(self, camera, event_type, description):
+        return {
+            'ipAddress': camera['ip'],
+            'portNo': 80,
+            'protocol': 'HTTP',
+            'macAddress': camera['mac'],
+            'channelID': 1,
+            'dateTime': datetime.now(CAMERA_TZ).isoformat(timespec='seconds'),
+            'activePostCount': 1,
+            'eventType': event_type,
+            'eventState': 'active',
+            'eventDescription': description,
+        }
+
+    def _person_event(self, camera):
+        index = self.rng.randrange(self.employees)
+        event = self._outer(camera, 'AccessControllerEvent', 'Access Controller Event')
+        event['AccessControllerEvent'] = {
+            'deviceName': camera['device'],
+            'majorEventType': 5,
+            'subEventType': 75,
+            'name': f"Нагрузочный сотрудник {index + 1:05d}",
+            'cardReaderNo': 1,
+            'employeeNoString': str(self.id_offset + index),
+            'serialNo': self._next_serial(camera),
+            'userType': 'normal',
+            'currentVerifyMode': 'cardOrFaceOrFp',
+            'mask': 'no',
+            'picturesNumber': 1,
+        }
+        return event
+
+    def _multipart(self, event):
+        boundary = f'----HikvisionBoundary{uuid.uuid4().hex}'
+        event_log = json.dumps(event, ensure_ascii=False).encode('utf-8')
+        body = b''.join([
+            f'--{boundary}\r\n'.encode(),
+            b'Content-Disposition: form-data; name="event_log"\r\n',
+            b'Content-Type: application/json\r\n\r\n',
+            event_log,
+            f'\r\n--{boundary}\r\n'.encode(),
+            b'Content-Disposition: form-data; name="Picture"; filename="Picture.jpg"\r\n',
+            b'Content-Type: image/jpeg\r\n\r\n',
+            self.picture,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        return f'multipart/form-data; boundary={boundary}', body
+
+    def make(self):
+        """
+        Возвращает (kind, content_type, body) очередного запроса.
+
+        kind дополняется суффиксом "-retry" для повторно отправленных событий.
+        """
+        with self.lock:
+            if self.recent and self.rng.random() < self.duplicate_ratio:
+                kind, content_type, body = self.rng.choice(self.recent)
+                return f'{kind}-retry', content_type, body
+
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            camera = self._camera()
+            if kind == 'multipart':
+                content_type, body = self._multipart(self._person_event(camera))
+            elif kind == 'json':
+                content_type = 'application/json'
+                body = json.dumps(self._person_event(camera), ensure_ascii=False).encode('utf-8')
+            elif kind == 'heartbeat':
+                content_type = 'application/json'
+                body = json.dumps(self._outer(camera, 'heartBeat', 'heartBeat')).encode('utf-8')
+            else:
+                # Событие двери без данных о сотруднике (например, дверь открыта)
+                event = self._outer(camera, 'AccessControllerEvent', 'Access Controller Event')
+                event['AccessControllerEvent'] = {
+                    'deviceName': camera['device'],
+                    'majorEventType': 2,
+                    'subEventType': 1024,
+                    'serialNo': self._next_serial(camera),
+                    'doorNo': 1,
+                }
+                content_type, body = self._multipart(event)
+
+            if kind in ('multipart', 'json'):
+                self.recent.append((kind, content_type, body))
+                if len(self.recent) > 1000:
+                    del self.recent[:500]
+            return kind, content_type, body
+
+
+class Stats:
+    """Потокобезопасный сбор задержек и ошибок по типам событий."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.service_times = {}
+        self.statuses = {}
+        self.errors = {}
+        self.error_samples = []
+
+    def record(self, kind, latency, service_time, status, error=None):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(latency)
+            self.service_times.setdefault(kind, []).append(service_time)
+            key = str(status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if error:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append(f'{kind}: {error}')
+
+
+def percentile(sorted_values, p):
+    """Перцентиль по методу ближайшего ранга (значения отсортированы)."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    summary = {'count': len(values), 'mean_ms': sum(values) / len(values) * 1000}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = percentile(values, p) * 1000
+    summary['max_ms'] = values[-1] * 1000
+    return summary
+
+
+def worker(target, jobs, stats, timeout):
+    """Отправляет запросы из очереди по одному keep-alive соединению."""
+    connection = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        scheduled_at, kind, content_type, body = job
+        started = time.perf_counter()
+        status = 'error'
+        error = None
+        try:
+            if connection is None:
+                connection_class = (
+                    http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+                )
+                connection = connection_class(target.hostname, target.port, timeout=timeout)
+            connection.request('POST', target.path or '/', body=body, headers={
+                'Content-Type': content_type,
+                'Content-Length': str(len(body)),
+                'Connection': 'keep-alive',
+            })
+            response = connection.getresponse()
+            payload = response.read()
+            status = response.status
+            if status != 200 or payload.strip() != b'OK':
+                error = f'HTTP {status}: {payload[:200]!r}'
+        except (OSError, http.client.HTTPException) as e:
+            error = f'{type(e).__name__}: {e}'
+            if connection is not None:
+                connection.close()
+            connection = None
+        finished = time.perf_counter()
+        stats.record(kind, finished - scheduled_at, finished - started, status, error)
+    if connection is not None:
+        connection.close()
+
+
+def current_rate(args, elapsed):
+    """Частота запросов с учетом всплесков пересменки."""
+    if args.burst_every and (elapsed % args.burst_every) < args.burst_duration:
+        return args.rate * args.burst_factor
+    return args.rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор нагрузки терминалов Hikvision')
+    parser.add_argument('--url', default=DEFAULT_URL, help=f'Адрес endpoint (по умолчанию {DEFAULT_URL})')
+    parser.add_argument('--rate', type=float, default=20.0, help='Запросов в секунду (по умолчанию 20)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Длительность теста в секундах (по умолчанию 30)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Количество параллельных соединений (по умолчанию 8)')
+    parser.add_argument('--employees', type=int, default=500, help='Количество сотрудников (по умолчанию 500)')
+    parser.add_argument('--id-offset', type=int, default=800000, help='Первый employeeNoString (по умолчанию 800000)')
+    parser.add_argument('--entry-ratio', type=float, default=0.5, help='Доля событий с камеры входа (по умолчанию 0.5)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Доли типов запросов (по умолчанию {DEFAULT_MIX})')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0,
+                        help='Доля повторных отправок уже отправленных событий (по умолчанию 0)')
+    parser.add_argument('--picture-size', type=int, default=60 * 1024, help='Размер изображения в байтах (по умолчанию 60 КБ)')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='Период всплесков в секундах (0 - без всплесков)')
+    parser.add_argument('--burst-duration', type=float, default=5.0, help='Длительность всплеска в секундах')
+    parser.add_argument('--burst-factor', type=float, default=5.0, help='Во сколько раз растет частота во время всплеска')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Таймаут запроса в секундах')
+    parser.add_argument('--seed', type=int, default=0, help='Seed генератора событий')
+    parser.add_argument('--output', help='JSON файл для сохранения результатов')
+    args = parser.parse_args()
+
+    target = urlsplit(args.url)
+    factory = EventFactory(args)
+    stats = Stats()
+    jobs = queue.Queue(maxsize=args.concurrency * 100)
+
+    threads = [
+        threading.Thread(target=worker, args=(target, jobs, stats, args.timeout), daemon=True)
+        for _ in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    print(f"Нагрузка на {args.url}: {args.rate} запр/с, {args.duration}s, {args.concurrency} соединений")
+    started = time.perf_counter()
+    next_send = started
+    sent = 0
+    dropped = 0
+    while True:
+        now = time.perf_counter()
+        elapsed = now - started
+        if elapsed >= args.duration:
+            break
+        if next_send > now:
+            time.sleep(min(next_send - now, 0.05))
+            continue
+        kind, content_type, body = factory.make()
+        try:
+            jobs.put_nowait((next_send, kind, content_type, body))
+            sent += 1
+        except queue.Full:
+            # Сервер не успевает: клиент не может поддерживать заданную частоту
+            dropped += 1
+        next_send += 1.0 / current_rate(args, next_send - started)
+
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    total_time = time.perf_counter() - started
+
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    all_service = [value for values in stats.service_times.values() for value in values]
+    total_errors = sum(stats.errors.values())
+    completed = len(all_latencies)
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {
+            key: value for key, value in vars(args).items()
+        },
+        'sent': sent,
+        'dropped_client_side': dropped,
+        'completed': completed,
+        'throughput_rps': completed / total_time if total_time else 0,
+        'errors': total_errors,
+        'error_rate': total_errors / completed if completed else 0,
+        'statuses': stats.statuses,
+        'latency': summarize(all_latencies),
+        'service_time': summarize(all_service),
+        'by_kind': {
+            kind: {
+                'latency': summarize(values),
+                'errors': stats.errors.get(kind, 0),
+            }
+            for kind, values in sorted(stats.latencies.items())
+        },
+        'error_samples': stats.error_samples,
+    }
+
+    print(f"\n{'='*60}")
+    print(f"Выполнено: {completed} запросов за {total_time:.1f}s ({results['throughput_rps']:.1f} запр/с)")
+    if dropped:
+        print(f"[WARNING] Не отправлено из-за переполнения очереди: {dropped}")
+    print(f"Ошибки: {total_errors} ({results['error_rate']:.2%}), статусы: {stats.statuses}")
+    print(f"{'Тип':<18}{'кол-во':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (мс)")
+    rows = [('всего', results['latency'])] + [(kind, data['latency']) for kind, data in results['by_kind'].items()]
+    for kind, summary in rows:
+        if not summary['count']:
+            continue
+        print(
+            f"{kind:<18}{summary['count']:>8}{summary['p50_ms']:>9.1f}{summary['p90_ms']:>9.1f}"
+            f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['max_ms']:>9.1f}"
+        )
+    for sample in stats.error_samples[:5]:
+        print(f"  [ERROR] {sample}")
+    print(f"{'='*60}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+        print(f"[OK] Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
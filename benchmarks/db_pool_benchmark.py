@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Сравнение режимов соединений с БД под нагрузкой камер.
+
+Для каждого режима DB_POOL_MODE (none, persistent, pool) запускает
+manage.py runserver, подает нагрузку benchmarks/camera_load.py и выводит
+задержки приема событий и разницу с режимом none (новое соединение на
+каждый запрос).
+
+По умолчанию runserver запускается с --nothreading: встроенный сервер
+создает поток на каждый запрос, и постоянные соединения при потоках не
+переиспользуются. --threading сравнивает режимы на потоковом сервере
+(там выигрыш дает только pool).
+
+Использование:
+  python benchmarks/db_pool_benchmark.py
+  python benchmarks/db_pool_benchmark.py --modes none,pool --threading --load-args "--rate 40 --duration 30"
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Настройка кодировки для Windows консоли
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        # Для старых версий Python
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANAGE_PY = os.path.join(PROJECT_ROOT, 'manage.py')
+CAMERA_LOAD = os.path.join(PROJECT_ROOT, 'benchmarks', 'camera_load.py')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+DEFAULT_LOAD_ARGS = '--rate 20 --duration 20 --concurrency 4'
+REPORTED_KINDS = ('json', 'multipart')
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def effective_mode(env):
+    """Режим, который фактически применят настройки (pool без psycopg 3 -> persistent)."""
+    output = subprocess.run(
+        [sys.executable, MANAGE_PY, 'shell', '-c', 'from django.conf import settings; print(settings.DB_POOL_MODE)'],
+        env=env, cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    lines = output.stdout.strip().splitlines()
+    return lines[-1] if lines else None
+
+
+def run_mode(mode, args):
+    env = dict(os.environ, DB_POOL_MODE=mode, DB_ROLE='ingest', PYTHONUNBUFFERED='1')
+    applied = effective_mode(env)
+    if applied != mode:
+        print(f"[WARNING] Режим {mode} недоступен (применяется {applied}), пропущен")
+        return None
+
+    command = [sys.executable, MANAGE_PY, 'runserver', f'127.0.0.1:{args.port}', '--noreload']
+    if not args.threading:
+        command.append('--nothreading')
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(command, env=env, cwd=PROJECT_ROOT, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_for_port(args.port):
+            log.seek(0)
+            print(log.read().decode('utf-8', 'replace')[-2000:])
+            raise RuntimeError(f"runserver ({mode}) не запустился")
+        output_path = os.path.join(tempfile.gettempdir(), f'db_pool_{mode}_{os.getpid()}.json')
+        load_command = [
+            sys.executable, CAMERA_LOAD,
+            '--url', f'http://127.0.0.1:{args.port}/api/v1/camera-events/',
+            '--seed', str(args.seed), '--output', output_path,
+        ] + shlex.split(args.load_args)
+        print(f"\n--- DB_POOL_MODE={mode} ---")
+        subprocess.run(load_command, cwd=PROJECT_ROOT, check=True)
+        with open(output_path, encoding='utf-8') as f:
+            result = json.load(f)
+        os.remove(output_path)
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение режимов соединений с БД под нагрузкой камер')
+    parser.add_argument('--modes', default='none,persistent,pool', help='Режимы через запятую (по умолчанию все)')
+    parser.add_argument('--port', type=int, default=8770, help='Порт runserver (по умолчанию 8770)')
+    parser.add_argument('--threading', action='store_true', help='Запускать runserver с потоками')
+    parser.add_argument('--load-args', default=DEFAULT_LOAD_ARGS,
+                        help=f'Аргументы camera_load.py (по умолчанию "{DEFAULT_LOAD_ARGS}")')
+    parser.add_argument('--seed', type=int, default=39, help='Seed генератора событий')
+    parser.add_argument('--output', help='JSON файл результатов (по умолчанию benchmarks/results/db_pool_*.json)')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in [value.strip() for value in args.modes.split(',') if value.strip()]:
+        result = run_mode(mode, args)
+        if result is not None:
+            results[mode] = result
+
+    if not results:
+        print("[ERROR] Ни один режим не выполнен")
+        sys.exit(1)
+
+    baseline = results.get('none')
+    print(f"\n{'='*72}")
+    print(f"{'Режим':<12}{'тип':<12}{'кол-во':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ошибки':>8}{'Δp50':>9}  (мс)")
+    for mode, result in results.items():
+        for kind in REPORTED_KINDS:
+            data = result['by_kind'].get(kind)
+            if not data or not data['latency']['count']:
+                continue
+            latency = data['latency']
+            delta = ''
+            if baseline and mode != 'none' and kind in baseline['by_kind']:
+                delta = f"{latency['p50_ms'] - baseline['by_kind'][kind]['latency']['p50_ms']:+.1f}"
+            print(
+                f"{mode:<12}{kind:<12}{latency['count']:>8}{latency['p50_ms']:>9.1f}{latency['p95_ms']:>9.1f}"
+                f"{latency['p99_ms']:>9.1f}{data['errors']:>8}{delta:>9}"
+            )
+    print(f"{'='*72}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"db_pool_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'threading': args.threading,
+            'load_args': args.load_args,
+            'results': results,
+        }, f, ensure_ascii=False, indent=2, default=str)
+    print(f"[OK] Результаты сохранены: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк разбора событий Hikvision.
+
+Сравнивает прежний разбор из CameraEventViewSet.create (цепочки .get() по
+синонимам и перебор форматов strptime) с camera_events.hikvision_parser на
+типичных событиях терминалов. Работа с БД не выполняется.
+
+Использование:
+  python benchmarks/parser_benchmark.py [--number N] [--repeat R]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+# Настройка кодировки для Windows консоли
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        # Для старых версий Python
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import django
+
+# Настройка Django окружения
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hikvision_project.settings')
+django.setup()
+
+from django.utils import timezone
+
+from camera_events.hikvision_parser import parse_event_payload
+
+SAMPLE_EVENTS = {
+    'face_entry': {
+        'ipAddress': '192.168.1.124',
+        'portNo': 80,
+        'protocol': 'HTTP',
+        'macAddress': 'bc:5e:33:00:01:24',
+        'channelID': 1,
+        'dateTime': '2025-11-24T08:54:25+05:00',
+        'activePostCount': 1,
+        'eventType': 'AccessControllerEvent',
+        'eventState': 'active',
+        'eventDescription': 'Access Controller Event',
+        'AccessControllerEvent': {
+            'deviceName': 'Вход 1',
+            'majorEventType': 5,
+            'subEventType': 75,
+            'name': 'Иванов Иван',
+            'cardReaderNo': 1,
+            'employeeNoString': '1042',
+            'serialNo': 51234,
+            'userType': 'normal',
+            'currentVerifyMode': 'cardOrFaceOrFp',
+            'mask': 'no',
+            'picturesNumber': 1,
+        },
+    },
+    'nested_naive_time': {
+        'AccessControllerEvent': {
+            'ipAddress': '192.168.1.143',
+            'dateTime': '2025-11-24 18:02:11',
+            'AccessControllerEvent': {
+                'doorName': 'Выход 1',
+                'majorEventType': 5,
+                'subEventType': 75,
+                'employeeName': 'Петров Петр',
+                'employeeNo': '0077',
+                'cardNo': '12345678',
+            },
+        },
+    },
+    'door_event': {
+        'ipAddress': '192.168.1.124',
+        'dateTime': '2025-11-24T08:54:25+05:00',
+        'eventType': 'AccessControllerEvent',
+        'AccessControllerEvent': {
+            'deviceName': 'Вход 1',
+            'majorEventType': 2,
+            'subEventType': 1024,
+            'doorNo': 1,
+        },
+    },
+}
+
+
+def legacy_parse_event_time(event_time_str):
+    """Прежний разбор времени: перебор форматов strptime."""
+    for fmt in ['%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S.%f']:
+        try:
+            parsed = datetime.strptime(event_time_str, fmt)
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            return parsed
+        except ValueError:
+            continue
+    return timezone.now()
+
+
+def legacy_parse(event_data):
+    """Прежнее извлечение полей AccessControllerEvent (без логирования)."""
+    outer_event = event_data["AccessControllerEvent"]
+    if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
+        access_event = outer_event["AccessControllerEvent"]
+    else:
+        access_event = outer_event
+    has_employee_data = (
+        access_event.get("employeeId") or access_event.get("employeeID") or
+        access_event.get("employeeNo") or access_event.get("employeeNoString") or
+        access_event.get("name") or access_event.get("employeeName") or
+        access_event.get("employeeNameString")
+    )
+    if access_event.get("subEventType") != 75 and not has_employee_data:
+        return None
+    hikvision_id = (
+        access_event.get("employeeId") or access_event.get("employeeID") or
+        access_event.get("employeeNo") or access_event.get("employeeNoString") or
+        access_event.get("employee_id") or access_event.get("Employee ID") or
+        access_event.get("cardNo") or access_event.get("cardNumber") or
+        access_event.get("cardReaderNo") or access_event.get("doorNo") or
+        access_event.get("door") or
+        (str(access_event.get("id")) if access_event.get("id") is not None else None)
+    )
+    employee_name = (
+        access_event.get("employeeName") or access_event.get("name") or
+        access_event.get("employeeNameString") or access_event.get("employee_name") or
+        access_event.get("Name") or None
+    )
+    card_no = (
+        access_event.get("cardNo") or access_event.get("cardNumber") or access_event.get("card") or
+        access_event.get("Card No.") or access_event.get("card_no") or None
+    )
+    device_name = (
+        access_event.get("deviceName") or access_event.get("door") or access_event.get("doorName") or
+        access_event.get("doorNo") or access_event.get("Door") or access_event.get("device_name") or None
+    )
+    event_time_str = (
+        outer_event.get("dateTime") or outer_event.get("time") or outer_event.get("eventTime") or None
+    )
+    if not event_time_str:
+        event_time_str = (
+            access_event.get("time") or access_event.get("dateTime") or access_event.get("eventTime") or
+            access_event.get("Time") or access_event.get("event_time") or None
+        )
+    if not event_time_str:
+        event_time_str = event_data.get("dateTime") or event_data.get("time") or None
+    if not employee_name or employee_name.strip() == "":
+        return None
+    event_time = legacy_parse_event_time(event_time_str) if event_time_str else timezone.now()
+    return hikvision_id, employee_name, card_no, device_name, event_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк разбора событий Hikvision')
+    parser.add_argument('--number', type=int, default=20000, help='Вызовов в одном замере (по умолчанию 20000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Количество замеров (берется лучший)')
+    args = parser.parse_args()
+
+    print(f"{'Событие':<22}{'прежний, мкс':>14}{'новый, мкс':>12}{'ускорение':>11}")
+    for name, event in SAMPLE_EVENTS.items():
+        legacy = legacy_parse(event)
+        parsed = parse_event_payload(event)
+        if legacy is not None and (parsed.hikvision_id, parsed.employee_name, parsed.event_time) != (
+            legacy[0], legacy[1], legacy[4]
+        ) and parsed.event_time_raw:
+            print(f"[WARNING] {name}: результаты разбора различаются: {legacy} / {parsed}")
+
+        legacy_time = min(timeit.repeat(lambda: legacy_parse(event), number=args.number, repeat=args.repeat))
+        new_time = min(timeit.repeat(lambda: parse_event_payload(event), number=args.number, repeat=args.repeat))
+        legacy_us = legacy_time / args.number * 1e6
+        new_us = new_time / args.number * 1e6
+        print(f"{name:<22}{legacy_us:>14.2f}{new_us:>12.2f}{legacy_us / new_us:>10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Проверка числа SQL запросов API на синтетических данных разного объема.
+
+Скрипт создает изолированную тестовую БД и для каждого масштаба
+(сотрудники x месяцы) заполняет ее детерминированным набором данных
+(camera_events.synthetic), затем запрашивает каждый endpoint через
+django.test.Client и считает SQL запросы на всех соединениях.
+
+Endpoint считается регрессией, если:
+  - число запросов растет с объемом данных больше чем на --growth-tolerance
+    (N+1: запрос на каждого сотрудника или подразделение);
+  - число запросов превышает бюджет маршрута из PROFILING_QUERY_BUDGETS
+    (settings.py, те же бюджеты проверяет RequestProfilingMiddleware).
+
+При регрессиях скрипт завершается с кодом 1, поэтому его можно запускать
+перед выкладкой. Результаты сохраняются в JSON (--output), файлы разных
+коммитов можно сравнивать (--baseline). На малых объемах то же проверяют
+тесты camera_events/tests/test_query_counts.py (python manage.py test).
+
+Использование:
+  python benchmarks/query_counts.py
+  python benchmarks/query_counts.py --scales 10x1,100x1,1000x1,10x3,100x3,1000x3
+  python benchmarks/query_counts.py --only attendance-stats-list --keepdb
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+# Настройка кодировки для Windows консоли
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        # Для старых версий Python
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import django
+
+# Настройка Django окружения
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hikvision_project.settings')
+# Проверяются запросы к основной БД: реплика в тестовой БД не создается
+os.environ.pop('DB_REPLICA_HOST', None)
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+from camera_events.models import Department
+from camera_events.presence import presence_index
+from camera_events.synthetic import (
+    DEFAULT_START_DATE,
+    SYNTHETIC_ROOT_DEPARTMENT,
+    clear_synthetic_dataset,
+    generate_synthetic_dataset,
+)
+
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+DEFAULT_SCALES = '10x1,100x1,1000x1,10x3,100x3,1000x3'
+# Бюджет для маршрутов, которых нет в PROFILING_QUERY_BUDGETS
+DEFAULT_BUDGET = 30
+
+
+def build_endpoints(dataset, root_department_id):
+    """
+    Проверяемые endpoint: (имя маршрута, путь, параметры, нужен ли staff).
+    Имя маршрута совпадает с ключами PROFILING_QUERY_BUDGETS.
+    """
+    start = dataset['start_date'].isoformat()
+    end = dataset['end_date'].isoformat()
+    period = {'start_date': start, 'end_date': end}
+    middle = (dataset['start_date'] + timedelta(days=14)).isoformat()
+    return [
+        ('departments-list', '/api/v1/departments/', {}, False),
+        ('entries-exits-employees-list', '/api/v1/entries-exits/employees-list/', {}, False),
+        ('entries-exits-departments-list', '/api/v1/entries-exits/departments-list/', {}, False),
+        ('entries-exits-check-date', '/api/v1/entries-exits/check-date/', {'date': middle}, False),
+        ('attendance-stats-list', '/api/v1/attendance-stats/', period, False),
+        ('top-late-employees-list', '/api/v1/top-late-employees/', {}, False),
+        ('presence-list', '/api/v1/presence/', {}, False),
+        ('camera-events-export-excel', '/api/v1/camera-events/export-excel/', period, False),
+        ('entries-exits-export-excel', '/api/v1/entries-exits/export-excel/',
+         dict(period, department_name=SYNTHETIC_ROOT_DEPARTMENT), False),
+        ('attendance-stats-export-excel', '/api/v1/attendance-stats/export-excel/',
+         dict(period, department_id=root_department_id), False),
+        ('addemployees-export', '/addemployees/export/', {}, True),
+    ]
+
+
+def parse_scales(value):
+    scales = []
+    for item in value.split(','):
+        employees, _, months = item.strip().partition('x')
+        scales.append((int(employees), int(months or 1)))
+    return scales
+
+
+def get_git_commit():
+    """Возвращает хэш текущего коммита или None, если git недоступен."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def count_queries(client, path, params):
+    """Выполняет GET и возвращает (статус, число запросов на всех соединениях, время)."""
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        started = time.perf_counter()
+        response = client.get(path, params)
+        elapsed = time.perf_counter() - started
+    # Тело выгрузки читается, чтобы учесть запросы при потоковой отдаче
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+    return response.status_code, sum(len(context.captured_queries) for context in contexts), elapsed
+
+
+def find_regressions(results, scales, budgets, growth_tolerance):
+    """Сравнивает число запросов между масштабами и с бюджетами."""
+    regressions = []
+    smallest = f"{scales[0][0]}x{scales[0][1]}"
+    for name, by_scale in results.items():
+        counts = {scale: data['queries'] for scale, data in by_scale.items() if data['status'] == 200}
+        failed = [scale for scale, data in by_scale.items() if data['status'] != 200]
+        if failed:
+            regressions.append(f"{name}: ошибка ответа на масштабах {', '.join(failed)}")
+        if not counts:
+            continue
+        budget = budgets.get(name, DEFAULT_BUDGET)
+        worst_scale = max(counts, key=counts.get)
+        if counts[worst_scale] > budget:
+            regressions.append(f"{name}: {counts[worst_scale]} запросов на {worst_scale} (бюджет {budget})")
+        base = counts.get(smallest)
+        if base is not None and counts[worst_scale] - base > growth_tolerance:
+            regressions.append(
+                f"{name}: число запросов растет с данными ({base} на {smallest} -> "
+                f"{counts[worst_scale]} на {worst_scale})"
+            )
+    return regressions
+
+
+def print_table(results, scale_labels):
+    name_width = max(len(name) for name in results)
+    print(f"\n{'endpoint':<{name_width}} " + ' '.join(f"{label:>9}" for label in scale_labels))
+    for name, by_scale in results.items():
+        cells = []
+        for label in scale_labels:
+            data = by_scale.get(label)
+            if data is None:
+                cells.append(f"{'-':>9}")
+            elif data['status'] != 200:
+                cells.append(f"{'HTTP ' + str(data['status']):>9}")
+            else:
+                cells.append(f"{data['queries']:>9}")
+        print(f"{name:<{name_width}} " + ' '.join(cells))
+
+
+def print_baseline_comparison(results, baseline_path):
+    """Печатает изменение числа запросов относительно ранее сохраненного файла."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit')}):")
+    for name, by_scale in results['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name, {})
+        changes = [
+            f"{scale}: {base[scale]['queries']} -> {data['queries']}"
+            for scale, data in by_scale.items()
+            if scale in base and base[scale]['queries'] != data['queries']
+        ]
+        if changes:
+            print(f"  {name}: " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка числа SQL запросов API на данных разного объема')
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help=f'Масштабы сотрудники x месяцы через запятую (по умолчанию {DEFAULT_SCALES})')
+    parser.add_argument('--only', action='append', help='Проверить только указанный маршрут (можно повторять)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed генератора данных (по умолчанию 0)')
+    parser.add_argument('--growth-tolerance', type=int, default=2,
+                        help='Допустимый рост числа запросов между масштабами (по умолчанию 2)')
+    parser.add_argument('--output', help='Путь к JSON файлу результатов (по умолчанию benchmarks/results/)')
+    parser.add_argument('--baseline', help='JSON файл предыдущего запуска для сравнения')
+    parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую БД после завершения')
+    args = parser.parse_args()
+
+    scales = parse_scales(args.scales)
+    scale_labels = [f"{employees}x{months}" for employees, months in scales]
+    budgets = getattr(settings, 'PROFILING_QUERY_BUDGETS', {})
+    commit = get_git_commit()
+
+    setup_test_environment()
+    old_db_name = connection.settings_dict['NAME']
+    print(f"Создание тестовой БД (основная: {old_db_name})...")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+
+    results = {}
+    try:
+        staff, _ = get_user_model().objects.get_or_create(
+            username='query_counts', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        for (employees, months), label in zip(scales, scale_labels):
+            started = time.perf_counter()
+            dataset = generate_synthetic_dataset(
+                employees=employees, months=months, seed=args.seed, start_date=DEFAULT_START_DATE
+            )
+            print(
+                f"Масштаб {label}: записей EntryExit {dataset['entry_exits']} "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+            root_id = Department.objects.get(name=SYNTHETIC_ROOT_DEPARTMENT, parent__isnull=True).id
+            # Табло присутствия считается с пересборкой индекса на каждом масштабе
+            presence_index.invalidate()
+
+            anonymous = Client()
+            staff_client = Client()
+            staff_client.force_login(staff)
+            for name, path, params, needs_staff in build_endpoints(dataset, root_id):
+                if args.only and name not in args.only:
+                    continue
+                client = staff_client if needs_staff else anonymous
+                status, queries, elapsed = count_queries(client, path, params)
+                results.setdefault(name, {})[label] = {
+                    'status': status, 'queries': queries, 'time_s': round(elapsed, 3),
+                }
+                print(f"  {name}: {queries} запросов, {elapsed:.2f}s, HTTP {status}")
+        clear_synthetic_dataset()
+    finally:
+        if not args.keepdb:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+
+    print_table(results, scale_labels)
+    regressions = find_regressions(results, scales, budgets, args.growth_tolerance)
+
+    output_data = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database_vendor': connection.vendor,
+        'params': {'scales': scale_labels, 'seed': args.seed, 'growth_tolerance': args.growth_tolerance},
+        'endpoints': results,
+        'regressions': regressions,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        suffix = (commit or 'nogit')[:12]
+        output = os.path.join(
+            RESULTS_DIR, f"query_counts-{suffix}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+        )
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    print(f"\n[OK] Результаты сохранены: {output}")
+
+    if args.baseline:
+        print_baseline_comparison(output_data, args.baseline)
+
+    if regressions:
+        print("\nРегрессии:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
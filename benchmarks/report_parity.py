@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Сравнение SQL и Python движков отчета о посещаемости на синтетических данных.
+
+Скрипт создает изолированную тестовую БД, заполняет ее детерминированным
+набором данных (camera_events.synthetic), запускает оба движка
+(generate_comprehensive_attendance_report_sql и
+generate_comprehensive_attendance_report_python), построчно сравнивает
+результаты и сохраняет время выполнения, количество запросов и пиковое
+потребление памяти каждого движка в JSON файл. Файлы результатов разных
+коммитов можно сравнивать между собой (--baseline).
+
+Использование:
+  python benchmarks/report_parity.py [--employees N] [--months M] [--seed S]
+                                     [--output путь.json] [--baseline путь.json]
+                                     [--repeat R] [--keepdb] [--no-fork]
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+import traceback
+from datetime import date, datetime
+from decimal import Decimal
+
+# Настройка кодировки для Windows консоли
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        # Для старых версий Python
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковое потребление памяти не измеряется
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import django
+
+# Настройка Django окружения
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hikvision_project.settings')
+django.setup()
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from camera_events.python_reports import generate_comprehensive_attendance_report_python
+from camera_events.sql_reports import generate_comprehensive_attendance_report_sql
+from camera_events.synthetic import DEFAULT_START_DATE, generate_synthetic_dataset
+
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+ENGINES = {
+    'sql': generate_comprehensive_attendance_report_sql,
+    'python': generate_comprehensive_attendance_report_python,
+}
+
+# Сравниваемые поля строки отчета и допустимое расхождение для числовых полей.
+# SQL возвращает дробные минуты, Python - целые (округление вниз).
+COMPARED_FIELDS = (
+    'employee_name',
+    'department_name',
+    'schedule_type',
+    'schedule_start_time',
+    'schedule_end_time',
+    'first_entry',
+    'last_exit',
+    'total_duration_seconds',
+    'late_minutes',
+    'early_leave_minutes',
+    'early_arrival_minutes',
+    'late_departure_minutes',
+)
+NUMERIC_TOLERANCE = {
+    'total_duration_seconds': 1,
+    'late_minutes': 1,
+    'early_leave_minutes': 1,
+    'early_arrival_minutes': 1,
+    'late_departure_minutes': 1,
+}
+
+
+def get_git_commit():
+    """Возвращает хэш текущего коммита или None, если git недоступен."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_peak_rss_kb():
+    """Пиковое потребление памяти текущим процессом (КБ) или None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS возвращает байты, Linux - килобайты
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure_engine(name, report_kwargs, repeat):
+    """
+    Выполняет движок repeat раз в текущем процессе.
+
+    Returns:
+        Словарь с метриками и строками отчета последнего запуска.
+    """
+    engine = ENGINES[name]
+    wall_times = []
+    query_counts = []
+    rows = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            rows, _, _ = engine(**report_kwargs)
+            wall_times.append(time.perf_counter() - started)
+        query_counts.append(len(queries.captured_queries))
+    return {
+        'wall_time_s': min(wall_times),
+        'wall_times_s': wall_times,
+        'queries': query_counts[-1],
+        'peak_rss_kb': get_peak_rss_kb(),
+        'rows': len(rows),
+        'report': rows,
+    }
+
+
+def run_engine_isolated(name, report_kwargs, repeat, use_fork):
+    """
+    Выполняет движок в отдельном дочернем процессе (fork), чтобы пиковое
+    потребление памяти одного движка не влияло на другой.
+
+    Без fork (Windows, БД в памяти, --no-fork) движок выполняется в текущем
+    процессе, и peak_rss_kb отражает максимум за все время работы скрипта.
+    """
+    if not use_fork:
+        result = measure_engine(name, report_kwargs, repeat)
+        result['isolated'] = False
+        return result
+
+    # Дочерний процесс должен открыть собственное соединение с БД
+    connections.close_all()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = ('ok', measure_engine(name, report_kwargs, repeat))
+        except BaseException:
+            payload = ('error', traceback.format_exc())
+        with os.fdopen(write_fd, 'wb') as pipe:
+            pickle.dump(payload, pipe)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        data = pipe.read()
+    os.waitpid(pid, 0)
+    if not data:
+        raise RuntimeError(f"Движок {name}: дочерний процесс завершился без результата")
+    status, result = pickle.loads(data)
+    if status != 'ok':
+        raise RuntimeError(f"Движок {name} завершился с ошибкой:\n{result}")
+    result['isolated'] = True
+    return result
+
+
+def normalize_value(value):
+    """Приводит значение строки отчета к сопоставимому виду."""
+    if isinstance(value, datetime):
+        # SQL возвращает локальное время без зоны, Python - с зоной
+        if timezone.is_aware(value):
+            value = timezone.localtime(value).replace(tzinfo=None)
+        return value.replace(microsecond=0)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def row_key(row):
+    report_date = row['report_date']
+    if isinstance(report_date, datetime):
+        report_date = report_date.date()
+    return str(row['hikvision_id']), report_date
+
+
+def diff_reports(sql_rows, python_rows, max_examples):
+    """
+    Построчно сравнивает отчеты по ключу (hikvision_id, report_date).
+
+    Returns:
+        Словарь со счетчиками расхождений и примерами.
+    """
+    sql_by_key = {row_key(row): row for row in sql_rows}
+    python_by_key = {row_key(row): row for row in python_rows}
+
+    only_sql = sorted(set(sql_by_key) - set(python_by_key))
+    only_python = sorted(set(python_by_key) - set(sql_by_key))
+    field_mismatches = {}
+    examples = []
+    mismatched_rows = 0
+
+    for key in sorted(set(sql_by_key) & set(python_by_key)):
+        sql_row = sql_by_key[key]
+        python_row = python_by_key[key]
+        row_diff = {}
+        for field in COMPARED_FIELDS:
+            sql_value = normalize_value(sql_row.get(field))
+            python_value = normalize_value(python_row.get(field))
+            tolerance = NUMERIC_TOLERANCE.get(field)
+            if tolerance is not None and sql_value is not None and python_value is not None:
+                equal = abs(float(sql_value) - float(python_value)) < tolerance
+            else:
+                equal = sql_value == python_value
+            if not equal:
+                row_diff[field] = {'sql': sql_value, 'python': python_value}
+                field_mismatches[field] = field_mismatches.get(field, 0) + 1
+        if row_diff:
+            mismatched_rows += 1
+            if len(examples) < max_examples:
+                examples.append({'hikvision_id': key[0], 'report_date': key[1], 'fields': row_diff})
+
+    return {
+        'matched_rows': len(set(sql_by_key) & set(python_by_key)) - mismatched_rows,
+        'mismatched_rows': mismatched_rows,
+        'only_sql': len(only_sql),
+        'only_python': len(only_python),
+        'only_sql_examples': [list(key) for key in only_sql[:max_examples]],
+        'only_python_examples': [list(key) for key in only_python[:max_examples]],
+        'field_mismatches': field_mismatches,
+        'examples': examples,
+    }
+
+
+def print_baseline_comparison(results, baseline_path):
+    """Печатает изменение метрик относительно ранее сохраненного файла результатов."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit')}):")
+    for name, metrics in results['engines'].items():
+        base = baseline.get('engines', {}).get(name)
+        if not base or 'wall_time_s' not in metrics or 'wall_time_s' not in base:
+            continue
+        ratio = metrics['wall_time_s'] / base['wall_time_s'] if base['wall_time_s'] else float('inf')
+        print(
+            f"  {name}: время {base['wall_time_s']:.3f}s -> {metrics['wall_time_s']:.3f}s (x{ratio:.2f}), "
+            f"запросы {base.get('queries')} -> {metrics.get('queries')}, "
+            f"память {base.get('peak_rss_kb')} -> {metrics.get('peak_rss_kb')} КБ"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Сравнение SQL и Python движков отчета о посещаемости на синтетических данных'
+    )
+    parser.add_argument('--employees', type=int, default=200, help='Количество сотрудников (по умолчанию 200)')
+    parser.add_argument('--months', type=int, default=3, help='Количество месяцев (по умолчанию 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed генератора данных (по умолчанию 0)')
+    parser.add_argument('--start-date', type=date.fromisoformat, default=DEFAULT_START_DATE,
+                        help=f'Первый день данных YYYY-MM-DD (по умолчанию {DEFAULT_START_DATE})')
+    parser.add_argument('--repeat', type=int, default=1, help='Количество запусков каждого движка (берется лучшее время)')
+    parser.add_argument('--output', help='Путь к JSON файлу результатов (по умолчанию benchmarks/results/)')
+    parser.add_argument('--baseline', help='JSON файл предыдущего запуска для сравнения метрик')
+    parser.add_argument('--max-examples', type=int, default=20, help='Максимум примеров расхождений в отчете')
+    parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую БД после завершения')
+    parser.add_argument('--no-fork', action='store_true', help='Выполнять движки в текущем процессе')
+    args = parser.parse_args()
+
+    commit = get_git_commit()
+    old_db_name = connection.settings_dict['NAME']
+    print(f"Создание тестовой БД (основная: {old_db_name})...")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+
+    try:
+        print(f"Генерация данных: {args.employees} сотрудников, {args.months} мес., seed={args.seed}")
+        started = time.perf_counter()
+        dataset = generate_synthetic_dataset(
+            employees=args.employees, months=args.months, seed=args.seed, start_date=args.start_date
+        )
+        print(f"  записей EntryExit: {dataset['entry_exits']} ({time.perf_counter() - started:.1f}s)")
+
+        report_kwargs = {
+            'start_date': dataset['start_date'].isoformat(),
+            'end_date': dataset['end_date'].isoformat(),
+            'excluded_hikvision_ids': [],
+        }
+        # SQLite в памяти (тестовые настройки) не переживает закрытие соединения перед fork
+        in_memory = connection.vendor == 'sqlite' and connection.is_in_memory_db()
+        use_fork = hasattr(os, 'fork') and not args.no_fork and not in_memory
+
+        engines = {}
+        reports = {}
+        for name in ENGINES:
+            if name == 'sql' and connection.vendor != 'postgresql':
+                print(f"  {name}: пропущен (требуется PostgreSQL, текущая БД: {connection.vendor})")
+                engines[name] = {'skipped': f'vendor {connection.vendor}'}
+                continue
+            print(f"  {name}: выполнение...")
+            result = run_engine_isolated(name, report_kwargs, args.repeat, use_fork)
+            reports[name] = result.pop('report')
+            engines[name] = result
+            print(
+                f"  {name}: {result['wall_time_s']:.3f}s, запросов {result['queries']}, "
+                f"строк {result['rows']}, пик памяти {result['peak_rss_kb']} КБ"
+            )
+
+        diff = None
+        if len(reports) == len(ENGINES):
+            diff = diff_reports(reports['sql'], reports['python'], args.max_examples)
+            print(
+                f"\nСовпадает строк: {diff['matched_rows']}, с расхождениями: {diff['mismatched_rows']}, "
+                f"только SQL: {diff['only_sql']}, только Python: {diff['only_python']}"
+            )
+            for field, count in sorted(diff['field_mismatches'].items()):
+                print(f"  {field}: {count}")
+    finally:
+        if not args.keepdb:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+
+    results = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database_vendor': connection.vendor,
+        'params': {
+            'employees': args.employees,
+            'months': args.months,
+            'seed': args.seed,
+            'start_date': dataset['start_date'],
+            'end_date': dataset['end_date'],
+            'entry_exits': dataset['entry_exits'],
+            'repeat': args.repeat,
+        },
+        'engines': engines,
+        'diff': diff,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        suffix = (commit or 'nogit')[:12]
+        output = os.path.join(
+            RESULTS_DIR, f"report_parity-{suffix}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+        )
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\n[OK] Результаты сохранены: {output}")
+
+    if args.baseline:
+        print_baseline_comparison(results, args.baseline)
+
+    if diff and (diff['mismatched_rows'] or diff['only_sql'] or diff['only_python']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 Админка для событий камер.
 """
 from django.contrib import admin
+from .hikvision_parser import get_parsed_event
 from .models import CameraEvent, EntryExit, Employee, Department, WorkSchedule
 
 
@@ -24,87 +25,23 @@ class CameraEventAdmin(admin.ModelAdmin):
     
     def get_employee_id(self, obj):
         """Извлекает Employee ID из raw_data."""
-        if obj and obj.raw_data and isinstance(obj.raw_data, dict):
-            outer_event = obj.raw_data.get("AccessControllerEvent", {})
-            # Проверяем вложенную структуру
-            if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-                access_event = outer_event["AccessControllerEvent"]
-            else:
-                access_event = outer_event if isinstance(outer_event, dict) else {}
-            
-            return (
-                access_event.get("employeeId") or
-                access_event.get("employeeID") or
-                access_event.get("employeeNo") or
-                access_event.get("employeeNoString") or
-                obj.hikvision_id or
-                "--"
-            )
-        return obj.hikvision_id or "--"
+        return get_parsed_event(obj).employee_no or obj.hikvision_id or "--"
     get_employee_id.short_description = "Employee ID"
     get_employee_id.admin_order_field = "hikvision_id"
     
     def get_employee_name(self, obj):
         """Извлекает имя сотрудника из raw_data."""
-        if obj and obj.raw_data and isinstance(obj.raw_data, dict):
-            outer_event = obj.raw_data.get("AccessControllerEvent", {})
-            # Проверяем вложенную структуру
-            if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-                access_event = outer_event["AccessControllerEvent"]
-            else:
-                access_event = outer_event if isinstance(outer_event, dict) else {}
-            
-            return (
-                access_event.get("employeeName") or
-                access_event.get("name") or
-                access_event.get("employeeNameString") or
-                "--"
-            )
-        return "--"
+        return get_parsed_event(obj).employee_name or "--"
     get_employee_name.short_description = "Имя"
     
     def get_card_no(self, obj):
         """Извлекает номер карты из raw_data."""
-        if obj and obj.raw_data and isinstance(obj.raw_data, dict):
-            outer_event = obj.raw_data.get("AccessControllerEvent", {})
-            # Проверяем вложенную структуру
-            if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-                access_event = outer_event["AccessControllerEvent"]
-            else:
-                access_event = outer_event if isinstance(outer_event, dict) else {}
-            
-            return (
-                access_event.get("cardNo") or
-                access_event.get("cardNumber") or
-                access_event.get("card") or
-                "--"
-            )
-        return "--"
+        return get_parsed_event(obj).card_no or "--"
     get_card_no.short_description = "Card No."
     
     def get_event_type(self, obj):
         """Извлекает тип события из raw_data."""
-        if obj and obj.raw_data and isinstance(obj.raw_data, dict):
-            outer_event = obj.raw_data.get("AccessControllerEvent", {})
-            # Проверяем вложенную структуру
-            if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-                access_event = outer_event["AccessControllerEvent"]
-            else:
-                access_event = outer_event if isinstance(outer_event, dict) else {}
-            
-            # Проверяем subEventType для определения типа
-            sub_event_type = access_event.get("subEventType")
-            if sub_event_type == 75:
-                return "Authenticated via Face"
-            
-            return (
-                access_event.get("eventType") or
-                access_event.get("eventTypes") or
-                access_event.get("eventDescription") or
-                access_event.get("event") or
-                "--"
-            )
-        return "--"
+        return get_parsed_event(obj).event_type or "--"
     get_event_type.short_description = "Event Type"
 
 
@@ -162,8 +99,8 @@ class EntryExitAdmin(admin.ModelAdmin):
 
 @admin.register(WorkSchedule)
 class WorkScheduleAdmin(admin.ModelAdmin):
-    list_display = ["employee", "schedule_type", "get_schedule_display", "allowed_late_minutes", "allowed_early_leave_minutes", "created_at"]
-    list_filter = ["schedule_type", "created_at"]
+    list_display = ["employee", "schedule_type", "get_schedule_display", "valid_from", "valid_to", "allowed_late_minutes", "allowed_early_leave_minutes", "created_at"]
+    list_filter = ["schedule_type", "valid_to", "created_at"]
     search_fields = ["employee__name", "employee__hikvision_id", "description"]
     readonly_fields = ["created_at", "updated_at", "get_schedule_display"]
     
@@ -0,0 +1,317 @@
+"""
+Архив старых событий камер в сжатых колоночных файлах.
+
+archive_month выгружает закрытый месяц CameraEvent (включая raw_data и фото)
+в файл CAMERA_EVENT_ARCHIVE_DIR/camera_events_YYYY-MM_<первый id>-<последний id>.zip
+и после проверки файла удаляет события из основной таблицы.
+
+Формат файла: ZIP (LZMA, если модуль lzma доступен) с manifest.json и
+группами строк по ARCHIVE_ROW_GROUP_SIZE; в каждой группе отдельный файл
+на столбец (NNNNN/<столбец>.jsonl, одно JSON значение на строку). Значения
+одного столбца лежат подряд и сжимаются заметно лучше построчного формата,
+а восстановление без фото не читает столбец picture_data.
+
+rehydrate_month загружает месяц из архива в ArchivedCameraEvent, откуда
+события читает recalculate_entries_exits.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import partitioning
+from .models import ArchivedCameraEvent, CameraEvent
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lzma  # noqa: F401
+    ARCHIVE_COMPRESSION = zipfile.ZIP_LZMA
+except ImportError:
+    ARCHIVE_COMPRESSION = zipfile.ZIP_DEFLATED
+
+ARCHIVE_FORMAT = "hikvision-camera-events"
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_COLUMNS = (
+    "id", "hikvision_id", "device_name", "event_time", "picture_data",
+    "raw_data", "dedup_key", "created_at", "updated_at",
+)
+DATETIME_COLUMNS = {"event_time", "created_at", "updated_at"}
+ARCHIVE_ROW_GROUP_SIZE = 5000
+DELETE_BATCH_SIZE = 5000
+
+
+def get_archive_dir():
+    return str(getattr(settings, "CAMERA_EVENT_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "archive")))
+
+
+def archive_files(month, directory=None):
+    """Файлы архива месяца в порядке id."""
+    pattern = os.path.join(directory or get_archive_dir(), f"camera_events_{month:%Y-%m}_*.zip")
+    return sorted(glob.glob(pattern))
+
+
+def _encode_value(column, value):
+    if value is None:
+        return "null"
+    if column in DATETIME_COLUMNS:
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return json.dumps(value.isoformat())
+    if column == "raw_data" and isinstance(value, str):
+        # Драйвер БД возвращает JSON текстом
+        value = json.loads(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _decode_value(column, value):
+    value = json.loads(value)
+    if value is not None and column in DATETIME_COLUMNS:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _source_table(month):
+    """
+    Таблица-источник месяца: отсоединенная секция (partition_camera_events
+    --detach-older-than) или основная таблица событий.
+
+    Returns:
+        (имя таблицы, True если это отсоединенная секция)
+    """
+    if connection.vendor == "postgresql":
+        name = partitioning.partition_name(month)
+        if name in partitioning.detached_partitions():
+            return name, True
+    return CameraEvent._meta.db_table, False
+
+
+def _month_range(month):
+    return partitioning.month_bound(month), partitioning.month_bound(partitioning.add_months(month, 1))
+
+
+def _write_group(archive, group_index, rows):
+    for position, column in enumerate(ARCHIVE_COLUMNS):
+        lines = "\n".join(_encode_value(column, row[position]) for row in rows)
+        archive.writestr(f"{group_index:05d}/{column}.jsonl", lines + "\n")
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_month(month, directory=None, delete=True):
+    """
+    Выгружает события месяца в архивный файл и удаляет их из основной таблицы.
+
+    Args:
+        month: Первое число месяца (date)
+        directory: Каталог архива (по умолчанию CAMERA_EVENT_ARCHIVE_DIR)
+        delete: Удалить выгруженные события из основной таблицы
+
+    Returns:
+        {"file": путь или None, "rows": N, "deleted": N}
+    """
+    if month >= partitioning.month_start(timezone.localdate()):
+        raise ValueError(f"Месяц {month:%Y-%m} еще не закрыт")
+
+    directory = directory or get_archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    table, detached = _source_table(month)
+    quote = connection.ops.quote_name
+    start, end = _month_range(month)
+    columns = ", ".join(quote(column) for column in ARCHIVE_COLUMNS)
+    where = "" if detached else f" WHERE {quote('event_time')} >= %s AND {quote('event_time')} < %s"
+    params = [] if detached else [start, end]
+
+    tmp_path = os.path.join(directory, f".camera_events_{month:%Y-%m}.zip.tmp")
+    rows_total = 0
+    groups = 0
+    first_id = last_id = None
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT {columns} FROM {quote(table)}{where} ORDER BY {quote('id')}", params)
+        with zipfile.ZipFile(tmp_path, "w", compression=ARCHIVE_COMPRESSION) as archive:
+            while True:
+                rows = cursor.fetchmany(ARCHIVE_ROW_GROUP_SIZE)
+                if not rows:
+                    break
+                _write_group(archive, groups, rows)
+                groups += 1
+                rows_total += len(rows)
+                first_id = rows[0][0] if first_id is None else first_id
+                last_id = rows[-1][0]
+            archive.writestr("manifest.json", json.dumps({
+                "format": ARCHIVE_FORMAT,
+                "version": ARCHIVE_FORMAT_VERSION,
+                "month": f"{month:%Y-%m}",
+                "source_table": table,
+                "columns": list(ARCHIVE_COLUMNS),
+                "row_groups": groups,
+                "rows": rows_total,
+                "first_id": first_id,
+                "last_id": last_id,
+                "created_at": timezone.now().isoformat(),
+            }, ensure_ascii=False, indent=2))
+
+    if not rows_total:
+        os.remove(tmp_path)
+        if detached:
+            _drop_table(table)
+        return {"file": None, "rows": 0, "deleted": 0}
+
+    with open(tmp_path, "rb") as stream:
+        os.fsync(stream.fileno())
+    _verify_archive(tmp_path, rows_total)
+    path = os.path.join(directory, f"camera_events_{month:%Y-%m}_{first_id}-{last_id}.zip")
+    os.replace(tmp_path, path)
+    with open(path + ".sha256", "w", encoding="utf-8") as stream:
+        stream.write(f"{_file_sha256(path)}  {os.path.basename(path)}\n")
+    logger.info(f"Архив {path}: событий {rows_total}, групп {groups}")
+
+    deleted = 0
+    if delete:
+        if detached:
+            _drop_table(table)
+            deleted = rows_total
+        else:
+            deleted = _delete_archived(month, last_id)
+    return {"file": path, "rows": rows_total, "deleted": deleted}
+
+
+def _verify_archive(path, expected_rows):
+    """Проверяет CRC всех файлов архива и число строк в manifest."""
+    with zipfile.ZipFile(path) as archive:
+        broken = archive.testzip()
+        if broken:
+            raise ValueError(f"Архив {path} поврежден: {broken}")
+        manifest = json.loads(archive.read("manifest.json"))
+    if manifest["rows"] != expected_rows:
+        raise ValueError(f"Архив {path}: {manifest['rows']} строк вместо {expected_rows}")
+
+
+def _delete_archived(month, last_id):
+    """
+    Удаляет выгруженные события месяца пакетами.
+
+    События с id больше last_id (пришли после выгрузки, например из spool)
+    остаются и попадут в следующий архив месяца.
+    """
+    start, end = _month_range(month)
+    queryset = CameraEvent.objects.filter(event_time__gte=start, event_time__lt=end, pk__lte=last_id)
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list("pk", flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            break
+        deleted += CameraEvent.objects.filter(
+            pk__in=ids, event_time__gte=start, event_time__lt=end,
+        ).delete()[0]
+
+    if connection.vendor == "postgresql" and partitioning.is_partitioned():
+        name = partitioning.partition_name(month)
+        if any(partition == name for partition, _, _ in partitioning.list_partitions()):
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {quote(name)})")
+                if cursor.fetchone()[0]:
+                    cursor.execute(f"DROP TABLE {quote(name)}")
+                    logger.info(f"Пустая секция {name} удалена")
+    return deleted
+
+
+def _drop_table(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {connection.ops.quote_name(table)}")
+    logger.info(f"Отсоединенная секция {table} удалена")
+
+
+def months_to_archive(older_than_months):
+    """Месяцы с событиями (включая отсоединенные секции) старше older_than_months."""
+    cutoff = partitioning.add_months(partitioning.month_start(timezone.localdate()), -older_than_months)
+    start, _ = _month_range(cutoff)
+    months = {
+        partitioning.month_start(value)
+        for value in CameraEvent.objects.filter(event_time__lt=start).dates("event_time", "month")
+    }
+    if connection.vendor == "postgresql":
+        for name in partitioning.detached_partitions():
+            month = partitioning.partition_month(name)
+            if month and month < cutoff:
+                months.add(month)
+    return sorted(months)
+
+
+def read_archive(path, with_pictures=False):
+    """
+    Читает события из архивного файла.
+
+    Yields:
+        Словари {столбец: значение} по группам строк.
+    """
+    columns = [column for column in ARCHIVE_COLUMNS if with_pictures or column != "picture_data"]
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        if manifest.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"{path} не является архивом событий камер")
+        for group_index in range(manifest["row_groups"]):
+            values = {
+                column: archive.read(f"{group_index:05d}/{column}.jsonl").decode("utf-8").splitlines()
+                for column in columns
+            }
+            for position in range(len(values["id"])):
+                yield {column: _decode_value(column, values[column][position]) for column in columns}
+
+
+@transaction.atomic
+def rehydrate_month(month, with_pictures=False, directory=None, batch_size=2000):
+    """
+    Загружает архив месяца в ArchivedCameraEvent (заменяя ранее загруженный).
+
+    Returns:
+        Количество загруженных событий.
+    """
+    files = archive_files(month, directory)
+    if not files:
+        raise ValueError(f"Архив за {month:%Y-%m} не найден в {directory or get_archive_dir()}")
+    ArchivedCameraEvent.objects.filter(archive_month=month).delete()
+
+    loaded = 0
+    batch = []
+    for path in files:
+        for row in read_archive(path, with_pictures=with_pictures):
+            original_id = row.pop("id")
+            batch.append(ArchivedCameraEvent(
+                original_id=original_id,
+                archive_month=month,
+                archive_file=os.path.basename(path),
+                **row,
+            ))
+            if len(batch) >= batch_size:
+                ArchivedCameraEvent.objects.bulk_create(batch)
+                loaded += len(batch)
+                batch = []
+    if batch:
+        ArchivedCameraEvent.objects.bulk_create(batch)
+        loaded += len(batch)
+    logger.info(f"Восстановлено из архива за {month:%Y-%m}: {loaded} событий")
+    return loaded
+
+
+def drop_rehydrated(month):
+    """Удаляет восстановленные события месяца из ArchivedCameraEvent."""
+    deleted, _ = ArchivedCameraEvent.objects.filter(archive_month=month).delete()
+    return deleted
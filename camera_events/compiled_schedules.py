@@ -0,0 +1,505 @@
+"""
+Скомпилированное представление графиков работы.
+
+WorkSchedule хранит график в "человеческом" виде (дни недели JSON-списком,
+плавающие смены строками "HH:MM"). Для сопоставления тысяч записей разбирать
+этот формат на каждую пару (запись, дата) слишком дорого, поэтому график один раз
+компилируется в CompiledSchedule: маска дней недели, смещения начала/окончания
+смены в минутах от полуночи и признак ночной смены для каждого дня недели.
+
+Пакетный API (expand_shift_calendar) разворачивает графики на диапазон дат в
+компактные массивы NumPy с временем начала и окончания смен (секунды Unix).
+
+ScheduleIndex хранит версии графиков (valid_from/valid_to) каждого сотрудника
+отсортированными по дате начала, поэтому поиск графика на дату - это bisect
+по списку в памяти, а не запрос к БД.
+"""
+import bisect
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.utils import timezone
+
+from .models import WorkSchedule
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Смена может закончиться не позже чем через сутки после полуночи дня начала,
+# поэтому полуночи дат вычисляются с запасом на один день после диапазона
+SHIFT_LOOKAHEAD_DAYS = 1
+
+# Значения по умолчанию для плавающих смен (как в ScheduleMatcher)
+DEFAULT_FLOATING_START = "08:00"
+DEFAULT_FLOATING_END = "17:00"
+
+
+def _parse_hhmm(value):
+    """Парсит строку 'HH:MM' в минуты от полуночи."""
+    hour, minute = map(int, value.split(':'))
+    return time(hour, minute).hour * 60 + minute
+
+
+def _time_to_minutes(value):
+    """Переводит datetime.time в минуты от полуночи."""
+    return value.hour * 60 + value.minute + value.second / 60.0
+
+
+class CompiledSchedule:
+    """
+    Разобранный график работы.
+
+    Для каждого дня недели (0=Понедельник, 6=Воскресенье) хранит:
+    - бит в weekday_mask, если в этот день есть смена;
+    - start_minutes[d] - начало смены в минутах от полуночи;
+    - end_minutes[d] - окончание смены в минутах от полуночи дня начала
+      (для ночных смен больше MINUTES_PER_DAY);
+    - overnight[d] - смена переходит через полночь.
+    """
+    __slots__ = (
+        'schedule_id',
+        'employee_id',
+        'schedule_type',
+        'weekday_mask',
+        'start_minutes',
+        'end_minutes',
+        'overnight',
+        'allowed_late_minutes',
+        'allowed_early_leave_minutes',
+        'version',
+    )
+
+    def __init__(self, schedule_id, employee_id, schedule_type, weekday_mask,
+                 start_minutes, end_minutes, overnight,
+                 allowed_late_minutes=0, allowed_early_leave_minutes=0, version=None):
+        self.schedule_id = schedule_id
+        self.employee_id = employee_id
+        self.schedule_type = schedule_type
+        self.weekday_mask = weekday_mask
+        self.start_minutes = start_minutes
+        self.end_minutes = end_minutes
+        self.overnight = overnight
+        self.allowed_late_minutes = allowed_late_minutes
+        self.allowed_early_leave_minutes = allowed_early_leave_minutes
+        self.version = version
+
+    def __repr__(self):
+        return (
+            f"CompiledSchedule(schedule_id={self.schedule_id}, type={self.schedule_type}, "
+            f"mask={self.weekday_mask:07b})"
+        )
+
+    def has_shift(self, weekday: int) -> bool:
+        """Есть ли смена в указанный день недели."""
+        return bool(self.weekday_mask & (1 << weekday))
+
+    def scheduled_times(self, day: date) -> Optional[tuple]:
+        """
+        Возвращает (scheduled_start, scheduled_end) как aware datetime для даты
+        или None, если в этот день смены нет.
+        Семантика совпадает с ScheduleMatcher.get_scheduled_time_for_date.
+        """
+        weekday = day.weekday()
+        if not self.has_shift(weekday):
+            return None
+        midnight = timezone.make_aware(datetime.combine(day, time(0, 0)))
+        start_dt = midnight + timedelta(minutes=self.start_minutes[weekday])
+        end_dt = midnight + timedelta(minutes=self.end_minutes[weekday])
+        return (start_dt, end_dt)
+
+
+def compile_schedule_uncached(schedule: WorkSchedule) -> CompiledSchedule:
+    """Компилирует WorkSchedule без использования кэша."""
+    weekday_mask = 0
+    start_minutes = [0] * 7
+    end_minutes = [0] * 7
+    overnight = [False] * 7
+
+    if schedule.schedule_type == 'round_the_clock':
+        # Круглосуточный график - каждый день с 00:00 на 24 часа
+        weekday_mask = 0b1111111
+        end_minutes = [MINUTES_PER_DAY] * 7
+
+    elif schedule.schedule_type == 'floating':
+        if schedule.floating_shifts and isinstance(schedule.floating_shifts, list):
+            for weekday in range(7):
+                # Как и раньше, используем первую смену с совпадающим днем
+                shift = next(
+                    (s for s in schedule.floating_shifts if isinstance(s, dict) and s.get('day') == weekday),
+                    None,
+                )
+                if shift is None:
+                    continue
+                try:
+                    start = _parse_hhmm(shift.get('start', DEFAULT_FLOATING_START))
+                    end = _parse_hhmm(shift.get('end', DEFAULT_FLOATING_END))
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.error(f"Некорректная плавающая смена в графике {schedule.id} (день {weekday}): {e}")
+                    continue
+                if end < start:
+                    end += MINUTES_PER_DAY
+                    overnight[weekday] = True
+                weekday_mask |= 1 << weekday
+                start_minutes[weekday] = start
+                end_minutes[weekday] = end
+
+    elif schedule.schedule_type == 'regular':
+        if schedule.days_of_week and schedule.start_time and schedule.end_time:
+            start = _time_to_minutes(schedule.start_time)
+            end = _time_to_minutes(schedule.end_time)
+            is_overnight = schedule.end_time < schedule.start_time
+            if is_overnight:
+                end += MINUTES_PER_DAY
+            for weekday in range(7):
+                if weekday in schedule.days_of_week:
+                    weekday_mask |= 1 << weekday
+                    start_minutes[weekday] = start
+                    end_minutes[weekday] = end
+                    overnight[weekday] = is_overnight
+
+    return CompiledSchedule(
+        schedule_id=schedule.pk,
+        employee_id=schedule.employee_id,
+        schedule_type=schedule.schedule_type,
+        weekday_mask=weekday_mask,
+        start_minutes=tuple(start_minutes),
+        end_minutes=tuple(end_minutes),
+        overnight=tuple(overnight),
+        allowed_late_minutes=schedule.allowed_late_minutes or 0,
+        allowed_early_leave_minutes=schedule.allowed_early_leave_minutes or 0,
+        version=schedule.updated_at,
+    )
+
+
+# Кэш скомпилированных графиков: schedule.pk -> CompiledSchedule.
+# Запись считается актуальной, пока совпадает updated_at графика.
+_compiled_cache: Dict[int, CompiledSchedule] = {}
+
+
+def compile_schedule(schedule: WorkSchedule) -> Optional[CompiledSchedule]:
+    """
+    Возвращает скомпилированный график (с кэшированием по pk и updated_at).
+    """
+    if schedule is None:
+        return None
+    if schedule.pk is None:
+        return compile_schedule_uncached(schedule)
+
+    compiled = _compiled_cache.get(schedule.pk)
+    if compiled is None or compiled.version != schedule.updated_at:
+        compiled = compile_schedule_uncached(schedule)
+        _compiled_cache[schedule.pk] = compiled
+    return compiled
+
+
+def load_compiled_schedules(employee_ids: Optional[Iterable[int]] = None) -> Dict[int, CompiledSchedule]:
+    """
+    Загружает графики одним запросом и возвращает словарь employee_id -> CompiledSchedule.
+    Для каждого сотрудника берется первый график (как employee.work_schedules.first()).
+
+    Args:
+        employee_ids: ID сотрудников (Employee.id). Если None - все графики.
+    """
+    queryset = WorkSchedule.objects.order_by(*WorkSchedule._meta.ordering, 'id')
+    if employee_ids is not None:
+        queryset = queryset.filter(employee_id__in=list(employee_ids))
+
+    result = {}
+    for schedule in queryset:
+        if schedule.employee_id not in result:
+            result[schedule.employee_id] = compile_schedule(schedule)
+    return result
+
+
+def local_midnight_timestamps(start_date: date, end_date: date) -> np.ndarray:
+    """
+    Возвращает массив секунд Unix для локальной полуночи каждой даты диапазона
+    (включительно). Смещение часового пояса вычисляется один раз на дату.
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return np.empty(0, dtype=np.int64)
+    tz = timezone.get_current_timezone()
+    return np.fromiter(
+        (
+            int(datetime.combine(start_date + timedelta(days=i), time(0, 0), tzinfo=tz).timestamp())
+            for i in range(days)
+        ),
+        dtype=np.int64,
+        count=days,
+    )
+
+
+class ShiftCalendar:
+    """
+    Развернутые смены графика на диапазоне дат.
+
+    Все массивы одинаковой длины (по одной позиции на день со сменой):
+    - ordinals - date.toordinal() дня начала смены (int32);
+    - start_ts / end_ts - начало и окончание смены в секундах Unix (int64);
+    - overnight - смена переходит через полночь (bool).
+    """
+    __slots__ = ('compiled', 'ordinals', 'start_ts', 'end_ts', 'overnight')
+
+    def __init__(self, compiled, ordinals, start_ts, end_ts, overnight):
+        self.compiled = compiled
+        self.ordinals = ordinals
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.overnight = overnight
+
+    def __len__(self):
+        return len(self.ordinals)
+
+
+def _schedule_arrays(compiled: CompiledSchedule):
+    """Возвращает массивы графика по дням недели (маска, начало, окончание, ночная смена)."""
+    mask = np.array([compiled.has_shift(d) for d in range(7)], dtype=bool)
+    start = np.array(compiled.start_minutes, dtype=np.float64)
+    end = np.array(compiled.end_minutes, dtype=np.float64)
+    overnight = np.array(compiled.overnight, dtype=bool)
+    return mask, start, end, overnight
+
+
+def shift_boundary_timestamps(midnights, day_index, minutes):
+    """
+    Переводит смещения в минутах от полуночи дня day_index в секунды Unix.
+    Полные сутки отсчитываются от локальной полуночи соответствующего дня,
+    поэтому смена смещения часового пояса в полночь учитывается корректно.
+    """
+    whole_days = (minutes // MINUTES_PER_DAY).astype(np.int64)
+    remainder = np.rint((minutes - whole_days * MINUTES_PER_DAY) * 60).astype(np.int64)
+    return midnights[day_index + whole_days] + remainder
+
+
+def expand_shifts(compiled: CompiledSchedule, start_date: date, end_date: date,
+                  midnights: Optional[np.ndarray] = None) -> ShiftCalendar:
+    """
+    Разворачивает смены одного графика на диапазон дат (включительно).
+
+    Args:
+        compiled: Скомпилированный график
+        start_date: Начальная дата
+        end_date: Конечная дата
+        midnights: Предвычисленный результат local_midnight_timestamps для диапазона
+            от start_date до end_date + SHIFT_LOOKAHEAD_DAYS
+    """
+    if midnights is None:
+        midnights = local_midnight_timestamps(start_date, end_date + timedelta(days=SHIFT_LOOKAHEAD_DAYS))
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return ShiftCalendar(compiled, empty.astype(np.int32), empty, empty, empty.astype(bool))
+
+    day_index = np.arange(days, dtype=np.int64)
+    ordinals = (start_date.toordinal() + day_index).astype(np.int32)
+    weekdays = (ordinals - 1) % 7  # date(1, 1, 1) - понедельник
+
+    mask, start, end, overnight = _schedule_arrays(compiled)
+    has_shift = mask[weekdays]
+    selected = weekdays[has_shift]
+    selected_index = day_index[has_shift]
+
+    return ShiftCalendar(
+        compiled=compiled,
+        ordinals=ordinals[has_shift],
+        start_ts=shift_boundary_timestamps(midnights, selected_index, start[selected]),
+        end_ts=shift_boundary_timestamps(midnights, selected_index, end[selected]),
+        overnight=overnight[selected],
+    )
+
+
+def expand_shift_calendar(compiled_by_employee: Dict[int, CompiledSchedule],
+                          start_date: date, end_date: date) -> Dict[int, ShiftCalendar]:
+    """
+    Разворачивает смены всех переданных графиков на диапазон дат.
+    Полуночи дат вычисляются один раз для всех сотрудников.
+    """
+    midnights = local_midnight_timestamps(start_date, end_date + timedelta(days=SHIFT_LOOKAHEAD_DAYS))
+    return {
+        employee_id: expand_shifts(compiled, start_date, end_date, midnights=midnights)
+        for employee_id, compiled in compiled_by_employee.items()
+        if compiled is not None
+    }
+
+
+# Порядковые номера дат для открытых границ периода действия
+_MIN_ORDINAL = date.min.toordinal()
+_MAX_ORDINAL = date.max.toordinal()
+
+
+class ScheduleIndex:
+    """
+    Индекс версий графиков работы по сотрудникам.
+
+    Для каждого сотрудника хранит отсортированные по valid_from списки:
+    начала периодов (порядковые номера дат), концы периодов и графики.
+    Пересекающиеся версии допускаются: при совпадении выигрывает версия
+    с более поздним valid_from, как и при обходе в порядке Meta.ordering.
+    """
+
+    def __init__(self, schedules: Iterable[WorkSchedule] = ()):
+        self._starts: Dict[int, list] = {}
+        self._ends: Dict[int, list] = {}
+        self._schedules: Dict[int, list] = {}
+        by_employee: Dict[int, list] = {}
+        for schedule in schedules:
+            by_employee.setdefault(schedule.employee_id, []).append(schedule)
+        for employee_id, versions in by_employee.items():
+            # Сортировка стабильная: среди версий с одинаковым valid_from
+            # остается порядок Meta.ordering (текущая версия первой)
+            versions.sort(key=lambda s: s.valid_from.toordinal() if s.valid_from else _MIN_ORDINAL)
+            self._starts[employee_id] = [
+                s.valid_from.toordinal() if s.valid_from else _MIN_ORDINAL for s in versions
+            ]
+            self._ends[employee_id] = [
+                s.valid_to.toordinal() if s.valid_to else _MAX_ORDINAL for s in versions
+            ]
+            self._schedules[employee_id] = versions
+
+    @classmethod
+    def load(cls, employee_ids: Optional[Iterable[int]] = None) -> 'ScheduleIndex':
+        """Загружает все версии графиков одним запросом."""
+        queryset = WorkSchedule.objects.order_by(*WorkSchedule._meta.ordering, 'id')
+        if employee_ids is not None:
+            queryset = queryset.filter(employee_id__in=list(employee_ids))
+        return cls(queryset)
+
+    def employee_ids(self):
+        """ID сотрудников, для которых есть графики."""
+        return self._schedules.keys()
+
+    def versions(self, employee_id: int) -> list:
+        """Все версии графика сотрудника в порядке valid_from."""
+        return list(self._schedules.get(employee_id, ()))
+
+    def schedule_for(self, employee_id: int, day: date) -> Optional[WorkSchedule]:
+        """Возвращает версию графика сотрудника, действующую на дату, или None."""
+        starts = self._starts.get(employee_id)
+        if not starts:
+            return None
+        ordinal = day.toordinal()
+        ends = self._ends[employee_id]
+        # Последняя версия, начавшаяся не позже даты
+        position = bisect.bisect_right(starts, ordinal) - 1
+        while position >= 0:
+            if ends[position] >= ordinal:
+                return self._schedules[employee_id][position]
+            position -= 1
+        return None
+
+    def expand(self, employee_id: int, start_date: date, end_date: date,
+               midnights: Optional[np.ndarray] = None) -> Optional[ShiftCalendar]:
+        """
+        Разворачивает смены сотрудника на диапазон дат с учетом версий графика:
+        каждый день берется из версии, действующей на этот день.
+        """
+        if employee_id not in self._schedules:
+            return None
+        if midnights is None:
+            midnights = local_midnight_timestamps(start_date, end_date + timedelta(days=SHIFT_LOOKAHEAD_DAYS))
+
+        versions = self._schedules[employee_id]
+        if len(versions) == 1 and versions[0].valid_from is None and versions[0].valid_to is None:
+            return expand_shifts(compile_schedule(versions[0]), start_date, end_date, midnights=midnights)
+
+        parts = []
+        current = start_date
+        while current <= end_date:
+            schedule = self.schedule_for(employee_id, current)
+            # Конец отрезка - последний день действия версии или начало следующей
+            segment_end = end_date
+            if schedule is not None and schedule.valid_to and schedule.valid_to < segment_end:
+                segment_end = schedule.valid_to
+            next_index = bisect.bisect_right(self._starts[employee_id], current.toordinal())
+            if next_index < len(versions):
+                next_start = date.fromordinal(self._starts[employee_id][next_index])
+                if next_start - timedelta(days=1) < segment_end:
+                    segment_end = next_start - timedelta(days=1)
+            if schedule is not None:
+                offset = (current - start_date).days
+                calendar = expand_shifts(
+                    compile_schedule(schedule), current, segment_end,
+                    midnights=midnights[offset:],
+                )
+                parts.append(calendar)
+            current = segment_end + timedelta(days=1)
+
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return ShiftCalendar(None, empty.astype(np.int32), empty, empty, empty.astype(bool))
+        if len(parts) == 1:
+            return parts[0]
+        return ShiftCalendar(
+            compiled=parts[-1].compiled,
+            ordinals=np.concatenate([p.ordinals for p in parts]),
+            start_ts=np.concatenate([p.start_ts for p in parts]),
+            end_ts=np.concatenate([p.end_ts for p in parts]),
+            overnight=np.concatenate([p.overnight for p in parts]),
+        )
+
+
+def select_schedule_version(schedules: Iterable[WorkSchedule], day: date) -> Optional[WorkSchedule]:
+    """
+    Выбирает из версий графика одного сотрудника ту, что действует на дату.
+    Правило то же, что в ScheduleIndex.schedule_for; используется с уже
+    загруженными (prefetch_related) графиками, где версий единицы.
+    """
+    selected = None
+    selected_start = None
+    for schedule in schedules:
+        if not schedule.is_valid_on(day):
+            continue
+        start = schedule.valid_from.toordinal() if schedule.valid_from else _MIN_ORDINAL
+        if selected is None or start > selected_start:
+            selected = schedule
+            selected_start = start
+    return selected
+
+
+def expand_schedule_index(index: ScheduleIndex, start_date: date, end_date: date) -> Dict[int, ShiftCalendar]:
+    """Разворачивает смены всех сотрудников индекса на диапазон дат."""
+    midnights = local_midnight_timestamps(start_date, end_date + timedelta(days=SHIFT_LOOKAHEAD_DAYS))
+    return {
+        employee_id: index.expand(employee_id, start_date, end_date, midnights=midnights)
+        for employee_id in index.employee_ids()
+    }
+
+
+class ScheduleTables:
+    """
+    Таблицы набора скомпилированных графиков для векторных вычислений.
+
+    Каждому графику присваивается индекс строки k; массивы формы (K, 7)
+    содержат маску дней, начало и окончание смены (минуты от полуночи дня начала),
+    массивы формы (K,) - допустимые опоздание и ранний уход.
+    """
+    __slots__ = ('positions', 'mask', 'start_minutes', 'end_minutes',
+                 'allowed_late_minutes', 'allowed_early_leave_minutes')
+
+    def __init__(self, compiled_schedules: Iterable[CompiledSchedule]):
+        compiled_schedules = list(compiled_schedules)
+        self.positions = {id(compiled): k for k, compiled in enumerate(compiled_schedules)}
+        self.mask = np.array(
+            [[compiled.has_shift(d) for d in range(7)] for compiled in compiled_schedules],
+            dtype=bool,
+        ).reshape(len(compiled_schedules), 7)
+        self.start_minutes = np.array(
+            [compiled.start_minutes for compiled in compiled_schedules], dtype=np.float64
+        ).reshape(len(compiled_schedules), 7)
+        self.end_minutes = np.array(
+            [compiled.end_minutes for compiled in compiled_schedules], dtype=np.float64
+        ).reshape(len(compiled_schedules), 7)
+        self.allowed_late_minutes = np.array(
+            [compiled.allowed_late_minutes for compiled in compiled_schedules], dtype=np.int64
+        )
+        self.allowed_early_leave_minutes = np.array(
+            [compiled.allowed_early_leave_minutes for compiled in compiled_schedules], dtype=np.int64
+        )
+
+    def position(self, compiled: CompiledSchedule) -> int:
+        """Индекс строки графика в таблицах."""
+        return self.positions[id(compiled)]
@@ -0,0 +1,249 @@
+"""
+Построение дерева подразделений для DepartmentViewSet без N+1 запросов.
+
+Дерево собирается в памяти из трех плоских запросов (подразделения, сотрудники,
+графики работы), а готовый JSON кэшируется. Ключ кэша и ETag зависят только от
+отпечатка таблиц Department, Employee и WorkSchedule, поэтому опрос страницы
+отчетов не выполняет повторную сборку, пока данные не изменились.
+
+get_department_paths и get_descendant_ids читают иерархию одним запросом
+для представлений, которым нужны пути или дочерние подразделения.
+"""
+import hashlib
+import json
+import logging
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from rest_framework import serializers
+
+from .models import Department, Employee, WorkSchedule
+from .utils import EXCLUDED_DEPARTMENTS
+
+logger = logging.getLogger(__name__)
+
+# Время жизни кэша (секунды). Инвалидация происходит по отпечатку данных,
+# таймаут нужен только для очистки устаревших ключей.
+DEPARTMENT_TREE_CACHE_TIMEOUT = 60 * 60
+
+_CACHE_KEY_PREFIX = "camera_events:department_tree:"
+
+# Форматирование дат так же, как в DepartmentSerializer (DRF DateTimeField)
+_datetime_field = serializers.DateTimeField()
+
+
+def _strip_aup_prefix(full_path):
+    """Убирает "АУП" / "АУП > " из начала пути (как в EmployeeSimpleSerializer)."""
+    if full_path.startswith("АУП > "):
+        result = full_path[6:]
+    elif full_path.startswith("АУП"):
+        result = full_path[3:].lstrip(" > ")
+    else:
+        result = full_path
+    return result.lstrip("/ > ")
+
+
+def _format_department_old(dept_old):
+    """Форматирует устаревшее текстовое поле подразделения."""
+    if dept_old.startswith("АУП/"):
+        result = dept_old[4:]
+    elif dept_old.startswith("АУП"):
+        result = dept_old[3:].lstrip("/")
+    else:
+        result = dept_old
+    result = result.replace("/", " > ")
+    return result.lstrip("/ > ")
+
+
+def get_department_paths():
+    """
+    Возвращает полные пути всех подразделений одним запросом.
+
+    Returns:
+        Словарь {id подразделения: "Родитель > Дочернее"}, как
+        Department.get_full_path(), но без запроса на каждого родителя.
+    """
+    departments = {
+        dept["id"]: dept for dept in Department.objects.values("id", "name", "parent_id")
+    }
+    paths = {}
+    for dept_id in departments:
+        names = []
+        current = departments.get(dept_id)
+        seen = set()
+        while current and current["id"] not in seen:
+            seen.add(current["id"])
+            names.insert(0, current["name"])
+            current = departments.get(current["parent_id"])
+        paths[dept_id] = " > ".join(names)
+    return paths
+
+
+def get_descendant_ids(department_ids):
+    """
+    Возвращает id подразделений вместе со всеми дочерними (на любую глубину).
+
+    Иерархия читается одним запросом вместо запроса children на каждое
+    подразделение.
+
+    Args:
+        department_ids: id корневых подразделений
+
+    Returns:
+        Список id без повторов в порядке обхода в глубину; id, которых нет
+        в таблице, пропускаются.
+    """
+    children_by_parent = defaultdict(list)
+    known_ids = set()
+    for dept_id, parent_id in Department.objects.order_by("name").values_list("id", "parent_id"):
+        children_by_parent[parent_id].append(dept_id)
+        known_ids.add(dept_id)
+    result = []
+    seen = set()
+    stack = list(reversed(list(department_ids)))
+    while stack:
+        dept_id = stack.pop()
+        if dept_id in seen or dept_id not in known_ids:
+            continue
+        seen.add(dept_id)
+        result.append(dept_id)
+        stack.extend(reversed(children_by_parent.get(dept_id, [])))
+    return result
+
+
+def get_department_tree_fingerprint():
+    """
+    Возвращает отпечаток данных, из которых строится дерево.
+
+    Один запрос с агрегатами (количество, максимальные id и updated_at) по трем
+    таблицам: любое добавление, изменение или удаление меняет отпечаток.
+    QuerySet.update() не обновляет auto_now поля, поэтому при массовых
+    изменениях updated_at нужно передавать явно.
+    """
+    parts = []
+    for model in (Department, Employee, WorkSchedule):
+        table = connection.ops.quote_name(model._meta.db_table)
+        parts.append(
+            f"(SELECT COUNT(*) FROM {table}), "
+            f"(SELECT MAX(id) FROM {table}), "
+            f"(SELECT MAX(updated_at) FROM {table})"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT " + ", ".join(parts))
+        row = cursor.fetchone()
+    raw = "|".join(str(value) for value in row)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def build_department_tree():
+    """
+    Собирает дерево корневых подразделений в формате DepartmentSerializer.
+
+    Returns:
+        Список словарей (корневые подразделения без исключенных) с вложенными
+        children и employees.
+    """
+    departments = list(
+        Department.objects.values("id", "name", "parent_id", "created_at", "updated_at")
+    )
+    employees = list(
+        Employee.objects.filter(department__isnull=False).values(
+            "id", "hikvision_id", "name", "position", "department_id", "department_old"
+        ).order_by("name")
+    )
+    # Первый график сотрудника в порядке Meta.ordering модели WorkSchedule
+    schedules = {}
+    for schedule in WorkSchedule.objects.order_by(*WorkSchedule._meta.ordering, "id"):
+        schedules.setdefault(schedule.employee_id, schedule)
+
+    departments_by_id = {dept["id"]: dept for dept in departments}
+    children_by_parent = defaultdict(list)
+    for dept in departments:
+        children_by_parent[dept["parent_id"]].append(dept)
+    employees_by_department = defaultdict(list)
+    for emp in employees:
+        employees_by_department[emp["department_id"]].append(emp)
+
+    full_paths = {}
+
+    def get_full_path(dept_id):
+        if dept_id in full_paths:
+            return full_paths[dept_id]
+        names = []
+        current = departments_by_id.get(dept_id)
+        seen = set()
+        while current and current["id"] not in seen:
+            seen.add(current["id"])
+            names.insert(0, current["name"])
+            current = departments_by_id.get(current["parent_id"])
+        full_paths[dept_id] = " > ".join(names)
+        return full_paths[dept_id]
+
+    def serialize_employee(emp):
+        schedule = schedules.get(emp["id"])
+        if emp["department_id"] in departments_by_id:
+            department_name = _strip_aup_prefix(get_full_path(emp["department_id"]))
+        elif emp["department_old"]:
+            department_name = _format_department_old(emp["department_old"])
+        else:
+            department_name = None
+        return {
+            "id": emp["id"],
+            "hikvision_id": emp["hikvision_id"],
+            "name": emp["name"],
+            "position": emp["position"],
+            "schedule_type": schedule.get_schedule_type_display() if schedule else None,
+            "schedule_description": schedule.get_schedule_display() if schedule else None,
+            "allowed_late_minutes": schedule.allowed_late_minutes if schedule else None,
+            "allowed_early_leave_minutes": schedule.allowed_early_leave_minutes if schedule else None,
+            "department_name": department_name,
+        }
+
+    def serialize_department(dept, path):
+        # path защищает от циклов в иерархии (parent ссылается на потомка)
+        parent = departments_by_id.get(dept["parent_id"])
+        children = sorted(children_by_parent.get(dept["id"], []), key=lambda d: d["name"])
+        return {
+            "id": dept["id"],
+            "name": dept["name"],
+            "parent": dept["parent_id"],
+            "parent_name": parent["name"] if parent else None,
+            "full_path": get_full_path(dept["id"]),
+            "employees": [serialize_employee(emp) for emp in employees_by_department.get(dept["id"], [])],
+            "children": [
+                serialize_department(child, path | {child["id"]})
+                for child in children
+                if child["id"] not in path
+            ],
+            "created_at": _datetime_field.to_representation(dept["created_at"]),
+            "updated_at": _datetime_field.to_representation(dept["updated_at"]),
+        }
+
+    roots = sorted(
+        (dept for dept in children_by_parent.get(None, []) if dept["name"] not in EXCLUDED_DEPARTMENTS),
+        key=lambda d: d["name"],
+    )
+    return [serialize_department(dept, {dept["id"]}) for dept in roots]
+
+
+def get_department_tree_json():
+    """
+    Возвращает (json_bytes, etag) для дерева подразделений.
+
+    Сборка дерева выполняется только при изменении отпечатка данных,
+    в остальных случаях JSON берется из кэша.
+    """
+    fingerprint = get_department_tree_fingerprint()
+    etag = f'"{fingerprint}"'
+    cache_key = _CACHE_KEY_PREFIX + fingerprint
+
+    content = cache.get(cache_key)
+    if content is None:
+        tree = build_department_tree()
+        content = json.dumps(tree, ensure_ascii=False, cls=DjangoJSONEncoder).encode("utf-8")
+        cache.set(cache_key, content, DEPARTMENT_TREE_CACHE_TIMEOUT)
+        logger.debug(f"Дерево подразделений пересобрано ({len(content)} байт)")
+
+    return content, etag
@@ -4,6 +4,8 @@
 import logging
 from datetime import timedelta
 from django.utils import timezone
+from . import metrics, presence
+from .compiled_schedules import select_schedule_version
 from .models import CameraEvent, EntryExit
 from .utils import clean_id
 
@@ -82,15 +84,17 @@ def process_single_camera_event(camera_event):
         if not (is_entry or is_exit):
             return
         
-        event_date = camera_event.event_time.date()
         event_time = camera_event.event_time
+        # Местная дата: сравнивается с entry_local_date (частичный индекс
+        # открытых сессий entryexit_open_session_idx)
+        event_date = timezone.localdate(event_time) if timezone.is_aware(event_time) else event_time.date()
         
         if is_entry:
             # Событие входа - создаем или обновляем запись EntryExit
             # Ищем существующую запись без выхода за этот день
             existing = EntryExit.objects.filter(
-                hikvision_id=clean_employee_id,
-                entry_time__date=event_date,
+                normalized_id=clean_employee_id,
+                entry_local_date=event_date,
                 exit_time__isnull=True
             ).order_by('entry_time').first()  # Берем самую раннюю запись
             
@@ -101,13 +105,15 @@ def process_single_camera_event(camera_event):
                     existing.entry_time = event_time
                     existing.device_name_entry = camera_event.device_name
                     existing.save()
+                    metrics.record_pairing("entry", event_time)
+                    presence.note_entry(existing)
                     logger.info(f"Обновлена запись EntryExit (более ранний вход) для сотрудника {clean_employee_id} на {event_date}: {event_time}")
                 else:
                     # Если новый вход позже существующего, не обновляем - сохраняем первый вход
                     logger.debug(f"Вход {event_time} позже существующего {existing.entry_time}, сохраняем первый вход")
             else:
                 # Создаем новую запись входа
-                EntryExit.objects.create(
+                entry_exit = EntryExit.objects.create(
                     hikvision_id=clean_employee_id,
                     entry_time=event_time,
                     exit_time=None,
@@ -115,6 +121,8 @@ def process_single_camera_event(camera_event):
                     device_name_exit=None,
                     work_duration_seconds=None,
                 )
+                metrics.record_pairing("entry", event_time)
+                presence.note_entry(entry_exit)
                 logger.info(f"Создана запись EntryExit (вход) для сотрудника {clean_employee_id} на {event_date}")
         
         elif is_exit:
@@ -128,7 +136,8 @@ def process_single_camera_event(camera_event):
             employee = Employee.objects.filter(hikvision_id=clean_employee_id).first()
             is_round_the_clock = False
             if employee:
-                schedule = employee.work_schedules.first()
+                # Версия графика, действующая на дату выхода
+                schedule = select_schedule_version(employee.work_schedules.all(), event_date)
                 if schedule and schedule.schedule_type == 'round_the_clock':
                     is_round_the_clock = True
             
@@ -139,39 +148,39 @@ def process_single_camera_event(camera_event):
             if is_round_the_clock:
                 # Для круглосуточных графиков сначала ищем за вчера (выход на следующий день после входа)
                 existing = EntryExit.objects.filter(
-                    hikvision_id=clean_employee_id,
-                    entry_time__date=yesterday,
+                    normalized_id=clean_employee_id,
+                    entry_local_date=yesterday,
                     exit_time__isnull=True
                 ).order_by('-entry_time').first()
                 
                 # Если не нашли за вчера, ищем за позавчера
                 if not existing:
                     existing = EntryExit.objects.filter(
-                        hikvision_id=clean_employee_id,
-                        entry_time__date=day_before_yesterday,
+                        normalized_id=clean_employee_id,
+                        entry_local_date=day_before_yesterday,
                         exit_time__isnull=True
                     ).order_by('-entry_time').first()
                 
                 # В последнюю очередь ищем за сегодня (на случай, если это не круглосуточный график)
                 if not existing:
                     existing = EntryExit.objects.filter(
-                        hikvision_id=clean_employee_id,
-                        entry_time__date=event_date,
+                        normalized_id=clean_employee_id,
+                        entry_local_date=event_date,
                         exit_time__isnull=True
                     ).order_by('-entry_time').first()
             else:
                 # Для обычных графиков: сначала ищем за сегодня
                 existing = EntryExit.objects.filter(
-                    hikvision_id=clean_employee_id,
-                    entry_time__date=event_date,
+                    normalized_id=clean_employee_id,
+                    entry_local_date=event_date,
                     exit_time__isnull=True
                 ).order_by('-entry_time').first()
                 
                 # Если не нашли за сегодня, ищем за вчера (для ночных смен)
                 if not existing:
                     existing = EntryExit.objects.filter(
-                        hikvision_id=clean_employee_id,
-                        entry_time__date=yesterday,
+                        normalized_id=clean_employee_id,
+                        entry_local_date=yesterday,
                         exit_time__isnull=True
                     ).order_by('-entry_time').first()
             
@@ -191,7 +200,9 @@ def process_single_camera_event(camera_event):
                         existing.device_name_exit = camera_event.device_name
                         existing.work_duration_seconds = int(duration.total_seconds())
                         existing.save()
-                        logger.info(f"Обновлена запись EntryExit (выход) для сотрудника {clean_employee_id} на {existing.entry_time.date()}, продолжительность: {hours_diff:.2f} часов")
+                        metrics.record_pairing("exit", event_time)
+                        presence.note_exit(existing)
+                        logger.info(f"Обновлена запись EntryExit (выход) для сотрудника {clean_employee_id} на {existing.entry_local_date}, продолжительность: {hours_diff:.2f} часов")
                     else:
                         logger.warning(f"Выход для сотрудника {clean_employee_id} отклонен: продолжительность {hours_diff:.2f} часов вне допустимого диапазона (0.5-{max_hours} часа)")
             else:
@@ -204,6 +215,7 @@ def process_single_camera_event(camera_event):
                     device_name_exit=camera_event.device_name,
                     work_duration_seconds=None,
                 )
+                metrics.record_pairing("exit_only", event_time)
                 logger.info(f"Создана запись EntryExit (только выход) для сотрудника {clean_employee_id} на {event_date}")
     
     except Exception as e:
@@ -0,0 +1,223 @@
+"""
+Объединение одинаковых выгрузок и ограничение числа одновременных выгрузок.
+
+Выгрузки Excel строят отчет по каждому сотруднику и собирают файл в
+openpyxl, поэтому несколько одновременных выгрузок занимают БД и потоки,
+которые нужны приему событий камер.
+
+Объединение (single-flight): одинаковые выгрузки, запрошенные пока первая
+еще выполняется (повторное нажатие "Экспорт", несколько пользователей с тем
+же периодом), не выполняются заново - они ждут первую и получают копию ее
+ответа. Ключ - имя выгрузки и параметры запроса (порядок параметров и
+значений, пустые значения не учитываются).
+
+Допуск: одновременно выполняется не больше EXPORT_MAX_CONCURRENT выгрузок,
+еще до EXPORT_QUEUE_SIZE ждут освобождения не дольше EXPORT_QUEUE_TIMEOUT
+секунд. Остальные сразу получают 429 с заголовком Retry-After. Объединенные
+запросы места в очереди не занимают, но их тоже не больше EXPORT_QUEUE_SIZE
+на выгрузку, и первую они ждут не дольше EXPORT_QUEUE_TIMEOUT секунд, иначе
+получают 429: зависшая выгрузка не занимает потоки без ограничения. Если
+первая выгрузка завершилась ошибкой, объединенные запросы получают 500.
+
+Ограничения действуют в пределах процесса: при нескольких воркерах
+gunicorn общее число выгрузок - EXPORT_MAX_CONCURRENT на воркер.
+"""
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionLimiter:
+    """Ограничение числа одновременных выполнений с очередью ограниченной длины."""
+
+    def __init__(self, max_concurrent, queue_size):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self._condition = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    def acquire(self, timeout):
+        """
+        Занимает место выполнения.
+
+        Returns:
+            True, если место получено; False, если очередь заполнена или
+            место не освободилось за timeout секунд.
+        """
+        with self._condition:
+            if self._running < self.max_concurrent:
+                self._running += 1
+                return True
+            if self._waiting >= self.queue_size:
+                return False
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + timeout
+                while self._running >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                self._running += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {"running": self._running, "waiting": self._waiting}
+
+
+class _SharedResponse:
+    """Ответ выгрузки, из которого для каждого запроса собирается свой HttpResponse."""
+
+    __slots__ = ("status", "headers", "content")
+
+    def __init__(self, response):
+        if getattr(response, "streaming", False):
+            self.content = b"".join(response.streaming_content)
+            # response.close() отправил бы request_finished посреди запроса
+            # (Django закрыл бы соединение с БД), поэтому закрываем только файл
+            file_to_stream = getattr(response, "file_to_stream", None)
+            if file_to_stream is not None:
+                file_to_stream.close()
+        else:
+            self.content = response.content
+        self.status = response.status_code
+        self.headers = [
+            (name, value) for name, value in response.items() if name.lower() != "content-length"
+        ]
+
+    def build(self):
+        response = HttpResponse(self.content, status=self.status)
+        for name, value in self.headers:
+            response[name] = value
+        return response
+
+
+class _Flight:
+    """Выполняющаяся выгрузка, результат которой ждут одинаковые запросы."""
+
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+limiter = AdmissionLimiter(
+    getattr(settings, "EXPORT_MAX_CONCURRENT", 2),
+    getattr(settings, "EXPORT_QUEUE_SIZE", 4),
+)
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def export_key(export_name, request):
+    """Ключ объединения: имя выгрузки и нормализованные параметры запроса."""
+    params = []
+    for name, values in request.GET.lists():
+        values = sorted(value.strip() for value in values if value.strip())
+        if values:
+            params.append((name, tuple(values)))
+    return export_name, tuple(sorted(params))
+
+
+def _export_failed(export_name):
+    logger.warning(f"Выгрузка {export_name} завершилась ошибкой, объединенный запрос получает 500")
+    return HttpResponse(
+        "Ошибка формирования выгрузки. Повторите запрос.",
+        status=500,
+        content_type="text/plain; charset=utf-8",
+    )
+
+
+def _too_many_requests(export_name):
+    retry_after = getattr(settings, "EXPORT_RETRY_AFTER", 30)
+    response = HttpResponse(
+        "Сервер занят формированием других выгрузок. Повторите запрос через минуту.",
+        status=429,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(retry_after)
+    logger.warning(f"Выгрузка {export_name} отклонена: {limiter.stats()}")
+    return response
+
+
+def heavy_export(export_name):
+    """
+    Декоратор действия ViewSet с тяжелой выгрузкой: объединение одинаковых
+    запросов и допуск через limiter (см. описание модуля).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            key = export_key(export_name, request)
+            queue_timeout = getattr(settings, "EXPORT_QUEUE_TIMEOUT", 30)
+            with _flights_lock:
+                flight = _flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _Flight()
+                    _flights[key] = flight
+                elif flight.followers >= limiter.queue_size:
+                    flight = None
+                else:
+                    flight.followers += 1
+
+            if flight is None:
+                metrics.record_export_admission(export_name, "rejected")
+                return _too_many_requests(export_name)
+
+            if not leader:
+                metrics.record_export_admission(export_name, "coalesced")
+                if not flight.done.wait(queue_timeout):
+                    with _flights_lock:
+                        flight.followers -= 1
+                    metrics.record_export_admission(export_name, "rejected")
+                    return _too_many_requests(export_name)
+                if flight.error is not None:
+                    # Исключение первой выгрузки не пробрасывается: его объект
+                    # (и __traceback__) общий для всех ожидающих потоков
+                    return _export_failed(export_name)
+                return flight.result.build()
+
+            try:
+                if limiter.acquire(queue_timeout):
+                    metrics.record_export_admission(export_name, "started")
+                    try:
+                        response = func(self, request, *args, **kwargs)
+                    finally:
+                        limiter.release()
+                else:
+                    metrics.record_export_admission(export_name, "rejected")
+                    response = _too_many_requests(export_name)
+                flight.result = _SharedResponse(response)
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with _flights_lock:
+                    del _flights[key]
+                flight.done.set()
+            if flight.followers:
+                logger.info(f"Выгрузка {export_name} отдана еще {flight.followers} одинаковым запросам")
+            return flight.result.build()
+        return wrapper
+    return decorator
@@ -0,0 +1,386 @@
+"""
+Разбор событий терминалов Hikvision.
+
+Поля события (ID сотрудника, имя, карта, устройство, время, IP камеры)
+описаны декларативными таблицами синонимов. Таблицы компилируются один раз
+в индекс "ключ -> (поле, приоритет)". Словарь события с числом ключей не
+больше числа синонимов в таблице (обычный AccessControllerEvent) обходится
+за один проход; в широком словаре (ключей больше, чем синонимов) значения
+ищутся прямыми обращениями по синонимам, это дешевле обхода всех ключей.
+Приоритеты повторяют прежний порядок "a.get(k1) or a.get(k2) or ...":
+берется первый синоним с непустым значением.
+
+Модуль используется при приеме событий (CameraEventViewSet.create),
+в админке и сериализаторах.
+"""
+import logging
+from datetime import datetime
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Синонимы полей во вложенном AccessControllerEvent (в порядке приоритета)
+ACCESS_EVENT_FIELDS = {
+    "hikvision_id": (
+        "employeeId", "employeeID", "employeeNo", "employeeNoString", "employee_id", "Employee ID",
+        "cardNo", "cardNumber", "cardReaderNo", "doorNo", "door",
+    ),
+    # ID сотрудника без номеров карт и дверей (для отображения)
+    "employee_no": ("employeeId", "employeeID", "employeeNo", "employeeNoString"),
+    "employee_name": ("employeeName", "name", "employeeNameString", "employee_name", "Name"),
+    "card_no": ("cardNo", "cardNumber", "card", "Card No.", "card_no"),
+    "device_name": ("deviceName", "door", "doorName", "doorNo", "Door", "device_name"),
+    "event_time_raw": ("time", "dateTime", "eventTime", "Time", "event_time"),
+    "event_type": ("eventType", "eventTypes", "eventDescription", "event"),
+    "camera_ip": ("ipAddress", "remoteHostAddr", "ip"),
+    # Порядковый номер события на терминале (повторная отправка сохраняет номер)
+    "serial_no": ("serialNo",),
+}
+
+# Ключи, наличие которых отличает событие сотрудника от служебного
+EMPLOYEE_DATA_KEYS = (
+    "employeeId", "employeeID", "employeeNo", "employeeNoString", "name", "employeeName", "employeeNameString",
+)
+
+# Синонимы во внешнем объекте AccessControllerEvent (время ищется сначала здесь)
+OUTER_EVENT_FIELDS = {
+    "event_time_raw": ("dateTime", "time", "eventTime"),
+    "camera_ip": ("ipAddress", "remoteHostAddr", "ip"),
+}
+
+# Синонимы для событий без AccessControllerEvent (поля на верхнем уровне)
+DIRECT_EVENT_FIELDS = {
+    "hikvision_id": ("cardNo", "employeeNo", "employeeNoString", "cardReaderNo", "doorNo"),
+    "employee_name": ("employeeName", "name", "employeeNameString", "employee_name", "Name"),
+    "event_type": ("eventType", "eventTypes", "eventDescription", "event"),
+    "camera_ip": ("ipAddress", "remoteHostAddr", "ip"),
+}
+
+# Верхний уровень события с AccessControllerEvent (последний вариант для времени и IP)
+TOP_LEVEL_FIELDS = {
+    "event_time_raw": ("dateTime", "time"),
+    "camera_ip": ("ipAddress", "remoteHostAddr", "ip"),
+}
+
+# Форматы времени, которые не разбирает datetime.fromisoformat
+EVENT_TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S.%f",
+)
+
+# Причины, по которым событие не сохраняется
+DISCARD_INVALID = "invalid"
+DISCARD_HEARTBEAT = "heartbeat"
+DISCARD_NO_EMPLOYEE = "no_employee"
+
+EXIT_CAMERA_IP = "192.168.1.143"
+ENTRY_CAMERA_IP = "192.168.1.124"
+_EXIT_WORDS = ("выход", "exit", "выходная", "выход 1", "выход1", "143")
+_ENTRY_WORDS = ("вход", "entry", "входная", "вход 1", "вход1", "124")
+
+# Формат времени, который последним сработал для устройства (ключ - IP или имя)
+_ISO_FORMAT = "iso"
+_device_time_formats = {}
+_DEVICE_FORMAT_CACHE_SIZE = 1024
+
+
+def compile_field_table(fields):
+    """
+    Компилирует таблицу синонимов.
+
+    Returns:
+        (имена полей, индекс ключ -> ((номер поля, приоритет), ...), синонимы по полям)
+    """
+    names = tuple(fields)
+    index = {}
+    for slot, name in enumerate(names):
+        for priority, key in enumerate(fields[name]):
+            index.setdefault(key, []).append((slot, priority))
+    aliases = tuple((name, tuple(fields[name])) for name in names)
+    return names, {key: tuple(targets) for key, targets in index.items()}, aliases
+
+
+_ACCESS_TABLE = compile_field_table(ACCESS_EVENT_FIELDS)
+_OUTER_TABLE = compile_field_table(OUTER_EVENT_FIELDS)
+_DIRECT_TABLE = compile_field_table(DIRECT_EVENT_FIELDS)
+_TOP_LEVEL_TABLE = compile_field_table(TOP_LEVEL_FIELDS)
+
+
+def resolve_fields(mapping, table):
+    """
+    Для каждого поля таблицы возвращает значение синонима с наивысшим
+    приоритетом среди непустых.
+
+    Если ключей в словаре больше, чем синонимов в таблице, выполняются прямые
+    обращения по синонимам, иначе словарь обходится за один проход.
+    """
+    names, index, aliases = table
+    if len(index) < len(mapping):
+        values = {}
+        for name, keys in aliases:
+            value = None
+            for key in keys:
+                value = mapping.get(key)
+                if value:
+                    break
+            values[name] = value or None
+        return values
+
+    values = [None] * len(names)
+    priorities = [None] * len(names)
+    for key, value in mapping.items():
+        targets = index.get(key)
+        if targets is None or not value:
+            continue
+        for slot, priority in targets:
+            if priorities[slot] is None or priority < priorities[slot]:
+                priorities[slot] = priority
+                values[slot] = value
+    return dict(zip(names, values))
+
+
+def split_access_event(event_data):
+    """
+    Возвращает (outer_event, access_event) из данных события.
+
+    Терминалы присылают как {"AccessControllerEvent": {...}}, так и двойную
+    вложенность {"AccessControllerEvent": {"AccessControllerEvent": {...}}}.
+    Если AccessControllerEvent отсутствует, возвращает (None, None).
+    """
+    if not isinstance(event_data, dict) or "AccessControllerEvent" not in event_data:
+        return None, None
+    outer_event = event_data["AccessControllerEvent"]
+    if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
+        return outer_event, outer_event["AccessControllerEvent"]
+    return outer_event, outer_event
+
+
+class ParsedEvent:
+    """Результат разбора события камеры."""
+
+    __slots__ = (
+        "hikvision_id",
+        "employee_no",
+        "employee_name",
+        "card_no",
+        "device_name",
+        "event_type",
+        "sub_event_type",
+        "major_event_type",
+        "camera_ip",
+        "serial_no",
+        "event_time_raw",
+        "event_time",
+        "event_time_fallback",
+        "discard_reason",
+        "has_access_event",
+    )
+
+    def __init__(self):
+        self.hikvision_id = None
+        self.employee_no = None
+        self.employee_name = None
+        self.card_no = None
+        self.device_name = None
+        self.event_type = None
+        self.sub_event_type = None
+        self.major_event_type = None
+        self.camera_ip = None
+        self.serial_no = None
+        self.event_time_raw = None
+        self.event_time = None
+        # True, если время не удалось взять из данных и подставлено now()
+        self.event_time_fallback = False
+        self.discard_reason = None
+        self.has_access_event = False
+
+    @property
+    def direction(self):
+        """Тип события по IP камеры или названию устройства: "Вход", "Выход" или "Событие"."""
+        if self.camera_ip:
+            camera_ip = str(self.camera_ip)
+            if EXIT_CAMERA_IP in camera_ip:
+                return "Выход"
+            if ENTRY_CAMERA_IP in camera_ip:
+                return "Вход"
+        device_name = str(self.device_name or "").lower()
+        if any(word in device_name for word in _EXIT_WORDS):
+            return "Выход"
+        if any(word in device_name for word in _ENTRY_WORDS):
+            return "Вход"
+        return "Событие"
+
+    def __repr__(self):
+        return (
+            f"ParsedEvent(hikvision_id={self.hikvision_id!r}, employee_name={self.employee_name!r}, "
+            f"event_time={self.event_time!r}, discard_reason={self.discard_reason!r})"
+        )
+
+
+def _is_heartbeat(value):
+    return isinstance(value, str) and "heart" in value.lower()
+
+
+def _has_employee_data(access_event):
+    for key in EMPLOYEE_DATA_KEYS:
+        if access_event.get(key):
+            return True
+    return False
+
+
+def _has_name(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def parse_event_payload(event_data, for_display=False):
+    """
+    Разбирает данные события (event_log или JSON тело запроса).
+
+    Args:
+        event_data: Словарь события
+        for_display: Режим отображения сохраненного события: время не
+            разбирается, поля заполняются и для отбрасываемых событий
+
+    Returns:
+        ParsedEvent. Если discard_reason не пустой, событие не сохраняется
+        (heartbeat, нет имени сотрудника или некорректная структура).
+    """
+    parsed = ParsedEvent()
+
+    if isinstance(event_data, dict) and "AccessControllerEvent" in event_data:
+        outer_event, access_event = split_access_event(event_data)
+        parsed.has_access_event = True
+        if not isinstance(access_event, dict):
+            parsed.discard_reason = DISCARD_INVALID
+            return parsed
+
+        # Служебные события (heartBeat) пропускаем; сохраняются события
+        # аутентификации по лицу и события с данными о сотруднике
+        parsed.sub_event_type = access_event.get("subEventType")
+        parsed.major_event_type = access_event.get("majorEventType")
+        if _is_heartbeat(access_event.get("eventType")) or _is_heartbeat(access_event.get("eventDescription")):
+            parsed.discard_reason = DISCARD_HEARTBEAT
+        elif parsed.sub_event_type != 75 and not _has_employee_data(access_event):
+            parsed.discard_reason = DISCARD_NO_EMPLOYEE
+        if parsed.discard_reason and not for_display:
+            return parsed
+
+        fields = resolve_fields(access_event, _ACCESS_TABLE)
+        if parsed.sub_event_type == 75:
+            parsed.event_type = "Authenticated via Face"
+        else:
+            parsed.event_type = fields["event_type"]
+        parsed.employee_no = fields["employee_no"]
+        parsed.hikvision_id = fields["hikvision_id"]
+        if not parsed.hikvision_id and access_event.get("id") is not None:
+            parsed.hikvision_id = str(access_event["id"])
+        parsed.employee_name = fields["employee_name"]
+        parsed.card_no = fields["card_no"]
+        parsed.device_name = fields["device_name"]
+        parsed.serial_no = fields["serial_no"]
+
+        # Время ищется сначала во внешнем объекте (при одинарной вложенности
+        # это тот же словарь, но с другим порядком синонимов)
+        outer_fields = resolve_fields(outer_event, _OUTER_TABLE) if isinstance(outer_event, dict) else {}
+        parsed.event_time_raw = outer_fields.get("event_time_raw") or fields["event_time_raw"]
+        parsed.camera_ip = fields["camera_ip"] or outer_fields.get("camera_ip")
+        if not parsed.event_time_raw or not parsed.camera_ip:
+            top_fields = resolve_fields(event_data, _TOP_LEVEL_TABLE)
+            parsed.event_time_raw = parsed.event_time_raw or top_fields["event_time_raw"]
+            parsed.camera_ip = parsed.camera_ip or top_fields["camera_ip"]
+    else:
+        if not isinstance(event_data, dict):
+            parsed.discard_reason = DISCARD_INVALID
+            return parsed
+        fields = resolve_fields(event_data, _DIRECT_TABLE)
+        parsed.event_type = fields["event_type"]
+        parsed.employee_name = fields["employee_name"]
+        parsed.hikvision_id = fields["hikvision_id"] or str(event_data.get("id", ""))
+        parsed.device_name = event_data.get("deviceName")
+        parsed.event_time_raw = event_data.get("dateTime")
+        parsed.camera_ip = fields["camera_ip"]
+
+        if parsed.event_type:
+            if _is_heartbeat(str(parsed.event_type)):
+                parsed.discard_reason = DISCARD_HEARTBEAT
+        elif not _has_name(parsed.employee_name):
+            if any(_is_heartbeat(value) for value in event_data.values()):
+                parsed.discard_reason = DISCARD_HEARTBEAT
+
+    # Имя сотрудника обязательно для сохранения
+    if not parsed.discard_reason and not _has_name(parsed.employee_name):
+        parsed.discard_reason = DISCARD_NO_EMPLOYEE
+
+    if not parsed.discard_reason and not for_display:
+        event_time = _parse_event_time(parsed.event_time_raw, parsed.camera_ip or parsed.device_name)
+        parsed.event_time_fallback = event_time is None
+        parsed.event_time = timezone.now() if event_time is None else event_time
+    return parsed
+
+
+def _parse_with_format(value, fmt):
+    if fmt == _ISO_FORMAT:
+        # Быстрый путь только для полной даты со временем: fromisoformat
+        # принимает и просто дату, которую прежние форматы отвергали
+        if len(value) < 19 or value[10] not in "T ":
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, fmt)
+
+
+def parse_event_time(value, device_key=None):
+    """
+    Разбирает время события камеры в aware datetime.
+
+    Сначала пробуется формат, который последним сработал для устройства
+    (device_key - IP или имя устройства), затем datetime.fromisoformat,
+    затем форматы EVENT_TIME_FORMATS. Наивное время считается локальным
+    (TIME_ZONE). Если разобрать не удалось, возвращается текущее время.
+    """
+    event_time = _parse_event_time(value, device_key)
+    return timezone.now() if event_time is None else event_time
+
+
+def _parse_event_time(value, device_key):
+    """Как parse_event_time, но возвращает None, если время не определено."""
+    if isinstance(value, datetime):
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+    if not isinstance(value, str) or not value:
+        return None
+
+    cached = _device_time_formats.get(device_key) if device_key is not None else None
+    candidates = (_ISO_FORMAT,) + EVENT_TIME_FORMATS
+    if cached is not None:
+        candidates = (cached,) + tuple(fmt for fmt in candidates if fmt != cached)
+
+    for fmt in candidates:
+        try:
+            parsed = _parse_with_format(value, fmt)
+        except ValueError:
+            continue
+        if device_key is not None and fmt != cached:
+            if len(_device_time_formats) >= _DEVICE_FORMAT_CACHE_SIZE:
+                _device_time_formats.clear()
+            _device_time_formats[device_key] = fmt
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    logger.warning(f"Could not parse event_time '{value}', using current time")
+    return None
+
+
+def get_parsed_event(camera_event):
+    """
+    Возвращает ParsedEvent для сохраненного CameraEvent (без разбора времени).
+
+    Результат кэшируется на экземпляре, поэтому несколько колонок админки
+    или полей сериализатора разбирают raw_data один раз.
+    """
+    parsed = getattr(camera_event, "_parsed_event", None)
+    if parsed is None:
+        parsed = parse_event_payload(camera_event.raw_data or {}, for_display=True)
+        camera_event._parsed_event = parsed
+    return parsed
@@ -0,0 +1,198 @@
+"""
+Учет ID сотрудников, замеченных камерами (SeenIdentity).
+
+Выгрузка сотрудников добавляет к таблице Employee тех, кого камеры видели,
+но кто еще не заведен. Вместо просмотра всей истории CameraEvent ID (без
+ведущих нулей), имя и время события записываются в SeenIdentity при приеме,
+и выгрузка читает только эту таблицу.
+
+Чтобы не писать в БД на каждое событие, процесс помнит недавно записанные
+ID: повторная запись выполняется, если изменилось имя или по времени
+событий прошло CAMERA_SEEN_IDENTITY_REFRESH_SECONDS.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Min
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .hikvision_parser import get_parsed_event, parse_event_payload
+from .models import CameraEvent, SeenIdentity
+from .utils import clean_id
+
+logger = logging.getLogger(__name__)
+
+SEEN_CACHE_SIZE = 10000
+UPSERT_BATCH_SIZE = 500
+
+
+class SeenCache:
+    """Потокобезопасный LRU: ID -> (имя, время последнего записанного события)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def needs_write(self, hikvision_id, name, seen_at, refresh_seconds):
+        with self._lock:
+            entry = self._items.get(hikvision_id)
+            if entry is not None:
+                self._items.move_to_end(hikvision_id)
+        if entry is None:
+            return True
+        cached_name, cached_seen = entry
+        if name and name != cached_name:
+            return True
+        return seen_at - cached_seen >= timedelta(seconds=refresh_seconds)
+
+    def remember(self, hikvision_id, name, seen_at):
+        with self._lock:
+            entry = self._items.get(hikvision_id)
+            if entry is not None:
+                name = name or entry[0]
+                seen_at = max(seen_at, entry[1])
+            self._items[hikvision_id] = (name, seen_at)
+            self._items.move_to_end(hikvision_id)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+seen_cache = SeenCache(SEEN_CACHE_SIZE)
+
+
+def _upsert_sql(connection, rows):
+    """
+    INSERT ... ON CONFLICT для SeenIdentity: first_seen/last_seen только
+    расширяются, имя берется из более позднего события.
+    """
+    quote = connection.ops.quote_name
+    table = quote(SeenIdentity._meta.db_table)
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * rows)
+    return (
+        f"INSERT INTO {table} (hikvision_id, employee_name, first_seen, last_seen, updated_at) "
+        f"VALUES {placeholders} "
+        f"ON CONFLICT (hikvision_id) DO UPDATE SET "
+        f"employee_name = CASE WHEN excluded.employee_name IS NOT NULL "
+        f"AND excluded.last_seen >= {table}.last_seen "
+        f"THEN excluded.employee_name ELSE {table}.employee_name END, "
+        f"first_seen = CASE WHEN excluded.first_seen < {table}.first_seen "
+        f"THEN excluded.first_seen ELSE {table}.first_seen END, "
+        f"last_seen = CASE WHEN excluded.last_seen > {table}.last_seen "
+        f"THEN excluded.last_seen ELSE {table}.last_seen END, "
+        f"updated_at = excluded.updated_at"
+    )
+
+
+def upsert_seen_identities(identities, using="default"):
+    """
+    Записывает ID в SeenIdentity.
+
+    Args:
+        identities: Словарь ID -> (имя, first_seen, last_seen)
+        using: Псевдоним БД
+    """
+    connection = connections[using]
+    field = SeenIdentity._meta.get_field("last_seen")
+    now = field.get_db_prep_save(timezone.now(), connection)
+    items = list(identities.items())
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        batch = items[start:start + UPSERT_BATCH_SIZE]
+        params = []
+        for hikvision_id, (name, first_seen, last_seen) in batch:
+            params.extend([
+                hikvision_id,
+                name[:255] if name else None,
+                field.get_db_prep_save(first_seen, connection),
+                field.get_db_prep_save(last_seen, connection),
+                now,
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute(_upsert_sql(connection, len(batch)), params)
+
+
+def note_seen_identity(camera_event):
+    """Отмечает ID из созданного события камеры (вызывается из signals.py)."""
+    hikvision_id = clean_id(camera_event.hikvision_id)
+    if not hikvision_id:
+        return
+    name = get_parsed_event(camera_event).employee_name or None
+    seen_at = camera_event.event_time or timezone.now()
+    refresh_seconds = getattr(settings, "CAMERA_SEEN_IDENTITY_REFRESH_SECONDS", 15 * 60)
+    if not seen_cache.needs_write(hikvision_id, name, seen_at, refresh_seconds):
+        return
+    # Отдельная точка сохранения: ошибка не должна прерывать транзакцию
+    # переноса событий из spool
+    with transaction.atomic():
+        upsert_seen_identities({hikvision_id: (name, seen_at, seen_at)})
+    seen_cache.remember(hikvision_id, name, seen_at)
+
+
+def collect_seen_identities(queryset):
+    """
+    Собирает ID из событий камер: ID -> (имя последнего события, первое, последнее время).
+
+    На PostgreSQL последнее событие каждого ID выбирается через DISTINCT ON,
+    поэтому raw_data читается по одной строке на ID, а не по всей истории.
+    """
+    # Время события может быть пустым - тогда используется время записи
+    queryset = queryset.exclude(hikvision_id__isnull=True).exclude(hikvision_id="").annotate(
+        seen_at=Coalesce("event_time", "created_at")
+    )
+    first_seen = dict(
+        queryset.order_by().values("hikvision_id").annotate(first=Min("seen_at")).values_list("hikvision_id", "first")
+    )
+
+    latest = queryset.order_by("hikvision_id", "-seen_at")
+    if connections[queryset.db].vendor == "postgresql":
+        latest = latest.distinct("hikvision_id")
+
+    identities = {}
+    previous_id = None
+    for row in latest.values("hikvision_id", "seen_at", "raw_data").iterator(chunk_size=2000):
+        if row["hikvision_id"] == previous_id:
+            continue
+        previous_id = row["hikvision_id"]
+        hikvision_id = clean_id(previous_id)
+        name = parse_event_payload(row["raw_data"] or {}, for_display=True).employee_name or None
+        first = first_seen[previous_id]
+        last = row["seen_at"]
+
+        # "001" и "1" - один сотрудник
+        if hikvision_id in identities:
+            known_name, known_first, known_last = identities[hikvision_id]
+            if last < known_last:
+                name = known_name or name
+            else:
+                name = name or known_name
+            first = min(first, known_first)
+            last = max(last, known_last)
+        identities[hikvision_id] = (name, first, last)
+    return identities
+
+
+def rebuild_seen_identities(queryset=None):
+    """
+    Заполняет SeenIdentity по истории событий (команда rebuild_seen_identities).
+    Существующие записи объединяются, а не заменяются: ID из уже
+    заархивированных событий сохраняются.
+
+    Returns:
+        Количество найденных ID.
+    """
+    if queryset is None:
+        queryset = CameraEvent.objects.all()
+    identities = collect_seen_identities(queryset)
+    upsert_seen_identities(identities, using=queryset.db)
+    seen_cache.clear()
+    logger.info(f"SeenIdentity: обработано ID: {len(identities)}")
+    return len(identities)
@@ -1,16 +1,31 @@
 """
 Утилита для импорта и экспорта сотрудников из/в Excel файлы.
 """
+import logging
 import os
+import re
 import django
+from datetime import timedelta
 from openpyxl import load_workbook, Workbook
 from django.db import transaction
+from django.utils import timezone
 
 # Настройка Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hikvision_project.settings')
 django.setup()
 
-from .models import Employee, Department, WorkSchedule, CameraEvent
+from .models import Employee, Department, WorkSchedule, SeenIdentity
+from .department_tree import get_department_paths
+
+logger = logging.getLogger(__name__)
+
+# Количество строк файла в одной пачке (одна транзакция)
+IMPORT_BATCH_SIZE = 500
+EMPLOYEE_UPDATE_FIELDS = ['name', 'department', 'position', 'updated_at']
+SCHEDULE_FIELDS = (
+    'schedule_type', 'start_time', 'end_time', 'description',
+    'allowed_late_minutes', 'allowed_early_leave_minutes',
+)
 
 
 def clean_id(id_str):
@@ -112,14 +127,407 @@ def parse_schedule_type(schedule_type_str):
         return 'regular'
 
 
-def import_employees_from_excel(file_path, update_existing=True):
+def replace_current_schedule(employee, **fields):
+    """
+    Устанавливает новый график сотрудника с сохранением истории версий.
+    
+    - если графиков еще нет, создается версия без нижней границы (действует всегда);
+    - если текущий график совпадает с новым, ничего не меняется;
+    - если текущая версия начинается сегодня (повторный импорт), она обновляется;
+    - иначе текущая версия закрывается вчерашним днем и создается новая с сегодняшнего дня.
+    
+    Возвращает действующую версию графика.
+    """
+    today = timezone.localdate()
+    open_versions = list(WorkSchedule.objects.filter(employee=employee, valid_to__isnull=True))
+    
+    if not open_versions:
+        if WorkSchedule.objects.filter(employee=employee).exists():
+            return WorkSchedule.objects.create(employee=employee, valid_from=today, **fields)
+        return WorkSchedule.objects.create(employee=employee, **fields)
+    
+    current = open_versions[0]
+    if all(getattr(current, name) == value for name, value in fields.items()) and len(open_versions) == 1:
+        return current
+    
+    if current.valid_from and current.valid_from >= today:
+        for name, value in fields.items():
+            setattr(current, name, value)
+        current.save()
+        versions_to_close = open_versions[1:]
+    else:
+        current = None
+        versions_to_close = open_versions
+    
+    for version in versions_to_close:
+        if version.valid_from and version.valid_from >= today:
+            # Версия еще не начала действовать - заменяется новой
+            version.delete()
+        else:
+            version.valid_to = today - timedelta(days=1)
+            version.save(update_fields=['valid_to', 'updated_at'])
+    
+    if current is None:
+        current = WorkSchedule.objects.create(employee=employee, valid_from=today, **fields)
+    return current
+
+
+class ImportRowError(ValueError):
+    """Ошибка данных в строке файла импорта."""
+
+
+class EmployeeImportRow:
+    """Разобранная строка файла импорта (до записи в БД)."""
+    __slots__ = ('row_num', 'hikvision_id', 'name', 'department_path', 'position', 'schedule')
+
+    def __init__(self, row_num, hikvision_id, name, department_path, position, schedule):
+        self.row_num = row_num
+        self.hikvision_id = hikvision_id
+        self.name = name
+        # Кортеж имен уровней иерархии или None
+        self.department_path = department_path
+        self.position = position
+        # Поля WorkSchedule или None, если график в строке не указан
+        self.schedule = schedule
+
+
+def parse_department_path(dept_name):
+    """
+    Разбирает подразделение 'A > B > C' в кортеж ('A', 'B', 'C').
+    Пустые промежуточные уровни пропускаются, пустой последний уровень - None
+    (как в get_or_create_department).
+    """
+    if not dept_name:
+        return None
+    dept_name = str(dept_name).strip()
+    if not dept_name:
+        return None
+    if ' > ' not in dept_name:
+        return (dept_name,)
+    parts = dept_name.split(' > ')
+    if not parts[-1].strip():
+        return None
+    return tuple(part.strip() for part in parts if part.strip())
+
+
+def _parse_minutes(value):
+    try:
+        return int(value) if value else 0
+    except (ValueError, TypeError):
+        return 0
+
+
+def parse_employee_row(row_num, row):
+    """
+    Разбирает строку Excel без обращения к БД.
+    
+    Возвращает EmployeeImportRow, None для пустой строки или выбрасывает
+    ImportRowError, если нет обязательных полей.
+    """
+    if not row or not any(row):
+        return None
+    
+    def cell(index):
+        return row[index] if len(row) > index else None
+    
+    employee_id_raw = cell(0)
+    name = cell(1)
+    position = cell(3)
+    schedule_type_str = cell(4)
+    schedule_str = cell(5)
+    
+    if not employee_id_raw:
+        raise ImportRowError("Отсутствует Employee ID")
+    if not name:
+        raise ImportRowError("Отсутствует имя сотрудника")
+    
+    # Нормализация как в Employee.save() (bulk_create его не вызывает)
+    name = str(name).strip().replace('\n', ' ').replace('\r', ' ')
+    name = re.sub(r'\s+', ' ', name).strip()
+    
+    schedule = None
+    if schedule_type_str or schedule_str:
+        schedule_type = parse_schedule_type(schedule_type_str)
+        start_time = None
+        end_time = None
+        description = None
+        if schedule_str:
+            schedule_str = str(schedule_str).strip()
+            if schedule_type == 'regular' and ('-' in schedule_str or ':' in schedule_str):
+                start_time, end_time = parse_time_string(schedule_str)
+                if start_time and end_time:
+                    description = f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}"
+            else:
+                description = schedule_str
+        schedule = {
+            'schedule_type': schedule_type,
+            'start_time': start_time,
+            'end_time': end_time,
+            'description': description,
+            'allowed_late_minutes': _parse_minutes(cell(6)),
+            'allowed_early_leave_minutes': _parse_minutes(cell(7)),
+        }
+    
+    return EmployeeImportRow(
+        row_num=row_num,
+        hikvision_id=clean_id(employee_id_raw),
+        name=name,
+        department_path=parse_department_path(cell(2)),
+        position=str(position).strip() if position else None,
+        schedule=schedule,
+    )
+
+
+class DepartmentTrie:
+    """
+    Дерево подразделений в памяти: (parent_id, имя) -> id.
+    
+    Строится одним запросом. Недостающие уровни путей создаются bulk_create
+    (один запрос на уровень иерархии) и добавляются в дерево только после
+    успешной записи.
+    """
+    
+    def __init__(self):
+        self.children = {}
+        # Имя -> первое подразделение с таким именем (для путей без иерархии)
+        self.by_name = {}
+        for dept_id, name, parent_id in Department.objects.order_by('id').values_list('id', 'name', 'parent_id'):
+            self._add(dept_id, name, parent_id)
+    
+    def _add(self, dept_id, name, parent_id):
+        self.children.setdefault((parent_id, name), dept_id)
+        self.by_name.setdefault(name, dept_id)
+    
+    def lookup(self, path):
+        """
+        Возвращает id подразделения по пути или None.
+        Имя без иерархии, как и раньше, находит подразделение с таким именем
+        на любом уровне (корневое - в первую очередь).
+        """
+        if len(path) == 1:
+            return self.children.get((None, path[0])) or self.by_name.get(path[0])
+        parent_id = None
+        for name in path:
+            parent_id = self.children.get((parent_id, name))
+            if parent_id is None:
+                return None
+        return parent_id
+    
+    def resolve(self, paths):
+        """Возвращает словарь путь -> id, создавая недостающие подразделения."""
+        paths = set(paths)
+        missing = [path for path in paths if self.lookup(path) is None]
+        if missing:
+            self._create(missing)
+        return {path: self.lookup(path) for path in paths}
+    
+    def _create(self, paths):
+        created = {}
+        
+        def node_id(parent_id, name):
+            key = (parent_id, name)
+            return self.children.get(key) or created.get(key)
+        
+        with transaction.atomic():
+            for level in range(max(len(path) for path in paths)):
+                new_departments = {}
+                for path in paths:
+                    if len(path) <= level:
+                        continue
+                    parent_id = None
+                    for name in path[:level]:
+                        parent_id = node_id(parent_id, name)
+                    key = (parent_id, path[level])
+                    if node_id(*key) is None and key not in new_departments:
+                        new_departments[key] = Department(name=path[level], parent_id=parent_id)
+                if not new_departments:
+                    continue
+                Department.objects.bulk_create(new_departments.values())
+                for key, department in new_departments.items():
+                    created[key] = department.pk
+        
+        for (parent_id, name), dept_id in created.items():
+            self._add(dept_id, name, parent_id)
+        logger.info(f"Импорт сотрудников: создано подразделений: {len(created)}")
+
+
+def replace_current_schedules(schedules):
+    """
+    Пакетный вариант replace_current_schedule с теми же правилами версий.
+    
+    Args:
+        schedules: Словарь employee_id -> поля графика
+    
+    Версии читаются одним запросом, изменения записываются bulk-запросами.
+    bulk_update не заполняет auto_now, поэтому updated_at передается явно
+    (от него зависят кэши скомпилированных графиков и дерева подразделений).
+    """
+    if not schedules:
+        return
+    today = timezone.localdate()
+    now = timezone.now()
+    
+    history = {}
+    queryset = WorkSchedule.objects.filter(employee_id__in=list(schedules)).order_by(*WorkSchedule._meta.ordering, 'id')
+    for schedule in queryset:
+        history.setdefault(schedule.employee_id, []).append(schedule)
+    
+    to_create = []
+    to_update = []
+    to_close = []
+    to_delete = []
+    for employee_id, fields in schedules.items():
+        versions = history.get(employee_id, [])
+        open_versions = [version for version in versions if version.valid_to is None]
+        
+        if not open_versions:
+            to_create.append(WorkSchedule(employee_id=employee_id, valid_from=today if versions else None, **fields))
+            continue
+        
+        current = open_versions[0]
+        if len(open_versions) == 1 and all(getattr(current, name) == value for name, value in fields.items()):
+            continue
+        
+        if current.valid_from and current.valid_from >= today:
+            for name, value in fields.items():
+                setattr(current, name, value)
+            current.updated_at = now
+            to_update.append(current)
+            versions_to_close = open_versions[1:]
+        else:
+            to_create.append(WorkSchedule(employee_id=employee_id, valid_from=today, **fields))
+            versions_to_close = open_versions
+        
+        for version in versions_to_close:
+            if version.valid_from and version.valid_from >= today:
+                to_delete.append(version.pk)
+            else:
+                version.valid_to = today - timedelta(days=1)
+                version.updated_at = now
+                to_close.append(version)
+    
+    if to_delete:
+        WorkSchedule.objects.filter(pk__in=to_delete).delete()
+    if to_close:
+        WorkSchedule.objects.bulk_update(to_close, ['valid_to', 'updated_at'])
+    if to_update:
+        WorkSchedule.objects.bulk_update(to_update, list(SCHEDULE_FIELDS) + ['updated_at'])
+    if to_create:
+        WorkSchedule.objects.bulk_create(to_create)
+
+
+def _upsert_batch(rows, department_ids, update_existing):
+    """
+    Записывает пачку строк: upsert сотрудников и замена графиков.
+    
+    Returns:
+        (created, updated) - счетчики по строкам файла.
+    """
+    # Повторы ID в пачке: действует последняя строка (ON CONFLICT не
+    # допускает двух изменений одной строки в одном INSERT)
+    unique_rows = {}
+    for row in rows:
+        unique_rows[row.hikvision_id] = row
+    
+    existing = dict(
+        Employee.objects.filter(hikvision_id__in=list(unique_rows)).values_list('hikvision_id', 'position')
+    )
+    
+    employees = []
+    for hikvision_id, row in unique_rows.items():
+        if hikvision_id in existing and not update_existing:
+            continue
+        employees.append(Employee(
+            hikvision_id=hikvision_id,
+            name=row.name,
+            department_id=department_ids.get(row.department_path) if row.department_path else None,
+            # Пустая должность в файле не затирает сохраненную
+            position=row.position or existing.get(hikvision_id),
+        ))
+    if employees:
+        Employee.objects.bulk_create(
+            employees,
+            update_conflicts=True,
+            unique_fields=['hikvision_id'],
+            update_fields=EMPLOYEE_UPDATE_FIELDS,
+        )
+    
+    schedule_rows = {hikvision_id: row.schedule for hikvision_id, row in unique_rows.items() if row.schedule}
+    if schedule_rows:
+        employee_ids = dict(
+            Employee.objects.filter(hikvision_id__in=list(schedule_rows)).values_list('hikvision_id', 'id')
+        )
+        # Графики заменяются с сегодняшнего дня, прошлые периоды пересчитываются по прежним
+        replace_current_schedules({
+            employee_ids[hikvision_id]: schedule for hikvision_id, schedule in schedule_rows.items()
+        })
+    
+    created = 0
+    updated = 0
+    known = set(existing)
+    for row in rows:
+        if row.hikvision_id not in known:
+            created += 1
+            known.add(row.hikvision_id)
+        elif update_existing:
+            updated += 1
+    return created, updated
+
+
+def _write_batch(rows, trie, update_existing, results):
+    """
+    Записывает пачку в отдельной транзакции. При ошибке пачка повторяется
+    построчно, чтобы ошибка одной строки не отменяла остальные.
+    """
+    try:
+        department_ids = trie.resolve(row.department_path for row in rows if row.department_path)
+        with transaction.atomic():
+            created, updated = _upsert_batch(rows, department_ids, update_existing)
+    except Exception as e:
+        if len(rows) == 1:
+            results['errors'].append(f"Строка {rows[0].row_num}: {str(e)}")
+            return
+        logger.warning(
+            f"Импорт сотрудников: строки {rows[0].row_num}-{rows[-1].row_num} не записаны пачкой ({e}), "
+            f"запись по одной строке"
+        )
+        for row in rows:
+            _write_batch([row], trie, update_existing, results)
+        return
+    
+    results['created'] += created
+    results['updated'] += updated
+    results['success'] += len(rows)
+
+
+def iter_excel_rows(file_path):
+    """Построчно читает активный лист (read_only), начиная со второй строки."""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        # Размер листа в read_only берется из заголовка файла, который
+        # некоторые программы записывают неверно - читаем все строки как есть
+        ws.reset_dimensions()
+        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            yield row_num, row
+    finally:
+        wb.close()
+
+
+def import_employees_from_excel(file_path, update_existing=True, batch_size=IMPORT_BATCH_SIZE):
     """
     Импортирует сотрудников из Excel файла.
     
+    Строки читаются потоком и записываются пачками по batch_size, каждая пачка
+    в своей транзакции: подразделения берутся из DepartmentTrie, сотрудники
+    записываются через bulk_create(update_conflicts=True), графики - через
+    replace_current_schedules.
+    
     Параметры:
         file_path (str): Путь к Excel файлу
         update_existing (bool): Если True, обновляет существующих сотрудников. 
                                 Если False, пропускает существующих.
+        batch_size (int): Количество строк в пачке
     
     Возвращает:
         dict: Словарь с результатами импорта:
@@ -139,162 +547,32 @@ def import_employees_from_excel(file_path, update_existing=True):
     }
     
     try:
-        wb = load_workbook(file_path, read_only=False, data_only=True)
-        ws = wb.active
-        
-        # Пропускаем заголовок (первую строку)
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-        
-        with transaction.atomic():
-            for row_num, row in enumerate(rows, start=2):
-                try:
-                    # Проверяем, есть ли данные в строке
-                    if not row or not any(row):
-                        continue
-                    
-                    # Извлекаем данные
-                    employee_id_raw = row[0] if len(row) > 0 else None
-                    name = row[1] if len(row) > 1 else None
-                    department_name = row[2] if len(row) > 2 else None
-                    position = row[3] if len(row) > 3 else None
-                    schedule_type_str = row[4] if len(row) > 4 else None
-                    schedule_str = row[5] if len(row) > 5 else None
-                    allowed_late_minutes = row[6] if len(row) > 6 else 0
-                    allowed_early_leave_minutes = row[7] if len(row) > 7 else 0
-                    
-                    # Валидация обязательных полей
-                    if not employee_id_raw:
-                        results['errors'].append(
-                            f"Строка {row_num}: Отсутствует Employee ID"
-                        )
-                        continue
-                    
-                    if not name:
-                        results['errors'].append(
-                            f"Строка {row_num}: Отсутствует имя сотрудника"
-                        )
-                        continue
-                    
-                    # Очищаем и нормализуем ID
-                    employee_id = clean_id(employee_id_raw)
-                    
-                    # Получаем или создаем подразделение
-                    department = None
-                    if department_name:
-                        department = get_or_create_department(department_name)
-                    
-                    # Обрабатываем имя
-                    name = str(name).strip().replace('\n', ' ').replace('\r', ' ')
-                    import re
-                    name = re.sub(r'\s+', ' ', name)
-                    
-                    # Получаем или создаем сотрудника
-                    employee, created = Employee.objects.get_or_create(
-                        hikvision_id=employee_id,
-                        defaults={
-                            'name': name,
-                            'department': department,
-                            'position': str(position).strip() if position else None,
-                        }
-                    )
-                    
-                    # Обновляем существующего сотрудника, если нужно
-                    if not created and update_existing:
-                        employee.name = name
-                        employee.department = department
-                        if position:
-                            employee.position = str(position).strip()
-                        employee.save()
-                        results['updated'] += 1
-                    elif created:
-                        results['created'] += 1
-                    
-                    # Обрабатываем график работы
-                    # Если есть данные о графике в Excel, заменяем все существующие графики новым
-                    if schedule_type_str or schedule_str:
-                        schedule_type = parse_schedule_type(schedule_type_str)
-                        
-                        # Преобразуем допустимые минуты в числа
-                        try:
-                            allowed_late = int(allowed_late_minutes) if allowed_late_minutes else 0
-                        except (ValueError, TypeError):
-                            allowed_late = 0
-                        
-                        try:
-                            allowed_early = int(allowed_early_leave_minutes) if allowed_early_leave_minutes else 0
-                        except (ValueError, TypeError):
-                            allowed_early = 0
-                        
-                        # Парсим график
-                        start_time = None
-                        end_time = None
-                        description = None
-                        
-                        if schedule_str:
-                            schedule_str = str(schedule_str).strip()
-                            if schedule_type == 'regular' and ('-' in schedule_str or ':' in schedule_str):
-                                start_time, end_time = parse_time_string(schedule_str)
-                                if start_time and end_time:
-                                    description = f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}"
-                            else:
-                                description = schedule_str
-                        
-                        # Удаляем все существующие графики сотрудника и создаем новый
-                        # Это гарантирует замену графика новыми данными при несовпадении
-                        WorkSchedule.objects.filter(employee=employee).delete()
-                        
-                        # Создаем новый график с данными из Excel
-                        WorkSchedule.objects.create(
-                            employee=employee,
-                            schedule_type=schedule_type,
-                            start_time=start_time,
-                            end_time=end_time,
-                            description=description,
-                            allowed_late_minutes=allowed_late,
-                            allowed_early_leave_minutes=allowed_early,
-                        )
-                    
-                    results['success'] += 1
-                    
-                except Exception as e:
-                    error_msg = f"Строка {row_num}: {str(e)}"
-                    results['errors'].append(error_msg)
-                    continue
-        
-        wb.close()
-        
+        trie = DepartmentTrie()
+        batch = []
+        for row_num, row in iter_excel_rows(file_path):
+            try:
+                parsed = parse_employee_row(row_num, row)
+            except ImportRowError as e:
+                results['errors'].append(f"Строка {row_num}: {e}")
+                continue
+            if parsed is None:
+                continue
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                _write_batch(batch, trie, update_existing, results)
+                batch = []
+        if batch:
+            _write_batch(batch, trie, update_existing, results)
     except Exception as e:
         results['errors'].append(f"Критическая ошибка при чтении файла: {str(e)}")
     
     return results
 
 
-def extract_employee_name_from_event(camera_event):
-    """
-    Извлекает имя сотрудника из raw_data события камеры.
-    """
-    if not camera_event or not camera_event.raw_data or not isinstance(camera_event.raw_data, dict):
-        return None
-    
-    outer_event = camera_event.raw_data.get("AccessControllerEvent", {})
-    # Проверяем вложенную структуру
-    if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-        access_event = outer_event["AccessControllerEvent"]
-    else:
-        access_event = outer_event if isinstance(outer_event, dict) else {}
-    
-    return (
-        access_event.get("employeeName") or
-        access_event.get("name") or
-        access_event.get("employeeNameString") or
-        None
-    )
-
-
 def export_employees_to_excel(file_path, department_filter=None):
     """
     Экспортирует сотрудников из базы данных в Excel файл.
-    Включает также сотрудников из CameraEvent, которых еще нет в Employee.
+    Включает также сотрудников, замеченных камерами (SeenIdentity), которых еще нет в Employee.
     
     Параметры:
         file_path (str): Путь к Excel файлу для сохранения
@@ -366,6 +644,9 @@ def export_employees_to_excel(file_path, department_filter=None):
         employees_list = list(employees)
         employees_list.sort(key=lambda emp: (get_id_sort_key(emp.hikvision_id), emp.hikvision_id))
         
+        # Полные пути подразделений одним запросом
+        department_paths = get_department_paths()
+        
         # Множество ID существующих сотрудников для быстрой проверки
         existing_employee_ids = set()
         
@@ -376,8 +657,8 @@ def export_employees_to_excel(file_path, department_filter=None):
                 
                 # Получаем подразделение (с полным путем, если есть иерархия)
                 department_name = ""
-                if employee.department:
-                    department_name = employee.department.get_full_path()
+                if employee.department_id in department_paths:
+                    department_name = department_paths[employee.department_id]
                 elif employee.department_old:
                     department_name = employee.department_old
                 
@@ -421,67 +702,21 @@ def export_employees_to_excel(file_path, department_filter=None):
                 results['errors'].append(error_msg)
                 continue
         
-        # Теперь добавляем сотрудников из CameraEvent, которых нет в Employee
-        # Получаем все события, отсортированные по времени (от новых к старым)
-        # Это позволит получить последнее событие для каждого ID в одном запросе
-        all_events = CameraEvent.objects.exclude(
-            hikvision_id__isnull=True
-        ).exclude(
-            hikvision_id=''
-        ).order_by('hikvision_id', '-event_time', '-created_at')
-        
-        # Словарь для хранения нормализованных ID и их последних событий
-        # Ключ - нормализованный ID, значение - последнее событие
-        normalized_events = {}
-        
-        # Обрабатываем события - берем только первое (последнее по времени) для каждого оригинального ID
-        processed_original_ids = set()
-        
-        for event in all_events:
-            try:
-                original_id = event.hikvision_id
-                
-                # Пропускаем, если уже обработали этот оригинальный ID
-                if original_id in processed_original_ids:
-                    continue
-                
-                # Нормализуем ID
-                hikvision_id = clean_id(original_id)
-                
-                # Пропускаем, если сотрудник уже есть в Employee
-                if hikvision_id in existing_employee_ids:
-                    processed_original_ids.add(original_id)
-                    continue
-                
-                # Если этот нормализованный ID уже обработан, пропускаем
-                # (это предотвратит дубликаты для случаев типа "001" и "1")
-                if hikvision_id in normalized_events:
-                    processed_original_ids.add(original_id)
-                    continue
-                
-                # Сохраняем последнее событие для этого нормализованного ID
-                normalized_events[hikvision_id] = event
-                processed_original_ids.add(original_id)
-                
-            except Exception as e:
-                error_msg = f"Ошибка при обработке события {event.id}: {str(e)}"
-                results['errors'].append(error_msg)
-                continue
-        
-        # Сортируем сотрудников из CameraEvent по числовому значению ID
-        def get_event_id_sort_key(item):
-            """Возвращает ключ для числовой сортировки ID из событий."""
-            hikvision_id, _ = item
-            return get_id_sort_key(hikvision_id)
+        # Теперь добавляем сотрудников, замеченных камерами, которых нет в Employee.
+        # SeenIdentity ведется при приеме событий (identities.py): одна строка
+        # на ID без ведущих нулей с именем из последнего события, поэтому
+        # история CameraEvent не просматривается
+        seen_identities = [
+            item for item in SeenIdentity.objects.values_list('hikvision_id', 'employee_name')
+            if item[0] not in existing_employee_ids
+        ]
         
-        sorted_events = sorted(normalized_events.items(), key=get_event_id_sort_key)
+        # Сортируем по числовому значению ID
+        sorted_identities = sorted(seen_identities, key=lambda item: get_id_sort_key(item[0]))
         
         # Теперь добавляем сотрудников из CameraEvent в Excel
-        for hikvision_id, event in sorted_events:
+        for hikvision_id, employee_name in sorted_identities:
             try:
-                # Извлекаем имя из raw_data
-                employee_name = extract_employee_name_from_event(event)
-                
                 # Если имени нет, используем ID как имя
                 if not employee_name:
                     employee_name = f"Сотрудник {hikvision_id}"
@@ -0,0 +1,371 @@
+"""
+Идемпотентная запись событий камер.
+
+Терминалы Hikvision повторяют отправку при таймаутах, поэтому одно событие
+может прийти несколько раз. Каждое событие получает ключ дедупликации:
+хэш (устройство, serialNo), а если терминал не передал serialNo - хэш
+данных события. Вставка выполняется одним запросом
+INSERT ... ON CONFLICT (dedup_key, event_time) DO NOTHING, а недавние ключи
+хранятся в памяти процесса, чтобы типичный повтор отбрасывался без
+обращения к БД.
+
+Если время события не удалось взять из данных, parse_event_time
+подставляет now(), и у каждого повтора оно свое. Такое событие получает
+время уже записанного события с тем же ключом (в пределах
+CAMERA_INGEST_UNTIMED_DEDUP_HOURS), поэтому повтор попадает в тот же
+ON CONFLICT.
+
+post_save отправляется вручную только для действительно созданных записей,
+поэтому обработка входов/выходов (signals.py) не видит дубликатов.
+
+ingest_camera_event дополнительно защищает прием от недоступной или
+медленной БД: такие события пишутся в локальный spool (spool.py), а
+replay_spool_records переносит их в БД пакетами через тот же ON CONFLICT.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, transaction
+from django.db.models.signals import post_save
+
+from . import metrics, spool
+from .hikvision_parser import parse_event_payload
+from .models import CameraEvent, normalize_hikvision_id
+
+logger = logging.getLogger(__name__)
+
+
+class RecentKeys:
+    """Потокобезопасный LRU набор недавно записанных ключей."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+recent_keys = RecentKeys(getattr(settings, "CAMERA_INGEST_DEDUP_CACHE_SIZE", 10000))
+
+
+def compute_dedup_key(parsed, event_data):
+    """
+    Возвращает ключ дедупликации события (sha1 hex).
+
+    Args:
+        parsed: ParsedEvent из hikvision_parser
+        event_data: Данные события (для хэша, если нет serialNo)
+    """
+    device = parsed.camera_ip or parsed.device_name
+    if parsed.serial_no and device:
+        source = f"sn|{device}|{parsed.serial_no}"
+    else:
+        source = "payload|" + json.dumps(event_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def _first_event_time(dedup_key, event_time):
+    """
+    Время уже записанного события с ключом dedup_key для события без
+    времени в данных (event_time - подставленное now()).
+
+    Ищется ближайшее по времени событие в пределах
+    CAMERA_INGEST_UNTIMED_DEDUP_HOURS; если его нет, возвращается event_time.
+    """
+    window = timedelta(hours=getattr(settings, "CAMERA_INGEST_UNTIMED_DEDUP_HOURS", 24))
+    first = (
+        CameraEvent.objects
+        .filter(dedup_key=dedup_key, event_time__range=(event_time - window, event_time + window))
+        .order_by("event_time")
+        .values_list("event_time", flat=True)
+        .first()
+    )
+    return event_time if first is None else first
+
+
+def _insert_fields():
+    return [field for field in CameraEvent._meta.concrete_fields if not field.primary_key]
+
+
+def _insert_sql(rows=1):
+    """SQL вставки с ON CONFLICT для всех полей CameraEvent, кроме id."""
+    quote = connection.ops.quote_name
+    fields = _insert_fields()
+    columns = ", ".join(quote(field.column) for field in fields)
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * len(fields)) + ")"] * rows)
+    sql = (
+        f"INSERT INTO {quote(CameraEvent._meta.db_table)} ({columns}) VALUES {placeholders} "
+        f"ON CONFLICT ({quote('dedup_key')}, {quote('event_time')}) DO NOTHING "
+        f"RETURNING {quote(CameraEvent._meta.pk.column)}, {quote('dedup_key')}"
+    )
+    return sql, fields
+
+
+def _insert_params(camera_event, fields):
+    # pre_save заполняет auto_now поля (created_at, updated_at)
+    return [
+        field.get_db_prep_save(field.pre_save(camera_event, add=True), connection)
+        for field in fields
+    ]
+
+
+def _build_camera_event(parsed, event_data, picture_data, dedup_key):
+    # Вставка идет мимо CameraEvent.save(), канонический ID заполняется здесь
+    normalized_id, numeric_id = normalize_hikvision_id(parsed.hikvision_id)
+    return CameraEvent(
+        hikvision_id=parsed.hikvision_id,
+        normalized_id=normalized_id,
+        numeric_id=numeric_id,
+        device_name=parsed.device_name,
+        event_time=parsed.event_time,
+        picture_data=picture_data,
+        raw_data=event_data,
+        dedup_key=dedup_key,
+    )
+
+
+def _mark_created(camera_event, pk):
+    camera_event.pk = pk
+    camera_event._state.adding = False
+    camera_event._state.db = connection.alias
+
+
+def _send_created(camera_event):
+    post_save.send(
+        sender=CameraEvent,
+        instance=camera_event,
+        created=True,
+        update_fields=None,
+        raw=False,
+        using=connection.alias,
+    )
+
+
+def _execute_insert(sql, params, timeout_ms=None):
+    """Выполняет вставку; timeout_ms ограничивает время запроса (PostgreSQL)."""
+    if timeout_ms and connection.vendor == "postgresql":
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [f"{int(timeout_ms)}ms"])
+                cursor.execute(sql, params)
+                return cursor.fetchone()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def _store_camera_event(parsed, event_data, picture_data=None, timeout_ms=None):
+    """
+    Записывает событие без отправки post_save.
+
+    Returns:
+        Созданный CameraEvent или None, если событие - повтор.
+    """
+    dedup_key = compute_dedup_key(parsed, event_data)
+    # Подставленное now() у каждого повтора свое: такие ключи кэшируются без времени
+    cache_key = (dedup_key, None if parsed.event_time_fallback else parsed.event_time)
+    if cache_key in recent_keys:
+        logger.info(f"Повтор события камеры отброшен (кэш): {parsed.hikvision_id} [{parsed.event_time_raw}]")
+        return None
+
+    if parsed.event_time_fallback:
+        parsed.event_time = _first_event_time(dedup_key, parsed.event_time)
+    camera_event = _build_camera_event(parsed, event_data, picture_data, dedup_key)
+    sql, fields = _insert_sql()
+    row = _execute_insert(sql, _insert_params(camera_event, fields), timeout_ms)
+    recent_keys.add(cache_key)
+
+    if row is None:
+        logger.info(f"Повтор события камеры отброшен (БД): {parsed.hikvision_id} [{parsed.event_time_raw}]")
+        return None
+
+    _mark_created(camera_event, row[0])
+    return camera_event
+
+
+def insert_camera_event(parsed, event_data, picture_data=None):
+    """
+    Записывает событие камеры, если такое событие еще не записано.
+
+    Args:
+        parsed: ParsedEvent (событие, прошедшее проверки разбора)
+        event_data: Сырые данные события (raw_data)
+        picture_data: Изображение в Base64
+
+    Returns:
+        Созданный CameraEvent или None, если событие - повтор.
+    """
+    camera_event = _store_camera_event(parsed, event_data, picture_data)
+    if camera_event is not None:
+        _send_created(camera_event)
+    return camera_event
+
+
+def ingest_camera_event(parsed, event_data, picture_data=None):
+    """
+    Записывает событие камеры, при недоступной или медленной БД - в spool.
+
+    Запись в БД ограничена CAMERA_INGEST_SPOOL_LATENCY_BUDGET_MS. Ошибка
+    соединения или превышение бюджета размыкают предохранитель, и следующие
+    события до его остывания сразу пишутся в spool.
+
+    Returns:
+        Созданный CameraEvent или None (повтор или событие записано в spool).
+    """
+    if not getattr(settings, "CAMERA_INGEST_SPOOL_ENABLED", True):
+        return _record_outcome(parsed, insert_camera_event(parsed, event_data, picture_data))
+
+    if not spool.breaker.allow():
+        spool.spool_writer.append(spool.build_record(parsed, event_data, picture_data))
+        metrics.record_ingest("spooled")
+        logger.info(f"Событие камеры записано в spool: {parsed.hikvision_id} [{parsed.event_time_raw}]")
+        return None
+
+    budget_ms = getattr(settings, "CAMERA_INGEST_SPOOL_LATENCY_BUDGET_MS", 2000)
+    started = time.perf_counter()
+    try:
+        camera_event = _store_camera_event(parsed, event_data, picture_data, timeout_ms=budget_ms)
+    except (OperationalError, InterfaceError) as e:
+        logger.error(f"Ошибка записи события камеры в БД, событие записано в spool: {e}")
+        spool.breaker.trip()
+        spool.spool_writer.append(spool.build_record(parsed, event_data, picture_data))
+        metrics.record_ingest("spooled")
+        return None
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if budget_ms and elapsed_ms > budget_ms:
+        logger.warning(f"Запись события камеры заняла {elapsed_ms:.0f} мс (бюджет {budget_ms} мс)")
+        spool.breaker.trip()
+    elif spool.breaker.reset() or spool.spool_writer.has_open_segment:
+        # БД снова отвечает: закрываем сегмент, чтобы drain_camera_spool его перенес
+        spool.spool_writer.rotate()
+
+    if camera_event is not None:
+        _send_created(camera_event)
+    return _record_outcome(parsed, camera_event)
+
+
+def _record_outcome(parsed, camera_event):
+    """Метрики записи: saved (и событие устройства) или duplicate."""
+    if camera_event is None:
+        metrics.record_ingest("duplicate")
+    else:
+        metrics.record_ingest("saved")
+        metrics.record_device_event(parsed.device_name)
+    return camera_event
+
+
+def _insert_batch(camera_events):
+    """Вставляет пакет событий с уникальными dedup_key, возвращает созданные."""
+    sql, fields = _insert_sql(rows=len(camera_events))
+    params = []
+    for camera_event in camera_events:
+        params.extend(_insert_params(camera_event, fields))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    by_key = {camera_event.dedup_key: camera_event for camera_event in camera_events}
+    created = []
+    for pk, dedup_key in rows:
+        camera_event = by_key[dedup_key]
+        _mark_created(camera_event, pk)
+        created.append(camera_event)
+    return created
+
+
+def insert_camera_events_bulk(camera_events):
+    """
+    Вставляет события пакетами с ON CONFLICT DO NOTHING.
+
+    События с одинаковым dedup_key (но разным временем) вставляются в
+    разных запросах, чтобы строки RETURNING однозначно сопоставлялись
+    с объектами.
+
+    Returns:
+        Созданные CameraEvent в порядке event_time.
+    """
+    created = []
+    pending = list(camera_events)
+    while pending:
+        batch, rest, seen = [], [], set()
+        for camera_event in pending:
+            if camera_event.dedup_key in seen:
+                rest.append(camera_event)
+            else:
+                seen.add(camera_event.dedup_key)
+                batch.append(camera_event)
+        created.extend(_insert_batch(batch))
+        pending = rest
+    created.sort(key=lambda camera_event: camera_event.event_time)
+    return created
+
+
+def replay_spool_records(records):
+    """
+    Переносит пакет записей spool в БД (используется drain_camera_spool).
+
+    Вставка и обработка входов/выходов выполняются в одной транзакции:
+    при ошибке соединения пакет откатывается целиком и сегмент остается
+    в spool, а повторный перенос не создает дубликатов.
+
+    Returns:
+        Количество созданных событий.
+    """
+    camera_events = []
+    untimed = {}
+    for record in records:
+        event_data = record["event_data"]
+        parsed = parse_event_payload(event_data)
+        if parsed.discard_reason:
+            continue
+        if record.get("event_time"):
+            # Время, определенное при приеме (без повторного fallback на now())
+            parsed.event_time = datetime.fromisoformat(record["event_time"])
+        dedup_key = compute_dedup_key(parsed, event_data)
+        if parsed.event_time_fallback:
+            # Повторы без времени в пакете и в БД получают одно время
+            if dedup_key not in untimed:
+                untimed[dedup_key] = _first_event_time(dedup_key, parsed.event_time)
+            parsed.event_time = untimed[dedup_key]
+        camera_events.append(_build_camera_event(parsed, event_data, record.get("picture_data"), dedup_key))
+    if not camera_events:
+        return 0
+
+    with transaction.atomic():
+        created = insert_camera_events_bulk(camera_events)
+        for camera_event in created:
+            try:
+                with transaction.atomic():
+                    _send_created(camera_event)
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки события из spool {camera_event.pk}: {e}", exc_info=True)
+    return len(created)
@@ -0,0 +1,31 @@
+"""
+Политика хранения событий камер: удаление старых фото и сокращение raw_data.
+
+Использование:
+  python manage.py apply_camera_event_retention
+  python manage.py apply_camera_event_retention --picture-days 60 --raw-data-days 730
+"""
+from django.core.management.base import BaseCommand
+
+from camera_events.partitioning import apply_retention
+
+
+class Command(BaseCommand):
+    help = "Удаляет фото и сокращает raw_data событий камер старше сроков хранения"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--picture-days", type=int, default=None,
+                            help="Срок хранения фото в днях (по умолчанию CAMERA_EVENT_RETENTION_PICTURE_DAYS, 0 - не удалять)")
+        parser.add_argument("--raw-data-days", type=int, default=None,
+                            help="Срок хранения полного raw_data (по умолчанию CAMERA_EVENT_RETENTION_RAW_DATA_DAYS, 0 - не сокращать)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Событий в одном UPDATE")
+
+    def handle(self, *args, **options):
+        result = apply_retention(
+            picture_days=options["picture_days"],
+            raw_data_days=options["raw_data_days"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено фото: {result['pictures']}, сокращено raw_data: {result['raw_data']}"
+        ))
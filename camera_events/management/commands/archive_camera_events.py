@@ -0,0 +1,58 @@
+"""
+Выгрузка старых месяцев событий камер в архивные файлы.
+
+Использование:
+  python manage.py archive_camera_events                  # месяцы старше CAMERA_EVENT_ARCHIVE_AFTER_MONTHS
+  python manage.py archive_camera_events --month 2025-01
+  python manage.py archive_camera_events --older-than 6 --keep   # без удаления из БД
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from camera_events import archive
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Неверный формат месяца: {value}. Используйте YYYY-MM")
+
+
+class Command(BaseCommand):
+    help = "Выгружает закрытые месяцы событий камер в сжатые архивные файлы и удаляет их из БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Месяц в формате YYYY-MM")
+        parser.add_argument("--older-than", type=int, default=None, metavar="MONTHS",
+                            help="Архивировать месяцы старше указанного числа месяцев "
+                                 "(по умолчанию CAMERA_EVENT_ARCHIVE_AFTER_MONTHS)")
+        parser.add_argument("--dir", dest="directory", help="Каталог архива (по умолчанию CAMERA_EVENT_ARCHIVE_DIR)")
+        parser.add_argument("--keep", action="store_true", help="Не удалять выгруженные события из БД")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать месяцы для архивации")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            months = [parse_month(options["month"])]
+        else:
+            older_than = options["older_than"]
+            if older_than is None:
+                older_than = getattr(settings, "CAMERA_EVENT_ARCHIVE_AFTER_MONTHS", 13)
+            months = archive.months_to_archive(older_than)
+
+        if not months:
+            self.stdout.write("Нет месяцев для архивации")
+            return
+        for month in months:
+            if options["dry_run"]:
+                self.stdout.write(f"{month:%Y-%m}")
+                continue
+            try:
+                result = archive.archive_month(month, directory=options["directory"], delete=not options["keep"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f"{month:%Y-%m}: событий {result['rows']}, удалено из БД {result['deleted']}, файл {result['file']}"
+            )
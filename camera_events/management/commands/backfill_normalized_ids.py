@@ -0,0 +1,27 @@
+"""
+Заполнение канонического ID (normalized_id, numeric_id) у CameraEvent и EntryExit.
+
+Миграция 0015 заполняет существующие записи; команда нужна для записей,
+добавленных в обход моделей (восстановление из резервной копии, старые
+версии приложения во время обновления). Повторный запуск безопасен.
+
+Использование:
+  python manage.py backfill_normalized_ids
+  python manage.py backfill_normalized_ids --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+
+from camera_events.models import CameraEvent, EntryExit
+from camera_events.utils import backfill_normalized_ids
+
+
+class Command(BaseCommand):
+    help = "Заполняет normalized_id/numeric_id у событий камер и записей входов/выходов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20000, help="Диапазон id в одном UPDATE")
+
+    def handle(self, *args, **options):
+        for model in (EntryExit, CameraEvent):
+            updated = backfill_normalized_ids(model, batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: обновлено записей: {updated}"))
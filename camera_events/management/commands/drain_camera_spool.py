@@ -0,0 +1,59 @@
+"""
+Перенос событий камер из локального spool в БД.
+
+Использование:
+  python manage.py drain_camera_spool                 # однократный перенос
+  python manage.py drain_camera_spool --loop          # постоянная работа
+  python manage.py drain_camera_spool --batch-size 1000
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, connection
+
+from camera_events import spool
+from camera_events.ingest import replay_spool_records
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Переносит события камер из локального spool в БД (повторный перенос не создает дубликатов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Записей в одной вставке (по умолчанию 500)")
+        parser.add_argument("--dir", dest="directory", help="Каталог spool (по умолчанию CAMERA_INGEST_SPOOL_DIR)")
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно, проверяя spool каждые --interval секунд")
+        parser.add_argument("--interval", type=float, default=10.0, help="Пауза между проверками в режиме --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                self.drain(options["directory"], options["batch_size"])
+            except (OperationalError, InterfaceError) as e:
+                # Сегмент остается в spool и будет перенесен при следующей попытке
+                self.stderr.write(f"БД недоступна, перенос отложен: {e}")
+                connection.close()
+                if not options["loop"]:
+                    raise SystemExit(1)
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def drain(self, directory, batch_size):
+        created_total = 0
+        for path in spool.list_segments(directory):
+            created = []
+
+            def replay(records):
+                created.append(replay_spool_records(records))
+
+            processed = spool.drain_segment(path, replay, batch_size=batch_size)
+            if processed is None:
+                logger.debug(f"Сегмент spool активен, пропущен: {path}")
+                continue
+            created_total += sum(created)
+            self.stdout.write(f"{path}: записей {processed}, создано событий {sum(created)}")
+        if created_total:
+            self.stdout.write(self.style.SUCCESS(f"Перенесено событий из spool: {created_total}"))
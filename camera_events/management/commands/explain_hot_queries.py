@@ -0,0 +1,44 @@
+"""
+Проверка планов частых запросов к EntryExit (PostgreSQL).
+
+Выполняет проверки camera_events.query_plans (их же запускают тесты
+camera_events/tests/test_explain_hot_queries.py) и печатает результат.
+Если индекс не используется, команда завершается с ошибкой.
+
+Использование:
+  python manage.py explain_hot_queries
+  python manage.py explain_hot_queries --verbose-plans
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from camera_events.query_plans import explain_hot_queries
+
+
+class Command(BaseCommand):
+    help = "Проверяет по EXPLAIN, что частые запросы к EntryExit используют индексы"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="Вывести планы полностью")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Проверка планов поддерживается только для PostgreSQL")
+
+        failed = []
+        try:
+            results = explain_hot_queries()
+        except LookupError as e:
+            raise CommandError(str(e))
+        for title, used, index_names, plan in results:
+            if options["verbose_plans"]:
+                self.stdout.write(plan)
+            if used:
+                self.stdout.write(self.style.SUCCESS(f"OK   {title}: {used}"))
+            else:
+                failed.append(title)
+                self.stdout.write(self.style.ERROR(f"FAIL {title}: ожидался {' или '.join(index_names)}"))
+                self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(f"Запросы без ожидаемого индекса: {len(failed)}")
@@ -0,0 +1,79 @@
+"""
+Детерминированные синтетические данные для нагрузочных проверок.
+
+Создает дерево подразделений, сотрудников со смешанными графиками
+(дневные, ночные, плавающие, сутки через двое) и события камер в формате
+терминалов Hikvision: опоздания, ночные смены, незакрытые смены, проходы
+без отметки входа и повторные срабатывания камер. С одинаковыми
+параметрами (--employees, --months, --seed) набор всегда одинаковый.
+
+Записи EntryExit по умолчанию не создаются: их строит пересчет
+(recalculate_entries_exits), который и нужно проверять. С --entries-exits
+записи загружаются напрямую, чтобы сразу проверять отчеты и выгрузки.
+
+На PostgreSQL записи загружаются через COPY. Повторный запуск заменяет
+ранее созданные синтетические данные, --clear только удаляет их.
+
+Использование:
+  python manage.py generate_synthetic_data --employees 1000 --months 3
+  python manage.py generate_synthetic_data --employees 10000 --months 6 --seed 1 --entries-exits
+  python manage.py generate_synthetic_data --clear
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from camera_events.synthetic import (
+    DEFAULT_START_DATE,
+    clear_synthetic_dataset,
+    generate_synthetic_dataset,
+)
+
+
+class Command(BaseCommand):
+    help = "Создает детерминированные синтетические события камер, сотрудников и графики"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=100, help="Количество сотрудников (по умолчанию 100)")
+        parser.add_argument("--months", type=int, default=1, help="Количество месяцев событий (по умолчанию 1)")
+        parser.add_argument("--seed", type=int, default=0, help="Seed генератора (по умолчанию 0)")
+        parser.add_argument("--start-date", default=DEFAULT_START_DATE.isoformat(),
+                            help=f"Первый день периода YYYY-MM-DD (по умолчанию {DEFAULT_START_DATE})")
+        parser.add_argument("--entries-exits", action="store_true",
+                            help="Загрузить записи EntryExit напрямую, без пересчета из событий")
+        parser.add_argument("--clear", action="store_true", help="Только удалить синтетические данные")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            clear_synthetic_dataset()
+            self.stdout.write(self.style.SUCCESS("Синтетические данные удалены"))
+            return
+
+        if options["employees"] < 1 or options["months"] < 1:
+            raise CommandError("--employees и --months должны быть больше нуля")
+        try:
+            start_date = date.fromisoformat(options["start_date"])
+        except ValueError:
+            raise CommandError(f"Некорректная дата: {options['start_date']}")
+
+        started = time.perf_counter()
+        result = generate_synthetic_dataset(
+            employees=options["employees"],
+            months=options["months"],
+            seed=options["seed"],
+            start_date=start_date,
+            entry_exits=options["entries_exits"],
+            camera_events=True,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Сотрудников: {result['employees']}, событий камер: {result['camera_events']}, "
+            f"записей EntryExit: {result['entry_exits']} за {result['start_date']} - {result['end_date']} "
+            f"({elapsed:.1f}s)"
+        ))
+        if not options["entries_exits"]:
+            self.stdout.write(
+                "Записи EntryExit строит пересчет: POST /api/v1/camera-events/recalculate/ "
+                f"с start_date={result['start_date']} и end_date={result['end_date']}"
+            )
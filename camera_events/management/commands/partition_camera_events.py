@@ -0,0 +1,55 @@
+"""
+Помесячное секционирование таблицы событий камер (PostgreSQL).
+
+Использование:
+  python manage.py partition_camera_events --convert        # однократный перевод таблицы
+  python manage.py partition_camera_events                  # создать секции на будущие месяцы
+  python manage.py partition_camera_events --detach-older-than 24
+  python manage.py partition_camera_events --status
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from camera_events import partitioning
+
+
+class Command(BaseCommand):
+    help = "Создает помесячные секции событий камер и отсоединяет старые"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--convert", action="store_true",
+                            help="Перевести существующую таблицу в секционированную (блокирует таблицу на время копирования)")
+        parser.add_argument("--keep-legacy", action="store_true",
+                            help="При --convert сохранить исходную таблицу как *_legacy")
+        parser.add_argument("--months-ahead", type=int, default=None,
+                            help="Сколько будущих месяцев создать (по умолчанию CAMERA_EVENT_PARTITION_MONTHS_AHEAD)")
+        parser.add_argument("--detach-older-than", type=int, metavar="MONTHS",
+                            help="Отсоединить секции старше указанного числа месяцев")
+        parser.add_argument("--status", action="store_true", help="Показать секции и оценку числа строк")
+
+    def handle(self, *args, **options):
+        try:
+            if options["convert"]:
+                copied = partitioning.convert_to_partitioned(
+                    months_ahead=options["months_ahead"], keep_legacy=options["keep_legacy"],
+                )
+                self.stdout.write(self.style.SUCCESS(f"Таблица секционирована, перенесено событий: {copied}"))
+            elif not partitioning.is_partitioned():
+                # Команда вызывается при запуске контейнера: без --convert ничего не меняем
+                self.stdout.write("Таблица событий не секционирована (используйте --convert)")
+                return
+
+            if options["status"]:
+                for name, month, estimate in partitioning.list_partitions():
+                    label = month.strftime("%Y-%m") if month else "по умолчанию"
+                    self.stdout.write(f"{name:<45} {label:<14} ~{estimate} строк")
+                return
+
+            created = partitioning.ensure_partitions(months_ahead=options["months_ahead"])
+            for name in created:
+                self.stdout.write(f"Создана секция {name}")
+
+            if options["detach_older_than"] is not None:
+                for name in partitioning.detach_partitions(options["detach_older_than"]):
+                    self.stdout.write(f"Отсоединена секция {name} (таблица сохранена)")
+        except RuntimeError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,20 @@
+"""
+Заполнение SeenIdentity по истории событий камер.
+
+Обычно таблица ведется при приеме событий; команда нужна после
+восстановления БД из резервной копии или переноса событий в обход приема.
+
+Использование:
+  python manage.py rebuild_seen_identities
+"""
+from django.core.management.base import BaseCommand
+
+from camera_events.identities import rebuild_seen_identities
+
+
+class Command(BaseCommand):
+    help = "Заполняет таблицу замеченных камерами ID по истории событий"
+
+    def handle(self, *args, **options):
+        count = rebuild_seen_identities()
+        self.stdout.write(self.style.SUCCESS(f"Обработано ID: {count}"))
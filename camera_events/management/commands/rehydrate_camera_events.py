@@ -0,0 +1,38 @@
+"""
+Загрузка архивного месяца событий камер в ArchivedCameraEvent.
+
+После загрузки recalculate_entries_exits учитывает события этого месяца.
+
+Использование:
+  python manage.py rehydrate_camera_events --month 2025-01
+  python manage.py rehydrate_camera_events --month 2025-01 --with-pictures
+  python manage.py rehydrate_camera_events --month 2025-01 --drop   # очистить загруженные события
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from camera_events import archive
+from camera_events.management.commands.archive_camera_events import parse_month
+
+
+class Command(BaseCommand):
+    help = "Загружает архив месяца событий камер во временную таблицу для пересчета"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", required=True, help="Месяц в формате YYYY-MM")
+        parser.add_argument("--with-pictures", action="store_true", help="Загружать фото (по умолчанию без фото)")
+        parser.add_argument("--dir", dest="directory", help="Каталог архива (по умолчанию CAMERA_EVENT_ARCHIVE_DIR)")
+        parser.add_argument("--drop", action="store_true", help="Удалить ранее загруженные события месяца")
+
+    def handle(self, *args, **options):
+        month = parse_month(options["month"])
+        if options["drop"]:
+            deleted = archive.drop_rehydrated(month)
+            self.stdout.write(f"Удалено загруженных событий за {month:%Y-%m}: {deleted}")
+            return
+        try:
+            loaded = archive.rehydrate_month(
+                month, with_pictures=options["with_pictures"], directory=options["directory"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Загружено событий за {month:%Y-%m}: {loaded}"))
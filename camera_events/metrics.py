@@ -0,0 +1,540 @@
+"""
+Метрики приема событий, сопоставления входов/выходов, пересчета и выгрузок
+в текстовом формате Prometheus (/metrics).
+
+Значения накапливаются в памяти процесса без блокировок на горячем пути:
+у каждого потока свой набор значений (shard), при сборе они суммируются.
+Наборы завершившихся потоков (runserver создает поток на запрос)
+переносятся в общий итог, поэтому память не растет.
+
+Несколько процессов (gunicorn, drain_camera_spool) объединяются через
+каталог METRICS_DIR: каждый процесс раз в METRICS_FLUSH_INTERVAL секунд и
+при завершении записывает снимок в metrics-<pid>-<время запуска>.json, а
+/metrics складывает снимки всех процессов. Время запуска в имени не дает
+новому процессу с тем же PID затереть снимок завершенного. Снимки, которые
+давно не обновлялись (процесс завершен), при сборе переносятся в общий итог
+retired.json и удаляются, поэтому счетчики не уменьшаются после
+перезапуска воркеров, а каталог не растет. Без METRICS_DIR /metrics
+показывает только текущий процесс.
+
+Отставание очереди (spool) вычисляется при запросе /metrics по файлам
+сегментов.
+"""
+import atexit
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: снимки складываются без блокировки каталога
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE_MAX = "gauge"
+HISTOGRAM = "histogram"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (10_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000, 100_000_000)
+INF_LABEL = 'le="+Inf"'
+
+
+class Metric:
+    """Описание метрики: тип, подсказка, имена меток, границы гистограммы."""
+
+    def __init__(self, name, kind, help_text, labelnames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+
+
+REGISTRY = {}
+
+
+def _register(name, kind, help_text, labelnames=(), buckets=None):
+    REGISTRY[name] = Metric(name, kind, help_text, labelnames, buckets)
+    return name
+
+
+INGEST_REQUESTS = _register(
+    "camera_ingest_requests_total", COUNTER,
+    "Запросы камер по результату (saved, duplicate, spooled, heartbeat, dropped, error)", ("outcome",),
+)
+DEVICE_EVENTS = _register(
+    "camera_device_events_total", COUNTER, "Записанные события по устройству", ("device",),
+)
+DEVICE_LAST_SEEN = _register(
+    "camera_device_last_seen_timestamp_seconds", GAUGE_MAX,
+    "Время последнего записанного события устройства (unix time)", ("device",),
+)
+PAIRING_LATENCY = _register(
+    "entry_exit_pairing_latency_seconds", HISTOGRAM,
+    "Задержка от event_time до записи EntryExit", ("action",), LATENCY_BUCKETS,
+)
+RECALC_RUNS = _register("recalc_runs_total", COUNTER, "Запуски recalculate_entries_exits")
+RECALC_EVENTS = _register("recalc_events_total", COUNTER, "События, обработанные пересчетом")
+RECALC_WRITES = _register(
+    "recalc_entry_exits_total", COUNTER, "Записи EntryExit, созданные/обновленные пересчетом", ("action",),
+)
+RECALC_DURATION = _register(
+    "recalc_duration_seconds", HISTOGRAM, "Длительность recalculate_entries_exits", (), DURATION_BUCKETS,
+)
+EXPORT_DURATION = _register(
+    "export_duration_seconds", HISTOGRAM, "Длительность выгрузки", ("export",), DURATION_BUCKETS,
+)
+EXPORT_SIZE = _register(
+    "export_size_bytes", HISTOGRAM, "Размер файла выгрузки", ("export",), SIZE_BUCKETS,
+)
+EXPORT_ADMISSION = _register(
+    "export_admission_total", COUNTER,
+    "Запросы выгрузок по результату допуска (started, coalesced, rejected)", ("export", "outcome"),
+)
+
+
+class _Shard(dict):
+    """Значения одного потока: (метрика, метки) -> число или [корзины..., сумма, количество]."""
+
+
+class _Store:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def snapshot(self):
+        """Сумма значений всех потоков процесса: {ключ: значение}."""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # Поток завершен и больше не пишет в свой набор
+                    _merge(self._retired, shard)
+            self._shards = alive
+            result = _Shard()
+            _merge(result, self._retired)
+            for _, shard in alive:
+                # Копия: поток может добавлять ключи во время обхода
+                _merge(result, dict(shard))
+        return result
+
+
+def _merge(target, source):
+    for key, value in source.items():
+        kind = REGISTRY[key[0]].kind
+        if kind == HISTOGRAM:
+            current = target.get(key)
+            if current is None:
+                target[key] = list(value)
+            else:
+                for index, item in enumerate(value):
+                    current[index] += item
+        elif kind == GAUGE_MAX:
+            target[key] = max(target.get(key, value), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+store = _Store()
+
+
+def _key(name, labels):
+    return (name, tuple(str(value) for value in labels))
+
+
+def inc(name, *labels, amount=1):
+    """Увеличивает счетчик."""
+    shard = store.shard()
+    key = _key(name, labels)
+    shard[key] = shard.get(key, 0) + amount
+    _flusher.ensure_started()
+
+
+def set_max(name, *labels, value):
+    """Устанавливает значение, если оно больше текущего (время последнего события)."""
+    shard = store.shard()
+    key = _key(name, labels)
+    if value > shard.get(key, -math.inf):
+        shard[key] = value
+    _flusher.ensure_started()
+
+
+def observe(name, *labels, value):
+    """Добавляет наблюдение в гистограмму."""
+    buckets = REGISTRY[name].buckets
+    shard = store.shard()
+    key = _key(name, labels)
+    data = shard.get(key)
+    if data is None:
+        data = [0] * (len(buckets) + 2)
+        shard[key] = data
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            data[index] += 1
+            break
+    data[-2] += value
+    data[-1] += 1
+    _flusher.ensure_started()
+
+
+# Результаты приема событий
+
+def record_ingest(outcome):
+    inc(INGEST_REQUESTS, outcome)
+
+
+def record_discard(reason):
+    """Отброшенное событие: heartbeat или dropped (нет сотрудника, не разобрано)."""
+    record_ingest("heartbeat" if reason == "heartbeat" else "dropped")
+
+
+def record_device_event(device_name):
+    device = device_name or "unknown"
+    inc(DEVICE_EVENTS, device)
+    set_max(DEVICE_LAST_SEEN, device, value=time.time())
+
+
+def record_pairing(action, event_time):
+    if event_time is None:
+        return
+    latency = time.time() - event_time.timestamp()
+    observe(PAIRING_LATENCY, action, value=max(latency, 0.0))
+
+
+def record_recalc(duration_seconds, events, created, updated):
+    inc(RECALC_RUNS)
+    inc(RECALC_EVENTS, amount=events)
+    inc(RECALC_WRITES, "created", amount=created)
+    inc(RECALC_WRITES, "updated", amount=updated)
+    observe(RECALC_DURATION, value=duration_seconds)
+
+
+def record_export_admission(export_name, outcome):
+    inc(EXPORT_ADMISSION, export_name, outcome)
+
+
+def track_export(export_name):
+    """Декоратор view выгрузки: длительность и размер ответа."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            response = func(*args, **kwargs)
+            observe(EXPORT_DURATION, export_name, value=time.perf_counter() - started)
+            if getattr(response, "status_code", None) == 200:
+                if getattr(response, "streaming", False):
+                    size = response.get("Content-Length")
+                else:
+                    size = len(response.content)
+                if size is not None:
+                    observe(EXPORT_SIZE, export_name, value=int(size))
+            return response
+        return wrapper
+    return decorator
+
+
+# Объединение процессов через METRICS_DIR
+
+def _metrics_dir():
+    return getattr(settings, "METRICS_DIR", None)
+
+
+RETIRED_FILE = "retired.json"
+LOCK_FILE = ".lock"
+# Снимок, не обновлявшийся столько секунд (и не меньше трех интервалов
+# METRICS_FLUSH_INTERVAL), принадлежит завершенному процессу
+STALE_SNAPSHOT_SECONDS = 120
+
+_process_key = None
+
+
+def _process_id():
+    """
+    Идентификатор процесса: PID и время первой записи снимка (мс).
+    Пересчитывается после fork, так как меняется PID.
+    """
+    global _process_key
+    pid = os.getpid()
+    if _process_key is None or _process_key[0] != pid:
+        _process_key = (pid, f"{pid}-{int(time.time() * 1000)}")
+    return _process_key[1]
+
+
+def _snapshot_path(directory, process_id):
+    return os.path.join(directory, f"metrics-{process_id}.json")
+
+
+class _DirectoryLock:
+    """flock на каталоге снимков: общий при чтении, исключительный при переносе."""
+
+    def __init__(self, directory, exclusive=False):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self.exclusive = exclusive
+        self._file = None
+
+    def __enter__(self):
+        """Возвращает False, если исключительная блокировка занята другим процессом."""
+        if fcntl is None:
+            return True
+        operation = fcntl.LOCK_EX | fcntl.LOCK_NB if self.exclusive else fcntl.LOCK_SH
+        self._file = open(self.path, "a")
+        try:
+            fcntl.flock(self._file.fileno(), operation)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()  # снимает flock
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_retired(directory):
+    """Итог завершенных процессов: (значения, имена уже перенесенных снимков)."""
+    try:
+        with open(os.path.join(directory, RETIRED_FILE), encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return _Shard(), set()
+    return _decode(data["values"]), set(data["folded"])
+
+
+def retire_stale_snapshots(directory=None, now=None):
+    """
+    Переносит снимки завершенных процессов в retired.json и удаляет их.
+
+    Имена перенесенных снимков записываются в retired.json до удаления
+    файлов: если процесс прервется между записью и удалением, снимок не
+    будет учтен дважды.
+
+    Returns:
+        Количество перенесенных снимков.
+    """
+    directory = directory or _metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return 0
+    now = now if now is not None else time.time()
+    stale_after = max(STALE_SNAPSHOT_SECONDS, 3 * getattr(settings, "METRICS_FLUSH_INTERVAL", 5))
+    own_path = _snapshot_path(directory, _process_id())
+    with _DirectoryLock(directory, exclusive=True) as locked:
+        if not locked:
+            return 0
+        try:
+            retired, folded = _read_retired(directory)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Итог метрик {RETIRED_FILE} не прочитан, снимки не переносятся: {e}")
+            return 0
+        paths = glob.glob(os.path.join(directory, "metrics-*.json"))
+        names = {os.path.basename(path) for path in paths}
+        stale = []
+        for path in paths:
+            name = os.path.basename(path)
+            if path == own_path or name in folded:
+                continue
+            try:
+                if now - os.stat(path).st_mtime < stale_after:
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    snapshot = _decode(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Снимок метрик {path} пропущен: {e}")
+                continue
+            _merge(retired, snapshot)
+            stale.append(path)
+        if not stale:
+            return 0
+        # Сохраняются только имена снимков, файлы которых еще не удалены
+        folded = (folded & names) | {os.path.basename(path) for path in stale}
+        _write_json(os.path.join(directory, RETIRED_FILE), {"values": _encode(retired), "folded": sorted(folded)})
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Снимок метрик {path} не удален: {e}")
+    logger.info(f"Снимки метрик завершенных процессов перенесены в {RETIRED_FILE}: {len(stale)}")
+    return len(stale)
+
+
+def _encode(snapshot):
+    return [[name, list(labels), value] for (name, labels), value in snapshot.items()]
+
+
+def _decode(rows):
+    result = _Shard()
+    for name, labels, value in rows:
+        if name in REGISTRY:
+            result[(name, tuple(labels))] = value
+    return result
+
+
+def flush():
+    """Записывает снимок процесса в METRICS_DIR (атомарная замена файла)."""
+    directory = _metrics_dir()
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_json(_snapshot_path(directory, _process_id()), _encode(store.snapshot()))
+    except OSError as e:
+        logger.warning(f"Не удалось записать метрики в {directory}: {e}")
+
+
+class _Flusher:
+    """Фоновая запись снимка раз в METRICS_FLUSH_INTERVAL секунд."""
+
+    def __init__(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._started or not _metrics_dir():
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            thread.start()
+            atexit.register(flush)
+
+    def _run(self):
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+        while True:
+            time.sleep(interval)
+            flush()
+
+
+_flusher = _Flusher()
+
+
+def collect():
+    """Значения всех процессов: итог завершенных, снимки METRICS_DIR и текущий процесс."""
+    result = _Shard()
+    directory = _metrics_dir()
+    if directory and os.path.isdir(directory):
+        retire_stale_snapshots(directory)
+        own_path = _snapshot_path(directory, _process_id())
+        # Общая блокировка: перенос снимков в итог не выполняется во время чтения
+        with _DirectoryLock(directory):
+            try:
+                retired, folded = _read_retired(directory)
+                _merge(result, retired)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Итог метрик {RETIRED_FILE} пропущен: {e}")
+                folded = set()
+            for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+                if path == own_path or os.path.basename(path) in folded:
+                    continue
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        _merge(result, _decode(json.load(f)))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Снимок метрик {path} пропущен: {e}")
+    _merge(result, store.snapshot())
+    return result
+
+
+def _spool_lines():
+    from . import spool
+
+    segments = spool.list_segments()
+    total_bytes = 0
+    oldest = None
+    for path in segments:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        total_bytes += stat.st_size
+        oldest = stat.st_mtime if oldest is None else min(oldest, stat.st_mtime)
+    lag = time.time() - oldest if oldest is not None else 0
+    return [
+        "# HELP camera_spool_segments Сегменты spool, ожидающие переноса в БД",
+        "# TYPE camera_spool_segments gauge",
+        f"camera_spool_segments {len(segments)}",
+        "# HELP camera_spool_bytes Размер spool, ожидающего переноса",
+        "# TYPE camera_spool_bytes gauge",
+        f"camera_spool_bytes {total_bytes}",
+        "# HELP camera_spool_lag_seconds Возраст самого старого сегмента spool",
+        "# TYPE camera_spool_lag_seconds gauge",
+        f"camera_spool_lag_seconds {lag:.3f}",
+    ]
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """Текстовый формат Prometheus 0.0.4."""
+    values = collect()
+    by_metric = {}
+    for (name, labels), value in values.items():
+        by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f"# HELP {name} {metric.help_text}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(by_metric.get(name, [])):
+            if metric.kind != HISTOGRAM:
+                lines.append(f"{name}{_labels(metric.labelnames, labels)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value):
+                cumulative += count
+                le = f'le="{_format_number(float(bound))}"'
+                lines.append(f"{name}_bucket{_labels(metric.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(metric.labelnames, labels, INF_LABEL)} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(metric.labelnames, labels)} {_format_number(float(value[-2]))}")
+            lines.append(f"{name}_count{_labels(metric.labelnames, labels)} {value[-1]}")
+    lines.extend(_spool_lines())
+    return "\n".join(lines) + "\n"
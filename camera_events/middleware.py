@@ -0,0 +1,135 @@
+"""
+Middleware приема событий от камер Hikvision.
+
+CameraIngestFilterMiddleware отвечает "OK" на heartbeat и события без имени
+сотрудника до того, как запрос пройдет остальные middleware (сессии, CSRF,
+аутентификация), согласование контента DRF и разбор multipart с изображением.
+Такие события CameraEventViewSet.create все равно отбрасывает, поэтому для
+камеры ответ не меняется.
+
+Классификация выполняется по префиксу тела запроса без разбора JSON:
+событие отбрасывается только если JSON события целиком попал в просмотренный
+префикс и в нем нет ни одного непустого поля с именем сотрудника. Во всех
+неоднозначных случаях запрос передается дальше без изменений.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Поля с именем сотрудника, которые проверяет CameraEventViewSet.create
+# (в нижнем регистре: префикс приводится к нижнему регистру перед поиском)
+_EMPLOYEE_NAME_RE = re.compile(
+    rb'"(?:employeename|name|employeenamestring|employee_name)"\s*:\s*"\s*[^"\s]'
+)
+_HEARTBEAT_RE = re.compile(rb'heart')
+_BOUNDARY_RE = re.compile(rb'boundary="?([^";]+)"?')
+_EVENT_PART_RE = re.compile(rb'name="(?:event_log|accesscontrollerevent)"')
+
+DISCARD_HEARTBEAT = "heartbeat"
+DISCARD_NO_EMPLOYEE = "no_employee"
+
+
+def _extract_event_part(prefix, content_type):
+    """
+    Возвращает JSON события из multipart префикса (в нижнем регистре) или None,
+    если часть event_log/AccessControllerEvent не найдена в префиксе целиком.
+    """
+    match = _BOUNDARY_RE.search(content_type.encode("latin-1", "ignore"))
+    if not match:
+        return None
+    delimiter = b"\r\n--" + match.group(1).lower()
+
+    part = _EVENT_PART_RE.search(prefix)
+    if not part:
+        return None
+    header_end = prefix.find(b"\r\n\r\n", part.end())
+    if header_end == -1:
+        return None
+    body_start = header_end + 4
+    body_end = prefix.find(delimiter, body_start)
+    if body_end == -1:
+        return None
+    return prefix[body_start:body_end]
+
+
+def classify_camera_payload(body, content_type, scan_bytes):
+    """
+    Определяет, можно ли отбросить событие камеры без полной обработки.
+
+    Args:
+        body: Тело запроса (bytes)
+        content_type: Заголовок Content-Type
+        scan_bytes: Сколько байт от начала тела просматривать
+
+    Returns:
+        DISCARD_HEARTBEAT, DISCARD_NO_EMPLOYEE или None (передать в view)
+    """
+    content_type_lower = content_type.lower()
+    prefix = body[:scan_bytes].lower()
+
+    if "multipart/form-data" in content_type_lower:
+        event_json = _extract_event_part(prefix, content_type_lower)
+        if event_json is None:
+            return None
+    elif "json" in content_type_lower:
+        # JSON целиком должен попасть в префикс: имя может идти после picData
+        if len(body) > scan_bytes:
+            return None
+        event_json = prefix
+    else:
+        return None
+
+    if _EMPLOYEE_NAME_RE.search(event_json):
+        return None
+    if _HEARTBEAT_RE.search(event_json):
+        return DISCARD_HEARTBEAT
+    return DISCARD_NO_EMPLOYEE
+
+
+class CameraIngestFilterMiddleware:
+    """
+    Ранняя фильтрация POST запросов камер на CAMERA_INGEST_PATH.
+
+    Должен стоять первым в MIDDLEWARE. Включается настройкой
+    CAMERA_INGEST_FILTER_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "CAMERA_INGEST_FILTER_ENABLED", True)
+        self.path = getattr(settings, "CAMERA_INGEST_PATH", "/api/v1/camera-events/").rstrip("/")
+        self.scan_bytes = getattr(settings, "CAMERA_INGEST_FILTER_SCAN_BYTES", 64 * 1024)
+
+    def __call__(self, request):
+        if self.enabled and request.method == "POST" and request.path_info.rstrip("/") == self.path:
+            reason = self._classify(request)
+            if reason:
+                logger.debug(f"Событие камеры отброшено до обработки: {reason}")
+                metrics.record_discard(reason)
+                return HttpResponse("OK", status=200)
+        return self.get_response(request)
+
+    def _classify(self, request):
+        # request.body для тела больше DATA_UPLOAD_MAX_MEMORY_SIZE вызывает
+        # RequestDataTooBig, такие запросы обрабатывает view (файлы в multipart
+        # под это ограничение не попадают)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return None
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if not content_length or (max_size is not None and content_length > max_size):
+            return None
+        try:
+            # Полный заголовок (request.content_type не содержит boundary)
+            content_type = request.META.get("CONTENT_TYPE", "")
+            return classify_camera_payload(request.body, content_type, self.scan_bytes)
+        except Exception as e:
+            logger.warning(f"Ошибка ранней фильтрации события камеры: {e}")
+            return None
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camera_events', '0010_attendancerecord'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='workschedule',
+            options={'ordering': ['employee', models.OrderBy(models.F('valid_to'), descending=True, nulls_first=True), 'schedule_type'], 'verbose_name': 'График работы', 'verbose_name_plural': 'Графики работы'},
+        ),
+        migrations.AddField(
+            model_name='workschedule',
+            name='valid_from',
+            field=models.DateField(blank=True, help_text='Первый день действия графика (пусто - с начала истории)', null=True, verbose_name='Действует с'),
+        ),
+        migrations.AddField(
+            model_name='workschedule',
+            name='valid_to',
+            field=models.DateField(blank=True, help_text='Последний день действия графика (пусто - действует сейчас)', null=True, verbose_name='Действует по'),
+        ),
+        migrations.AddIndex(
+            model_name='workschedule',
+            index=models.Index(fields=['employee', 'valid_from', 'valid_to'], name='camera_even_employe_3acffc_idx'),
+        ),
+    ]
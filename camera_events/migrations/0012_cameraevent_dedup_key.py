@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camera_events', '0011_workschedule_valid_from_valid_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cameraevent',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Ключ дедупликации'),
+        ),
+        migrations.AddConstraint(
+            model_name='cameraevent',
+            constraint=models.UniqueConstraint(fields=('dedup_key', 'event_time'), name='camera_event_dedup_key_uniq'),
+        ),
+    ]
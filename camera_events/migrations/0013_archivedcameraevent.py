@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camera_events', '0012_cameraevent_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCameraEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(db_index=True, verbose_name='ID исходного события')),
+                ('hikvision_id', models.CharField(blank=True, max_length=64, null=True, verbose_name='ID от Hikvision')),
+                ('device_name', models.CharField(blank=True, max_length=255, null=True, verbose_name='Название устройства/камеры')),
+                ('event_time', models.DateTimeField(blank=True, null=True, verbose_name='Время события')),
+                ('picture_data', models.TextField(blank=True, null=True, verbose_name='Фото в формате Base64')),
+                ('raw_data', models.JSONField(blank=True, null=True, verbose_name='Сырые данные события')),
+                ('dedup_key', models.CharField(blank=True, max_length=64, null=True, verbose_name='Ключ дедупликации')),
+                ('created_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата создания записи')),
+                ('updated_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обновления записи')),
+                ('archive_month', models.DateField(db_index=True, verbose_name='Архивный месяц')),
+                ('archive_file', models.CharField(max_length=255, verbose_name='Файл архива')),
+            ],
+            options={
+                'verbose_name': 'Архивное событие камеры',
+                'verbose_name_plural': 'Архивные события камер',
+                'ordering': ['-event_time'],
+                'indexes': [models.Index(fields=['event_time'], name='camera_even_event_t_445401_idx'), models.Index(fields=['hikvision_id', 'event_time'], name='camera_even_hikvisi_35e567_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import Coalesce
+
+# Синонимы имени сотрудника в событии камеры (в порядке приоритета)
+EMPLOYEE_NAME_KEYS = ('employeeName', 'name', 'employeeNameString', 'employee_name', 'Name')
+
+
+def clean_id(value):
+    """ID без ведущих нулей ("001" и "1" - один сотрудник)."""
+    return str(value).strip().lstrip('0') or '0'
+
+
+def event_employee_name(raw_data):
+    """Имя сотрудника из raw_data (AccessControllerEvent или плоский JSON)."""
+    event = raw_data
+    if isinstance(event, dict) and 'AccessControllerEvent' in event:
+        event = event['AccessControllerEvent']
+        if isinstance(event, dict) and 'AccessControllerEvent' in event:
+            event = event['AccessControllerEvent']
+    if not isinstance(event, dict):
+        return None
+    for key in EMPLOYEE_NAME_KEYS:
+        if event.get(key):
+            return str(event[key])[:255]
+    return None
+
+
+def fill_seen_identities(apps, schema_editor):
+    """
+    Заполняет SeenIdentity по истории событий: ID -> имя из последнего
+    события, время первого и последнего события.
+    """
+    CameraEvent = apps.get_model('camera_events', 'CameraEvent')
+    SeenIdentity = apps.get_model('camera_events', 'SeenIdentity')
+    db_alias = schema_editor.connection.alias
+
+    # Время события может быть пустым - тогда используется время записи
+    events = CameraEvent.objects.using(db_alias).exclude(hikvision_id__isnull=True).exclude(hikvision_id='').annotate(
+        seen_at=Coalesce('event_time', 'created_at')
+    )
+    first_seen = dict(
+        events.order_by().values('hikvision_id').annotate(first=Min('seen_at')).values_list('hikvision_id', 'first')
+    )
+    # На PostgreSQL raw_data читается по одной строке на ID (DISTINCT ON)
+    latest = events.order_by('hikvision_id', '-seen_at')
+    if schema_editor.connection.vendor == 'postgresql':
+        latest = latest.distinct('hikvision_id')
+
+    identities = {}
+    previous_id = None
+    for row in latest.values('hikvision_id', 'seen_at', 'raw_data').iterator(chunk_size=2000):
+        if row['hikvision_id'] == previous_id:
+            continue
+        previous_id = row['hikvision_id']
+        hikvision_id = clean_id(previous_id)
+        name = event_employee_name(row['raw_data'])
+        first = first_seen[previous_id]
+        last = row['seen_at']
+        if hikvision_id in identities:
+            known_name, known_first, known_last = identities[hikvision_id]
+            if last < known_last:
+                name = known_name or name
+            else:
+                name = name or known_name
+            first = min(first, known_first)
+            last = max(last, known_last)
+        identities[hikvision_id] = (name, first, last)
+
+    SeenIdentity.objects.using(db_alias).bulk_create(
+        [
+            SeenIdentity(hikvision_id=hikvision_id, employee_name=name, first_seen=first, last_seen=last)
+            for hikvision_id, (name, first, last) in identities.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camera_events', '0013_archivedcameraevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hikvision_id', models.CharField(max_length=64, unique=True, verbose_name='ID от Hikvision')),
+                ('employee_name', models.CharField(blank=True, max_length=255, null=True, verbose_name='Имя сотрудника на камере')),
+                ('first_seen', models.DateTimeField(verbose_name='Первое событие')),
+                ('last_seen', models.DateTimeField(verbose_name='Последнее событие')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления записи')),
+            ],
+            options={
+                'verbose_name': 'Замеченный ID',
+                'verbose_name_plural': 'Замеченные ID',
+                'ordering': ['hikvision_id'],
+            },
+        ),
+        migrations.RunPython(fill_seen_identities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Case, CharField, Max, Min, Value, When
+
+NUMERIC_ID_MAX_DIGITS = 18
+BATCH_SIZE = 20000
+
+
+def normalize_hikvision_id(hikvision_id):
+    """(ID без ведущих нулей, ID числом или None)."""
+    normalized = str(hikvision_id).strip().lstrip('0') or '0'
+    numeric = None
+    if normalized.isascii() and normalized.isdigit() and len(normalized) <= NUMERIC_ID_MAX_DIGITS:
+        numeric = int(normalized)
+    return normalized, numeric
+
+
+def fill_normalized_ids(apps, schema_editor):
+    """
+    Заполняет normalized_id/numeric_id порциями по диапазону id: каждая
+    порция - один UPDATE с CASE по различным исходным ID.
+    """
+    db_alias = schema_editor.connection.alias
+    for model_name in ('EntryExit', 'CameraEvent'):
+        model = apps.get_model('camera_events', model_name)
+        queryset = model.objects.using(db_alias).filter(
+            normalized_id__isnull=True, hikvision_id__isnull=False
+        ).exclude(hikvision_id='')
+        bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            continue
+        for start in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+            chunk = queryset.filter(id__gte=start, id__lt=start + BATCH_SIZE)
+            raw_ids = set(chunk.order_by().values_list('hikvision_id', flat=True).distinct())
+            if not raw_ids:
+                continue
+            normalized_cases = []
+            numeric_cases = []
+            for raw_id in raw_ids:
+                normalized, numeric = normalize_hikvision_id(raw_id)
+                normalized_cases.append(When(hikvision_id=raw_id, then=Value(normalized)))
+                numeric_cases.append(When(hikvision_id=raw_id, then=Value(numeric)))
+            chunk.update(
+                normalized_id=Case(*normalized_cases, output_field=CharField()),
+                numeric_id=Case(*numeric_cases, output_field=BigIntegerField()),
+            )
+
+
+class Migration(migrations.Migration):
+    # Заполнение идет порциями, каждая в своей транзакции
+    atomic = False
+
+    dependencies = [
+        ('camera_events', '0014_seenidentity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cameraevent',
+            name='normalized_id',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='ID без ведущих нулей'),
+        ),
+        migrations.AddField(
+            model_name='cameraevent',
+            name='numeric_id',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Заполняется для числовых ID', null=True, verbose_name='ID числом'),
+        ),
+        migrations.AddField(
+            model_name='entryexit',
+            name='normalized_id',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='ID без ведущих нулей'),
+        ),
+        migrations.AddField(
+            model_name='entryexit',
+            name='numeric_id',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Заполняется для числовых ID', null=True, verbose_name='ID числом'),
+        ),
+        migrations.RunPython(fill_normalized_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cameraevent',
+            index=models.Index(fields=['normalized_id', 'event_time'], name='camera_even_normali_5c4077_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entryexit',
+            index=models.Index(fields=['normalized_id', 'entry_time'], name='camera_even_normali_f7de46_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entryexit',
+            index=models.Index(fields=['numeric_id', 'entry_time'], name='camera_even_numeric_5fe89e_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:40
+
+import camera_events.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camera_events', '0015_normalized_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entryexit',
+            name='entry_local_date',
+            field=models.GeneratedField(db_persist=True, expression=camera_events.models.LocalDate('entry_time'), output_field=models.DateField(), verbose_name='Дата входа (местная)'),
+        ),
+        migrations.AddField(
+            model_name='entryexit',
+            name='exit_local_date',
+            field=models.GeneratedField(db_persist=True, expression=camera_events.models.LocalDate('exit_time'), output_field=models.DateField(), verbose_name='Дата выхода (местная)'),
+        ),
+        migrations.AddIndex(
+            model_name='entryexit',
+            index=models.Index(condition=models.Q(('exit_time__isnull', True)), fields=['normalized_id', 'entry_local_date'], name='entryexit_open_session_idx'),
+        ),
+    ]
@@ -2,7 +2,43 @@
 Модели для хранения событий от камер Hikvision.
 """
 import re
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+
+
+# Числовой ID хранится в BIGINT (до 18 цифр помещается всегда)
+NUMERIC_ID_MAX_DIGITS = 18
+
+
+def normalize_hikvision_id(hikvision_id):
+    """
+    Канонический ID сотрудника: (ID без ведущих нулей, ID числом или None).
+    Нормализация та же, что у clean_id в utils.py.
+    """
+    if not hikvision_id:
+        return None, None
+    s = str(hikvision_id).strip()
+    if s.replace('0', '') == '':
+        normalized = "0"
+    else:
+        normalized = s.lstrip('0') or "0"
+    numeric = None
+    if normalized.isascii() and normalized.isdigit() and len(normalized) <= NUMERIC_ID_MAX_DIGITS:
+        numeric = int(normalized)
+    return normalized, numeric
+
+
+class LocalDate(TruncDate):
+    """
+    Дата в часовом поясе проекта (TIME_ZONE), а не в активном поясе запроса.
+    Используется в вычисляемых колонках, поэтому выражение не должно
+    зависеть от timezone.activate().
+    """
+
+    def get_tzname(self):
+        return settings.TIME_ZONE if settings.USE_TZ else None
 
 
 class Department(models.Model):
@@ -69,6 +105,22 @@ class CameraEvent(models.Model):
         verbose_name="ID от Hikvision",
         db_index=True,
     )
+    # Канонический ID (normalize_hikvision_id): поиск записей сотрудника
+    # одним условием вместо пары "очищенный или исходный ID"
+    normalized_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="ID без ведущих нулей",
+    )
+    numeric_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="ID числом",
+        help_text="Заполняется для числовых ID",
+    )
     device_name = models.CharField(
         max_length=255,
         null=True,
@@ -96,6 +148,16 @@ class CameraEvent(models.Model):
         verbose_name="Сырые данные события",
     )
     
+    # Ключ идемпотентности: хэш (устройство, serialNo) или хэш данных события.
+    # Повторная отправка события камерой не создает новую запись.
+    dedup_key = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Ключ дедупликации",
+    )
+    
     # Метаданные
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -112,12 +174,107 @@ class CameraEvent(models.Model):
         ordering = ["-event_time", "-created_at"]
         indexes = [
             models.Index(fields=["hikvision_id", "event_time"]),
+            models.Index(fields=["normalized_id", "event_time"]),
             models.Index(fields=["device_name", "event_time"]),
         ]
+        constraints = [
+            # event_time входит в ключ: serialNo сбрасывается при переинициализации терминала
+            models.UniqueConstraint(
+                fields=["dedup_key", "event_time"],
+                name="camera_event_dedup_key_uniq",
+            ),
+        ]
     
     def __str__(self):
         return f"CameraEvent {self.id} - {self.hikvision_id} - {self.event_time}"
 
+    def save(self, *args, **kwargs):
+        """Заполняет канонический ID перед сохранением."""
+        self.normalized_id, self.numeric_id = normalize_hikvision_id(self.hikvision_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'hikvision_id' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_id', 'numeric_id'}
+        super().save(*args, **kwargs)
+
+
+class ArchivedCameraEvent(models.Model):
+    """
+    Промежуточная таблица событий камер, восстановленных из архива.
+
+    Заполняется командой rehydrate_camera_events для месяца, вынесенного
+    в архив (archive_camera_events), чтобы пересчет входов/выходов мог
+    работать с архивными периодами. Поля повторяют CameraEvent.
+    """
+    original_id = models.BigIntegerField(
+        verbose_name="ID исходного события",
+        db_index=True,
+    )
+    hikvision_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name="ID от Hikvision",
+    )
+    device_name = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        verbose_name="Название устройства/камеры",
+    )
+    event_time = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Время события",
+    )
+    picture_data = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Фото в формате Base64",
+    )
+    raw_data = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Сырые данные события",
+    )
+    dedup_key = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name="Ключ дедупликации",
+    )
+    created_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Дата создания записи",
+    )
+    updated_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Дата обновления записи",
+    )
+
+    # Откуда восстановлено событие
+    archive_month = models.DateField(
+        verbose_name="Архивный месяц",
+        db_index=True,
+    )
+    archive_file = models.CharField(
+        max_length=255,
+        verbose_name="Файл архива",
+    )
+
+    class Meta:
+        verbose_name = "Архивное событие камеры"
+        verbose_name_plural = "Архивные события камер"
+        ordering = ["-event_time"]
+        indexes = [
+            models.Index(fields=["event_time"]),
+            models.Index(fields=["hikvision_id", "event_time"]),
+        ]
+
+    def __str__(self):
+        return f"ArchivedCameraEvent {self.original_id} - {self.hikvision_id} - {self.event_time}"
+
 
 class Employee(models.Model):
     """
@@ -209,6 +366,43 @@ class Employee(models.Model):
         return f"{self.name} ({self.hikvision_id}) - {dept_name}"
 
 
+class SeenIdentity(models.Model):
+    """
+    ID сотрудников, замеченных камерами (одна запись на ID без ведущих нулей).
+    Обновляется при приеме событий (identities.py), чтобы выгрузка сотрудников
+    не просматривала всю историю CameraEvent.
+    """
+    hikvision_id = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name="ID от Hikvision",
+    )
+    employee_name = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        verbose_name="Имя сотрудника на камере",
+    )
+    first_seen = models.DateTimeField(
+        verbose_name="Первое событие",
+    )
+    last_seen = models.DateTimeField(
+        verbose_name="Последнее событие",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления записи",
+    )
+
+    class Meta:
+        verbose_name = "Замеченный ID"
+        verbose_name_plural = "Замеченные ID"
+        ordering = ["hikvision_id"]
+
+    def __str__(self):
+        return f"{self.employee_name or '-'} ({self.hikvision_id})"
+
+
 class EntryExit(models.Model):
     """
     Модель для хранения записей входов и выходов.
@@ -220,6 +414,22 @@ class EntryExit(models.Model):
         verbose_name="ID от Hikvision",
         db_index=True,
     )
+    # Канонический ID (normalize_hikvision_id): поиск записей сотрудника
+    # одним условием вместо пары "очищенный или исходный ID"
+    normalized_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="ID без ведущих нулей",
+    )
+    numeric_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="ID числом",
+        help_text="Заполняется для числовых ID",
+    )
     entry_time = models.DateTimeField(
         null=True,
         blank=True,
@@ -232,6 +442,20 @@ class EntryExit(models.Model):
         verbose_name="Время выхода",
         db_index=True,
     )
+    # Локальные даты входа/выхода хранятся в БД: фильтр по дню использует
+    # индекс вместо DATE(entry_time AT TIME ZONE ...) по каждой строке
+    entry_local_date = models.GeneratedField(
+        expression=LocalDate("entry_time"),
+        output_field=models.DateField(),
+        db_persist=True,
+        verbose_name="Дата входа (местная)",
+    )
+    exit_local_date = models.GeneratedField(
+        expression=LocalDate("exit_time"),
+        output_field=models.DateField(),
+        db_persist=True,
+        verbose_name="Дата выхода (местная)",
+    )
     device_name_entry = models.CharField(
         max_length=255,
         null=True,
@@ -280,12 +504,28 @@ class EntryExit(models.Model):
         ordering = ["-entry_time"]
         indexes = [
             models.Index(fields=["hikvision_id", "entry_time"]),
+            models.Index(fields=["normalized_id", "entry_time"]),
+            models.Index(fields=["numeric_id", "entry_time"]),
+            # Открытые сессии (вход без выхода) - поиск записи при событии выхода
+            models.Index(
+                fields=["normalized_id", "entry_local_date"],
+                condition=Q(exit_time__isnull=True),
+                name="entryexit_open_session_idx",
+            ),
             models.Index(fields=["entry_time"]),
             models.Index(fields=["exit_time"]),
         ]
     
     def __str__(self):
         return f"EntryExit {self.id} - {self.hikvision_id} - {self.entry_time}"
+
+    def save(self, *args, **kwargs):
+        """Заполняет канонический ID перед сохранением."""
+        self.normalized_id, self.numeric_id = normalize_hikvision_id(self.hikvision_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'hikvision_id' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_id', 'numeric_id'}
+        super().save(*args, **kwargs)
     
     @property
     def work_duration_formatted(self):
@@ -379,6 +619,21 @@ class WorkSchedule(models.Model):
         help_text="На сколько минут можно уйти раньше (например: 15)",
     )
     
+    # Период действия версии графика (включительно).
+    # NULL в valid_from - действует с начала истории, NULL в valid_to - текущая версия.
+    valid_from = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Действует с",
+        help_text="Первый день действия графика (пусто - с начала истории)",
+    )
+    valid_to = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Действует по",
+        help_text="Последний день действия графика (пусто - действует сейчас)",
+    )
+    
     # Метаданные
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -392,10 +647,13 @@ class WorkSchedule(models.Model):
     class Meta:
         verbose_name = "График работы"
         verbose_name_plural = "Графики работы"
-        ordering = ["employee", "schedule_type"]
+        # Текущая версия (valid_to IS NULL) идет первой, поэтому
+        # employee.work_schedules.first() возвращает действующий график
+        ordering = ["employee", models.F("valid_to").desc(nulls_first=True), "schedule_type"]
         indexes = [
             models.Index(fields=["employee", "schedule_type"]),
             models.Index(fields=["schedule_type"]),
+            models.Index(fields=["employee", "valid_from", "valid_to"]),
         ]
     
     def __str__(self):
@@ -420,6 +678,14 @@ class WorkSchedule(models.Model):
             # Возвращаем только время без дней
             return f"{self.start_time.strftime('%H:%M')}-{self.end_time.strftime('%H:%M')}"
         return self.description or "Не указано"
+    
+    def is_valid_on(self, date):
+        """Проверяет, действует ли эта версия графика на указанную дату."""
+        if self.valid_from and date < self.valid_from:
+            return False
+        if self.valid_to and date > self.valid_to:
+            return False
+        return True
 
 
 class EmployeeAttendanceStats(models.Model):
@@ -0,0 +1,389 @@
+"""
+Помесячное секционирование таблицы событий камер (PostgreSQL).
+
+camera_events_cameraevent переводится в таблицу PARTITION BY RANGE (event_time)
+с секциями camera_events_cameraevent_pYYYYMM по календарным месяцам в
+часовом поясе TIME_ZONE и секцией по умолчанию для событий вне созданных
+диапазонов (и событий без event_time). Запросы по диапазону времени читают
+только нужные секции, VACUUM и удаление старых данных работают по секциям.
+
+Первичный ключ секционированной таблицы должен включать event_time, который
+может быть NULL, поэтому вместо PRIMARY KEY (id) создается обычный индекс
+по id: уникальность id обеспечивает последовательность. Ограничение
+camera_event_dedup_key_uniq уже включает event_time и переносится как есть.
+
+Миграции, добавляющие поля и индексы CameraEvent, на секционированной
+таблице выполняются без изменений (CREATE INDEX CONCURRENTLY недоступен).
+"""
+import logging
+import re
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .hikvision_parser import parse_event_payload
+from .models import CameraEvent
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME_RE = re.compile(r"_p(\d{4})(\d{2})$")
+# Ключ в raw_data, сокращенном политикой хранения
+COMPACT_RAW_DATA_MARKER = "retention"
+
+
+def parent_table():
+    return CameraEvent._meta.db_table
+
+
+def partition_name(month):
+    return f"{parent_table()}_p{month.year:04d}{month.month:02d}"
+
+
+def default_partition_name():
+    return f"{parent_table()}_default"
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bound(month):
+    """Начало месяца в часовом поясе проекта (литерал timestamptz)."""
+    return timezone.make_aware(datetime(month.year, month.month, 1)).isoformat()
+
+
+def _require_postgresql():
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Секционирование событий камер поддерживается только для PostgreSQL")
+
+
+def is_partitioned():
+    _require_postgresql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)",
+            [parent_table()],
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions():
+    """
+    Секции таблицы событий.
+
+    Returns:
+        Список (имя, месяц или None для секции по умолчанию, оценка числа строк).
+    """
+    _require_postgresql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [parent_table()],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, estimate in rows:
+        partitions.append((name, partition_month(name), max(estimate, 0)))
+    return partitions
+
+
+def partition_month(name):
+    """Месяц секции по ее имени или None (секция по умолчанию)."""
+    match = PARTITION_NAME_RE.search(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def detached_partitions():
+    """Имена отсоединенных секций (таблицы *_pYYYYMM вне секционированной таблицы)."""
+    _require_postgresql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_class c "
+            "WHERE c.relkind = 'r' AND c.relname LIKE %s AND pg_table_is_visible(c.oid) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)",
+            [parent_table().replace("_", r"\_") + r"\_p%"],
+        )
+        return [name for (name,) in cursor.fetchall() if partition_month(name)]
+
+
+def create_month_partition(month):
+    """
+    Создает секцию месяца, если ее нет.
+
+    События этого месяца, уже попавшие в секцию по умолчанию, переносятся
+    в новую секцию (иначе PostgreSQL не позволит ее создать).
+
+    Returns:
+        True, если секция создана.
+    """
+    name = partition_name(month)
+    quote = connection.ops.quote_name
+    start, end = month_bound(month), month_bound(add_months(month, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute("SELECT to_regclass(%s)", [default_partition_name()])
+        has_default = cursor.fetchone()[0] is not None
+        if has_default:
+            cursor.execute(
+                f"CREATE TEMP TABLE _camera_event_moved ON COMMIT DROP AS "
+                f"WITH moved AS (DELETE FROM {quote(default_partition_name())} "
+                f"WHERE event_time >= %s AND event_time < %s RETURNING *) SELECT * FROM moved",
+                [start, end],
+            )
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(parent_table())} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+        if has_default:
+            cursor.execute(f"INSERT INTO {quote(parent_table())} SELECT * FROM _camera_event_moved")
+            if cursor.rowcount:
+                logger.info(f"Перенесено {cursor.rowcount} событий из секции по умолчанию в {name}")
+            cursor.execute("DROP TABLE _camera_event_moved")
+    logger.info(f"Создана секция {name}")
+    return True
+
+
+def ensure_partitions(months_ahead=None, today=None):
+    """
+    Создает секции текущего месяца и months_ahead следующих.
+
+    Returns:
+        Список созданных секций.
+    """
+    if months_ahead is None:
+        months_ahead = getattr(settings, "CAMERA_EVENT_PARTITION_MONTHS_AHEAD", 3)
+    current = month_start(today or timezone.localdate())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_month_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def detach_partitions(older_than_months, today=None):
+    """
+    Отсоединяет секции месяцев старше older_than_months.
+
+    Отсоединенная секция остается обычной таблицей с тем же именем
+    (данные доступны для архивации), но не участвует в запросах к событиям.
+
+    Returns:
+        Список отсоединенных секций.
+    """
+    cutoff = add_months(month_start(today or timezone.localdate()), -older_than_months)
+    quote = connection.ops.quote_name
+    detached = []
+    for name, month, _ in list_partitions():
+        if month is None or month >= cutoff:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(parent_table())} DETACH PARTITION {quote(name)}")
+        logger.info(f"Секция {name} отсоединена")
+        detached.append(name)
+    return detached
+
+
+def _index_definitions(cursor, table):
+    """Индексы таблицы, не являющиеся ограничениями: (имя, CREATE INDEX ...)."""
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = to_regclass(%s) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def _constraint_definitions(cursor, table):
+    """Ограничения UNIQUE и FOREIGN KEY таблицы: (имя, определение)."""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('u', 'f')",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def _legacy_name(name):
+    # Имена объектов PostgreSQL ограничены 63 байтами
+    return name[:56] + "_legacy"
+
+
+def convert_to_partitioned(months_ahead=None, keep_legacy=False):
+    """
+    Переводит существующую таблицу событий в секционированную.
+
+    Выполняется в одной транзакции: таблица переименовывается, создается
+    секционированная таблица с теми же столбцами, индексами и ограничениями,
+    секции всех месяцев с событиями и months_ahead будущих, данные
+    копируются. На время копирования таблица заблокирована: прием событий
+    в это время уходит в spool (CAMERA_INGEST_SPOOL_ENABLED).
+
+    Args:
+        months_ahead: Сколько будущих месяцев создать
+        keep_legacy: Не удалять исходную таблицу (остается как *_legacy)
+
+    Returns:
+        Количество перенесенных событий.
+    """
+    _require_postgresql()
+    if is_partitioned():
+        raise RuntimeError(f"Таблица {parent_table()} уже секционирована")
+
+    table = parent_table()
+    legacy = _legacy_name(table)
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+        indexes = _index_definitions(cursor, table)
+        constraints = _constraint_definitions(cursor, table)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}")
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {quote(name)} RENAME TO {quote(_legacy_name(name))}")
+        for name, _ in constraints:
+            cursor.execute(
+                f"ALTER TABLE {quote(legacy)} RENAME CONSTRAINT {quote(name)} TO {quote(_legacy_name(name))}"
+            )
+        if sequence:
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {quote(_legacy_name(table + '_id_seq'))}")
+
+        # INCLUDING IDENTITY недоступен для секционированных таблиц до PostgreSQL 17
+        cursor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS "
+            f"INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE (event_time)"
+        )
+        new_sequence = quote(f"{table}_id_seq")
+        cursor.execute(f"CREATE SEQUENCE {new_sequence} OWNED BY {quote(table)}.id")
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{new_sequence}')")
+        cursor.execute(f"CREATE INDEX {quote(table + '_id_idx')} ON {quote(table)} (id)")
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+        for name, definition in indexes:
+            cursor.execute(definition)
+
+        cursor.execute(
+            f"CREATE TABLE {quote(default_partition_name())} PARTITION OF {quote(table)} DEFAULT"
+        )
+        cursor.execute(f"SELECT min(event_time), max(event_time) FROM {quote(legacy)}")
+        first, last = cursor.fetchone()
+        current = month_start(timezone.localdate())
+        month = month_start(timezone.localtime(first)) if first else current
+        last_month = max(current, month_start(timezone.localtime(last)) if last else current)
+        last_month = add_months(last_month, getattr(settings, "CAMERA_EVENT_PARTITION_MONTHS_AHEAD", 3)
+                                if months_ahead is None else months_ahead)
+        while month <= last_month:
+            cursor.execute(
+                f"CREATE TABLE {quote(partition_name(month))} PARTITION OF {quote(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month_bound(month), month_bound(add_months(month, 1))],
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}")
+        copied = cursor.rowcount
+        cursor.execute(
+            f"SELECT setval('{new_sequence}', COALESCE((SELECT max(id) FROM {quote(legacy)}), 0) + 1, false)"
+        )
+        if not keep_legacy:
+            cursor.execute(f"DROP TABLE {quote(legacy)}")
+        cursor.execute(f"ANALYZE {quote(table)}")
+    logger.info(f"Таблица {table} секционирована, перенесено событий: {copied}")
+    return copied
+
+
+def apply_retention(picture_days=None, raw_data_days=None, batch_size=5000, now=None):
+    """
+    Применяет политику хранения событий камер.
+
+    Фото удаляются у событий старше picture_days дней. raw_data старше
+    raw_data_days дней сокращается до полей, нужных для определения
+    сотрудника и направления (вход/выход) при пересчете, - полный JSON
+    события не хранится. Обновление выполняется пакетами по batch_size.
+
+    Args:
+        picture_days: Срок хранения фото (None - CAMERA_EVENT_RETENTION_PICTURE_DAYS)
+        raw_data_days: Срок хранения raw_data (None - CAMERA_EVENT_RETENTION_RAW_DATA_DAYS)
+
+    Returns:
+        {"pictures": N, "raw_data": N} - количество обновленных событий.
+    """
+    now = now or timezone.now()
+    if picture_days is None:
+        picture_days = getattr(settings, "CAMERA_EVENT_RETENTION_PICTURE_DAYS", 90)
+    if raw_data_days is None:
+        raw_data_days = getattr(settings, "CAMERA_EVENT_RETENTION_RAW_DATA_DAYS", 365)
+
+    result = {"pictures": 0, "raw_data": 0}
+    if picture_days:
+        # Условие по event_time и в UPDATE: на секционированной таблице
+        # читаются только старые секции
+        cutoff = now - timedelta(days=picture_days)
+        queryset = CameraEvent.objects.filter(event_time__lt=cutoff, picture_data__isnull=False)
+        while True:
+            ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            result["pictures"] += CameraEvent.objects.filter(
+                pk__in=ids, event_time__lt=cutoff,
+            ).update(picture_data=None)
+
+    if raw_data_days:
+        queryset = CameraEvent.objects.filter(
+            event_time__lt=now - timedelta(days=raw_data_days), raw_data__isnull=False,
+        ).exclude(raw_data__has_key=COMPACT_RAW_DATA_MARKER)
+        while True:
+            events = list(queryset.only("pk", "raw_data")[:batch_size])
+            if not events:
+                break
+            for camera_event in events:
+                camera_event.raw_data = compact_raw_data(camera_event.raw_data)
+            CameraEvent.objects.bulk_update(events, ["raw_data"])
+            result["raw_data"] += len(events)
+    return result
+
+
+def compact_raw_data(raw_data):
+    """
+    Сокращает raw_data до полей, которые читают event_processor, админка и API.
+
+    Структура (ipAddress + AccessControllerEvent) совместима с разбором
+    hikvision_parser и определением направления по IP камеры.
+    """
+    if not isinstance(raw_data, dict):
+        return {COMPACT_RAW_DATA_MARKER: True}
+    parsed = parse_event_payload(raw_data, for_display=True)
+    access_event = {
+        "employeeNoString": parsed.employee_no or parsed.hikvision_id,
+        "name": parsed.employee_name,
+        "cardNo": parsed.card_no,
+        "deviceName": parsed.device_name,
+        "majorEventType": parsed.major_event_type,
+        "subEventType": parsed.sub_event_type,
+        "serialNo": parsed.serial_no,
+    }
+    return {
+        COMPACT_RAW_DATA_MARKER: True,
+        "ipAddress": parsed.camera_ip,
+        "dateTime": parsed.event_time_raw,
+        "eventType": parsed.event_type,
+        "AccessControllerEvent": {key: value for key, value in access_event.items() if value is not None},
+    }
@@ -0,0 +1,301 @@
+"""
+Табло присутствия: кто сейчас на территории.
+
+Индекс в памяти процесса хранит открытые сессии EntryExit (вход без
+выхода) по ID сотрудника без ведущих нулей и справочник сотрудников
+(имя, подразделение, круглосуточный график). Обработка событий камер
+(event_processor) обновляет индекс после фиксации транзакции, поэтому
+табло отдается без запросов к БД.
+
+Индекс собирается из БД при первом обращении и затем не реже раза в
+PRESENCE_REFRESH_SECONDS: так в процесс попадают события, обработанные
+другими процессами (gunicorn), пересчет и правки в админке. Сборка читает
+только открытые сессии за последние дни (частичный индекс
+entryexit_open_session_idx) и справочник сотрудников.
+
+Сессия считается открытой столько же, сколько ее может закрыть выход при
+обработке событий: 24 часа, для круглосуточных графиков 48 часов. Более
+старые сессии без выхода (забытая отметка) на табло не показываются.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .compiled_schedules import select_schedule_version
+from .department_tree import _format_department_old, _strip_aup_prefix
+from .models import Department, Employee, EntryExit, SeenIdentity, WorkSchedule
+from .utils import EXCLUDED_DEPARTMENTS, clean_id
+
+logger = logging.getLogger(__name__)
+
+# Окно поиска открытых сессий (как при поиске входа для выхода в event_processor)
+LOOKBACK_DAYS = 2
+MAX_SESSION_HOURS = 24
+MAX_ROUND_THE_CLOCK_SESSION_HOURS = 48
+
+NO_DEPARTMENT_NAME = "Без подразделения"
+
+
+class _Person:
+    """Сотрудник в справочнике индекса."""
+
+    __slots__ = ("employee_id", "name", "department_key", "round_the_clock")
+
+    def __init__(self, employee_id, name, department_key, round_the_clock):
+        self.employee_id = employee_id
+        self.name = name
+        self.department_key = department_key
+        self.round_the_clock = round_the_clock
+
+
+def _load_directory(today):
+    """
+    Справочник сотрудников: (ID -> _Person, подразделения, исключенные ID).
+
+    Подразделения: ключ группы -> (название, id подразделения и его предков).
+    Ключ группы - id подразделения или текст устаревшего поля department_old.
+    Круглосуточный график определяется по версии, действующей на today.
+    """
+    departments = {
+        dept["id"]: dept for dept in Department.objects.values("id", "name", "parent_id")
+    }
+    schedules = defaultdict(list)
+    for schedule in WorkSchedule.objects.filter(
+        Q(valid_from__isnull=True) | Q(valid_from__lte=today),
+        Q(valid_to__isnull=True) | Q(valid_to__gte=today),
+    ).only("id", "employee_id", "schedule_type", "valid_from", "valid_to"):
+        schedules[schedule.employee_id].append(schedule)
+    round_the_clock = {
+        employee_id for employee_id, versions in schedules.items()
+        if select_schedule_version(versions, today).schedule_type == "round_the_clock"
+    }
+
+    def ancestors(dept_id):
+        chain = []
+        current = departments.get(dept_id)
+        while current and current["id"] not in chain:
+            chain.append(current["id"])
+            current = departments.get(current["parent_id"])
+        return chain
+
+    people = {}
+    groups = {}
+    excluded = set()
+    for emp in Employee.objects.values("id", "hikvision_id", "name", "department_id", "department_old"):
+        hikvision_id = clean_id(emp["hikvision_id"])
+        if not hikvision_id:
+            continue
+        if emp["department_id"] in departments:
+            key = emp["department_id"]
+            if key not in groups:
+                chain = ancestors(key)
+                path = " > ".join(departments[dept_id]["name"] for dept_id in reversed(chain))
+                groups[key] = (_strip_aup_prefix(path), frozenset(chain))
+            excluded_department = departments[key]["name"] in EXCLUDED_DEPARTMENTS
+        elif emp["department_old"]:
+            key = emp["department_old"]
+            groups.setdefault(key, (_format_department_old(key), frozenset()))
+            excluded_department = key in EXCLUDED_DEPARTMENTS
+        else:
+            key = None
+            excluded_department = False
+        if excluded_department:
+            excluded.add(hikvision_id)
+            continue
+        people[hikvision_id] = _Person(emp["id"], emp["name"], key, emp["id"] in round_the_clock)
+    groups[None] = (NO_DEPARTMENT_NAME, frozenset())
+    return people, groups, excluded
+
+
+def _load_open_sessions(now):
+    """Открытые сессии за окно LOOKBACK_DAYS: ID -> (id записи, время входа, устройство)."""
+    since = timezone.localdate(now) - timedelta(days=LOOKBACK_DAYS)
+    sessions = {}
+    rows = EntryExit.objects.filter(
+        exit_time__isnull=True, entry_time__isnull=False, entry_local_date__gte=since,
+    ).values_list("id", "normalized_id", "entry_time", "device_name_entry").order_by("entry_time")
+    for entry_exit_id, normalized_id, entry_time, device_name in rows:
+        # При нескольких открытых сессиях показывается последняя
+        sessions[normalized_id] = (entry_exit_id, entry_time, device_name)
+    return sessions
+
+
+class PresenceIndex:
+    """Открытые сессии и справочник сотрудников (общие для потоков процесса)."""
+
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._sessions = {}
+        self._people = {}
+        self._groups = {}
+        self._excluded = set()
+        self._names = {}
+        self._built_at = None
+        self._version = 0
+        self._rendered = (None, None)
+
+    def rebuild(self):
+        """Собирает индекс из БД."""
+        started = time.perf_counter()
+        now = timezone.now()
+        people, groups, excluded = _load_directory(timezone.localdate(now))
+        sessions = _load_open_sessions(now)
+        # Имена сотрудников, которых нет в справочнике, - из событий камер
+        unknown = [hikvision_id for hikvision_id in sessions if hikvision_id not in people]
+        names = dict(
+            SeenIdentity.objects.filter(hikvision_id__in=unknown).values_list("hikvision_id", "employee_name")
+        ) if unknown else {}
+        with self._lock:
+            self._people, self._groups, self._excluded, self._names = people, groups, excluded, names
+            self._sessions = sessions
+            self._built_at = time.monotonic()
+            self._version += 1
+        logger.debug(
+            f"Индекс присутствия собран: {len(sessions)} открытых сессий, "
+            f"{(time.perf_counter() - started) * 1000:.1f} мс"
+        )
+
+    def invalidate(self):
+        """Пересобрать индекс при следующем обращении (после пересчета EntryExit)."""
+        with self._lock:
+            self._built_at = None
+
+    def _ensure_fresh(self):
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at < self.refresh_seconds:
+            return
+        # Первую сборку ждут все запросы, обновление выполняет один поток,
+        # остальные отдают текущее состояние
+        if not self._rebuild_lock.acquire(blocking=built_at is None):
+            return
+        try:
+            if self._built_at == built_at:
+                self.rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def note_entry(self, hikvision_id, entry_exit_id, entry_time, device_name):
+        """Вход: открыта сессия или у открытой сессии изменилось время входа."""
+        with self._lock:
+            # Индекс еще не собран (или сброшен) - сборка прочитает запись из БД
+            if self._built_at is None:
+                return
+            current = self._sessions.get(hikvision_id)
+            if current is None or current[0] == entry_exit_id or current[1] <= entry_time:
+                self._sessions[hikvision_id] = (entry_exit_id, entry_time, device_name)
+                self._version += 1
+
+    def note_exit(self, hikvision_id, entry_exit_id):
+        """Выход: сессия закрыта."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            current = self._sessions.get(hikvision_id)
+            if current is not None and current[0] == entry_exit_id:
+                del self._sessions[hikvision_id]
+                self._version += 1
+
+    def board(self, now=None, department_id=None):
+        """
+        Сотрудники на территории по подразделениям.
+
+        Args:
+            now: Момент, на который считается время присутствия
+            department_id: Только указанное подразделение и его дочерние
+
+        Returns:
+            Словарь generated_at, total и departments (список групп с
+            department_id, department_name, count и employees).
+        """
+        self._ensure_fresh()
+        now = now or timezone.now()
+        with self._lock:
+            sessions = list(self._sessions.items())
+            people, groups, excluded, names = self._people, self._groups, self._excluded, self._names
+
+        by_group = defaultdict(list)
+        for hikvision_id, (entry_exit_id, entry_time, device_name) in sessions:
+            if hikvision_id in excluded:
+                continue
+            person = people.get(hikvision_id)
+            elapsed = (now - entry_time).total_seconds()
+            max_hours = MAX_ROUND_THE_CLOCK_SESSION_HOURS if person and person.round_the_clock else MAX_SESSION_HOURS
+            if elapsed < 0 or elapsed > max_hours * 3600:
+                continue
+            key = person.department_key if person else None
+            if department_id is not None and department_id not in groups.get(key, (None, ()))[1]:
+                continue
+            by_group[key].append({
+                "hikvision_id": hikvision_id,
+                "employee_id": person.employee_id if person else None,
+                "name": person.name if person else names.get(hikvision_id),
+                "entry_time": timezone.localtime(entry_time),
+                "elapsed_seconds": int(elapsed),
+                "device_name": device_name,
+                "entry_exit_id": entry_exit_id,
+            })
+
+        departments = []
+        for key, employees in by_group.items():
+            employees.sort(key=lambda item: item["entry_time"])
+            departments.append({
+                "department_id": key if isinstance(key, int) else None,
+                "department_name": groups.get(key, (NO_DEPARTMENT_NAME,))[0],
+                "count": len(employees),
+                "employees": employees,
+            })
+        # Группа "Без подразделения" - в конце
+        departments.sort(key=lambda item: (item["department_name"] == NO_DEPARTMENT_NAME, item["department_name"]))
+        return {
+            "generated_at": timezone.localtime(now),
+            "total": sum(item["count"] for item in departments),
+            "departments": departments,
+        }
+
+    def board_json(self, department_id=None):
+        """
+        Табло в JSON (bytes).
+
+        Время присутствия считается с точностью до секунды, поэтому JSON
+        без фильтра кэшируется до изменения индекса или следующей секунды:
+        частые опросы табло многими экранами не сериализуют его заново.
+        """
+        self._ensure_fresh()
+        now = timezone.now().replace(microsecond=0)
+        key = (self._version, now)
+        if department_id is None:
+            cached_key, content = self._rendered
+            if cached_key == key:
+                return content
+        content = json.dumps(
+            self.board(now, department_id), ensure_ascii=False, cls=DjangoJSONEncoder
+        ).encode("utf-8")
+        if department_id is None:
+            self._rendered = (key, content)
+        return content
+
+
+presence_index = PresenceIndex(getattr(settings, "PRESENCE_REFRESH_SECONDS", 15))
+
+
+def note_entry(entry_exit):
+    """Отмечает вход после фиксации транзакции (вызывается из event_processor)."""
+    transaction.on_commit(lambda: presence_index.note_entry(
+        entry_exit.normalized_id, entry_exit.pk, entry_exit.entry_time, entry_exit.device_name_entry,
+    ))
+
+
+def note_exit(entry_exit):
+    """Отмечает выход после фиксации транзакции (вызывается из event_processor)."""
+    transaction.on_commit(lambda: presence_index.note_exit(entry_exit.normalized_id, entry_exit.pk))
@@ -0,0 +1,206 @@
+"""
+Профилирование запросов: число и время SQL, самые медленные запросы с местом
+вызова, время Python и выделенная память.
+
+Включается настройкой PROFILING_ENABLED (переменная окружения), иначе
+RequestProfilingMiddleware исключается из цепочки при запуске и не
+добавляет накладных расходов.
+
+Для каждого запроса:
+  - заголовки ответа X-DB-Queries, X-DB-Time-Ms, X-Python-Time-Ms,
+    X-CPU-Time-Ms и X-Memory-Peak-KB (при PROFILING_TRACE_MEMORY);
+  - запись в кольцевой буфер последних PROFILING_RING_SIZE запросов
+    (web_views.profiling_requests, только для staff);
+  - при времени больше PROFILING_SLOW_REQUEST_MS - предупреждение в лог
+    со всеми SQL запроса;
+  - при числе SQL больше бюджета представления (PROFILING_QUERY_BUDGETS,
+    ключ - имя маршрута, например "attendance-stats-list") - предупреждение
+    в лог, так видны N+1 после изменений.
+
+Пиковая память считается через tracemalloc, который общий для процесса:
+при параллельных запросах в потоках пик включает чужие выделения.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько SQL одного запроса хранить с текстом (остальные только считаются)
+MAX_RECORDED_STATEMENTS = 1000
+
+_PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _call_site():
+    """Первый кадр стека из кода проекта (не Django, не site-packages)."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(_PROJECT_DIR)
+            and filename != _THIS_FILE
+            and "site-packages" not in filename
+        ):
+            relative = filename[len(_PROJECT_DIR):]
+            return f"{relative}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ""
+
+
+class QueryCollector:
+    """execute_wrapper: время и текст каждого SQL запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.total_seconds += duration
+            if len(self.statements) < MAX_RECORDED_STATEMENTS:
+                alias = context["connection"].alias
+                self.statements.append((duration, alias, sql, _call_site()))
+
+    def slowest(self, limit):
+        return sorted(self.statements, key=lambda item: item[0], reverse=True)[:limit]
+
+
+class ProfileBuffer:
+    """Кольцевой буфер последних профилей запросов (общий для потоков процесса)."""
+
+    def __init__(self, size):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        with self._lock:
+            self._items.append(record)
+
+    def snapshot(self):
+        with self._lock:
+            return list(reversed(self._items))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+profile_buffer = ProfileBuffer(getattr(settings, "PROFILING_RING_SIZE", 200))
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else ""
+
+
+class RequestProfilingMiddleware:
+    """
+    Профиль каждого запроса (см. описание модуля).
+
+    Ставится сразу после CameraIngestFilterMiddleware: отброшенные heartbeat
+    камер не попадают в буфер.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top_queries = getattr(settings, "PROFILING_TOP_QUERIES", 5)
+        self.slow_request_ms = getattr(settings, "PROFILING_SLOW_REQUEST_MS", 1000)
+        self.budgets = getattr(settings, "PROFILING_QUERY_BUDGETS", {})
+        self.trace_memory = getattr(settings, "PROFILING_TRACE_MEMORY", False)
+        self.excluded_paths = tuple(getattr(settings, "PROFILING_EXCLUDED_PATHS", ()))
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        if self.excluded_paths and request.path_info.startswith(self.excluded_paths):
+            return self.get_response(request)
+
+        collector = QueryCollector()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        cpu_started = time.thread_time()
+        started = time.perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+
+        total_ms = (time.perf_counter() - started) * 1000
+        cpu_ms = (time.thread_time() - cpu_started) * 1000
+        sql_ms = collector.total_seconds * 1000
+        python_ms = max(total_ms - sql_ms, 0.0)
+        memory_peak_kb = None
+        if self.trace_memory:
+            memory_peak_kb = max(tracemalloc.get_traced_memory()[1] - memory_start, 0) / 1024
+
+        view_name = _view_name(request)
+        budget = self.budgets.get(view_name)
+        over_budget = budget is not None and collector.count > budget
+
+        response["X-DB-Queries"] = str(collector.count)
+        response["X-DB-Time-Ms"] = f"{sql_ms:.1f}"
+        response["X-Python-Time-Ms"] = f"{python_ms:.1f}"
+        response["X-CPU-Time-Ms"] = f"{cpu_ms:.1f}"
+        if memory_peak_kb is not None:
+            response["X-Memory-Peak-KB"] = f"{memory_peak_kb:.0f}"
+
+        profile_buffer.append({
+            "time": time.time(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view_name,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "sql_ms": round(sql_ms, 1),
+            "python_ms": round(python_ms, 1),
+            "cpu_ms": round(cpu_ms, 1),
+            "memory_peak_kb": round(memory_peak_kb) if memory_peak_kb is not None else None,
+            "queries": collector.count,
+            "query_budget": budget,
+            "over_budget": over_budget,
+            "slowest": [
+                {"ms": round(duration * 1000, 2), "db": alias, "sql": sql, "site": site}
+                for duration, alias, sql, site in collector.slowest(self.top_queries)
+            ],
+        })
+
+        if over_budget:
+            logger.warning(
+                f"Превышен бюджет SQL для {view_name}: {collector.count} запросов "
+                f"(бюджет {budget}), {request.method} {request.path}"
+            )
+        if total_ms > self.slow_request_ms:
+            self._log_slow_request(request, collector, total_ms, sql_ms)
+        return response
+
+    def _log_slow_request(self, request, collector, total_ms, sql_ms):
+        lines = [
+            f"Медленный запрос {request.method} {request.get_full_path()}: {total_ms:.0f} мс, "
+            f"SQL {collector.count} запросов / {sql_ms:.0f} мс"
+        ]
+        for duration, alias, sql, site in collector.statements:
+            lines.append(f"  {duration * 1000:8.2f} мс [{alias}] {site}: {sql}")
+        if collector.count > len(collector.statements):
+            lines.append(f"  ... еще {collector.count - len(collector.statements)} запросов")
+        logger.warning("\n".join(lines))
@@ -1,19 +1,52 @@
 """
 Python версия генерации отчетов о посещаемости.
-Использует Django ORM вместо SQL запросов.
+
+Используется как запасной вариант, когда SQL-отчет недоступен, и как эталонная
+реализация для сверки с sql_reports. Записи EntryExit за период загружаются одним
+запросом в массивы NumPy; ключи дней, продолжительности, опоздания и ранние уходы
+вычисляются векторно. Все вычисления ведутся в локальном "настенном" времени
+(микросекунды), как при сравнении datetime с одинаковым tzinfo.
 """
 from django.utils import timezone
-from datetime import datetime, timedelta, time, date
-from typing import Optional, List, Dict, Tuple
+from datetime import datetime, timedelta, time, date, timezone as dt_timezone
+from typing import Optional, List, Dict, Tuple, Iterable
 import logging
-from collections import defaultdict
 
-from .models import EntryExit, Employee, WorkSchedule, Department
-from .utils import clean_id, get_excluded_hikvision_ids
-from .schedule_matcher import ScheduleMatcher
+import numpy as np
+
+from .models import EntryExit, Employee, WorkSchedule
+from .utils import clean_id, employee_id_lookup, get_excluded_hikvision_ids
+from .compiled_schedules import ScheduleIndex, local_midnight_timestamps
 
 logger = logging.getLogger(__name__)
 
+_US_PER_SECOND = 1_000_000
+_US_PER_MINUTE = 60 * _US_PER_SECOND
+_US_PER_HOUR = 60 * _US_PER_MINUTE
+_US_PER_DAY = 24 * _US_PER_HOUR
+
+# date(1970, 1, 1).toordinal() - перевод "дней от эпохи" в порядковый номер даты
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Смена круглосуточного графика ("24" в табеле) - запись продолжительностью 20-30 часов
+_SHIFT_MIN_US = 20 * _US_PER_HOUR
+_SHIFT_MAX_US = 30 * _US_PER_HOUR
+
+# Утреннее окно входа для круглосуточных графиков (включительно)
+_MORNING_FROM_US = 7 * _US_PER_HOUR
+_MORNING_TO_US = 10 * _US_PER_HOUR
+
+# Порог раннего прихода / позднего выхода (минуты), как в sql_reports
+_EARLY_ARRIVAL_THRESHOLD = 10
+_LATE_DEPARTURE_THRESHOLD = 10
+
+# Шаг, с которым вычисляется смещение часового пояса (микросекунды)
+_OFFSET_BUCKET_US = 15 * _US_PER_MINUTE
+
+_SCHEDULE_TYPE_CODES = {'regular': 0, 'floating': 1, 'round_the_clock': 2}
+_RTC = _SCHEDULE_TYPE_CODES['round_the_clock']
+
 
 def is_round_the_clock_morning_entry(dt: datetime) -> bool:
     """
@@ -31,118 +64,182 @@ def is_round_the_clock_morning_entry(dt: datetime) -> bool:
     return True
 
 
-def is_work_day_for_schedule(schedule: WorkSchedule, check_date: date, employee: Employee = None) -> bool:
+def _datetimes_to_utc_us(values: Iterable[datetime]) -> np.ndarray:
+    """Переводит aware datetime (или None) в микросекунды Unix (None -> 0)."""
+    return np.array(
+        [
+            value.astimezone(dt_timezone.utc).replace(tzinfo=None) if value is not None else _EPOCH.replace(tzinfo=None)
+            for value in values
+        ],
+        dtype='datetime64[us]',
+    ).astype(np.int64)
+
+
+def _utc_us_to_local(value_us: int) -> datetime:
+    """Переводит микросекунды Unix в локальный aware datetime."""
+    return timezone.localtime(_EPOCH + timedelta(microseconds=int(value_us)))
+
+
+def _local_wall_us(utc_us: np.ndarray) -> np.ndarray:
+    """
+    Переводит микросекунды Unix в локальное "настенное" время (тоже микросекунды).
+
+    Смещение часового пояса вычисляется один раз на 15-минутный интервал;
+    если смещение меняется внутри интервала, значения считаются поштучно.
+    """
+    if len(utc_us) == 0:
+        return utc_us.copy()
+    tz = timezone.get_current_timezone()
+
+    def offset_us(moment_us):
+        moment = _EPOCH + timedelta(microseconds=int(moment_us))
+        return moment.astimezone(tz).utcoffset() // timedelta(microseconds=1)
+
+    buckets, inverse = np.unique(utc_us // _OFFSET_BUCKET_US, return_inverse=True)
+    bucket_start = [offset_us(b * _OFFSET_BUCKET_US) for b in buckets]
+    bucket_end = [offset_us((b + 1) * _OFFSET_BUCKET_US - 1) for b in buckets]
+    offsets = np.array(bucket_start, dtype=np.int64)[inverse]
+
+    changing = np.nonzero(np.array(bucket_start) != np.array(bucket_end))[0]
+    if len(changing):
+        rows = np.nonzero(np.isin(inverse, changing))[0]
+        offsets[rows] = [offset_us(utc_us[i]) for i in rows]
+    return utc_us + offsets
+
+
+def _department_name(employee: Employee) -> str:
+    """Название подразделения сотрудника для отчета (родитель > подразделение)."""
+    if employee.department:
+        try:
+            if employee.department.parent:
+                return f"{employee.department.parent.name} > {employee.department.name}"
+            return employee.department.name
+        except Exception:
+            return employee.department.name if employee.department.name else ''
+    if employee.department_old:
+        return employee.department_old.replace('/', ' > ')
+    return ''
+
+
+def _find_round_the_clock_shift_days(hikvision_ids: Iterable[str], start_date: date, end_date: date) -> set:
+    """
+    Возвращает множество (hikvision_id, date) дней, в которые у сотрудника была
+    смена круглосуточного графика: запись с входом в этот день и продолжительностью
+    20-30 часов, либо вход в этот день и выход на следующий день через 20-30 часов.
+
+    Выполняет два запроса на весь диапазон вместо запросов на каждый день.
+    """
+    hikvision_ids = list(hikvision_ids)
+    if not hikvision_ids or start_date > end_date:
+        return set()
+
+    midnights = local_midnight_timestamps(start_date, end_date + timedelta(days=2)) * _US_PER_SECOND
+    start_ordinal = start_date.toordinal()
+    days = (end_date - start_date).days + 1
+
+    def aware(index):
+        return _EPOCH + timedelta(microseconds=int(midnights[index]))
+
+    entries = list(
+        EntryExit.objects.filter(
+            hikvision_id__in=hikvision_ids,
+            entry_time__gte=aware(0),
+            entry_time__lt=aware(days),
+            exit_time__isnull=False,
+        ).values_list('hikvision_id', 'entry_time', 'work_duration_seconds')
+    )
+    if not entries:
+        return set()
+    next_day_exits = list(
+        EntryExit.objects.filter(
+            hikvision_id__in=hikvision_ids,
+            exit_time__gte=aware(1),
+            exit_time__lt=aware(days + 1),
+            entry_time__isnull=False,
+        ).values_list('hikvision_id', 'exit_time')
+    )
+
+    result = set()
+    entry_us = _datetimes_to_utc_us(row[1] for row in entries)
+    # Индекс дня входа относительно start_date (границы дней - локальные полуночи)
+    entry_day = np.searchsorted(midnights, entry_us, side='right') - 1
+    durations = np.array([row[2] or 0 for row in entries], dtype=np.int64) * _US_PER_SECOND
+    by_duration = (durations >= _SHIFT_MIN_US) & (durations <= _SHIFT_MAX_US)
+    for i in np.nonzero(by_duration)[0]:
+        result.add((entries[i][0], date.fromordinal(start_ordinal + int(entry_day[i]))))
+
+    # Пары "вход в день D - выход в день D+1" с разницей 20-30 часов
+    exits_by_id = {}
+    for hikvision_id, exit_time in next_day_exits:
+        exits_by_id.setdefault(hikvision_id, []).append(exit_time)
+    entry_ids = np.array([row[0] for row in entries], dtype=object)
+    for hikvision_id, exit_times in exits_by_id.items():
+        exit_us = np.sort(_datetimes_to_utc_us(exit_times))
+        rows = np.nonzero(entry_ids == hikvision_id)[0]
+        rows = rows[~by_duration[rows]]
+        if len(rows) == 0:
+            continue
+        day = entry_day[rows]
+        low = np.maximum(entry_us[rows] + _SHIFT_MIN_US, midnights[day + 1])
+        high = np.minimum(entry_us[rows] + _SHIFT_MAX_US, midnights[day + 2] - 1)
+        found = np.searchsorted(exit_us, high, side='right') > np.searchsorted(exit_us, low, side='left')
+        for d in np.unique(day[found & (low <= high)]):
+            result.add((hikvision_id, date.fromordinal(start_ordinal + int(d))))
+    return result
+
+
+def is_work_day_for_schedule(schedule: WorkSchedule, check_date: date, employee: Employee = None,
+                             shift_days: Optional[set] = None) -> bool:
     """
     Проверяет, является ли дата рабочим днем по графику.
     Для круглосуточных графиков также проверяет фактические записи EntryExit,
     чтобы определить, была ли смена (24 часа работы).
-    
+
     Args:
         schedule: График работы
         check_date: Дата для проверки
         employee: Сотрудник (опционально, для проверки фактических записей)
-    
+        shift_days: Предзагруженное множество (hikvision_id, date) дней со сменой
+            (см. _find_round_the_clock_shift_days). Если не передано,
+            записи сотрудника за день загружаются из БД.
+
     Returns:
         True, если день рабочий, False если выходной
     """
     if schedule.schedule_type == 'round_the_clock':
-        # Для круглосуточных графиков проверяем:
-        # 1. График работы (days_of_week)
-        # 2. Фактические записи EntryExit - была ли смена (24 часа работы)
-        
-        # Сначала проверяем график
+        # Сначала проверяем график (days_of_week); если не указано - все дни рабочие
         if schedule.days_of_week:
-            weekday = check_date.weekday()  # 0=понедельник, 6=воскресенье
-            is_scheduled_work_day = weekday in schedule.days_of_week
+            is_scheduled_work_day = check_date.weekday() in schedule.days_of_week
         else:
-            # Если days_of_week не указано, все дни могут быть рабочими
             is_scheduled_work_day = True
-        
-        # Если есть сотрудник, проверяем фактические записи
+
         # "24" в табеле = была смена = есть запись EntryExit с продолжительностью около 20-30 часов
         if employee:
-            start_datetime = timezone.make_aware(datetime.combine(check_date, datetime.min.time()))
-            end_datetime = timezone.make_aware(datetime.combine(check_date + timedelta(days=1), datetime.min.time()))
-            
-            # Ищем записи с входом в этот день
-            entries = EntryExit.objects.filter(
-                hikvision_id=employee.hikvision_id,
-                entry_time__gte=start_datetime,
-                entry_time__lt=end_datetime,
-                exit_time__isnull=False
-            )
-            
-            # Проверяем, есть ли запись с продолжительностью около 20-30 часов (смена)
-            for entry in entries:
-                if entry.work_duration_seconds:
-                    duration_hours = entry.work_duration_seconds / 3600
-                    # Если продолжительность 20-30 часов - это смена (24 в табеле)
-                    if 20 <= duration_hours <= 30:
-                        return True  # Была смена - рабочий день
-            
-            # Если нет записей с продолжительностью 20-30 часов, но есть запись с входом,
-            # проверяем, может быть выход на следующий день
-            if entries.exists():
-                # Проверяем записи с выходом на следующий день
-                next_day = check_date + timedelta(days=1)
-                next_day_start = timezone.make_aware(datetime.combine(next_day, datetime.min.time()))
-                next_day_end = timezone.make_aware(datetime.combine(next_day + timedelta(days=1), datetime.min.time()))
-                
-                next_day_exits = EntryExit.objects.filter(
-                    hikvision_id=employee.hikvision_id,
-                    exit_time__gte=next_day_start,
-                    exit_time__lt=next_day_end
-                )
-                
-                # Если есть выход на следующий день, проверяем продолжительность
-                for entry in entries:
-                    for exit_entry in next_day_exits:
-                        if exit_entry.entry_time and entry.entry_time:
-                            duration = exit_entry.exit_time - entry.entry_time
-                            duration_hours = duration.total_seconds() / 3600
-                            if 20 <= duration_hours <= 30:
-                                return True  # Была смена - рабочий день
-        
+            if shift_days is None:
+                shift_days = _find_round_the_clock_shift_days([employee.hikvision_id], check_date, check_date)
+            if (employee.hikvision_id, check_date) in shift_days:
+                return True
+
         # Если нет фактических записей, используем график
         return is_scheduled_work_day
-        
+
     elif schedule.schedule_type == 'regular':
         # Для обычных графиков проверяем days_of_week
         if schedule.days_of_week:
-            weekday = check_date.weekday()
-            return weekday in schedule.days_of_week
+            return check_date.weekday() in schedule.days_of_week
         else:
             return True
     elif schedule.schedule_type == 'floating':
         return True
-    
+
     return False
 
 
-def generate_comprehensive_attendance_report_python(
-    hikvision_id: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    device_name: Optional[str] = None,
-    excluded_hikvision_ids: Optional[List[str]] = None
-) -> Tuple[List[Dict], date, date]:
-    """
-    Генерирует отчет о посещаемости используя Python и Django ORM.
-    
-    Args:
-        hikvision_id: ID сотрудника от Hikvision (опционально)
-        start_date: Начальная дата (формат: YYYY-MM-DD)
-        end_date: Конечная дата (формат: YYYY-MM-DD)
-        device_name: Фильтр по названию устройства
-        excluded_hikvision_ids: Список ID для исключения
-        
-    Returns:
-        Кортеж (список словарей с данными, start_date_obj, end_date_obj)
-    """
-    # Парсим даты
+def _parse_report_dates(start_date: Optional[str], end_date: Optional[str]) -> Tuple[date, date]:
+    """Парсит границы отчета (как в generate_comprehensive_attendance_report_python)."""
     start_date_obj = None
     end_date_obj = None
-    
+
     if start_date:
         try:
             if ' ' in start_date or 'T' in start_date:
@@ -150,14 +247,14 @@ def generate_comprehensive_attendance_report_python(
                 start_datetime = datetime.strptime(start_date_clean, "%Y-%m-%d %H:%M:%S")
             else:
                 start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-            
+
             if timezone.is_naive(start_datetime):
                 start_datetime = timezone.make_aware(start_datetime)
-            
+
             start_date_obj = timezone.localtime(start_datetime).date()
         except ValueError:
             pass
-    
+
     if end_date:
         try:
             if ' ' in end_date or 'T' in end_date:
@@ -167,42 +264,79 @@ def generate_comprehensive_attendance_report_python(
                 end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
                 # Добавляем время конца дня
                 end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
-            
+
             if timezone.is_naive(end_datetime):
                 end_datetime = timezone.make_aware(end_datetime)
-            
+
             end_date_obj = timezone.localtime(end_datetime).date()
         except ValueError:
             pass
-    
+
     if not start_date_obj:
         start_date_obj = timezone.now().date() - timedelta(days=30)
-    
+
     if not end_date_obj:
         end_date_obj = timezone.now().date()
-    
+
+    return start_date_obj, end_date_obj
+
+
+def _first_per_group(groups: np.ndarray, *sort_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Возвращает (группы, индексы элементов), где для каждой группы выбран первый
+    элемент в порядке sort_keys (первый ключ - главный).
+    """
+    order = np.lexsort(tuple(reversed(sort_keys)) + (groups,))
+    unique_groups, first = np.unique(groups[order], return_index=True)
+    return unique_groups, order[first]
+
+
+def _time_to_us(value: time) -> int:
+    """Переводит datetime.time в микросекунды от полуночи."""
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * _US_PER_SECOND + value.microsecond
+
+
+def generate_comprehensive_attendance_report_python(
+    hikvision_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    device_name: Optional[str] = None,
+    excluded_hikvision_ids: Optional[List[str]] = None
+) -> Tuple[List[Dict], date, date]:
+    """
+    Генерирует отчет о посещаемости используя Python и NumPy.
+
+    Args:
+        hikvision_id: ID сотрудника от Hikvision (опционально)
+        start_date: Начальная дата (формат: YYYY-MM-DD)
+        end_date: Конечная дата (формат: YYYY-MM-DD)
+        device_name: Фильтр по названию устройства
+        excluded_hikvision_ids: Список ID для исключения
+
+    Returns:
+        Кортеж (список словарей с данными, start_date_obj, end_date_obj)
+    """
+    start_date_obj, end_date_obj = _parse_report_dates(start_date, end_date)
+
     # Получаем исключаемые ID
     if excluded_hikvision_ids is None:
         excluded_hikvision_ids = get_excluded_hikvision_ids()
-    
-    # Получаем записи EntryExit (без select_related, так как нет прямого ForeignKey на Employee)
+
     queryset = EntryExit.objects.filter(
         entry_time__isnull=False,
         exit_time__isnull=False
     )
-    
+
     # Фильтр по hikvision_id
     if hikvision_id:
-        clean_id_str = clean_id(hikvision_id)
-        queryset = queryset.filter(
-            hikvision_id__in=[clean_id_str, hikvision_id]
-        )
-    
+        id_field, id_value = employee_id_lookup(hikvision_id)
+        queryset = queryset.filter(**{id_field: id_value})
+
     # Фильтр по датам
     start_datetime_aware = timezone.make_aware(datetime.combine(start_date_obj, datetime.min.time()))
     end_datetime_aware = timezone.make_aware(datetime.combine(end_date_obj, datetime.max.time()))
     queryset = queryset.filter(entry_time__gte=start_datetime_aware, entry_time__lte=end_datetime_aware)
-    
+
     # Фильтр по device_name
     if device_name:
         queryset = queryset.filter(
@@ -210,277 +344,239 @@ def generate_comprehensive_attendance_report_python(
         ) | queryset.filter(
             device_name_exit__icontains=device_name
         )
-    
+
     # Исключаем определенных сотрудников
     if excluded_hikvision_ids:
         queryset = queryset.exclude(hikvision_id__in=excluded_hikvision_ids)
-    
-    # Получаем все записи
-    entry_exits = list(queryset.order_by('entry_time'))
-    
-    # Предзагружаем всех сотрудников и их графики для оптимизации
-    hikvision_ids = set(ee.hikvision_id for ee in entry_exits if ee.hikvision_id)
+
+    # Загружаем записи одним запросом
+    rows = [
+        row for row in queryset.order_by('entry_time').values_list('hikvision_id', 'entry_time', 'exit_time')
+        if row[0]
+    ]
+    if not rows:
+        return [], start_date_obj, end_date_obj
+
+    # Коды сотрудников (по исходному hikvision_id записи)
+    code_by_id = {}
+    row_codes = np.fromiter(
+        (code_by_id.setdefault(row[0], len(code_by_id)) for row in rows), dtype=np.int64, count=len(rows)
+    )
+    raw_ids = list(code_by_id)
+
+    # Предзагружаем сотрудников: поиск сначала по очищенному ID, затем по исходному
     employees_dict = {}
-    schedules_dict = {}
-    
-    if hikvision_ids:
-        employees = Employee.objects.filter(
-            hikvision_id__in=hikvision_ids
-        ).select_related('department').prefetch_related('work_schedules')
-        
-        for emp in employees:
-            clean_emp_id = clean_id(emp.hikvision_id)
-            employees_dict[clean_emp_id] = emp
-            employees_dict[emp.hikvision_id] = emp  # Также сохраняем с оригинальным ID
-            schedule = emp.work_schedules.first()
-            if schedule:
-                schedules_dict[clean_emp_id] = schedule
-                schedules_dict[emp.hikvision_id] = schedule
-    
-    # Группируем по сотрудникам и периодам
-    # Структура: (hikvision_id, period_date) -> {entries: [], exits: [], ...}
-    results_by_employee_period = defaultdict(lambda: {
-        'employee_name': None,
-        'department_name': None,
-        'schedule_type': None,
-        'schedule_start_time': None,
-        'schedule_end_time': None,
-        'allowed_late_minutes': None,
-        'allowed_early_leave_minutes': None,
-        'days_of_week': None,
-        'entries': [],  # Входы, которые относятся к этому периоду (period_date = period_date)
-        'exits': [],    # Выходы, которые относятся к этому периоду (exit_period_date = period_date)
-        'period_date': None
-    })
-    
-    # Обрабатываем каждую запись
-    for ee in entry_exits:
-        try:
-            if not ee.hikvision_id:
-                continue
-            
-            # Получаем сотрудника из кэша
-            clean_emp_id = clean_id(ee.hikvision_id)
-            employee = employees_dict.get(clean_emp_id) or employees_dict.get(ee.hikvision_id)
-            if not employee:
+    employees = list(
+        Employee.objects.filter(hikvision_id__in=raw_ids).select_related('department', 'department__parent')
+    )
+    for emp in employees:
+        employees_dict[clean_id(emp.hikvision_id)] = emp
+        employees_dict[emp.hikvision_id] = emp
+    code_employee = [employees_dict.get(clean_id(raw_id)) or employees_dict.get(raw_id) for raw_id in raw_ids]
+    # Сотрудник с точно совпадающим hikvision_id - для проверки рабочего дня
+    exact_employee = {emp.hikvision_id: emp for emp in employees}
+    code_exact = [exact_employee.get(raw_id) for raw_id in raw_ids]
+
+    index = ScheduleIndex.load({emp.id for emp in employees})
+
+    # Время в микросекундах: UTC и локальное "настенное"
+    entry_utc = _datetimes_to_utc_us(row[1] for row in rows)
+    exit_utc = _datetimes_to_utc_us(row[2] for row in rows)
+    entry_wall = _local_wall_us(entry_utc)
+    exit_wall = _local_wall_us(exit_utc)
+    entry_day = entry_wall // _US_PER_DAY
+    exit_day = exit_wall // _US_PER_DAY
+
+    # Версии графиков по уникальным парам (сотрудник, день)
+    schedules = []
+    schedule_positions = {}
+
+    def resolve_schedules(codes, days, employee_by_code):
+        pair_keys, inverse = np.unique(np.stack([codes, days], axis=1), axis=0, return_inverse=True)
+        resolved = np.full(len(pair_keys), -1, dtype=np.int64)
+        for j, (code, day) in enumerate(pair_keys):
+            employee = employee_by_code[int(code)]
+            if employee is None:
                 continue
-            
-            # Получаем график работы из кэша
-            schedule = schedules_dict.get(clean_emp_id) or schedules_dict.get(ee.hikvision_id)
-            if not schedule:
+            schedule = index.schedule_for(employee.id, date.fromordinal(_EPOCH_ORDINAL + int(day)))
+            if schedule is None:
                 continue
-            
-            # Получаем название подразделения
-            department_name = ''
-            if employee.department:
-                try:
-                    if employee.department.parent:
-                        department_name = f"{employee.department.parent.name} > {employee.department.name}"
-                    else:
-                        department_name = employee.department.name
-                except:
-                    department_name = employee.department.name if employee.department.name else ''
-            elif employee.department_old:
-                department_name = employee.department_old.replace('/', ' > ')
-            
-            # Конвертируем времена в локальный часовой пояс
-            if timezone.is_naive(ee.entry_time):
-                entry_time = timezone.make_aware(ee.entry_time)
-            else:
-                entry_time = ee.entry_time
-            entry_local = timezone.localtime(entry_time)
-            
-            if timezone.is_naive(ee.exit_time):
-                exit_time = timezone.make_aware(ee.exit_time)
-            else:
-                exit_time = ee.exit_time
-            exit_local = timezone.localtime(exit_time)
-            
-            # Определяем период для входа/выхода
-            if schedule.schedule_type == 'round_the_clock':
-                # Новая логика для круглосуточных графиков:
-                # - Берем ВСЕ входы (ограничение 07:00–10:00 убрано)
-                # - Период (дата графика) = календарная дата этого входа
-                # - Выход относится к тому же периоду, даже если он на следующий день
-                # - Если выход в тот же день, что и вход, и продолжительность < 20 часов,
-                #   то это неправильная запись, но мы все равно включаем её в отчет
-                period_date = entry_local.date()
-                
-                key = (ee.hikvision_id, period_date)
-                
-                if results_by_employee_period[key]['employee_name'] is None:
-                    results_by_employee_period[key]['employee_name'] = employee.name
-                    results_by_employee_period[key]['department_name'] = department_name
-                    results_by_employee_period[key]['schedule_type'] = schedule.schedule_type
-                    results_by_employee_period[key]['schedule_start_time'] = schedule.start_time
-                    results_by_employee_period[key]['schedule_end_time'] = schedule.end_time
-                    results_by_employee_period[key]['allowed_late_minutes'] = schedule.allowed_late_minutes
-                    results_by_employee_period[key]['allowed_early_leave_minutes'] = schedule.allowed_early_leave_minutes
-                    results_by_employee_period[key]['days_of_week'] = schedule.days_of_week
-                    results_by_employee_period[key]['period_date'] = period_date
-                
-                # Для круглосуточного графика вход и выход всегда относим к одному и тому же периоду
-                results_by_employee_period[key]['entries'].append(entry_local)
-                results_by_employee_period[key]['exits'].append(exit_local)
-            else:
-                period_date = entry_local.date()
-                exit_period_date = exit_local.date()
-                
-                # Ключ для группировки входов (по периоду входа)
-                entry_key = (ee.hikvision_id, period_date)
-                
-                # Сохраняем информацию о сотруднике и графике
-                if results_by_employee_period[entry_key]['employee_name'] is None:
-                    results_by_employee_period[entry_key]['employee_name'] = employee.name
-                    results_by_employee_period[entry_key]['department_name'] = department_name
-                    results_by_employee_period[entry_key]['schedule_type'] = schedule.schedule_type
-                    results_by_employee_period[entry_key]['schedule_start_time'] = schedule.start_time
-                    results_by_employee_period[entry_key]['schedule_end_time'] = schedule.end_time
-                    results_by_employee_period[entry_key]['allowed_late_minutes'] = schedule.allowed_late_minutes
-                    results_by_employee_period[entry_key]['allowed_early_leave_minutes'] = schedule.allowed_early_leave_minutes
-                    results_by_employee_period[entry_key]['days_of_week'] = schedule.days_of_week
-                    results_by_employee_period[entry_key]['period_date'] = period_date
-                
-                # Добавляем вход к периоду входа
-                if results_by_employee_period[entry_key]['employee_name'] is None:
-                    results_by_employee_period[entry_key]['employee_name'] = employee.name
-                    results_by_employee_period[entry_key]['department_name'] = department_name
-                    results_by_employee_period[entry_key]['schedule_type'] = schedule.schedule_type
-                    results_by_employee_period[entry_key]['schedule_start_time'] = schedule.start_time
-                    results_by_employee_period[entry_key]['schedule_end_time'] = schedule.end_time
-                    results_by_employee_period[entry_key]['allowed_late_minutes'] = schedule.allowed_late_minutes
-                    results_by_employee_period[entry_key]['allowed_early_leave_minutes'] = schedule.allowed_early_leave_minutes
-                    results_by_employee_period[entry_key]['days_of_week'] = schedule.days_of_week
-                    results_by_employee_period[entry_key]['period_date'] = period_date
-                results_by_employee_period[entry_key]['entries'].append(entry_local)
-                
-                # Добавляем выход к периоду выхода (exit_period_date)
-                exit_key = (ee.hikvision_id, exit_period_date)
-                if results_by_employee_period[exit_key]['employee_name'] is None:
-                    results_by_employee_period[exit_key]['employee_name'] = employee.name
-                    results_by_employee_period[exit_key]['department_name'] = department_name
-                    results_by_employee_period[exit_key]['schedule_type'] = schedule.schedule_type
-                    results_by_employee_period[exit_key]['schedule_start_time'] = schedule.start_time
-                    results_by_employee_period[exit_key]['schedule_end_time'] = schedule.end_time
-                    results_by_employee_period[exit_key]['allowed_late_minutes'] = schedule.allowed_late_minutes
-                    results_by_employee_period[exit_key]['allowed_early_leave_minutes'] = schedule.allowed_early_leave_minutes
-                    results_by_employee_period[exit_key]['days_of_week'] = schedule.days_of_week
-                    results_by_employee_period[exit_key]['period_date'] = exit_period_date
-                results_by_employee_period[exit_key]['exits'].append(exit_local)
-            
-        except Exception as e:
-            logger.warning(f"Ошибка при обработке записи EntryExit (id={ee.id}): {e}")
-            continue
-    
-    # Формируем результаты
+            position = schedule_positions.get(schedule.pk)
+            if position is None:
+                position = len(schedules)
+                schedule_positions[schedule.pk] = position
+                schedules.append(schedule)
+            resolved[j] = position
+        return resolved[inverse.reshape(-1)]
+
+    row_schedule = resolve_schedules(row_codes, entry_day, code_employee)
+    kept = np.nonzero(row_schedule >= 0)[0]
+    if len(kept) == 0:
+        return [], start_date_obj, end_date_obj
+
+    schedule_type = np.array(
+        [_SCHEDULE_TYPE_CODES.get(s.schedule_type, -1) for s in schedules], dtype=np.int64
+    )
+    row_is_rtc = schedule_type[row_schedule[kept]] == _RTC
+
+    # Вклады записей в периоды: вход - в день входа; выход - в день выхода,
+    # для круглосуточных графиков - в день входа. Порядок как при обходе записей.
+    n = len(kept)
+    contrib_row = np.concatenate([kept, kept])
+    contrib_is_entry = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+    contrib_order = np.concatenate([2 * kept, 2 * kept + 1])
+    contrib_code = row_codes[contrib_row]
+    contrib_day = np.concatenate([entry_day[kept], np.where(row_is_rtc, entry_day[kept], exit_day[kept])])
+    contrib_wall = np.concatenate([entry_wall[kept], exit_wall[kept]])
+    contrib_utc = np.concatenate([entry_utc[kept], exit_utc[kept]])
+
+    day_base = int(contrib_day.min())
+    group_keys, groups = np.unique(contrib_code * (int(contrib_day.max()) - day_base + 1) + (contrib_day - day_base),
+                                   return_inverse=True)
+    groups = groups.reshape(-1)
+    group_count = len(group_keys)
+
+    # Параметры периода берутся из записи, первой попавшей в период
+    _, first_contrib = _first_per_group(groups, contrib_order)
+    group_row = contrib_row[first_contrib]
+    group_code = contrib_code[first_contrib]
+    group_day = contrib_day[first_contrib]
+    group_schedule = row_schedule[group_row]
+    group_type = schedule_type[group_schedule]
+
+    # Первый вход: для круглосуточных - приоритет входов в окне 07:00–10:00
+    entry_idx = np.nonzero(contrib_is_entry)[0]
+    time_of_day = contrib_wall[entry_idx] % _US_PER_DAY
+    morning = (time_of_day >= _MORNING_FROM_US) & (time_of_day <= _MORNING_TO_US)
+    morning_first = (~(morning & (group_type[groups[entry_idx]] == _RTC))).astype(np.int64)
+    entry_groups, first_entry_idx = _first_per_group(
+        groups[entry_idx], morning_first, contrib_wall[entry_idx], contrib_order[entry_idx]
+    )
+    first_entry_contrib = np.full(group_count, -1, dtype=np.int64)
+    first_entry_contrib[entry_groups] = entry_idx[first_entry_idx]
+
+    # Последний выход
+    exit_idx = np.nonzero(~contrib_is_entry)[0]
+    exit_groups, last_exit_idx = _first_per_group(
+        groups[exit_idx], -contrib_wall[exit_idx], contrib_order[exit_idx]
+    )
+    last_exit_contrib = np.full(group_count, -1, dtype=np.int64)
+    last_exit_contrib[exit_groups] = exit_idx[last_exit_idx]
+
+    valid = (first_entry_contrib >= 0) & (last_exit_contrib >= 0)
+
+    # Проверка рабочего дня: график сотрудника с точно совпадающим ID на дату периода
+    check_schedule = resolve_schedules(group_code, group_day, code_exact)
+    check_type = np.where(check_schedule >= 0, schedule_type[np.maximum(check_schedule, 0)], -2)
+    weekday = (group_day + _EPOCH_ORDINAL - 1) % 7
+    days_mask = np.array(
+        [[d in (s.days_of_week or []) for d in range(7)] for s in schedules], dtype=bool
+    ).reshape(len(schedules), 7)
+    days_empty = np.array([not s.days_of_week for s in schedules], dtype=bool)
+    scheduled_day = days_empty[np.maximum(check_schedule, 0)] | days_mask[np.maximum(check_schedule, 0), weekday]
+
+    is_work_day = (check_type == -2) | (check_type == _SCHEDULE_TYPE_CODES['floating'])
+    is_work_day |= (check_type == _SCHEDULE_TYPE_CODES['regular']) & scheduled_day
+    is_work_day |= (check_type == _RTC) & scheduled_day
+
+    # Для круглосуточных графиков без смены по графику проверяем фактические смены 20-30 часов
+    rtc_check = np.nonzero(valid & (check_type == _RTC) & ~scheduled_day)[0]
+    if len(rtc_check):
+        check_dates = group_day[rtc_check] + _EPOCH_ORDINAL
+        shift_days = _find_round_the_clock_shift_days(
+            {code_exact[int(c)].hikvision_id for c in group_code[rtc_check]},
+            date.fromordinal(int(check_dates.min())),
+            date.fromordinal(int(check_dates.max())),
+        )
+        for g, c, ordinal in zip(rtc_check, group_code[rtc_check], check_dates):
+            if (code_exact[int(c)].hikvision_id, date.fromordinal(int(ordinal))) in shift_days:
+                is_work_day[g] = True
+
+    included = np.nonzero(valid & is_work_day)[0]
+
+    first_wall = contrib_wall[first_entry_contrib[included]]
+    last_wall = contrib_wall[last_exit_contrib[included]]
+    day_start_wall = group_day[included] * _US_PER_DAY
+    inc_schedule = group_schedule[included]
+    not_rtc = group_type[included] != _RTC
+
+    start_us = np.array([_time_to_us(s.start_time) if s.start_time else -1 for s in schedules], dtype=np.int64)
+    end_us = np.array([_time_to_us(s.end_time) if s.end_time else -1 for s in schedules], dtype=np.int64)
+    allowed_late = np.array([s.allowed_late_minutes or 0 for s in schedules], dtype=np.int64)
+    allowed_early = np.array([s.allowed_early_leave_minutes or 0 for s in schedules], dtype=np.int64)
+
+    has_start = start_us[inc_schedule] >= 0
+    has_end = end_us[inc_schedule] >= 0
+    # Время окончания без времени начала нельзя сравнить - такие периоды пропускаются
+    broken = not_rtc & has_end & ~has_start
+
+    duration = np.where(last_wall > first_wall, (last_wall - first_wall) // _US_PER_SECOND, 0)
+
+    scheduled_start = day_start_wall + start_us[inc_schedule]
+    late_delta = first_wall - scheduled_start
+    late_minutes = np.where(
+        not_rtc & has_start & (late_delta > 0),
+        np.maximum(0, late_delta // _US_PER_MINUTE - allowed_late[inc_schedule]),
+        0,
+    )
+    early_arrival_minutes = np.where(
+        not_rtc & has_start & (late_delta < 0),
+        np.maximum(0, (-late_delta) // _US_PER_MINUTE - _EARLY_ARRIVAL_THRESHOLD),
+        0,
+    )
+
+    overnight = end_us[inc_schedule] < start_us[inc_schedule]
+    scheduled_end = day_start_wall + end_us[inc_schedule] + np.where(overnight, _US_PER_DAY, 0)
+    early_delta = scheduled_end - last_wall
+    early_leave_minutes = np.where(
+        not_rtc & has_end & (early_delta > 0),
+        np.maximum(0, early_delta // _US_PER_MINUTE - allowed_early[inc_schedule]),
+        0,
+    )
+    late_departure_minutes = np.where(
+        not_rtc & has_end & (early_delta < 0),
+        np.maximum(0, (-early_delta) // _US_PER_MINUTE - _LATE_DEPARTURE_THRESHOLD),
+        0,
+    )
+
+    # Формируем результаты (в порядке первого появления периода, затем сортировка)
     results = []
-    
-    for (hikvision_id, period_date), data in results_by_employee_period.items():
-        try:
-            # Проверяем, является ли день рабочим
-            # Для круглосуточных графиков: если нет смены (24 часа) - это выходной
-            employee = Employee.objects.filter(hikvision_id=hikvision_id).first()
-            if employee:
-                schedule = employee.work_schedules.first()
-                if schedule:
-                    # Для круглосуточных графиков проверяем фактические записи
-                    # "24" в табеле = была смена = есть запись с продолжительностью 20-30 часов
-                    if schedule.schedule_type == 'round_the_clock':
-                        # Проверяем, была ли смена (24 часа работы)
-                        if not is_work_day_for_schedule(schedule, period_date, employee):
-                            # Нет смены - выходной, пропускаем
-                            continue
-                    else:
-                        # Для обычных графиков используем стандартную проверку
-                        if not is_work_day_for_schedule(schedule, period_date, employee):
-                            continue
-            
-            # Находим первый вход и последний выход
-            if not data['entries'] or not data['exits']:
-                continue
-            
-            # Находим первый вход и последний выход для этого периода
-            if data['schedule_type'] == 'round_the_clock' and data['entries']:
-                # Для круглосуточных графиков:
-                # если есть входы в окне 07:00–10:00, берем самый ранний из них,
-                # иначе берем самый ранний вход за день
-                morning_entries = [
-                    e for e in data['entries']
-                    if time(7, 0) <= e.time() <= time(10, 0)
-                ]
-                if morning_entries:
-                    first_entry = min(morning_entries)
-                else:
-                    first_entry = min(data['entries'])
-            else:
-                first_entry = min(data['entries']) if data['entries'] else None
-            last_exit = max(data['exits']) if data['exits'] else None
-            
-            if first_entry is None or last_exit is None:
-                continue
-            
-            # Вычисляем продолжительность без искусственных ограничений по максимуму часов
-            if last_exit > first_entry:
-                duration_seconds = int((last_exit - first_entry).total_seconds())
-            else:
-                duration_seconds = 0
-            
-            # Вычисляем опоздание (только для обычных графиков)
-            late_minutes = 0
-            if data['schedule_type'] != 'round_the_clock' and data['schedule_start_time']:
-                schedule_start = datetime.combine(period_date, data['schedule_start_time'])
-                schedule_start = timezone.make_aware(schedule_start)
-                schedule_start_local = timezone.localtime(schedule_start)
-                
-                if first_entry > schedule_start_local:
-                    late_seconds = (first_entry - schedule_start_local).total_seconds()
-                    late_minutes = int(late_seconds / 60) - (data['allowed_late_minutes'] or 0)
-                    late_minutes = max(0, late_minutes)
-            
-            # Вычисляем ранний уход (только для обычных графиков)
-            early_leave_minutes = 0
-            if data['schedule_type'] != 'round_the_clock' and data['schedule_end_time']:
-                schedule_end = datetime.combine(period_date, data['schedule_end_time'])
-                if data['schedule_end_time'] < data['schedule_start_time']:
-                    schedule_end += timedelta(days=1)
-                schedule_end = timezone.make_aware(schedule_end)
-                schedule_end_local = timezone.localtime(schedule_end)
-                
-                if last_exit < schedule_end_local:
-                    early_seconds = (schedule_end_local - last_exit).total_seconds()
-                    early_leave_minutes = int(early_seconds / 60) - (data['allowed_early_leave_minutes'] or 0)
-                    early_leave_minutes = max(0, early_leave_minutes)
-            
-            # День недели (PostgreSQL DOW формат: 0=воскресенье, 1=понедельник, ..., 6=суббота)
-            # Python weekday(): 0=понедельник, 6=воскресенье
-            # Конвертация: postgresql_dow = (python_weekday + 1) % 7
-            python_weekday = period_date.weekday()
-            day_of_week = (python_weekday + 1) % 7
-            
-            results.append({
-                'hikvision_id': hikvision_id,
-                'employee_name': data['employee_name'],
-                'department_name': data['department_name'],
-                'report_date': period_date,
-                'day_of_week': day_of_week,
-                'schedule_type': data['schedule_type'],
-                'schedule_start_time': data['schedule_start_time'],
-                'schedule_end_time': data['schedule_end_time'],
-                'allowed_late_minutes': data['allowed_late_minutes'],
-                'allowed_early_leave_minutes': data['allowed_early_leave_minutes'],
-                'first_entry': first_entry,
-                'last_exit': last_exit,
-                'total_duration_seconds': duration_seconds,
-                'late_minutes': late_minutes,
-                'early_leave_minutes': early_leave_minutes,
-            })
-            
-        except Exception as e:
-            logger.warning(f"Ошибка при формировании результата для {hikvision_id}, {period_date}: {e}")
+    order = np.argsort(contrib_order[first_contrib[included]], kind='stable')
+    for j in order:
+        g = included[j]
+        code = int(group_code[g])
+        employee = code_employee[code]
+        schedule = schedules[int(group_schedule[g])]
+        period_date = date.fromordinal(_EPOCH_ORDINAL + int(group_day[g]))
+        if broken[j]:
+            logger.warning(
+                f"Ошибка при формировании результата для {raw_ids[code]}, {period_date}: "
+                f"у графика {schedule.id} указано время окончания без времени начала"
+            )
             continue
-    
+
+        results.append({
+            'hikvision_id': raw_ids[code],
+            'employee_name': employee.name,
+            'department_name': _department_name(employee),
+            'report_date': period_date,
+            # PostgreSQL DOW формат: 0=воскресенье, 1=понедельник, ..., 6=суббота
+            'day_of_week': (period_date.weekday() + 1) % 7,
+            'schedule_type': schedule.schedule_type,
+            'schedule_start_time': schedule.start_time,
+            'schedule_end_time': schedule.end_time,
+            'allowed_late_minutes': schedule.allowed_late_minutes,
+            'allowed_early_leave_minutes': schedule.allowed_early_leave_minutes,
+            'first_entry': _utc_us_to_local(contrib_utc[first_entry_contrib[g]]),
+            'last_exit': _utc_us_to_local(contrib_utc[last_exit_contrib[g]]),
+            'total_duration_seconds': int(duration[j]),
+            'late_minutes': int(late_minutes[j]),
+            'early_leave_minutes': int(early_leave_minutes[j]),
+            'early_arrival_minutes': int(early_arrival_minutes[j]),
+            'late_departure_minutes': int(late_departure_minutes[j]),
+        })
+
     # Сортируем результаты
     results.sort(key=lambda x: (x['employee_name'], x['report_date']))
-    
-    return results, start_date_obj, end_date_obj
 
+    return results, start_date_obj, end_date_obj
@@ -0,0 +1,76 @@
+"""
+Проверка планов частых запросов к EntryExit (PostgreSQL).
+
+Для каждого запроса выполняется EXPLAIN и проверяется, что план использует
+ожидаемый индекс. Последовательное сканирование на время проверки
+отключается (enable_seqscan = off): на маленькой таблице планировщик
+выбирает его и при подходящем индексе, а проверяется именно то, что
+условие запроса совпадает с индексом.
+
+Проверки запускают тесты (camera_events/tests/test_explain_hot_queries.py)
+и команда explain_hot_queries.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EntryExit
+
+
+def _index_name(fields, condition=False):
+    for index in EntryExit._meta.indexes:
+        if list(index.fields) == fields and bool(index.condition) == condition:
+            return index.name
+    raise LookupError(f"Индекс {fields} не найден в EntryExit.Meta.indexes")
+
+
+def hot_queries():
+    """(описание, queryset, допустимые индексы) для запросов приема и отчетов."""
+    now = timezone.now()
+    today = timezone.localdate(now)
+    return [
+        (
+            "Открытая сессия за день (event_processor)",
+            EntryExit.objects.filter(
+                normalized_id="1", entry_local_date=today, exit_time__isnull=True,
+            ).order_by("-entry_time"),
+            [_index_name(["normalized_id", "entry_local_date"], condition=True)],
+        ),
+        (
+            "Запись по точному времени входа (recalculate_entries_exits)",
+            EntryExit.objects.filter(normalized_id="1", entry_time=now),
+            # Точное время селективно само по себе: подходит и индекс по entry_time
+            [_index_name(["normalized_id", "entry_time"]), _index_name(["entry_time"])],
+        ),
+        (
+            "Записи сотрудника за период (отчеты)",
+            EntryExit.objects.filter(
+                numeric_id=1, entry_time__gte=now - timedelta(days=31), entry_time__lte=now,
+                exit_time__isnull=False,
+            ),
+            [_index_name(["numeric_id", "entry_time"])],
+        ),
+    ]
+
+
+def explain_hot_queries():
+    """
+    Выполняет EXPLAIN для каждого запроса из hot_queries().
+
+    Returns:
+        Список (описание, использованный индекс или None, допустимые
+        индексы, план).
+    """
+    if connection.vendor != "postgresql":
+        raise NotImplementedError("Проверка планов поддерживается только для PostgreSQL")
+
+    results = []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for title, queryset, index_names in hot_queries():
+            plan = queryset.explain()
+            used = next((name for name in index_names if name in plan), None)
+            results.append((title, used, index_names, plan))
+    return results
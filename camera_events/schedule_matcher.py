@@ -2,12 +2,38 @@
 Модуль для сопоставления записей входов/выходов с графиками работы сотрудников.
 """
 import logging
-from datetime import datetime, timedelta, time
+from datetime import date as date_cls, datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.db.models import F, Q
 from django.utils import timezone
 from .models import WorkSchedule, Employee, EntryExit
+from .compiled_schedules import (
+    ScheduleIndex,
+    ScheduleTables,
+    compile_schedule,
+    expand_schedule_index,
+    local_midnight_timestamps,
+    select_schedule_version,
+    shift_boundary_timestamps,
+)
+from .utils import clean_id
 
 logger = logging.getLogger(__name__)
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECONDS_PER_MINUTE = 60 * 1_000_000
+_MICROSECONDS_PER_SECOND = 1_000_000
+# Смена длиннее 12 часов по часам (без учета смены смещения часового пояса)
+# считается ночной, как в match_entry_exit_to_schedule
+_OVERNIGHT_THRESHOLD_MINUTES = 12 * 60
+
+
+def _to_microseconds(value: datetime) -> int:
+    """Переводит datetime в микросекунды Unix (наивное время считается локальным)."""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
 
 class ScheduleMatcher:
     """
@@ -19,17 +45,32 @@ class ScheduleMatcher:
         """
         Получает график работы сотрудника на указанную дату.
         
+        Учитывает период действия версий графика (valid_from/valid_to).
+        Если графики сотрудника загружены через prefetch_related('work_schedules'),
+        запрос к БД не выполняется.
+        
         Args:
             employee: Сотрудник
-            date: Дата (date объект)
+            date: Дата (date объект). Если None - текущий график.
             
         Returns:
             WorkSchedule объект или None, если график не найден
         """
         try:
-            # Получаем первый активный график сотрудника
-            schedule = WorkSchedule.objects.filter(employee=employee).first()
-            return schedule
+            prefetched = getattr(employee, '_prefetched_objects_cache', {}).get('work_schedules')
+            if prefetched is not None:
+                schedules = list(prefetched)
+                if date is None:
+                    return schedules[0] if schedules else None
+                return select_schedule_version(schedules, date)
+            
+            schedules = WorkSchedule.objects.filter(employee=employee)
+            if date is not None:
+                schedules = schedules.filter(
+                    Q(valid_from__isnull=True) | Q(valid_from__lte=date),
+                    Q(valid_to__isnull=True) | Q(valid_to__gte=date),
+                ).order_by(F('valid_from').desc(nulls_last=True), *WorkSchedule._meta.ordering)
+            return schedules.first()
         except Exception as e:
             logger.error(f"Ошибка при получении графика для сотрудника {employee.id}: {e}")
             return None
@@ -39,6 +80,9 @@ class ScheduleMatcher:
         """
         Получает запланированное время начала и окончания работы для указанной даты.
         
+        График разбирается один раз (см. compiled_schedules.compile_schedule),
+        повторные вызовы используют скомпилированное представление.
+        
         Args:
             schedule: График работы
             date: Дата (date объект)
@@ -51,60 +95,74 @@ class ScheduleMatcher:
             return None
         
         try:
-            weekday = date.weekday()  # 0 = Понедельник, 6 = Воскресенье
-            
-            if schedule.schedule_type == 'round_the_clock':
-                # Круглосуточный график - 24 часа
-                start_dt = timezone.make_aware(datetime.combine(date, time(0, 0)))
-                end_dt = start_dt + timedelta(days=1)
-                return (start_dt, end_dt)
-            
-            elif schedule.schedule_type == 'floating':
-                # Плавающий график - используем floating_shifts
-                if schedule.floating_shifts and isinstance(schedule.floating_shifts, list):
-                    # Ищем смену для текущего дня недели
-                    for shift in schedule.floating_shifts:
-                        if isinstance(shift, dict) and shift.get('day') == weekday:
-                            start_str = shift.get('start', '08:00')
-                            end_str = shift.get('end', '17:00')
-                            
-                            # Парсим время
-                            start_hour, start_minute = map(int, start_str.split(':'))
-                            end_hour, end_minute = map(int, end_str.split(':'))
-                            
-                            start_dt = timezone.make_aware(datetime.combine(date, time(start_hour, start_minute)))
-                            end_dt = timezone.make_aware(datetime.combine(date, time(end_hour, end_minute)))
-                            
-                            # Если время окончания меньше времени начала, значит смена через полночь
-                            if end_hour < start_hour or (end_hour == start_hour and end_minute < start_minute):
-                                end_dt += timedelta(days=1)
-                            
-                            return (start_dt, end_dt)
-                
-                # Если смена не найдена, возвращаем None
-                return None
-            
-            elif schedule.schedule_type == 'regular':
-                # Обычный график - проверяем, есть ли этот день недели в расписании
-                if schedule.days_of_week and weekday in schedule.days_of_week:
-                    if schedule.start_time and schedule.end_time:
-                        start_dt = timezone.make_aware(datetime.combine(date, schedule.start_time))
-                        end_dt = timezone.make_aware(datetime.combine(date, schedule.end_time))
-                        
-                        # Если время окончания меньше времени начала, значит смена через полночь
-                        if schedule.end_time < schedule.start_time:
-                            end_dt += timedelta(days=1)
-                        
-                        return (start_dt, end_dt)
-                
-                # Если день не в расписании, возвращаем None
-                return None
-            
-            return None
-            
+            return compile_schedule(schedule).scheduled_times(date)
         except Exception as e:
             logger.error(f"Ошибка при получении запланированного времени для графика {schedule.id} на дату {date}: {e}")
             return None
+
+    @staticmethod
+    def get_scheduled_hours_for_period(schedules, start_date, end_date) -> tuple:
+        """
+        Считает, сколько часов сотрудник должен отработать за период.
+
+        Каждый день считается по версии графика, действующей на эту дату:
+        обычный график - длительность смены по времени начала и окончания
+        версии, плавающий - длительность смены дня, круглосуточный - 24 часа
+        на каждую смену (по дате начала смены).
+
+        Args:
+            schedules: Версии графика сотрудника (уже загруженные)
+            start_date: Начальная дата
+            end_date: Конечная дата
+
+        Returns:
+            Кортеж (часы, первая смена плавающего графика как
+            (scheduled_start, scheduled_end) или None)
+        """
+        hours = 0.0
+        first_floating_shift = None
+        round_the_clock_shifts = set()
+        day = start_date
+        while day <= end_date:
+            schedule = select_schedule_version(schedules, day)
+            scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, day)
+            if scheduled_times:
+                scheduled_start, scheduled_end = scheduled_times
+                if schedule.schedule_type == 'round_the_clock':
+                    # Дата начала смены определяет уникальную смену
+                    round_the_clock_shifts.add(scheduled_start.date())
+                elif schedule.schedule_type == 'regular' and schedule.start_time and schedule.end_time:
+                    start_datetime = datetime.combine(day, schedule.start_time)
+                    end_datetime = datetime.combine(day, schedule.end_time)
+                    if schedule.end_time < schedule.start_time:
+                        # Ночная смена - добавляем день
+                        end_datetime += timedelta(days=1)
+                    hours += (end_datetime - start_datetime).total_seconds() / 3600.0
+                else:
+                    hours += (scheduled_end - scheduled_start).total_seconds() / 3600.0
+                    if schedule.schedule_type == 'floating' and first_floating_shift is None:
+                        first_floating_shift = scheduled_times
+            day += timedelta(days=1)
+        return hours + 24.0 * len(round_the_clock_shifts), first_floating_shift
+
+    @staticmethod
+    def get_shift_calendar(employee_ids, start_date, end_date) -> dict:
+        """
+        Пакетно разворачивает графики сотрудников на диапазон дат.
+        
+        Выполняет один запрос к WorkSchedule, дальнейшее сопоставление
+        не требует обращений к БД. Каждый день берется из версии графика,
+        действующей на эту дату.
+        
+        Args:
+            employee_ids: ID сотрудников (Employee.id)
+            start_date: Начальная дата
+            end_date: Конечная дата
+            
+        Returns:
+            Словарь employee_id -> ShiftCalendar
+        """
+        return expand_schedule_index(ScheduleIndex.load(employee_ids), start_date, end_date)
     
     @staticmethod
     def match_entry_exit_to_schedule(entry_exit: EntryExit, schedule: WorkSchedule) -> dict:
@@ -199,3 +257,168 @@ class ScheduleMatcher:
             logger.error(f"Ошибка при сопоставлении записи {entry_exit.id} с графиком {schedule.id}: {e}")
             result['is_extra_shift'] = True
             return result
+    
+    @staticmethod
+    def match_batch(rows, schedules) -> dict:
+        """
+        Пакетная версия match_entry_exit_to_schedule.
+        
+        Разбор входных данных выполняется одним проходом, сами вычисления
+        опозданий и ранних уходов - векторно по массивам NumPy.
+        
+        Args:
+            rows: Последовательность кортежей (employee, entry_time, exit_time),
+                где employee - объект Employee или его id. Дата смены берется
+                из entry_time так же, как в match_entry_exit_to_schedule.
+            schedules: Словарь employee_id -> CompiledSchedule
+                (например, load_compiled_schedules) или ScheduleIndex -
+                тогда для каждой записи берется версия графика на дату входа.
+            
+        Returns:
+            Словарь параллельных массивов длины len(rows):
+            {
+                'is_late': bool,
+                'late_minutes': int64,
+                'is_early_leave': bool,
+                'early_leave_minutes': int64,
+                'is_extra_shift': bool,
+                'scheduled_start': datetime64[us] (NaT, если смены нет),
+                'scheduled_end': datetime64[us] (NaT, если смены нет)
+            }
+        """
+        n = len(rows)
+        positions = np.full(n, -1, dtype=np.int64)
+        entry_us = np.zeros(n, dtype=np.int64)
+        exit_us = np.zeros(n, dtype=np.int64)
+        has_exit = np.zeros(n, dtype=bool)
+        ordinals = np.zeros(n, dtype=np.int64)
+        
+        compiled_list = []
+        compiled_positions = {}
+        use_index = isinstance(schedules, ScheduleIndex)
+        
+        for i, (employee, entry_time, exit_time) in enumerate(rows):
+            if entry_time is None or employee is None:
+                continue
+            employee_id = getattr(employee, 'pk', employee)
+            entry_date = entry_time.date()
+            if use_index:
+                schedule = schedules.schedule_for(employee_id, entry_date)
+                compiled = compile_schedule(schedule) if schedule else None
+            else:
+                compiled = schedules.get(employee_id)
+            if compiled is None:
+                continue
+            
+            k = compiled_positions.get(id(compiled))
+            if k is None:
+                k = len(compiled_list)
+                compiled_positions[id(compiled)] = k
+                compiled_list.append(compiled)
+            positions[i] = k
+            entry_us[i] = _to_microseconds(entry_time)
+            ordinals[i] = entry_date.toordinal()
+            if exit_time is not None:
+                has_exit[i] = True
+                exit_us[i] = _to_microseconds(exit_time)
+        
+        result = {
+            'is_late': np.zeros(n, dtype=bool),
+            'late_minutes': np.zeros(n, dtype=np.int64),
+            'is_early_leave': np.zeros(n, dtype=bool),
+            'early_leave_minutes': np.zeros(n, dtype=np.int64),
+            'is_extra_shift': positions < 0,
+            'scheduled_start': np.full(n, np.datetime64('NaT'), dtype='datetime64[us]'),
+            'scheduled_end': np.full(n, np.datetime64('NaT'), dtype='datetime64[us]'),
+        }
+        
+        rows_idx = np.nonzero(positions >= 0)[0]
+        if len(rows_idx) == 0:
+            return result
+        
+        tables = ScheduleTables(compiled_list)
+        k = positions[rows_idx]
+        day_ordinals = ordinals[rows_idx]
+        weekday = (day_ordinals - 1) % 7  # date(1, 1, 1) - понедельник
+        prev_weekday = (weekday - 1) % 7
+        
+        # Полуночи с запасом: предыдущий день (ночные смены) и следующий (окончание смены)
+        base_ordinal = int(day_ordinals.min()) - 1
+        midnights = local_midnight_timestamps(
+            date_cls.fromordinal(base_ordinal), date_cls.fromordinal(int(day_ordinals.max()) + 1)
+        )
+        day_index = day_ordinals - base_ordinal
+        
+        has_shift = tables.mask[k, weekday]
+        start_us = shift_boundary_timestamps(midnights, day_index, tables.start_minutes[k, weekday]) * _MICROSECONDS_PER_SECOND
+        end_us = shift_boundary_timestamps(midnights, day_index, tables.end_minutes[k, weekday]) * _MICROSECONDS_PER_SECOND
+        
+        entry = entry_us[rows_idx]
+        exit_ = exit_us[rows_idx]
+        with_exit = has_exit[rows_idx] & has_shift
+        
+        # Опоздание
+        late_delta = entry - start_us
+        late_minutes = np.where(late_delta > 0, late_delta // _MICROSECONDS_PER_MINUTE, 0)
+        allowed_late = tables.allowed_late_minutes[k]
+        is_late = has_shift & (late_delta > 0) & (late_minutes > allowed_late)
+        
+        # Ранний уход: для ночной смены выход до начала смены относится к смене предыдущего дня
+        prev_has_shift = tables.mask[k, prev_weekday]
+        prev_end_us = shift_boundary_timestamps(
+            midnights, day_index - 1, tables.end_minutes[k, prev_weekday]
+        ) * _MICROSECONDS_PER_SECOND
+        overnight = tables.end_minutes[k, weekday] - tables.start_minutes[k, weekday] > _OVERNIGHT_THRESHOLD_MINUTES
+        use_prev = with_exit & overnight & (exit_ < start_us) & prev_has_shift
+        effective_end = np.where(use_prev, prev_end_us, end_us)
+        early_delta = effective_end - exit_
+        early_minutes = np.where(early_delta > 0, early_delta // _MICROSECONDS_PER_MINUTE, 0)
+        allowed_early = tables.allowed_early_leave_minutes[k]
+        is_early = with_exit & (early_delta > 0) & (early_minutes > allowed_early)
+        
+        result['is_late'][rows_idx] = is_late
+        result['late_minutes'][rows_idx] = np.where(is_late, late_minutes - allowed_late, 0)
+        result['is_early_leave'][rows_idx] = is_early
+        result['early_leave_minutes'][rows_idx] = np.where(is_early, early_minutes - allowed_early, 0)
+        result['is_extra_shift'][rows_idx] = ~has_shift
+        result['scheduled_start'][rows_idx] = np.where(
+            has_shift, start_us.astype('datetime64[us]'), np.datetime64('NaT')
+        )
+        result['scheduled_end'][rows_idx] = np.where(
+            has_shift, end_us.astype('datetime64[us]'), np.datetime64('NaT')
+        )
+        return result
+    
+    @staticmethod
+    def match_entry_exits(entry_exits) -> dict:
+        """
+        Сопоставляет набор записей EntryExit с графиками сотрудников.
+        
+        Сотрудники и версии графиков загружаются двумя запросами,
+        далее используется match_batch.
+        
+        Args:
+            entry_exits: Список (или QuerySet) записей EntryExit
+            
+        Returns:
+            Словарь параллельных массивов (см. match_batch) в порядке entry_exits
+        """
+        entry_exits = list(entry_exits)
+        raw_ids = {ee.hikvision_id for ee in entry_exits if ee.hikvision_id}
+        lookup_ids = raw_ids | {clean_id(value) for value in raw_ids}
+        
+        employee_ids = {}
+        for employee_id, hikvision_id in Employee.objects.filter(
+            hikvision_id__in=lookup_ids
+        ).values_list('id', 'hikvision_id'):
+            employee_ids[hikvision_id] = employee_id
+            employee_ids.setdefault(clean_id(hikvision_id), employee_id)
+        
+        index = ScheduleIndex.load(set(employee_ids.values()))
+        rows = []
+        for ee in entry_exits:
+            employee_id = None
+            if ee.hikvision_id:
+                employee_id = employee_ids.get(clean_id(ee.hikvision_id)) or employee_ids.get(ee.hikvision_id)
+            rows.append((employee_id, ee.entry_time, ee.exit_time))
+        return ScheduleMatcher.match_batch(rows, index)
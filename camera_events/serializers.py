@@ -2,6 +2,7 @@
 Сериализаторы для событий камер.
 """
 from rest_framework import serializers
+from .hikvision_parser import get_parsed_event
 from .models import CameraEvent, EntryExit, Department, Employee, WorkSchedule
 
 
@@ -30,64 +31,21 @@ class CameraEventSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "created_at", "updated_at", "employee_id", "employee_name", "card_no", "event_type"]
     
-    def _get_access_event(self, obj):
-        """Извлекает вложенный AccessControllerEvent из raw_data."""
-        if obj and obj.raw_data and isinstance(obj.raw_data, dict):
-            outer_event = obj.raw_data.get("AccessControllerEvent", {})
-            # Проверяем вложенную структуру
-            if isinstance(outer_event, dict) and "AccessControllerEvent" in outer_event:
-                return outer_event["AccessControllerEvent"]
-            elif isinstance(outer_event, dict):
-                return outer_event
-        return {}
-    
     def get_employee_id(self, obj):
         """Извлекает Employee ID из raw_data."""
-        access_event = self._get_access_event(obj)
-        return (
-            access_event.get("employeeId") or
-            access_event.get("employeeID") or
-            access_event.get("employeeNo") or
-            access_event.get("employeeNoString") or
-            obj.hikvision_id or
-            None
-        )
+        return get_parsed_event(obj).employee_no or obj.hikvision_id or None
     
     def get_employee_name(self, obj):
         """Извлекает имя сотрудника из raw_data."""
-        access_event = self._get_access_event(obj)
-        return (
-            access_event.get("employeeName") or
-            access_event.get("name") or
-            access_event.get("employeeNameString") or
-            None
-        )
+        return get_parsed_event(obj).employee_name or None
     
     def get_card_no(self, obj):
         """Извлекает номер карты из raw_data."""
-        access_event = self._get_access_event(obj)
-        return (
-            access_event.get("cardNo") or
-            access_event.get("cardNumber") or
-            access_event.get("card") or
-            None
-        )
+        return get_parsed_event(obj).card_no or None
     
     def get_event_type(self, obj):
         """Извлекает тип события из raw_data."""
-        access_event = self._get_access_event(obj)
-        # Проверяем subEventType для определения типа
-        sub_event_type = access_event.get("subEventType")
-        if sub_event_type == 75:
-            return "Authenticated via Face"
-        
-        return (
-            access_event.get("eventType") or
-            access_event.get("eventTypes") or
-            access_event.get("eventDescription") or
-            access_event.get("event") or
-            None
-        )
+        return get_parsed_event(obj).event_type or None
 
 
 class EntryExitSerializer(serializers.ModelSerializer):
@@ -6,6 +6,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import CameraEvent
 from .event_processor import process_single_camera_event
+from .identities import note_seen_identity
 
 logger = logging.getLogger(__name__)
 
@@ -22,3 +23,15 @@ def camera_event_saved(sender, instance, created, **kwargs):
             process_single_camera_event(instance)
         except Exception as e:
             logger.error(f"Error processing camera event {instance.id}: {e}", exc_info=True)
+
+
+@receiver(post_save, sender=CameraEvent)
+def camera_event_seen(sender, instance, created, **kwargs):
+    """
+    Отмечает ID сотрудника в SeenIdentity (для выгрузки сотрудников).
+    """
+    if created:
+        try:
+            note_seen_identity(instance)
+        except Exception as e:
+            logger.error(f"Error updating seen identity for camera event {instance.id}: {e}", exc_info=True)
@@ -0,0 +1,307 @@
+"""
+Локальный журнал (spool) событий камер на случай недоступности БД.
+
+Если запись события в БД завершилась ошибкой или превысила бюджет времени,
+событие дописывается в локальный файл, камера получает "OK", а команда
+drain_camera_spool позже переносит накопленные события в БД пакетами.
+
+Формат сегмента: заголовок SPOOL_MAGIC, затем записи
+[длина: 4 байта][crc32: 4 байта][zlib(JSON)]. Каждый процесс пишет в свой
+сегмент и держит на нем flock, поэтому drain пропускает активные сегменты.
+fsync выполняется не чаще CAMERA_INGEST_SPOOL_FSYNC_INTERVAL секунд
+(0 - после каждой записи). Если запись пришлась на этот интервал, fsync
+выполняет таймер по его истечении, поэтому и хвост серии записей теряется
+при сбое не более чем за интервал. При закрытии сегмента и завершении
+процесса (atexit) fsync выполняется сразу.
+
+После ошибки БД срабатывает предохранитель (circuit breaker): в течение
+CAMERA_INGEST_SPOOL_BREAKER_SECONDS события сразу пишутся в spool без
+попыток обращения к БД, чтобы задержка ответа камере не зависела от БД.
+"""
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки сегментов нет, drain обрабатывает только закрытые сегменты
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_MAGIC = b"HKSPOOL1\n"
+_RECORD_HEADER = struct.Struct(">II")
+ACTIVE_SUFFIX = ".open"
+CLOSED_SUFFIX = ".wal"
+CORRUPT_SUFFIX = ".corrupt"
+TEMP_SUFFIX = ".tmp"
+
+
+def get_spool_dir():
+    return str(getattr(settings, "CAMERA_INGEST_SPOOL_DIR", os.path.join(settings.BASE_DIR, "spool")))
+
+
+class CircuitBreaker:
+    """
+    Предохранитель обращений к БД.
+
+    После trip() в течение cooldown секунд allow() возвращает False,
+    затем пропускает запросы снова (первый успешный запрос закрывает
+    предохранитель, ошибка - снова размыкает).
+    """
+
+    def __init__(self, cooldown):
+        self.cooldown = cooldown
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            return self._opened_at is None or time.monotonic() - self._opened_at >= self.cooldown
+
+    def trip(self):
+        with self._lock:
+            if self._opened_at is None:
+                logger.warning(f"БД недоступна или медленная: события пишутся в spool ({self.cooldown}s)")
+            self._opened_at = time.monotonic()
+
+    def reset(self):
+        """Закрывает предохранитель. Возвращает True, если он был разомкнут."""
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._opened_at = None
+            return was_open
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+def encode_record(record):
+    payload = zlib.compress(json.dumps(record, ensure_ascii=False, default=str).encode("utf-8"))
+    return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(stream):
+    """
+    Читает записи сегмента.
+
+    Yields:
+        Словари записей. Усеченная последняя запись (сбой во время записи)
+        пропускается, поврежденная запись вызывает ValueError.
+    """
+    if stream.read(len(SPOOL_MAGIC)) != SPOOL_MAGIC:
+        raise ValueError("Некорректный заголовок сегмента spool")
+    while True:
+        header = stream.read(_RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) < _RECORD_HEADER.size:
+            logger.warning("Усеченный заголовок записи в конце сегмента spool")
+            return
+        length, crc = _RECORD_HEADER.unpack(header)
+        payload = stream.read(length)
+        if len(payload) < length:
+            logger.warning("Усеченная запись в конце сегмента spool")
+            return
+        if zlib.crc32(payload) != crc:
+            raise ValueError("Контрольная сумма записи spool не совпадает")
+        yield json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+class SpoolWriter:
+    """Запись событий в сегмент spool текущего процесса."""
+
+    def __init__(self, directory=None, max_segment_bytes=None, fsync_interval=None):
+        self.directory = directory or get_spool_dir()
+        self.max_segment_bytes = max_segment_bytes or getattr(
+            settings, "CAMERA_INGEST_SPOOL_SEGMENT_BYTES", 64 * 1024 * 1024
+        )
+        self.fsync_interval = (
+            fsync_interval if fsync_interval is not None
+            else getattr(settings, "CAMERA_INGEST_SPOOL_FSYNC_INTERVAL", 0.2)
+        )
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._last_fsync = 0.0
+        self._dirty = False
+        self._timer = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"spool-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._sequence:04d}"
+        self._path = os.path.join(self.directory, name + ACTIVE_SUFFIX)
+        # Сегмент создается под временным именем, которое drain не видит, и
+        # получает имя .open уже заблокированным и с записанным заголовком
+        temp_path = os.path.join(self.directory, name + TEMP_SUFFIX)
+        self._file = open(temp_path, "xb")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        self._file.write(SPOOL_MAGIC)
+        self._size = len(SPOOL_MAGIC)
+        self._sync(force=True)
+        os.replace(temp_path, self._path)
+
+    def _sync(self, force=False):
+        self._file.flush()
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+            self._dirty = False
+        else:
+            self._dirty = True
+            self._schedule_fsync(self.fsync_interval - (now - self._last_fsync))
+
+    def _schedule_fsync(self, delay):
+        # Без таймера хвост серии записей ждал бы fsync до следующей записи
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self._deferred_fsync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _deferred_fsync(self):
+        with self._lock:
+            self._timer = None
+            if self._file is not None and self._dirty:
+                self._sync(force=True)
+
+    def flush(self):
+        """fsync текущего сегмента, если в нем есть несинхронизированные записи."""
+        with self._lock:
+            if self._file is not None and self._dirty:
+                self._sync(force=True)
+
+    def append(self, record):
+        """Дописывает запись в текущий сегмент (с ротацией по размеру)."""
+        data = encode_record(record)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(data)
+            self._size += len(data)
+            self._sync()
+            if self._size >= self.max_segment_bytes:
+                self._close_segment()
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._sync(force=True)
+        closed_path = self._path[: -len(ACTIVE_SUFFIX)] + CLOSED_SUFFIX
+        os.replace(self._path, closed_path)
+        self._file.close()  # снимает flock
+        logger.info(f"Сегмент spool закрыт: {closed_path}")
+        self._file = None
+        self._path = None
+
+    def rotate(self):
+        """Закрывает текущий сегмент, чтобы drain мог его обработать."""
+        with self._lock:
+            self._close_segment()
+
+    @property
+    def has_open_segment(self):
+        return self._file is not None
+
+
+def list_segments(directory=None):
+    """Сегменты spool в порядке создания (закрытые и открытые)."""
+    directory = directory or get_spool_dir()
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.endswith(CLOSED_SUFFIX) or name.endswith(ACTIVE_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def _try_lock(stream):
+    """Пытается захватить сегмент. False - сегмент пишет другой процесс."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(stream.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def drain_segment(path, replay, batch_size=500):
+    """
+    Переносит записи сегмента в БД и удаляет сегмент.
+
+    Args:
+        path: Путь к сегменту
+        replay: Функция, принимающая список записей (пакет)
+        batch_size: Размер пакета
+
+    Returns:
+        Количество обработанных записей или None, если сегмент активен.
+    """
+    if fcntl is None and path.endswith(ACTIVE_SUFFIX):
+        return None
+    with open(path, "rb") as stream:
+        if not _try_lock(stream):
+            return None
+        if path.endswith(ACTIVE_SUFFIX):
+            # Пока drain открывал файл, писатель мог закрыть сегмент
+            # (переименовать в .wal): он будет обработан под новым именем
+            try:
+                if os.stat(path).st_ino != os.fstat(stream.fileno()).st_ino:
+                    return None
+            except FileNotFoundError:
+                return None
+            # Заголовок еще не записан - сегмент создается
+            if os.fstat(stream.fileno()).st_size < len(SPOOL_MAGIC):
+                return None
+        processed = 0
+        batch = []
+        try:
+            for record in read_records(stream):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    replay(batch)
+                    processed += len(batch)
+                    batch = []
+            if batch:
+                replay(batch)
+                processed += len(batch)
+        except ValueError as e:
+            # Уже перенесенные записи повторно не создадут событий (ON CONFLICT)
+            corrupt_path = path + CORRUPT_SUFFIX
+            os.replace(path, corrupt_path)
+            logger.error(f"Сегмент spool поврежден ({e}), перемещен в {corrupt_path}")
+            return processed
+        os.remove(path)
+    return processed
+
+
+def build_record(parsed, event_data, picture_data):
+    """Запись spool для разобранного события."""
+    return {
+        "event_data": event_data,
+        "picture_data": picture_data,
+        "event_time": parsed.event_time.isoformat() if parsed.event_time else None,
+        "received_at": timezone.now().isoformat(),
+    }
+
+
+spool_writer = SpoolWriter()
+atexit.register(spool_writer.flush)
+breaker = CircuitBreaker(getattr(settings, "CAMERA_INGEST_SPOOL_BREAKER_SECONDS", 30))
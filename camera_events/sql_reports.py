@@ -2,11 +2,14 @@
 Оптимизированные SQL запросы для генерации отчетов.
 Использует raw SQL для максимальной производительности.
 """
-from django.db import connection
+from hikvision_project.db_router import read_connection
 from django.utils import timezone
 from datetime import datetime, timedelta, time, date
 from typing import Optional, List, Dict, Tuple
 import logging
+from collections import defaultdict
+
+from .utils import employee_id_lookup
 
 logger = logging.getLogger(__name__)
 
@@ -75,7 +78,7 @@ def generate_attendance_report_sql(
             pass
     
     # Строим SQL запрос
-    with connection.cursor() as cursor:
+    with read_connection().cursor() as cursor:
         # Базовый запрос с JOIN'ами для получения всех нужных данных
         query = """
         SELECT 
@@ -83,15 +86,15 @@ def generate_attendance_report_sql(
             e.hikvision_id,
             e.name as employee_name,
             COALESCE(d.name, e.department_old, '') as department_name,
-            DATE(ee.entry_time AT TIME ZONE 'Asia/Almaty') as report_date,
-            EXTRACT(DOW FROM ee.entry_time AT TIME ZONE 'Asia/Almaty') as day_of_week,
+            ee.entry_local_date as report_date,
+            EXTRACT(DOW FROM ee.entry_local_date) as day_of_week,
             ws.schedule_type,
             ws.start_time as schedule_start_time,
             ws.end_time as schedule_end_time,
             -- Конвертируем время из UTC в местное время (Asia/Almaty, UTC+5)
             MIN(ee.entry_time AT TIME ZONE 'Asia/Almaty') as first_entry,
             MAX(ee.exit_time AT TIME ZONE 'Asia/Almaty') as last_exit,
-            COUNT(DISTINCT DATE(ee.entry_time AT TIME ZONE 'Asia/Almaty')) as days_count,
+            COUNT(DISTINCT ee.entry_local_date) as days_count,
             -- Рассчитываем продолжительность как разницу между первым входом и последним выходом за день
             -- Используем исходные UTC времена для правильного расчета разницы
             EXTRACT(EPOCH FROM (
@@ -99,9 +102,12 @@ def generate_attendance_report_sql(
                 MIN(ee.entry_time AT TIME ZONE 'Asia/Almaty')::timestamp
             )) as total_duration_seconds
         FROM camera_events_entryexit ee
-        INNER JOIN camera_events_employee e ON ee.hikvision_id = e.hikvision_id
+        INNER JOIN camera_events_employee e ON ee.normalized_id = e.hikvision_id
         LEFT JOIN camera_events_department d ON e.department_id = d.id
         LEFT JOIN camera_events_workschedule ws ON ws.employee_id = e.id
+            -- Версия графика, действующая на дату входа
+            AND (ws.valid_from IS NULL OR ws.valid_from <= ee.entry_local_date)
+            AND (ws.valid_to IS NULL OR ws.valid_to >= ee.entry_local_date)
         WHERE ee.entry_time IS NOT NULL
             AND ee.exit_time IS NOT NULL
         """
@@ -110,10 +116,10 @@ def generate_attendance_report_sql(
         
         # Фильтр по hikvision_id
         if hikvision_id:
-            # Очищаем ID от ведущих нулей
-            clean_id_str = hikvision_id.lstrip('0') or '0'
-            query += " AND (ee.hikvision_id = %s OR ee.hikvision_id = %s)"
-            params.extend([clean_id_str, hikvision_id])
+            # Один индексируемый ключ вместо пары "очищенный или исходный ID"
+            id_field, id_value = employee_id_lookup(hikvision_id)
+            query += f" AND ee.{id_field} = %s"
+            params.append(id_value)
         
         # Фильтр по датам
         if start_datetime:
@@ -139,8 +145,7 @@ def generate_attendance_report_sql(
         query += """
         GROUP BY 
             e.id, e.hikvision_id, e.name, d.name, e.department_old,
-            DATE(ee.entry_time AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Almaty'),
-            EXTRACT(DOW FROM ee.entry_time AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Almaty'),
+            ee.entry_local_date,
             ws.schedule_type, ws.start_time, ws.end_time
         ORDER BY e.name, report_date
         """
@@ -223,7 +228,7 @@ def generate_round_the_clock_report_sql(
     # Время начала периода в секундах от начала дня
     schedule_start_seconds = schedule_start_time.hour * 3600 + schedule_start_time.minute * 60
     
-    with connection.cursor() as cursor:
+    with read_connection().cursor() as cursor:
         # Используем CTE для определения периода графика для каждой записи
         query = f"""
         WITH entry_exits_with_period AS (
@@ -238,15 +243,15 @@ def generate_round_the_clock_report_sql(
                 CASE 
                     WHEN EXTRACT(HOUR FROM ee.entry_time AT TIME ZONE 'Asia/Almaty') * 3600 + 
                          EXTRACT(MINUTE FROM ee.entry_time AT TIME ZONE 'Asia/Almaty') * 60 < {schedule_start_seconds}
-                    THEN DATE(ee.entry_time AT TIME ZONE 'Asia/Almaty') - INTERVAL '1 day'
-                    ELSE DATE(ee.entry_time AT TIME ZONE 'Asia/Almaty')
+                    THEN ee.entry_local_date - INTERVAL '1 day'
+                    ELSE ee.entry_local_date
                 END::date as period_date,
                 -- Время входа в локальном часовом поясе (конвертируем из UTC в Asia/Almaty)
                 ee.entry_time AT TIME ZONE 'Asia/Almaty' as entry_local,
                 -- Время выхода в локальном часовом поясе (конвертируем из UTC в Asia/Almaty)
                 ee.exit_time AT TIME ZONE 'Asia/Almaty' as exit_local
             FROM camera_events_entryexit ee
-            INNER JOIN camera_events_employee e ON ee.hikvision_id = e.hikvision_id
+            INNER JOIN camera_events_employee e ON ee.normalized_id = e.hikvision_id
             LEFT JOIN camera_events_department d ON e.department_id = d.id
             WHERE ee.entry_time IS NOT NULL
                 AND ee.exit_time IS NOT NULL
@@ -256,9 +261,9 @@ def generate_round_the_clock_report_sql(
         
         # Фильтр по hikvision_id
         if hikvision_id:
-            clean_id_str = hikvision_id.lstrip('0') or '0'
-            query += " AND (ee.hikvision_id = %s OR ee.hikvision_id = %s)"
-            params.extend([clean_id_str, hikvision_id])
+            id_field, id_value = employee_id_lookup(hikvision_id)
+            query += f" AND ee.{id_field} = %s"
+            params.append(id_value)
         
         # Фильтр по датам
         if start_datetime:
@@ -310,7 +315,8 @@ def generate_comprehensive_attendance_report_sql(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     device_name: Optional[str] = None,
-    excluded_hikvision_ids: Optional[List[str]] = None
+    excluded_hikvision_ids: Optional[List[str]] = None,
+    hikvision_ids: Optional[List[str]] = None
 ) -> Tuple[List[Dict], date, date]:
     """
     Комплексный SQL запрос для генерации полного отчета о посещаемости.
@@ -322,6 +328,8 @@ def generate_comprehensive_attendance_report_sql(
         end_date: Конечная дата (формат: YYYY-MM-DD)
         device_name: Фильтр по названию устройства
         excluded_hikvision_ids: Список ID для исключения
+        hikvision_ids: Отчет сразу по нескольким сотрудникам (опционально);
+            строки раскладываются по сотрудникам через group_report_by_employee
         
     Returns:
         Кортеж: (список словарей с данными для отчета, start_date_obj, end_date_obj)
@@ -379,7 +387,7 @@ def generate_comprehensive_attendance_report_sql(
     if not end_date_obj:
         end_date_obj = timezone.now().date()
     
-    with connection.cursor() as cursor:
+    with read_connection().cursor() as cursor:
         # Сложный запрос с обработкой всех типов графиков
         query = """
         WITH 
@@ -409,17 +417,13 @@ def generate_comprehensive_attendance_report_sql(
                 -- Определяем дату периода графика
                 -- Новая логика для круглосуточных графиков:
                 -- период всегда равен КАЛЕНДАРНОЙ дате входа (без сдвига на 09:00)
-                DATE(ee.entry_time AT TIME ZONE 'Asia/Almaty')::date as period_date,
+                ee.entry_local_date as period_date,
                 -- Время входа и выхода в локальном часовом поясе (конвертируем из UTC в Asia/Almaty)
                 ee.entry_time AT TIME ZONE 'Asia/Almaty' as entry_local,
                 ee.exit_time AT TIME ZONE 'Asia/Almaty' as exit_local,
                 -- Период для выхода: также используем КАЛЕНДАРНУЮ дату выхода
                 -- (важно: дату выхода больше не сдвигаем к предыдущему дню)
-                CASE 
-                    WHEN ee.exit_time IS NOT NULL THEN
-                        DATE(ee.exit_time AT TIME ZONE 'Asia/Almaty')
-                    ELSE NULL
-                END::date as exit_period_date,
+                ee.exit_local_date as exit_period_date,
                 -- Вычисляем продолжительность для каждой записи (в секундах)
                 -- ИСПРАВЛЕНО: Добавлена валидация для правильного расчета времени работы
                 -- 1. Проверяем, что выход позже входа (exit_time > entry_time)
@@ -441,9 +445,12 @@ def generate_comprehensive_attendance_report_sql(
                         0
                 END as individual_duration_seconds
             FROM camera_events_entryexit ee
-            INNER JOIN camera_events_employee e ON ee.hikvision_id = e.hikvision_id
+            INNER JOIN camera_events_employee e ON ee.normalized_id = e.hikvision_id
             LEFT JOIN camera_events_department d ON e.department_id = d.id
             LEFT JOIN camera_events_workschedule ws ON ws.employee_id = e.id
+                -- Версия графика, действующая на дату входа
+                AND (ws.valid_from IS NULL OR ws.valid_from <= ee.entry_local_date)
+                AND (ws.valid_to IS NULL OR ws.valid_to >= ee.entry_local_date)
             WHERE ee.entry_time IS NOT NULL
                 AND ee.exit_time IS NOT NULL
         """
@@ -452,9 +459,23 @@ def generate_comprehensive_attendance_report_sql(
         
         # Фильтр по hikvision_id
         if hikvision_id:
-            clean_id_str = hikvision_id.lstrip('0') or '0'
-            query += " AND (ee.hikvision_id = %s OR ee.hikvision_id = %s)"
-            params.extend([clean_id_str, hikvision_id])
+            id_field, id_value = employee_id_lookup(hikvision_id)
+            query += f" AND ee.{id_field} = %s"
+            params.append(id_value)
+        
+        # Фильтр по списку сотрудников (то же условие, что и для одного hikvision_id)
+        if hikvision_ids is not None:
+            ids_by_field = {'numeric_id': [], 'normalized_id': []}
+            for value in hikvision_ids:
+                id_field, id_value = employee_id_lookup(value)
+                ids_by_field[id_field].append(id_value)
+            conditions = []
+            for id_field, id_values in ids_by_field.items():
+                if id_values:
+                    placeholders = ','.join(['%s'] * len(id_values))
+                    conditions.append(f"ee.{id_field} IN ({placeholders})")
+                    params.extend(id_values)
+            query += f" AND ({' OR '.join(conditions) or 'FALSE'})"
         
         # Фильтр по датам
         if start_datetime:
@@ -800,3 +821,18 @@ def generate_comprehensive_attendance_report_sql(
         
         return filtered_results, start_date_obj, end_date_obj
 
+
+def group_report_by_employee(results: List[Dict]) -> Dict[tuple, List[Dict]]:
+    """
+    Раскладывает строки generate_comprehensive_attendance_report_sql
+    (запрос с hikvision_ids) по сотрудникам.
+
+    Ключ - employee_id_lookup(hikvision_id), то же условие, по которому
+    отбираются записи при отчете по одному сотруднику, поэтому строки
+    сотрудника совпадают с отдельным запросом по его hikvision_id.
+    """
+    grouped = defaultdict(list)
+    for result in results:
+        grouped[employee_id_lookup(result.get('hikvision_id'))].append(result)
+    return grouped
+
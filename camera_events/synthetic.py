@@ -0,0 +1,544 @@
+"""
+Детерминированный генератор синтетических данных посещаемости.
+
+Используется скриптами сравнения и нагрузочного тестирования отчетов:
+при одинаковых параметрах (количество сотрудников, месяцев и seed) всегда
+создается один и тот же набор подразделений, сотрудников, графиков и
+записей EntryExit. Смешиваются все типы графиков: дневные и ночные обычные,
+плавающие (день/ночь) и круглосуточные "сутки через двое".
+
+По тем же проходам можно создать события камер (CameraEvent) в формате
+терминалов Hikvision: вход и выход через камеры ENTRY_CAMERA_IP и
+EXIT_CAMERA_IP, повторные срабатывания камеры через несколько секунд,
+пропущенные отметки входа и выхода. На PostgreSQL записи загружаются через
+COPY (команда generate_synthetic_data), что позволяет создавать миллионы
+событий за минуты.
+"""
+import calendar
+import io
+import json
+import logging
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import partitioning
+from .hikvision_parser import ENTRY_CAMERA_IP, EXIT_CAMERA_IP, parse_event_payload
+from .identities import rebuild_seen_identities
+from .ingest import compute_dedup_key
+from .models import (
+    CameraEvent,
+    Department,
+    Employee,
+    EntryExit,
+    SeenIdentity,
+    WorkSchedule,
+    normalize_hikvision_id,
+)
+from .utils import clean_id
+
+logger = logging.getLogger(__name__)
+
+# Префикс hikvision_id синтетических сотрудников (не пересекается с реальными ID)
+SYNTHETIC_ID_PREFIX = "9"
+SYNTHETIC_ROOT_DEPARTMENT = "Синтетические данные"
+SYNTHETIC_DEVICE_ENTRY = "Синтетический вход"
+SYNTHETIC_DEVICE_EXIT = "Синтетический выход"
+
+# Первый месяц по умолчанию: включает смену смещения Asia/Almaty (+6 -> +5) 01.03.2024
+DEFAULT_START_DATE = date(2024, 1, 1)
+
+# Доли типов графиков (в порядке назначения)
+SCHEDULE_MIX = (
+    ("regular_day", 0.40),
+    ("regular_night", 0.15),
+    ("floating", 0.20),
+    ("round_the_clock", 0.25),
+)
+
+_DEPARTMENT_NAMES = ("Производство", "Охрана", "Логистика", "Администрация")
+
+# Камеры синтетических событий: IP определяют направление прохода
+SYNTHETIC_CAMERAS = {
+    ENTRY_CAMERA_IP: (SYNTHETIC_DEVICE_ENTRY, "bc:5e:33:00:01:24"),
+    EXIT_CAMERA_IP: (SYNTHETIC_DEVICE_EXIT, "bc:5e:33:00:01:43"),
+}
+# Доля проходов, на которых камера срабатывает повторно через несколько секунд
+DUPLICATE_SCAN_RATIO = 0.03
+# Доля смен без отметки входа (сотрудник прошел за другим)
+MISSING_ENTRY_RATIO = 0.005
+
+BULK_BATCH_SIZE = 5000
+COPY_BATCH_SIZE = 50000
+
+
+def synthetic_hikvision_id(index):
+    """Возвращает hikvision_id синтетического сотрудника по его номеру."""
+    return f"{SYNTHETIC_ID_PREFIX}{index + 1:05d}"
+
+
+def add_months(start, months):
+    """Возвращает дату через months месяцев (день месяца ограничивается концом месяца)."""
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def build_employee_specs(employees, seed=0):
+    """
+    Возвращает описания синтетических сотрудников (без записи в БД).
+
+    Args:
+        employees: Количество сотрудников
+        seed: Начальное значение генератора случайных чисел
+
+    Returns:
+        Список словарей с ключами hikvision_id, name, department, kind и schedule
+        (поля WorkSchedule).
+    """
+    rng = random.Random(f"employees:{seed}")
+    kinds = []
+    for kind, share in SCHEDULE_MIX:
+        kinds.extend([kind] * round(employees * share))
+    kinds = (kinds + ["regular_day"] * employees)[:employees]
+    rng.shuffle(kinds)
+
+    specs = []
+    for index, kind in enumerate(kinds):
+        allowed_late = rng.choice((0, 5, 10, 15))
+        allowed_early = rng.choice((0, 5, 10, 15))
+        if kind == "regular_day":
+            start_hour = rng.choice((8, 9))
+            schedule = {
+                "schedule_type": "regular",
+                "days_of_week": [0, 1, 2, 3, 4],
+                "start_time": time(start_hour, 0),
+                "end_time": time(start_hour + 9, 0),
+                "floating_shifts": [],
+            }
+        elif kind == "regular_night":
+            schedule = {
+                "schedule_type": "regular",
+                "days_of_week": [0, 1, 2, 3, 4, 5, 6],
+                "start_time": time(20, 0),
+                "end_time": time(8, 0),
+                "floating_shifts": [],
+            }
+        elif kind == "floating":
+            schedule = {
+                "schedule_type": "floating",
+                "days_of_week": [],
+                "start_time": time(8, 0),
+                "end_time": time(20, 0),
+                "floating_shifts": [
+                    {"day": 0, "start": "08:00", "end": "20:00"},
+                    {"day": 1, "start": "20:00", "end": "08:00"},
+                ],
+            }
+        else:
+            schedule = {
+                "schedule_type": "round_the_clock",
+                "days_of_week": [],
+                "start_time": time(9, 0),
+                "end_time": time(9, 0),
+                "floating_shifts": [],
+            }
+        schedule["allowed_late_minutes"] = allowed_late
+        schedule["allowed_early_leave_minutes"] = allowed_early
+        specs.append({
+            "hikvision_id": synthetic_hikvision_id(index),
+            "name": f"Синтетический сотрудник {index + 1:05d}",
+            "department": _DEPARTMENT_NAMES[index % len(_DEPARTMENT_NAMES)],
+            "kind": kind,
+            # Сдвиг цикла смен, чтобы сотрудники не выходили в одни и те же дни
+            "phase": rng.randrange(3),
+            "schedule": schedule,
+        })
+    return specs
+
+
+def _aware(day, minutes):
+    """Локальное время (Asia/Almaty) через minutes минут от полуночи day."""
+    naive = datetime.combine(day, time()) + timedelta(minutes=minutes)
+    return timezone.make_aware(naive)
+
+
+def _shift_for_day(spec, day, start_date):
+    """
+    Возвращает плановую смену (start_minutes, end_minutes) для дня или None.
+
+    Минуты отсчитываются от полуночи дня; end_minutes может быть больше суток
+    для ночных и круглосуточных смен.
+    """
+    kind = spec["kind"]
+    day_index = (day - start_date).days + spec["phase"]
+    if kind == "regular_day":
+        if day.weekday() >= 5:
+            return None
+        start = spec["schedule"]["start_time"].hour * 60
+        return start, start + 9 * 60
+    if kind == "regular_night":
+        # Пять ночей через две
+        if day_index % 7 >= 5:
+            return None
+        return 20 * 60, 32 * 60
+    if kind == "floating":
+        # День, ночь, два выходных
+        phase = day_index % 4
+        if phase == 0:
+            return 8 * 60, 20 * 60
+        if phase == 1:
+            return 20 * 60, 32 * 60
+        return None
+    # Сутки через двое
+    if day_index % 3:
+        return None
+    return 9 * 60, 33 * 60
+
+
+def iter_entry_exit_rows(specs, start_date, end_date, seed=0):
+    """
+    Генерирует записи входа/выхода для сотрудников за период (включительно).
+
+    Yields:
+        Словари с полями EntryExit (hikvision_id, entry_time, exit_time,
+        device_name_entry, device_name_exit, work_duration_seconds).
+        У части записей exit_time отсутствует (незакрытый вход), часть
+        дневных смен разбита на два интервала (обеденный перерыв).
+    """
+    rng = random.Random(f"entries:{seed}")
+    day = start_date
+    while day <= end_date:
+        for spec in specs:
+            shift = _shift_for_day(spec, day, start_date)
+            if shift is None:
+                continue
+            # Прогулы
+            if rng.random() < 0.04:
+                continue
+            start_minutes, end_minutes = shift
+            roll = rng.random()
+            if roll < 0.15:
+                entry_offset = rng.randint(1, 60)  # опоздание
+            elif roll < 0.35:
+                entry_offset = -rng.randint(11, 45)  # ранний приход
+            else:
+                entry_offset = rng.randint(-10, 5)
+            roll = rng.random()
+            if roll < 0.10:
+                exit_offset = -rng.randint(1, 90)  # ранний уход
+            elif roll < 0.30:
+                exit_offset = rng.randint(11, 60)  # поздний выход
+            else:
+                exit_offset = rng.randint(-5, 10)
+
+            entry_time = _aware(day, start_minutes + entry_offset)
+            exit_time = _aware(day, end_minutes + exit_offset)
+
+            intervals = [(entry_time, exit_time)]
+            if spec["kind"] == "regular_day" and rng.random() < 0.25:
+                lunch_start = _aware(day, 13 * 60 + rng.randint(-20, 20))
+                lunch_end = lunch_start + timedelta(minutes=rng.randint(20, 60))
+                intervals = [(entry_time, lunch_start), (lunch_end, exit_time)]
+            if rng.random() < 0.01:
+                intervals[-1] = (intervals[-1][0], None)
+
+            for entry, exit_ in intervals:
+                yield {
+                    "hikvision_id": spec["hikvision_id"],
+                    "entry_time": entry,
+                    "exit_time": exit_,
+                    "device_name_entry": SYNTHETIC_DEVICE_ENTRY,
+                    "device_name_exit": SYNTHETIC_DEVICE_EXIT if exit_ else None,
+                    "work_duration_seconds": int((exit_ - entry).total_seconds()) if exit_ else None,
+                }
+        day += timedelta(days=1)
+
+
+def _camera_payload(camera_ip, event_time, hikvision_id, name, serial_no, local_tz):
+    """Тело события терминала (raw_data) с вложенным AccessControllerEvent."""
+    device_name, mac = SYNTHETIC_CAMERAS[camera_ip]
+    return {
+        "ipAddress": camera_ip,
+        "portNo": 80,
+        "protocol": "HTTP",
+        "macAddress": mac,
+        "channelID": 1,
+        "dateTime": event_time.astimezone(local_tz).isoformat(timespec="seconds"),
+        "activePostCount": 1,
+        "eventType": "AccessControllerEvent",
+        "eventState": "active",
+        "eventDescription": "Access Controller Event",
+        "AccessControllerEvent": {
+            "deviceName": device_name,
+            "majorEventType": 5,
+            "subEventType": 75,
+            "name": name,
+            "cardReaderNo": 1,
+            "employeeNoString": hikvision_id,
+            "serialNo": serial_no,
+            "userType": "normal",
+            "currentVerifyMode": "cardOrFaceOrFp",
+            "mask": "no",
+            "picturesNumber": 1,
+        },
+    }
+
+
+def iter_camera_event_rows(specs, start_date, end_date, seed=0):
+    """
+    Генерирует события камер по проходам iter_entry_exit_rows.
+
+    Поля события заполняются так же, как при приеме (parse_event_payload и
+    compute_dedup_key), поэтому пересчет EntryExit и отчеты работают с ними
+    как с настоящими. Кроме незакрытых смен добавляются смены без отметки
+    входа и повторные срабатывания камеры (новый serialNo через 2-30 секунд).
+
+    Yields:
+        Словари с полями CameraEvent.
+    """
+    rng = random.Random(f"camera:{seed}")
+    names = {spec["hikvision_id"]: spec["name"] for spec in specs}
+    serial_numbers = dict.fromkeys(SYNTHETIC_CAMERAS, 0)
+    local_tz = timezone.get_current_timezone()
+    for row in iter_entry_exit_rows(specs, start_date, end_date, seed):
+        passages = []
+        if rng.random() >= MISSING_ENTRY_RATIO:
+            passages.append((ENTRY_CAMERA_IP, row["entry_time"]))
+        if row["exit_time"]:
+            passages.append((EXIT_CAMERA_IP, row["exit_time"]))
+        for camera_ip, passage_time in passages:
+            event_times = [passage_time]
+            if rng.random() < DUPLICATE_SCAN_RATIO:
+                event_times.append(passage_time + timedelta(seconds=rng.randint(2, 30)))
+            for event_time in event_times:
+                serial_numbers[camera_ip] += 1
+                raw_data = _camera_payload(
+                    camera_ip, event_time, row["hikvision_id"], names[row["hikvision_id"]],
+                    serial_numbers[camera_ip], local_tz,
+                )
+                parsed = parse_event_payload(raw_data)
+                normalized_id, numeric_id = normalize_hikvision_id(parsed.hikvision_id)
+                yield {
+                    "hikvision_id": parsed.hikvision_id,
+                    "normalized_id": normalized_id,
+                    "numeric_id": numeric_id,
+                    "device_name": parsed.device_name,
+                    "event_time": parsed.event_time,
+                    "raw_data": raw_data,
+                    "dedup_key": compute_dedup_key(parsed, raw_data),
+                }
+
+
+def _copy_text(value):
+    """Значение поля в текстовом формате COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, (datetime, date, time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_chunk(cursor, sql, buffer):
+    # psycopg2: copy_expert, psycopg 3 (DB_POOL_MODE=pool): cursor.copy
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(sql, buffer)
+    else:
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def load_rows(model, rows, batch_size=COPY_BATCH_SIZE):
+    """
+    Загружает записи модели из словарей полей.
+
+    На PostgreSQL используется COPY пакетами по batch_size строк (без
+    save() и сигналов), на других СУБД - bulk_create. Генерируемые поля
+    (GeneratedField) вычисляет БД, created_at/updated_at заполняются
+    текущим временем.
+
+    Returns:
+        Количество загруженных записей.
+    """
+    if connection.vendor != "postgresql":
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(model(**row))
+            if len(batch) >= BULK_BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key and not field.generated]
+    now = timezone.now()
+    defaults = {}
+    for field in fields:
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            defaults[field.attname] = now
+        elif field.has_default():
+            defaults[field.attname] = field.get_default()
+        else:
+            defaults[field.attname] = None
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+    sql = f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN"
+
+    count = 0
+    buffer = io.StringIO()
+    with connection.cursor() as cursor:
+        for row in rows:
+            buffer.write("\t".join(_copy_text(row.get(name, default)) for name, default in defaults.items()))
+            buffer.write("\n")
+            count += 1
+            if count % batch_size == 0:
+                buffer.seek(0)
+                _copy_chunk(cursor, sql, buffer)
+                buffer = io.StringIO()
+                logger.info(f"{model.__name__}: загружено {count} записей")
+        if buffer.tell():
+            buffer.seek(0)
+            _copy_chunk(cursor, sql, buffer)
+    return count
+
+
+def _ensure_event_partitions(start_date, end_date):
+    """Создает секции событий за период, если таблица секционирована."""
+    if connection.vendor != "postgresql" or not partitioning.is_partitioned():
+        return
+    month = partitioning.month_start(start_date)
+    while month <= end_date:
+        partitioning.create_month_partition(month)
+        month = partitioning.add_months(month, 1)
+
+
+def _create_employees(specs):
+    """Создает подразделения, сотрудников и графики синтетического набора."""
+    root = Department.objects.create(name=SYNTHETIC_ROOT_DEPARTMENT)
+    departments = {
+        name: Department.objects.create(name=name, parent=root)
+        for name in _DEPARTMENT_NAMES
+    }
+
+    Employee.objects.bulk_create(
+        [
+            Employee(
+                hikvision_id=spec["hikvision_id"],
+                name=spec["name"],
+                department=departments[spec["department"]],
+                position=spec["kind"],
+            )
+            for spec in specs
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    employee_pks = dict(
+        Employee.objects.filter(
+            hikvision_id__in=[spec["hikvision_id"] for spec in specs]
+        ).values_list("hikvision_id", "id")
+    )
+    WorkSchedule.objects.bulk_create(
+        [
+            WorkSchedule(employee_id=employee_pks[spec["hikvision_id"]], **spec["schedule"])
+            for spec in specs
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def _entry_exit_rows(specs, start_date, end_date, seed):
+    for row in iter_entry_exit_rows(specs, start_date, end_date, seed):
+        # Загрузка идет мимо save(), канонический ID заполняется явно
+        row["normalized_id"], row["numeric_id"] = normalize_hikvision_id(row["hikvision_id"])
+        yield row
+
+
+@transaction.atomic
+def generate_synthetic_dataset(
+    employees=100,
+    months=1,
+    seed=0,
+    start_date=DEFAULT_START_DATE,
+    entry_exits=True,
+    camera_events=False,
+):
+    """
+    Создает в текущей БД синтетический набор данных.
+
+    Ранее созданные синтетические данные (по префиксу ID и корневому
+    подразделению) удаляются, поэтому повторный вызов с теми же параметрами
+    дает идентичный результат.
+
+    Args:
+        employees: Количество сотрудников
+        months: Количество месяцев записей входа/выхода
+        seed: Начальное значение генератора случайных чисел
+        start_date: Первый день периода
+        entry_exits: Создать записи EntryExit напрямую (без пересчета)
+        camera_events: Создать события камер (CameraEvent) и SeenIdentity
+
+    Returns:
+        Словарь со сводкой: start_date, end_date, employees, entry_exits,
+        camera_events
+    """
+    end_date = add_months(start_date, months) - timedelta(days=1)
+    specs = build_employee_specs(employees, seed)
+
+    clear_synthetic_dataset()
+    _create_employees(specs)
+
+    created = 0
+    if entry_exits:
+        created = load_rows(EntryExit, _entry_exit_rows(specs, start_date, end_date, seed))
+
+    events = 0
+    if camera_events:
+        _ensure_event_partitions(start_date, end_date)
+        events = load_rows(CameraEvent, iter_camera_event_rows(specs, start_date, end_date, seed))
+        rebuild_seen_identities(
+            CameraEvent.objects.filter(device_name__in=[SYNTHETIC_DEVICE_ENTRY, SYNTHETIC_DEVICE_EXIT])
+        )
+
+    logger.info(
+        f"Синтетические данные: {len(specs)} сотрудников, {created} записей EntryExit, "
+        f"{events} событий камер за период {start_date} - {end_date}"
+    )
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "employees": len(specs),
+        "entry_exits": created,
+        "camera_events": events,
+    }
+
+
+def clear_synthetic_dataset():
+    """Удаляет синтетических сотрудников, их записи, события камер и подразделения."""
+    synthetic_devices = [SYNTHETIC_DEVICE_ENTRY, SYNTHETIC_DEVICE_EXIT]
+    employees = Employee.objects.filter(department__parent__name=SYNTHETIC_ROOT_DEPARTMENT)
+    seen_ids = [clean_id(hikvision_id) for hikvision_id in employees.values_list("hikvision_id", flat=True)]
+    SeenIdentity.objects.filter(hikvision_id__in=seen_ids).delete()
+    CameraEvent.objects.filter(device_name__in=synthetic_devices).delete()
+    EntryExit.objects.filter(device_name_entry=SYNTHETIC_DEVICE_ENTRY).delete()
+    employees.delete()
+    Department.objects.filter(parent__name=SYNTHETIC_ROOT_DEPARTMENT).delete()
+    Department.objects.filter(name=SYNTHETIC_ROOT_DEPARTMENT, parent__isnull=True).delete()
@@ -0,0 +1,43 @@
+"""
+Выход закрывает сессию по версии графика, действующей на дату выхода.
+"""
+from datetime import date, datetime, time
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.test import TestCase
+
+from camera_events.models import CameraEvent, Employee, EntryExit, WorkSchedule
+
+
+def local(*args):
+    return datetime(*args, tzinfo=ZoneInfo(settings.TIME_ZONE))
+
+
+class ExitScheduleVersionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Бессрочная (будущая) версия идет первой в порядке WorkSchedule.Meta.ordering
+        employee = Employee.objects.create(hikvision_id="301", name="Переходит на круглосуточный")
+        WorkSchedule.objects.create(
+            employee=employee, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4],
+            start_time=time(9, 0), end_time=time(18, 0), valid_to=date(2024, 3, 20),
+        )
+        WorkSchedule.objects.create(
+            employee=employee, schedule_type="round_the_clock", valid_from=date(2024, 3, 21),
+        )
+
+    def test_exit_uses_current_version(self):
+        yesterday = EntryExit.objects.create(hikvision_id="301", entry_time=local(2024, 3, 11, 9, 0))
+        today = EntryExit.objects.create(hikvision_id="301", entry_time=local(2024, 3, 12, 9, 0))
+
+        # Будущая круглосуточная версия закрыла бы вчерашний вход
+        CameraEvent.objects.create(
+            hikvision_id="301", device_name="Выход", event_time=local(2024, 3, 12, 18, 0), raw_data={},
+        )
+
+        today.refresh_from_db()
+        yesterday.refresh_from_db()
+        self.assertEqual(today.exit_time, local(2024, 3, 12, 18, 0))
+        self.assertIsNone(yesterday.exit_time)
@@ -0,0 +1,43 @@
+"""
+Частые запросы к EntryExit используют ожидаемые индексы (EXPLAIN, PostgreSQL).
+
+Таблица заполняется закрытыми сессиями нескольких сотрудников и
+анализируется (ANALYZE): на пустой таблице без статистики планировщик
+выбирает индексы произвольно.
+"""
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from camera_events.models import EntryExit
+from camera_events.query_plans import explain_hot_queries
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN проверяется только на PostgreSQL")
+class ExplainHotQueriesTests(TestCase):
+    """План каждого запроса из query_plans.hot_queries() содержит его индекс."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        EntryExit.objects.bulk_create(
+            EntryExit(
+                hikvision_id=str(employee),
+                normalized_id=str(employee),
+                numeric_id=employee,
+                entry_time=now - timedelta(days=day, hours=9),
+                exit_time=now - timedelta(days=day),
+            )
+            for employee in range(1, 21)
+            for day in range(1, 101)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {EntryExit._meta.db_table}")
+
+    def test_hot_queries_use_indexes(self):
+        for title, used, index_names, plan in explain_hot_queries():
+            with self.subTest(query=title):
+                self.assertIsNotNone(used, f"ожидался {' или '.join(index_names)}:\n{plan}")
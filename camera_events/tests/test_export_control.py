@@ -0,0 +1,97 @@
+"""
+Объединение одинаковых выгрузок (export_control.heavy_export): ожидание
+первой выгрузки ограничено, ошибка первой выгрузки не пробрасывается в
+объединенные запросы.
+"""
+import threading
+import time
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from camera_events import export_control
+
+
+class SlowExport:
+    """Выгрузка, которая выполняется, пока тест не разрешит ей завершиться."""
+
+    def __init__(self, error=None):
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        self.error = error
+
+    @export_control.heavy_export("test_export")
+    def export(self, request):
+        self.started.set()
+        self.finish.wait(5)
+        if self.error is not None:
+            raise self.error
+        return HttpResponse(b"xlsx")
+
+
+@override_settings(EXPORT_QUEUE_TIMEOUT=0.2)
+class HeavyExportCoalescingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def start_leader(self, view):
+        results = {}
+
+        def run():
+            try:
+                results["response"] = view.export(self.factory.get("/export/", {"date": "2024-03-01"}))
+            except Exception as e:
+                results["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(view.started.wait(5))
+        return thread, results
+
+    def test_follower_wait_is_bounded(self):
+        view = SlowExport()
+        thread, results = self.start_leader(view)
+        try:
+            response = view.export(self.factory.get("/export/", {"date": "2024-03-01"}))
+            self.assertEqual(response.status_code, 429)
+            self.assertIn("Retry-After", response)
+        finally:
+            view.finish.set()
+            thread.join(5)
+        self.assertEqual(results["response"].status_code, 200)
+
+    def test_followers_are_capped(self):
+        view = SlowExport()
+        thread, results = self.start_leader(view)
+        key = export_control.export_key("test_export", self.factory.get("/export/", {"date": "2024-03-01"}))
+        try:
+            export_control._flights[key].followers = export_control.limiter.queue_size
+            response = view.export(self.factory.get("/export/", {"date": "2024-03-01"}))
+            self.assertEqual(response.status_code, 429)
+        finally:
+            view.finish.set()
+            thread.join(5)
+
+    def test_leader_error_gives_followers_500(self):
+        view = SlowExport(error=ValueError("сбой"))
+        thread, results = self.start_leader(view)
+        follower = {}
+
+        def run_follower():
+            follower["response"] = view.export(self.factory.get("/export/", {"date": "2024-03-01"}))
+
+        with override_settings(EXPORT_QUEUE_TIMEOUT=5):
+            follower_thread = threading.Thread(target=run_follower)
+            follower_thread.start()
+            # Запрос должен успеть присоединиться к выполняющейся выгрузке
+            key = export_control.export_key("test_export", self.factory.get("/export/", {"date": "2024-03-01"}))
+            for _ in range(100):
+                if export_control._flights[key].followers:
+                    break
+                time.sleep(0.01)
+            view.finish.set()
+            follower_thread.join(5)
+            thread.join(5)
+        self.assertIsInstance(results["error"], ValueError)
+        self.assertEqual(follower["response"].status_code, 500)
@@ -0,0 +1,64 @@
+"""
+Повторная отправка события камеры не создает второй CameraEvent
+(ingest.insert_camera_event и replay_spool_records).
+"""
+import copy
+
+from django.test import TestCase
+
+from camera_events import ingest
+from camera_events.hikvision_parser import parse_event_payload
+from camera_events.models import CameraEvent
+
+PAYLOAD = {
+    "ipAddress": "192.168.1.10",
+    "AccessControllerEvent": {
+        "employeeNoString": "15",
+        "name": "Иванов",
+        "deviceName": "Вход",
+        "majorEventType": 5,
+        "subEventType": 75,
+    },
+}
+
+
+class IngestDedupTests(TestCase):
+
+    def setUp(self):
+        ingest.recent_keys.clear()
+
+    def send(self, payload):
+        payload = copy.deepcopy(payload)
+        return ingest.insert_camera_event(parse_event_payload(payload), payload)
+
+    def test_resend_with_time(self):
+        payload = copy.deepcopy(PAYLOAD)
+        payload["dateTime"] = "2024-03-01T09:00:00+06:00"
+        self.assertIsNotNone(self.send(payload))
+        self.assertIsNone(self.send(payload))
+        ingest.recent_keys.clear()
+        self.assertIsNone(self.send(payload))
+        self.assertEqual(CameraEvent.objects.count(), 1)
+
+    def test_resend_without_time(self):
+        # Время подставляется now(), но повтор все равно отбрасывается
+        self.assertIsNotNone(self.send(PAYLOAD))
+        self.assertIsNone(self.send(PAYLOAD))
+        ingest.recent_keys.clear()
+        self.assertIsNone(self.send(PAYLOAD))
+
+        unparsed = copy.deepcopy(PAYLOAD)
+        unparsed["dateTime"] = "не время"
+        self.assertIsNotNone(self.send(unparsed))
+        ingest.recent_keys.clear()
+        self.assertIsNone(self.send(unparsed))
+        self.assertEqual(CameraEvent.objects.count(), 2)
+
+    def test_replay_resends_without_time(self):
+        self.assertIsNotNone(self.send(PAYLOAD))
+        records = [
+            {"event_data": copy.deepcopy(PAYLOAD), "picture_data": None, "event_time": None},
+            {"event_data": copy.deepcopy(PAYLOAD), "picture_data": None, "event_time": None},
+        ]
+        self.assertEqual(ingest.replay_spool_records(records), 0)
+        self.assertEqual(CameraEvent.objects.count(), 1)
@@ -0,0 +1,33 @@
+"""
+Справочник табло присутствия учитывает версию графика, действующую сегодня.
+"""
+from datetime import date, time
+
+from django.test import TestCase
+
+from camera_events.models import Employee, WorkSchedule
+from camera_events.presence import _load_directory
+
+
+class PresenceDirectoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        moved = Employee.objects.create(hikvision_id="201", name="Перешел на дневной")
+        WorkSchedule.objects.create(
+            employee=moved, schedule_type="round_the_clock", valid_to=date(2024, 3, 10),
+        )
+        WorkSchedule.objects.create(
+            employee=moved, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4],
+            start_time=time(9, 0), end_time=time(18, 0), valid_from=date(2024, 3, 11),
+        )
+        guard = Employee.objects.create(hikvision_id="202", name="Охрана")
+        WorkSchedule.objects.create(employee=guard, schedule_type="round_the_clock")
+
+    def test_round_the_clock_by_active_version(self):
+        people, _, _ = _load_directory(date(2024, 3, 12))
+        self.assertFalse(people["201"].round_the_clock)
+        self.assertTrue(people["202"].round_the_clock)
+
+        people, _, _ = _load_directory(date(2024, 3, 1))
+        self.assertTrue(people["201"].round_the_clock)
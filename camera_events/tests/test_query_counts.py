@@ -0,0 +1,150 @@
+"""
+Число SQL запросов API не растет с объемом данных (нет N+1).
+
+Каждый endpoint запрашивается на двух синтетических наборах разного
+размера (camera_events.synthetic): число запросов должно совпадать в
+пределах QUERY_GROWTH_TOLERANCE и не превышать бюджет маршрута из
+PROFILING_QUERY_BUDGETS. Проверка на больших объемах и сравнение между
+коммитами - benchmarks/query_counts.py.
+"""
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from camera_events.models import Department, Employee
+from camera_events.presence import presence_index
+from camera_events.synthetic import DEFAULT_START_DATE, SYNTHETIC_ROOT_DEPARTMENT, generate_synthetic_dataset
+
+SMALL_SCALE = 3
+LARGE_SCALE = 12
+# Допустимая разница между масштабами: график основного сотрудника в
+# выгрузке событий камер и т.п. (не запрос на каждого сотрудника)
+QUERY_GROWTH_TOLERANCE = 1
+# Бюджет для маршрутов, которых нет в PROFILING_QUERY_BUDGETS
+DEFAULT_BUDGET = 30
+
+# Маршруты с SQL, специфичным для PostgreSQL (sql_reports.py)
+POSTGRESQL_ONLY = {
+    "camera-events-export-excel",
+    "entries-exits-export-excel",
+    "attendance-stats-export-excel",
+}
+
+
+def build_endpoints(dataset, root_department_id, department_name):
+    """
+    Проверяемые endpoint: {имя маршрута: (путь, параметры, нужен ли staff)}.
+    Имя маршрута совпадает с ключами PROFILING_QUERY_BUDGETS.
+    """
+    period = {"start_date": dataset["start_date"].isoformat(), "end_date": dataset["end_date"].isoformat()}
+    middle = (dataset["start_date"] + timedelta(days=14)).isoformat()
+    return {
+        "departments-list": ("/api/v1/departments/", {}, False),
+        "entries-exits-employees-list": ("/api/v1/entries-exits/employees-list/", {}, False),
+        "entries-exits-departments-list": ("/api/v1/entries-exits/departments-list/", {}, False),
+        "entries-exits-check-date": ("/api/v1/entries-exits/check-date/", {"date": middle}, False),
+        "attendance-stats-list": (
+            "/api/v1/attendance-stats/", dict(period, department=root_department_id), False,
+        ),
+        "top-late-employees-list": ("/api/v1/top-late-employees/", {}, False),
+        "presence-list": ("/api/v1/presence/", {}, False),
+        "camera-events-export-excel": ("/api/v1/camera-events/export-excel/", period, False),
+        "entries-exits-export-excel": (
+            "/api/v1/entries-exits/export-excel/", dict(period, department_name=department_name), False,
+        ),
+        "attendance-stats-export-excel": (
+            "/api/v1/attendance-stats/export-excel/", dict(period, department_id=root_department_id), False,
+        ),
+        "addemployees-export": ("/addemployees/export/", {}, True),
+    }
+
+
+class QueryCountTests(TestCase):
+    """Число запросов каждого endpoint на малом и большом наборе данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user(
+            username="query_counts", password="query_counts", is_staff=True, is_superuser=True,
+        )
+        cls.counts = {}
+        for scale in (SMALL_SCALE, LARGE_SCALE):
+            dataset = generate_synthetic_dataset(
+                employees=scale, months=1, seed=0, start_date=DEFAULT_START_DATE, camera_events=True,
+            )
+            root = Department.objects.get(name=SYNTHETIC_ROOT_DEPARTMENT, parent__isnull=True)
+            # Подразделение первого сотрудника: в выгрузку попадают сотрудники на обоих масштабах
+            department = Employee.objects.filter(department__isnull=False).order_by("hikvision_id").first().department
+            # Табло присутствия считается с пересборкой индекса на каждом масштабе
+            presence_index.invalidate()
+            for name, (path, params, needs_staff) in build_endpoints(dataset, root.id, department.name).items():
+                if name in POSTGRESQL_ONLY and connection.vendor != "postgresql":
+                    continue
+                cls.counts.setdefault(name, {})[scale] = cls.count_queries(path, params, needs_staff)
+
+    @classmethod
+    def count_queries(cls, path, params, needs_staff):
+        """Выполняет GET и возвращает (статус, число запросов на всех соединениях)."""
+        client = cls.client_class()
+        if needs_staff:
+            client.force_login(cls.staff)
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            response = client.get(path, params)
+            # Тело выгрузки читается, чтобы учесть запросы при потоковой отдаче
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+        return response.status_code, sum(len(context.captured_queries) for context in contexts)
+
+    def assert_query_count(self, name):
+        if name not in self.counts:
+            self.skipTest(f"{name}: нужен PostgreSQL")
+        (small_status, small), (large_status, large) = (
+            self.counts[name][SMALL_SCALE], self.counts[name][LARGE_SCALE]
+        )
+        self.assertEqual((small_status, large_status), (200, 200))
+        self.assertLessEqual(
+            large - small, QUERY_GROWTH_TOLERANCE,
+            f"{name}: число запросов растет с данными ({small} на {SMALL_SCALE} сотр. -> "
+            f"{large} на {LARGE_SCALE} сотр.)",
+        )
+        budget = getattr(settings, "PROFILING_QUERY_BUDGETS", {}).get(name, DEFAULT_BUDGET)
+        self.assertLessEqual(max(small, large), budget, f"{name}: {max(small, large)} запросов (бюджет {budget})")
+
+    def test_departments_list(self):
+        self.assert_query_count("departments-list")
+
+    def test_entries_exits_employees_list(self):
+        self.assert_query_count("entries-exits-employees-list")
+
+    def test_entries_exits_departments_list(self):
+        self.assert_query_count("entries-exits-departments-list")
+
+    def test_entries_exits_check_date(self):
+        self.assert_query_count("entries-exits-check-date")
+
+    def test_attendance_stats_list(self):
+        self.assert_query_count("attendance-stats-list")
+
+    def test_top_late_employees_list(self):
+        self.assert_query_count("top-late-employees-list")
+
+    def test_presence_list(self):
+        self.assert_query_count("presence-list")
+
+    def test_camera_events_export_excel(self):
+        self.assert_query_count("camera-events-export-excel")
+
+    def test_entries_exits_export_excel(self):
+        self.assert_query_count("entries-exits-export-excel")
+
+    def test_attendance_stats_export_excel(self):
+        self.assert_query_count("attendance-stats-export-excel")
+
+    def test_addemployees_export(self):
+        self.assert_query_count("addemployees-export")
@@ -0,0 +1,171 @@
+"""
+Совпадение пакетного сопоставления (match_batch, match_entry_exits) с
+построчным match_entry_exit_to_schedule.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.test import TestCase
+
+from camera_events.compiled_schedules import ScheduleIndex, load_compiled_schedules, select_schedule_version
+from camera_events.models import Employee, EntryExit, WorkSchedule
+from camera_events.schedule_matcher import ScheduleMatcher
+from camera_events.utils import clean_id
+
+ALMATY = ZoneInfo("Asia/Almaty")
+BOOL_FIELDS = ("is_late", "is_early_leave", "is_extra_shift")
+INT_FIELDS = ("late_minutes", "early_leave_minutes")
+
+
+def local(year, month, day, hour, minute=0):
+    """Время Алматы, переведенное в UTC (как его возвращает БД)."""
+    return datetime(year, month, day, hour, minute, tzinfo=ALMATY).astimezone(dt_timezone.utc)
+
+
+def almaty_offset_changes():
+    """Есть ли в tzdata переход Алматы на UTC+5 с 2024-03-01."""
+    before = datetime(2024, 2, 29, 12, tzinfo=ALMATY).utcoffset()
+    after = datetime(2024, 3, 1, 12, tzinfo=ALMATY).utcoffset()
+    return before != after
+
+
+class MatchBatchParityTests(TestCase):
+    """match_entry_exits возвращает то же, что построчное сопоставление."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day_employee = Employee.objects.create(hikvision_id="101", name="Дневной")
+        cls.night_employee = Employee.objects.create(hikvision_id="102", name="Ночной")
+        cls.versioned_employee = Employee.objects.create(hikvision_id="103", name="Сменил график")
+
+        WorkSchedule.objects.create(
+            employee=cls.day_employee, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4],
+            start_time=time(9, 0), end_time=time(18, 0),
+            allowed_late_minutes=5, allowed_early_leave_minutes=5,
+        )
+        # Ровно 12 часов по часам: на ночь 2024-02-29 -> 2024-03-01 смена длится 13 часов
+        WorkSchedule.objects.create(
+            employee=cls.night_employee, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4, 5, 6],
+            start_time=time(20, 0), end_time=time(8, 0),
+        )
+        WorkSchedule.objects.create(
+            employee=cls.versioned_employee, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4],
+            start_time=time(9, 0), end_time=time(18, 0), valid_to=date(2024, 3, 10),
+        )
+        WorkSchedule.objects.create(
+            employee=cls.versioned_employee, schedule_type="regular", days_of_week=[0, 1, 2, 3, 4],
+            start_time=time(8, 0), end_time=time(20, 0), valid_from=date(2024, 3, 11),
+        )
+
+    def create_rows(self, rows):
+        """Создает записи и читает их из БД (время в UTC, как при отчетах)."""
+        ids = [
+            EntryExit.objects.create(hikvision_id=hikvision_id, entry_time=entry_time, exit_time=exit_time).pk
+            for hikvision_id, entry_time, exit_time in rows
+        ]
+        return list(EntryExit.objects.filter(pk__in=ids).order_by("pk"))
+
+    def assert_parity(self, entry_exits):
+        """Сравнивает match_entry_exits с match_entry_exit_to_schedule по каждой записи."""
+        batch = ScheduleMatcher.match_entry_exits(entry_exits)
+        for i, entry_exit in enumerate(entry_exits):
+            employee = Employee.objects.filter(hikvision_id=clean_id(entry_exit.hikvision_id)).first()
+            schedule = None
+            if employee is not None:
+                schedule = select_schedule_version(
+                    list(employee.work_schedules.all()), entry_exit.entry_time.date()
+                )
+            expected = ScheduleMatcher.match_entry_exit_to_schedule(entry_exit, schedule)
+            with self.subTest(row=i, entry_time=entry_exit.entry_time, exit_time=entry_exit.exit_time):
+                for field in BOOL_FIELDS:
+                    self.assertEqual(bool(batch[field][i]), expected[field], field)
+                for field in INT_FIELDS:
+                    self.assertEqual(int(batch[field][i]), expected[field], field)
+                for field in ("scheduled_start", "scheduled_end"):
+                    if expected[field] is None:
+                        self.assertTrue(np.isnat(batch[field][i]), field)
+                    else:
+                        utc_naive = expected[field].astimezone(dt_timezone.utc).replace(tzinfo=None)
+                        self.assertEqual(batch[field][i], np.datetime64(utc_naive, "us"), field)
+        return batch
+
+    def test_regular_day(self):
+        """Обычный день без смены смещения: опоздания, ранние уходы, выходные."""
+        entry_exits = self.create_rows([
+            ("101", local(2024, 3, 12, 8, 55), local(2024, 3, 12, 18, 5)),   # вовремя
+            ("101", local(2024, 3, 12, 9, 4), local(2024, 3, 12, 17, 56)),   # в пределах допуска
+            ("101", local(2024, 3, 13, 9, 30), local(2024, 3, 13, 16, 0)),   # опоздание и ранний уход
+            ("101", local(2024, 3, 14, 9, 20), None),                        # нет выхода
+            ("101", local(2024, 3, 16, 10, 0), local(2024, 3, 16, 14, 0)),   # суббота - доп. смена
+            ("0101", local(2024, 3, 15, 9, 10), local(2024, 3, 15, 18, 0)),  # ID с ведущим нулем
+            ("999", local(2024, 3, 12, 9, 0), local(2024, 3, 12, 18, 0)),    # нет сотрудника
+            ("102", local(2024, 3, 12, 20, 15), local(2024, 3, 13, 7, 30)),  # ночная смена
+        ])
+        batch = self.assert_parity(entry_exits)
+        self.assertEqual(batch["late_minutes"].tolist()[:4], [0, 0, 25, 15])
+        self.assertEqual(batch["early_leave_minutes"].tolist()[:4], [0, 0, 115, 0])
+        self.assertEqual(batch["is_extra_shift"].tolist()[4:], [True, False, True, False])
+
+    def test_schedule_version_per_entry_date(self):
+        """Версия графика берется на дату входа."""
+        entry_exits = self.create_rows([
+            ("103", local(2024, 3, 7, 9, 10), local(2024, 3, 7, 18, 0)),
+            ("103", local(2024, 3, 12, 9, 10), local(2024, 3, 12, 18, 0)),
+        ])
+        batch = self.assert_parity(entry_exits)
+        self.assertEqual(batch["late_minutes"].tolist(), [10, 70])
+        self.assertEqual(batch["early_leave_minutes"].tolist(), [0, 120])
+
+    def test_almaty_offset_change_matches_regular_day(self):
+        """
+        2024-03-01 Алматы переходит с UTC+6 на UTC+5, смена 20:00-08:00 в
+        ночь на 1 марта длится 13 часов. Как и построчный метод, пакетный
+        считает ночной смену длиннее 12 часов по часам, поэтому выход до
+        начала смены сопоставляется так же, как в обычный день; минуты
+        раннего ухода считаются по фактическому времени (на час больше).
+        """
+        if not almaty_offset_changes():
+            self.skipTest("tzdata без перехода Asia/Almaty на UTC+5 (2024a)")
+
+        shift_start, shift_end = ScheduleMatcher.get_scheduled_time_for_date(
+            WorkSchedule.objects.get(employee=self.night_employee), date(2024, 2, 29)
+        )
+        self.assertEqual(shift_end - shift_start, timedelta(hours=12))
+        self.assertEqual(
+            shift_end.astimezone(dt_timezone.utc) - shift_start.astimezone(dt_timezone.utc), timedelta(hours=13)
+        )
+
+        offset_day = self.create_rows([
+            ("102", local(2024, 2, 29, 19, 50), local(2024, 2, 29, 19, 55)),  # выход до начала смены
+            ("102", local(2024, 2, 29, 20, 30), local(2024, 3, 1, 7, 0)),
+            ("102", local(2024, 3, 1, 20, 0), local(2024, 3, 2, 8, 0)),
+        ])
+        regular_day = self.create_rows([
+            ("102", local(2024, 3, 7, 19, 50), local(2024, 3, 7, 19, 55)),
+            ("102", local(2024, 3, 7, 20, 30), local(2024, 3, 8, 7, 0)),
+            ("102", local(2024, 3, 8, 20, 0), local(2024, 3, 9, 8, 0)),
+        ])
+        offset_batch = self.assert_parity(offset_day)
+        regular_batch = self.assert_parity(regular_day)
+        for field in BOOL_FIELDS + ("late_minutes",):
+            with self.subTest(field=field):
+                self.assertEqual(offset_batch[field].tolist(), regular_batch[field].tolist())
+        self.assertEqual(offset_batch["early_leave_minutes"].tolist(), [785, 60, 0])
+        self.assertEqual(regular_batch["early_leave_minutes"].tolist(), [725, 60, 0])
+
+    def test_match_batch_with_compiled_schedules(self):
+        """match_batch со словарем скомпилированных графиков и пустыми строками."""
+        index = ScheduleIndex.load([self.day_employee.pk])
+        rows = [
+            (self.day_employee, local(2024, 3, 12, 9, 30), local(2024, 3, 12, 18, 0)),
+            (self.day_employee.pk, None, None),
+            (None, local(2024, 3, 12, 9, 30), None),
+        ]
+        for schedules in (index, load_compiled_schedules([self.day_employee.pk])):
+            with self.subTest(schedules=type(schedules).__name__):
+                batch = ScheduleMatcher.match_batch(rows, schedules)
+                self.assertEqual(batch["late_minutes"].tolist(), [25, 0, 0])
+                self.assertEqual(batch["is_extra_shift"].tolist(), [False, True, True])
+                # 09:00 в Алматы (UTC+5) - 04:00 UTC
+                self.assertEqual(batch["scheduled_start"][0], np.datetime64("2024-03-12T04:00", "us"))
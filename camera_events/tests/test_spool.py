@@ -0,0 +1,41 @@
+"""
+fsync сегмента spool: последняя запись серии синхронизируется по истечении
+CAMERA_INGEST_SPOOL_FSYNC_INTERVAL без следующей записи.
+"""
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from camera_events import spool
+
+
+class SpoolWriterFsyncTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.writer = spool.SpoolWriter(directory.name, fsync_interval=0.1)
+        self.addCleanup(self.writer.rotate)
+
+    def test_tail_of_burst_is_synced_by_timer(self):
+        self.writer.append({"n": 0})
+        with mock.patch("camera_events.spool.os.fsync", wraps=spool.os.fsync) as fsync:
+            self.writer.append({"n": 1})
+            self.writer.append({"n": 2})
+            self.assertEqual(fsync.call_count, 0)
+            deadline = time.monotonic() + 2
+            while not fsync.called and time.monotonic() < deadline:
+                time.sleep(0.02)
+            self.assertEqual(fsync.call_count, 1)
+        self.assertFalse(self.writer._dirty)
+
+    def test_flush_syncs_pending_records(self):
+        self.writer.fsync_interval = 60
+        self.writer.append({"n": 0})
+        self.writer.append({"n": 1})
+        with mock.patch("camera_events.spool.os.fsync") as fsync:
+            self.writer.flush()
+            self.writer.flush()
+        self.assertEqual(fsync.call_count, 1)
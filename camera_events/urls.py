@@ -4,6 +4,7 @@ URL маршруты для приложения camera_events.
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CameraEventViewSet, EntryExitViewSet, DepartmentViewSet, AttendanceStatsViewSet
+from .viewsets.presence import PresenceViewSet
 from .viewsets.top_late import TopLateEmployeesViewSet
 
 router = DefaultRouter()
@@ -12,6 +13,7 @@ router.register(r"entries-exits", EntryExitViewSet, basename="entries-exits")
 router.register(r"departments", DepartmentViewSet, basename="departments")
 router.register(r"attendance-stats", AttendanceStatsViewSet, basename="attendance-stats")
 router.register(r"top-late-employees", TopLateEmployeesViewSet, basename="top-late-employees")
+router.register(r"presence", PresenceViewSet, basename="presence")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -2,8 +2,8 @@
 Утилиты для работы с событиями камер Hikvision.
 """
 from django.utils import timezone
-from django.db.models import Q
-from .models import Employee
+from django.db.models import BigIntegerField, Case, CharField, Max, Min, Q, Value, When
+from .models import Employee, normalize_hikvision_id
 
 # Попытка использовать zoneinfo (Python 3.9+), иначе используем настройки Django
 try:
@@ -48,6 +48,60 @@ def clean_id(id_str):
     return s.lstrip('0') or "0"
 
 
+def employee_id_lookup(hikvision_id):
+    """
+    Условие поиска записей CameraEvent/EntryExit одного сотрудника по
+    каноническому ID: числовые ID ищутся по numeric_id, остальные - по normalized_id.
+
+    Returns:
+        (имя поля, значение)
+    """
+    normalized, numeric = normalize_hikvision_id(hikvision_id)
+    if numeric is not None:
+        return 'numeric_id', numeric
+    return 'normalized_id', normalized
+
+
+def backfill_normalized_ids(model, batch_size=20000, using='default'):
+    """
+    Заполняет normalized_id/numeric_id у записей, где они пусты
+    (CameraEvent, EntryExit). Записи обновляются порциями по диапазону id,
+    каждая порция - один UPDATE с CASE по различным исходным ID.
+
+    Args:
+        model: Модель (CameraEvent или EntryExit)
+        batch_size: Размер диапазона id в одной порции
+        using: Псевдоним БД
+
+    Returns:
+        Количество обновленных записей.
+    """
+    queryset = model._default_manager.using(using).filter(
+        normalized_id__isnull=True, hikvision_id__isnull=False
+    ).exclude(hikvision_id='')
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        chunk = queryset.filter(id__gte=start, id__lt=start + batch_size)
+        raw_ids = set(chunk.order_by().values_list('hikvision_id', flat=True).distinct())
+        if not raw_ids:
+            continue
+        normalized_cases = []
+        numeric_cases = []
+        for raw_id in raw_ids:
+            normalized, numeric = normalize_hikvision_id(raw_id)
+            normalized_cases.append(When(hikvision_id=raw_id, then=Value(normalized)))
+            numeric_cases.append(When(hikvision_id=raw_id, then=Value(numeric)))
+        updated += chunk.update(
+            normalized_id=Case(*normalized_cases, output_field=CharField()),
+            numeric_id=Case(*numeric_cases, output_field=BigIntegerField()),
+        )
+    return updated
+
+
 def ensure_aware(dt):
     """
     Преобразует наивный datetime в timezone-aware datetime.
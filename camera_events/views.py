@@ -15,10 +15,14 @@ from .utils import (
     get_excluded_hikvision_ids,
     ensure_aware,
     clean_id,
+    employee_id_lookup,
 )
 
 # Импортируем функции обработки событий
 from .event_processor import process_single_camera_event
+from .hikvision_parser import parse_event_payload, split_access_event
+from .ingest import ingest_camera_event
+from . import export_control, metrics, presence
 
 # Импортируем ViewSet'ы
 # Пока что только DepartmentViewSet вынесен в отдельный модуль
@@ -31,8 +35,10 @@ from .viewsets.department import DepartmentViewSet
 # (они будут постепенно вынесены в отдельные модули)
 import json
 import base64
+import heapq
 import logging
 import re
+from operator import attrgetter
 from datetime import datetime, timedelta, time, date
 from django.http import HttpResponse, JsonResponse, FileResponse
 from django.utils import timezone
@@ -55,10 +61,13 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl import utils
 from io import BytesIO
 
-from .models import CameraEvent, EntryExit, Employee, Department, EmployeeAttendanceStats
+from .models import ArchivedCameraEvent, CameraEvent, EntryExit, Employee, Department, EmployeeAttendanceStats
 from .serializers import CameraEventSerializer, EntryExitSerializer, DepartmentSerializer
 from .schedule_matcher import ScheduleMatcher
-from .sql_reports import generate_round_the_clock_report_sql
+from .compiled_schedules import select_schedule_version
+from .department_tree import get_department_paths, get_descendant_ids
+from .sql_reports import generate_round_the_clock_report_sql, group_report_by_employee
+from hikvision_project.db_router import ReplicaReadMixin
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +92,7 @@ def recalculate_entries_exits(start_date=None, end_date=None):
     try:
         created_count = 0
         updated_count = 0
+        processed_events = 0
         
         # Получаем все события с hikvision_id и event_time
         try:
@@ -105,6 +115,18 @@ def recalculate_entries_exits(start_date=None, end_date=None):
                 events = events.filter(event_time__lt=end_date_with_time)
             
             events = events.order_by('event_time')
+            
+            # События архивных месяцев, загруженные командой rehydrate_camera_events
+            archived_events = ArchivedCameraEvent.objects.filter(
+                hikvision_id__isnull=False,
+                event_time__isnull=False
+            )
+            if start_date:
+                archived_events = archived_events.filter(event_time__gte=start_date)
+            if end_date:
+                archived_events = archived_events.filter(event_time__lt=end_date_with_time)
+            if archived_events.exists():
+                events = heapq.merge(events, archived_events.order_by('event_time'), key=attrgetter('event_time'))
         except Exception as e:
             logger.error(f"Ошибка при получении событий: {e}", exc_info=True)
             return {"created": 0, "updated": 0, "error": str(e)}
@@ -117,6 +139,7 @@ def recalculate_entries_exits(start_date=None, end_date=None):
         
         try:
             for event in events:
+                processed_events += 1
                 try:
                     if not event.hikvision_id or not event.event_time:
                         continue
@@ -351,22 +374,16 @@ def recalculate_entries_exits(start_date=None, end_date=None):
                         except Exception as e:
                             logger.warning(f"Ошибка при поиске соответствующего выхода для сотрудника {hikvision_id}: {e}")
                         
-                        # Проверяем, существует ли уже запись (используем очищенный ID)
+                        # Проверяем, существует ли уже запись: канонический ID находит
+                        # и записи, сохраненные с ведущими нулями
                         try:
                             clean_hikvision_id = clean_id(hikvision_id)
+                            # Точное время входа уже задает день: условие по дате не нужно,
+                            # поиск идет по индексу (normalized_id, entry_time)
                             existing = EntryExit.objects.filter(
-                                hikvision_id=clean_hikvision_id,
-                                entry_time__date=event_date,
+                                normalized_id=clean_hikvision_id,
                                 entry_time=entry_time
                             ).first()
-                            
-                            # Если не нашли по очищенному ID, пробуем найти по исходному
-                            if not existing:
-                                existing = EntryExit.objects.filter(
-                                    hikvision_id=hikvision_id,
-                                    entry_time__date=event_date,
-                                    entry_time=entry_time
-                                ).first()
                         except Exception as e:
                             logger.warning(f"Ошибка при поиске существующей записи для сотрудника {hikvision_id}: {e}")
                             existing = None
@@ -431,6 +448,8 @@ def recalculate_entries_exits(start_date=None, end_date=None):
         end_time = timezone.now()
         duration = (end_time - start_time).total_seconds()
         logger.info(f"[{end_time.strftime('%H:%M:%S')}] Данные: {duration:.1f}с, создано={created_count}, обновлено={updated_count}")
+        metrics.record_recalc(duration, processed_events, created_count, updated_count)
+        presence.presence_index.invalidate()
         
         return {"created": created_count, "updated": updated_count}
     
@@ -441,7 +460,7 @@ def recalculate_entries_exits(start_date=None, end_date=None):
         return {"created": 0, "updated": 0, "error": str(e)}
 
 
-class CameraEventViewSet(viewsets.ModelViewSet):
+class CameraEventViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для приема событий от камер Hikvision.
     
@@ -450,6 +469,8 @@ class CameraEventViewSet(viewsets.ModelViewSet):
     queryset = CameraEvent.objects.all()
     permission_classes = [AllowAny]  # Камеры не используют аутентификацию
     serializer_class = CameraEventSerializer
+    # Списки и выгрузки читают с реплики (db_router.py), прием событий - основная БД
+    replica_actions = ("list", "retrieve", "export_excel")
     
     def create(self, request, *args, **kwargs):
         """
@@ -551,400 +572,39 @@ class CameraEventViewSet(viewsets.ModelViewSet):
                     logger.warning("⚠️  Still no event data found, returning OK to camera")
                 return HttpResponse("OK", status=200)
             
-            # Извлекаем данные из AccessControllerEvent если есть
-            if isinstance(event_data, dict) and "AccessControllerEvent" in event_data:
-                # Получаем внешний объект AccessControllerEvent
-                outer_event = event_data["AccessControllerEvent"]
-                
-                # Получаем вложенный объект AccessControllerEvent
-                if isinstance(outer_event, dict):
-                    # Если AccessControllerEvent - это словарь, проверяем, есть ли внутри еще один AccessControllerEvent
-                    if "AccessControllerEvent" in outer_event:
-                        access_event = outer_event["AccessControllerEvent"]
-                    else:
-                        access_event = outer_event
-                else:
-                    access_event = outer_event
-                
-                # Извлекаем дату события (но не фильтруем по дате)
-                # Все события будут сохранены с их реальной датой, события до 1 ноября будут первыми в базе
-                event_date = None
-                if isinstance(outer_event, dict):
-                    date_time_str = outer_event.get("dateTime")
-                    if date_time_str:
-                        try:
-                            # Парсим дату в формате ISO (например, "2025-11-24T16:54:25+05:00")
-                            if 'T' in date_time_str:
-                                date_part = date_time_str.split('T')[0]  # Берем только дату (YYYY-MM-DD)
-                            else:
-                                date_part = date_time_str.split()[0]  # Если формат другой
-                            
-                            event_date = datetime.strptime(date_part, "%Y-%m-%d").date()
-                        except Exception as e:
-                            logger.warning(f"⚠️  Could not parse date '{date_time_str}': {e}")
-                
-                # Проверяем тип события внутри AccessControllerEvent
-                # Сохраняем только события с данными о сотрудниках, пропускаем служебные (heartBeat и т.д.)
-                is_valid_event = False
-                if isinstance(access_event, dict):
-                    sub_event_type = access_event.get("subEventType")
-                    major_event_type = access_event.get("majorEventType")
-                    event_type = access_event.get("eventType")
-                    event_description = access_event.get("eventDescription")
-                    
-                    # Пропускаем служебные события типа heartBeat
-                    if event_type and isinstance(event_type, str):
-                        event_type_lower = event_type.lower()
-                        if "heartbeat" in event_type_lower or "heart" in event_type_lower:
-                            return HttpResponse("OK", status=200)
-                    
-                    if event_description and isinstance(event_description, str):
-                        event_desc_lower = event_description.lower()
-                        if "heartbeat" in event_desc_lower or "heart" in event_desc_lower:
-                            return HttpResponse("OK", status=200)
-                    
-                    # Проверяем наличие данных о сотруднике (ID или имя)
-                    has_employee_data = (
-                        access_event.get("employeeId") or
-                        access_event.get("employeeID") or
-                        access_event.get("employeeNo") or
-                        access_event.get("employeeNoString") or
-                        access_event.get("name") or
-                        access_event.get("employeeName") or
-                        access_event.get("employeeNameString")
-                    )
-                    
-                    # События аутентификации по лицу (subEventType = 75)
-                    if sub_event_type == 75:
-                        is_valid_event = True
-                        # Определяем тип события (Вход/Выход) по IP адресу
-                        event_type_text = ""
-                        camera_ip = None
-                        if isinstance(outer_event, dict):
-                            camera_ip = (
-                                outer_event.get("ipAddress") or
-                                outer_event.get("remoteHostAddr") or
-                                outer_event.get("ip") or
-                                None
-                            )
-                        if not camera_ip and isinstance(access_event, dict):
-                            camera_ip = (
-                                access_event.get("ipAddress") or
-                                access_event.get("remoteHostAddr") or
-                                access_event.get("ip") or
-                                None
-                            )
-                        if camera_ip:
-                            if "192.168.1.143" in str(camera_ip):
-                                event_type_text = "Выход"
-                            elif "192.168.1.124" in str(camera_ip):
-                                event_type_text = "Вход"
-                        
-                        # Если IP не определен, проверяем device_name из access_event
-                        if not event_type_text and isinstance(access_event, dict):
-                            device_name_check = access_event.get("deviceName") or access_event.get("door") or access_event.get("doorName") or ""
-                            device_name_lower = str(device_name_check).lower()
-                            if any(word in device_name_lower for word in ['выход', 'exit', 'выходная', 'выход 1', 'выход1', '143']):
-                                event_type_text = "Выход"
-                            elif any(word in device_name_lower for word in ['вход', 'entry', 'входная', 'вход 1', 'вход1', '124']):
-                                event_type_text = "Вход"
-                        
-                        # Если тип не определен, используем значение по умолчанию
-                        if not event_type_text:
-                            event_type_text = "Событие"
-                        
-                        # Получаем время события для логирования
-                        event_time_for_log = None
-                        if isinstance(outer_event, dict):
-                            event_time_for_log = outer_event.get("dateTime") or access_event.get("dateTime") if isinstance(access_event, dict) else None
-                        event_time_display = f" [{event_time_for_log}]" if event_time_for_log else ""
-                        logger.info(f"✅ {event_type_text}{event_time_display}")
-                    # События контроля доступа (majorEventType = 5) с данными о сотруднике
-                    elif major_event_type == 5 and has_employee_data:
-                        is_valid_event = True
-                    # Любое событие с данными о сотруднике
-                    elif has_employee_data:
-                        is_valid_event = True
-                    
-                    # Если событие не содержит данных о сотруднике, пропускаем
-                    if not is_valid_event:
-                        return HttpResponse("OK", status=200)
-                else:
-                    # Если access_event не словарь, пропускаем
-                    return HttpResponse("OK", status=200)
-                
-                # Извлекаем ID от Hikvision (пробуем разные варианты названий полей)
-                hikvision_id = None
-                if isinstance(access_event, dict):
-                    hikvision_id = (
-                        access_event.get("employeeId") or
-                        access_event.get("employeeID") or
-                        access_event.get("employeeNo") or 
-                        access_event.get("employeeNoString") or
-                        access_event.get("employee_id") or
-                        access_event.get("Employee ID") or
-                        access_event.get("cardNo") or
-                        access_event.get("cardNumber") or
-                        access_event.get("cardReaderNo") or
-                        access_event.get("doorNo") or
-                        access_event.get("door") or
-                        (str(access_event.get("id")) if access_event.get("id") is not None else None)
-                    )
-                
-                # Извлекаем имя сотрудника
-                employee_name = None
-                if isinstance(access_event, dict):
-                    employee_name = (
-                        access_event.get("employeeName") or
-                        access_event.get("name") or
-                        access_event.get("employeeNameString") or
-                        access_event.get("employee_name") or
-                        access_event.get("Name") or
-                        None
-                    )
-                
-                # Извлекаем номер карты
-                card_no = None
-                if isinstance(access_event, dict):
-                    card_no = (
-                        access_event.get("cardNo") or
-                        access_event.get("cardNumber") or
-                        access_event.get("card") or
-                        access_event.get("Card No.") or
-                        access_event.get("card_no") or
-                        None
-                    )
-                
-                # Извлекаем дверь/устройство
-                device_name = None
-                if isinstance(access_event, dict):
-                    device_name = (
-                        access_event.get("deviceName") or
-                        access_event.get("door") or
-                        access_event.get("doorName") or
-                        access_event.get("doorNo") or
-                        access_event.get("Door") or
-                        access_event.get("device_name") or
-                        None
-                    )
-                
-                # Извлекаем время события
-                # Время может быть во внешнем объекте (outer_event) или во внутреннем (access_event)
-                event_time_str = None
-                if isinstance(outer_event, dict):
-                    event_time_str = (
-                        outer_event.get("dateTime") or
-                        outer_event.get("time") or
-                        outer_event.get("eventTime") or
-                        None
-                    )
-                
-                # Если не нашли во внешнем, проверяем внутренний
-                if not event_time_str and isinstance(access_event, dict):
-                    event_time_str = (
-                        access_event.get("time") or
-                        access_event.get("dateTime") or
-                        access_event.get("eventTime") or
-                        access_event.get("Time") or
-                        access_event.get("event_time") or
-                        None
-                    )
-                
-                # Если все еще не нашли, проверяем event_data
-                if not event_time_str:
-                    event_time_str = (
-                        event_data.get("dateTime") or
-                        event_data.get("time") or
-                        None
-                    )
-                
-                # Проверка имени сотрудника (обязательно для сохранения)
-                # Событие уже прошло проверку по subEventType, теперь проверяем наличие имени
-                if not employee_name or employee_name.strip() == "":
-                    return HttpResponse("OK", status=200)
-                else:
-                    # Используем уже извлеченное время для логирования
-                    event_time_display = f" [{event_time_str}]" if event_time_str else ""
-                    logger.info(f"✅ Employee name found: '{employee_name}' - will save{event_time_display}")
-                
-                # Парсим event_time в datetime объект перед сохранением
-                event_time_parsed = None
-                if event_time_str:
-                    if isinstance(event_time_str, str):
-                        try:
-                            # Пробуем разные форматы даты
-                            for fmt in ['%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S.%f']:
-                                try:
-                                    event_time_parsed = datetime.strptime(event_time_str, fmt)
-                                    if timezone.is_naive(event_time_parsed):
-                                        event_time_parsed = timezone.make_aware(event_time_parsed)
-                                    break
-                                except ValueError:
-                                    continue
-                            if event_time_parsed is None:
-                                # Если не удалось распарсить, используем текущее время
-                                logger.warning(f"Could not parse event_time '{event_time_str}', using current time")
-                                event_time_parsed = timezone.now()
-                        except Exception as e:
-                            logger.warning(f"Error parsing event_time '{event_time_str}': {e}, using current time")
-                            event_time_parsed = timezone.now()
-                    elif isinstance(event_time_str, datetime):
-                        event_time_parsed = event_time_str
-                        if timezone.is_naive(event_time_parsed):
-                            event_time_parsed = timezone.make_aware(event_time_parsed)
-                    else:
-                        event_time_parsed = timezone.now()
-                else:
-                    event_time_parsed = timezone.now()
-                
-                # Если ничего не нашли, логируем все ключи
-                if not hikvision_id and isinstance(access_event, dict):
-                    logger.warning(f"⚠️  Could not find employee ID. Available keys: {list(access_event.keys())}")
-                    logger.warning(f"⚠️  Full access_event: {json.dumps(access_event, indent=2, ensure_ascii=False)}")
-            else:
-                # Если нет AccessControllerEvent, проверяем event_data напрямую
-                # Но для событий без AccessControllerEvent тоже нужно проверить тип
-                employee_name = None  # Инициализируем переменную
-                
-                event_type_direct = (
-                    event_data.get("eventType") or
-                    event_data.get("eventTypes") or
-                    event_data.get("eventDescription") or
-                    event_data.get("event") or
-                    None
-                )
-                
-                # Извлекаем имя сотрудника из event_data
-                employee_name_direct = (
-                    event_data.get("employeeName") or
-                    event_data.get("name") or
-                    event_data.get("employeeNameString") or
-                    event_data.get("employee_name") or
-                    event_data.get("Name") or
-                    None
-                )
-                
-                # Проверяем тип события для событий без AccessControllerEvent
-                should_save_direct = False
-                if event_type_direct:
-                    event_type_lower = str(event_type_direct).lower()
-                    # Пропускаем служебные события
-                    if "heartbeat" in event_type_lower or "heart" in event_type_lower:
-                        return HttpResponse("OK", status=200)
-                    # Проверяем наличие данных о сотруднике
-                    if employee_name_direct and employee_name_direct.strip():
-                        should_save_direct = True
-                    else:
-                        return HttpResponse("OK", status=200)
-                else:
-                    # Если тип не определен, проверяем наличие данных о сотруднике
-                    if employee_name_direct and employee_name_direct.strip():
-                        should_save_direct = True
-                    else:
-                        # Проверяем, не является ли это служебным событием
-                        if isinstance(event_data, dict):
-                            for key, value in event_data.items():
-                                if isinstance(value, str):
-                                    value_lower = value.lower()
-                                    if "heartbeat" in value_lower or "heart" in value_lower:
-                                        return HttpResponse("OK", status=200)
-                        return HttpResponse("OK", status=200)
-                
-                # Сохраняем имя сотрудника
-                if should_save_direct and employee_name_direct and employee_name_direct.strip():
-                    employee_name = employee_name_direct
-                
-                # Пробуем извлечь ID из разных возможных полей
-                hikvision_id = (
-                    event_data.get("cardNo") or 
-                    event_data.get("employeeNo") or 
-                    event_data.get("employeeNoString") or
-                    event_data.get("cardReaderNo") or
-                    event_data.get("doorNo") or
-                    str(event_data.get("id", ""))
-                )
-                device_name = event_data.get("deviceName")
-                event_time_str = event_data.get("dateTime")
+            # Разбираем событие (heartbeat и события без имени сотрудника не сохраняются)
+            parsed = parse_event_payload(event_data)
+            if parsed.discard_reason:
+                metrics.record_discard(parsed.discard_reason)
+                return HttpResponse("OK", status=200)
             
-            # Парсим event_time в datetime объект перед сохранением
-            event_time_parsed = None
-            if event_time_str:
-                if isinstance(event_time_str, str):
-                    try:
-                        # Пробуем разные форматы даты
-                        for fmt in ['%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S.%f']:
-                            try:
-                                event_time_parsed = datetime.strptime(event_time_str, fmt)
-                                if timezone.is_naive(event_time_parsed):
-                                    event_time_parsed = timezone.make_aware(event_time_parsed)
-                                break
-                            except ValueError:
-                                continue
-                        if event_time_parsed is None:
-                            # Если не удалось распарсить, используем текущее время
-                            logger.warning(f"Could not parse event_time '{event_time_str}', using current time")
-                            event_time_parsed = timezone.now()
-                    except Exception as e:
-                        logger.warning(f"Error parsing event_time '{event_time_str}': {e}, using current time")
-                        event_time_parsed = timezone.now()
-                elif isinstance(event_time_str, datetime):
-                    event_time_parsed = event_time_str
-                    if timezone.is_naive(event_time_parsed):
-                        event_time_parsed = timezone.make_aware(event_time_parsed)
-                else:
-                    event_time_parsed = timezone.now()
-            else:
-                event_time_parsed = timezone.now()
+            event_time_display = f" [{parsed.event_time_raw}]" if parsed.event_time_raw else ""
+            if parsed.sub_event_type == 75:
+                # События аутентификации по лицу: тип (Вход/Выход) по IP камеры или устройству
+                logger.info(f"✅ {parsed.direction}{event_time_display}")
+            logger.info(f"✅ Employee name found: '{parsed.employee_name}' - will save{event_time_display}")
             
-            # Создаем запись события
+            if not parsed.hikvision_id and parsed.has_access_event:
+                _, access_event = split_access_event(event_data)
+                logger.warning(f"⚠️  Could not find employee ID. Available keys: {list(access_event.keys())}")
+                logger.warning(f"⚠️  Full access_event: {json.dumps(access_event, indent=2, ensure_ascii=False)}")
+            
+            # Создаем запись события (повторная отправка того же события не создает дубликат)
             try:
-                camera_event = CameraEvent.objects.create(
-                    hikvision_id=hikvision_id,
-                    device_name=device_name,
-                    event_time=event_time_parsed,  # Сохраняем как datetime объект
-                    picture_data=picture_data,
-                    raw_data=event_data,  # Все данные сохраняются здесь для доступа к employeeName, cardNo, eventType и т.д.
-                )
-                
-                # Определяем тип события для логирования
-                event_type_str = "N/A"
-                try:
-                    # Пробуем получить тип события из access_event, если он доступен
-                    if 'access_event' in locals() and isinstance(access_event, dict):
-                        sub_event_type = access_event.get("subEventType")
-                        major_event_type = access_event.get("majorEventType")
-                        if sub_event_type == 75:
-                            event_type_str = "Authenticated via Face (subEventType=75)"
-                        elif sub_event_type:
-                            event_type_str = f"subEventType={sub_event_type}, majorEventType={major_event_type}"
-                except:
-                    pass
-                
+                ingest_camera_event(parsed, event_data, picture_data)
             except Exception as e:
+                metrics.record_ingest("error")
                 logger.error(f"Error creating CameraEvent: {e}", exc_info=True)
-                logger.error(f"Event data: hikvision_id={hikvision_id}, device_name={device_name}, event_time={event_time_parsed}")
+                logger.error(
+                    f"Event data: hikvision_id={parsed.hikvision_id}, device_name={parsed.device_name}, "
+                    f"event_time={parsed.event_time}"
+                )
                 return HttpResponse("OK", status=200)
             
-            # Если данные не извлечены, логируем для анализа
-            if (not hikvision_id or hikvision_id == "") and (not employee_name or employee_name == ""):
-                logger.warning(f"⚠️  No data extracted from event ID={camera_event.id}!")
-                logger.warning(f"⚠️  event_data type: {type(event_data)}")
-                if isinstance(event_data, dict):
-                    logger.warning(f"⚠️  event_data keys: {list(event_data.keys())}")
-                    if "AccessControllerEvent" in event_data:
-                        access_event = event_data["AccessControllerEvent"]
-                        logger.warning(f"⚠️  AccessControllerEvent type: {type(access_event)}")
-                        if isinstance(access_event, dict):
-                            logger.warning(f"⚠️  AccessControllerEvent keys: {list(access_event.keys())}")
-                            logger.warning(f"⚠️  AccessControllerEvent content: {json.dumps(access_event, indent=2, ensure_ascii=False)}")
-                        elif isinstance(access_event, str):
-                            logger.warning(f"⚠️  AccessControllerEvent is string: {access_event}")
-                        else:
-                            logger.warning(f"⚠️  AccessControllerEvent value: {access_event}")
-            
             return HttpResponse("OK", status=200)
             
         except Exception as e:
+            metrics.record_ingest("error")
             logger.exception(f"Error processing camera event: {e}")
             # Всегда возвращаем OK камере, чтобы она не повторяла запрос
             return HttpResponse("OK", status=200)
@@ -972,6 +632,8 @@ class CameraEventViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=["get"], url_path="export-excel")
+    @export_control.heavy_export("camera_events")
+    @metrics.track_export("camera_events")
     def export_excel(self, request):
         """
         Экспорт событий в Excel формат.
@@ -1081,17 +743,20 @@ class CameraEventViewSet(viewsets.ModelViewSet):
                 'id', 'hikvision_id', 'name', 'department_id', 'department_old'
             ).filter(
                 hikvision_id__in=unique_employee_ids
-            ).select_related('department').prefetch_related('work_schedules')
+            ).prefetch_related('work_schedules')
+            department_paths = get_department_paths()
             
             for employee in employees:
                 clean_emp_id = clean_id(employee.hikvision_id)
+                department_path = department_paths.get(employee.department_id)
                 employee_info_cache[clean_emp_id] = {
                     'name': employee.name.replace('\n', ' ').replace('\r', ' ').strip() if employee.name else '',
-                    'department': employee.department.get_full_path() if employee.department else (employee.department_old or '')
+                    'department': department_path if department_path is not None else (employee.department_old or '')
                 }
-                schedule = employee.work_schedules.first()
-                if schedule:
-                    schedule_cache[clean_emp_id] = schedule
+                # Все версии графика: на каждую дату берется действующая версия
+                schedules = list(employee.work_schedules.all())
+                if schedules:
+                    schedule_cache[clean_emp_id] = schedules
         
         # Определяем основной employee_id для пустых строк
         main_employee_id = None
@@ -1103,6 +768,10 @@ class CameraEventViewSet(viewsets.ModelViewSet):
         main_employee_info = employee_info_cache.get(main_employee_id, {})
         main_schedule = schedule_cache.get(main_employee_id)
         
+        # Записи EntryExit основного сотрудника за весь период загружаются один раз
+        # (с запасом на ночные смены), окно каждого дня выбирается в памяти
+        main_entry_exits = None
+        
         # Генерируем все даты в диапазоне
         current_date = start_date_obj
         row_num = 2
@@ -1173,7 +842,9 @@ class CameraEventViewSet(viewsets.ModelViewSet):
             
             # КОРРЕКТИРУЕМ вход и выход согласно графику работы
             # Получаем график для сотрудника
-            emp_schedule = schedule_cache.get(main_employee_id) if main_employee_id else None
+            emp_schedule = None
+            if main_employee_id and current_date:
+                emp_schedule = select_schedule_version(schedule_cache.get(main_employee_id, []), current_date)
             
             entry_time = None
             exit_time = None
@@ -1200,14 +871,26 @@ class CameraEventViewSet(viewsets.ModelViewSet):
                         search_start = scheduled_start - timedelta(hours=6)
                         search_end = scheduled_end + timedelta(hours=6)
                         
-                        entry_exits_for_day = EntryExit.objects.filter(
-                            hikvision_id=clean_emp_id,
-                            entry_time__isnull=False,
-                            exit_time__isnull=False
-                        ).filter(
-                            entry_time__gte=search_start,
-                            entry_time__lte=search_end
-                        ).order_by('entry_time')
+                        if main_entry_exits is None:
+                            period_start = timezone.make_aware(
+                                datetime.combine(start_date_obj - timedelta(days=1), time(0, 0))
+                            )
+                            period_end = timezone.make_aware(
+                                datetime.combine(end_date_obj + timedelta(days=3), time(0, 0))
+                            )
+                            main_entry_exits = list(EntryExit.objects.filter(
+                                normalized_id=clean_emp_id,
+                                entry_time__isnull=False,
+                                exit_time__isnull=False
+                            ).filter(
+                                entry_time__gte=period_start,
+                                entry_time__lte=period_end
+                            ).order_by('entry_time'))
+                        
+                        entry_exits_for_day = [
+                            ee for ee in main_entry_exits
+                            if search_start <= ee.entry_time <= search_end
+                        ]
                         
                         # Находим записи, которые попадают в период графика
                         valid_entries = []
@@ -1647,7 +1330,7 @@ class CameraEventViewSet(viewsets.ModelViewSet):
             }, status=500)
 
 
-class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
+class EntryExitViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра записей входов и выходов.
     Поддерживает фильтрацию по датам и экспорт в Excel.
@@ -1655,6 +1338,7 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = EntryExit.objects.all()
     permission_classes = [AllowAny]
     serializer_class = EntryExitSerializer
+    replica_actions = ("list", "retrieve", "employees_list", "check_date", "departments_list", "export_excel")
     
     def get_queryset(self):
         """Фильтрация по параметрам запроса."""
@@ -1726,13 +1410,14 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
             hikvision_id__isnull=False
         ).exclude(
             hikvision_id__in=get_excluded_hikvision_ids()
-        ).select_related('department').order_by('name')
+        ).order_by('name')
+        department_paths = get_department_paths()
         
         employees_data = []
         for emp in employees:
             department_name = ""
-            if emp.department:
-                full_path = emp.department.get_full_path()
+            if emp.department_id in department_paths:
+                full_path = department_paths[emp.department_id]
                 # Убираем "АУП" или "АУП > " из начала пути
                 if full_path.startswith("АУП > "):
                     department_name = full_path[6:]
@@ -1807,15 +1492,6 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                 "raw_data": event.raw_data
             })
         
-        for hikvision_id, events in events_by_employee.items():
-            employee = Employee.objects.filter(hikvision_id=hikvision_id).first()
-            employee_name = employee.name if employee else f"ID_{hikvision_id}"
-            result["camera_events"][hikvision_id] = {
-                "employee_name": employee_name,
-                "events_count": len(events),
-                "events": events
-            }
-        
         # 2. Получаем все EntryExit
         entry_exits = EntryExit.objects.filter(
             Q(entry_time__gte=start_datetime, entry_time__lt=end_datetime) |
@@ -1832,9 +1508,21 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                 "is_complete": bool(entry_exit.entry_time and entry_exit.exit_time)
             })
         
+        # Имена сотрудников одним запросом для всех ID за дату
+        employee_names = dict(Employee.objects.filter(
+            hikvision_id__in=set(events_by_employee) | set(entry_exits_by_employee)
+        ).values_list('hikvision_id', 'name'))
+        
+        for hikvision_id, events in events_by_employee.items():
+            employee_name = employee_names.get(hikvision_id, f"ID_{hikvision_id}")
+            result["camera_events"][hikvision_id] = {
+                "employee_name": employee_name,
+                "events_count": len(events),
+                "events": events
+            }
+        
         for hikvision_id, entries in entry_exits_by_employee.items():
-            employee = Employee.objects.filter(hikvision_id=hikvision_id).first()
-            employee_name = employee.name if employee else f"ID_{hikvision_id}"
+            employee_name = employee_names.get(hikvision_id, f"ID_{hikvision_id}")
             result["entry_exits"][hikvision_id] = {
                 "employee_name": employee_name,
                 "entries_count": len(entries),
@@ -1842,17 +1530,19 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
             }
         
         # 3. Находим проблемы
+        # ID с полной записью EntryExit (вход за дату и есть выход) - одним запросом
+        complete_ids = set(EntryExit.objects.filter(
+            hikvision_id__in=list(events_by_employee),
+            entry_time__gte=start_datetime,
+            entry_time__lt=end_datetime,
+            exit_time__isnull=False
+        ).values_list('hikvision_id', flat=True).distinct())
+        
         for hikvision_id in events_by_employee.keys():
-            employee = Employee.objects.filter(hikvision_id=hikvision_id).first()
-            employee_name = employee.name if employee else f"ID_{hikvision_id}"
+            employee_name = employee_names.get(hikvision_id, f"ID_{hikvision_id}")
             
             # Проверяем, есть ли полная запись EntryExit
-            full_entry_exit = EntryExit.objects.filter(
-                hikvision_id=hikvision_id,
-                entry_time__gte=start_datetime,
-                entry_time__lt=end_datetime,
-                exit_time__isnull=False
-            ).exists()
+            full_entry_exit = hikvision_id in complete_ids
             
             if not full_entry_exit:
                 events = events_by_employee[hikvision_id]
@@ -1860,12 +1550,8 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                     "hikvision_id": hikvision_id,
                     "employee_name": employee_name,
                     "events_count": len(events),
-                    "has_partial_entry_exit": EntryExit.objects.filter(
-                        hikvision_id=hikvision_id
-                    ).filter(
-                        Q(entry_time__gte=start_datetime, entry_time__lt=end_datetime) |
-                        Q(exit_time__gte=start_datetime, exit_time__lt=end_datetime)
-                    ).exists(),
+                    # Записи за дату уже загружены в пункте 2
+                    "has_partial_entry_exit": hikvision_id in entry_exits_by_employee,
                     "message": "Есть события CameraEvent, но нет полной записи EntryExit (нет выхода)"
                 })
         
@@ -1885,10 +1571,11 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         Возвращает список всех подразделений для выпадающего списка.
         """
         departments = Department.objects.all().order_by('name')
+        department_paths = get_department_paths()
         
         departments_data = []
         for dept in departments:
-            full_path = dept.get_full_path()
+            full_path = department_paths[dept.id]
             # Убираем "АУП" или "АУП > " из начала пути
             if full_path.startswith("АУП > "):
                 display_name = full_path[6:]
@@ -1907,6 +1594,8 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(departments_data)
     
     @action(detail=False, methods=["get"], url_path="export-excel")
+    @export_control.heavy_export("entries_exits")
+    @metrics.track_export("entries_exits")
     def export_excel(self, request):
         """
         Экспорт записей входов/выходов в Excel с фильтрацией по датам.
@@ -1969,15 +1658,10 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                     Q(department_old__icontains=department_name)
                 )
                 # Также проверяем полный путь подразделения через связанные отделы
-                department_ids = []
-                for dept in Department.objects.filter(name__icontains=department_name):
-                    # Получаем все дочерние подразделения
-                    def get_all_children(dept_obj):
-                        children = [dept_obj.id]
-                        for child in dept_obj.children.all():
-                            children.extend(get_all_children(child))
-                        return children
-                    department_ids.extend(get_all_children(dept))
+                # (подразделения с подходящим названием вместе со всеми дочерними)
+                department_ids = get_descendant_ids(
+                    Department.objects.filter(name__icontains=department_name).values_list('id', flat=True)
+                )
                 
                 if department_ids:
                     employees_query = employees_query.filter(
@@ -2010,18 +1694,23 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         if wb.worksheets:
             wb.remove(wb.worksheets[0])
         
+        # Данные всех сотрудников одним запросом, затем раскладываем по сотрудникам
+        all_results, start_date_obj, end_date_obj = generate_comprehensive_attendance_report_sql(
+            start_date=start_date_str,
+            end_date=end_date_str,
+            device_name=None,
+            excluded_hikvision_ids=excluded_hikvision_ids,
+            hikvision_ids=[employee.hikvision_id for employee in employees_to_export]
+        )
+        results_by_employee = group_report_by_employee(all_results)
+        department_paths = get_department_paths()
+        
         # Для каждого сотрудника создаем отдельный лист
         for employee in employees_to_export:
             emp_hikvision_id = employee.hikvision_id
             
             # Получаем данные для этого сотрудника
-            results, start_date_obj, end_date_obj = generate_comprehensive_attendance_report_sql(
-                hikvision_id=emp_hikvision_id,
-                start_date=start_date_str,
-                end_date=end_date_str,
-                device_name=None,
-                excluded_hikvision_ids=excluded_hikvision_ids
-            )
+            results = results_by_employee.get(employee_id_lookup(emp_hikvision_id), [])
             
             # Создаем лист для сотрудника
             # Ограничиваем длину имени листа (Excel ограничение - 31 символ)
@@ -2029,7 +1718,7 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
             ws = wb.create_sheet(title=sheet_name)
             
             # Вызываем вспомогательную функцию для заполнения листа
-            self._fill_employee_sheet(ws, employee, results, start_date_obj, end_date_obj)
+            self._fill_employee_sheet(ws, employee, results, start_date_obj, end_date_obj, department_paths)
         
         # Если нет ни одного листа, создаем пустой
         if len(wb.worksheets) == 0:
@@ -2066,9 +1755,11 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         response['Content-Disposition'] = f'attachment; filename*=UTF-8\'\'{quote(filename)}'
         return response
     
-    def _fill_employee_sheet(self, ws, employee, results, start_date_obj, end_date_obj):
+    def _fill_employee_sheet(self, ws, employee, results, start_date_obj, end_date_obj, department_paths=None):
         """
         Заполняет лист Excel данными для одного сотрудника.
+        department_paths - пути подразделений (get_department_paths), чтобы
+        не запрашивать родителей подразделения на каждом листе.
         """
         from datetime import date
         
@@ -2117,11 +1808,14 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         employee_name = employee.name if employee.name else ""
         department_name = ""
         position = employee.position if employee.position else ""
-        schedule = employee.work_schedules.first()
+        schedules = list(employee.work_schedules.all())
+        schedule = schedules[0] if schedules else None
         
         # Получаем название подразделения
-        if employee.department:
-            full_path = employee.department.get_full_path()
+        if department_paths is None:
+            department_paths = get_department_paths()
+        if employee.department_id in department_paths:
+            full_path = department_paths[employee.department_id]
             if full_path.startswith("АУП > "):
                 department_name = full_path[6:]
             elif full_path.startswith("АУП"):
@@ -2240,18 +1934,21 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         logger.debug(f"Уникальные даты в данных: {sorted(data_by_date.keys())}")
         
         while current_date <= end_date_obj:
+            # Версия графика, действующая на эту дату
+            day_schedule = select_schedule_version(schedules, current_date)
+            
             date_str = current_date.strftime("%d-%m-%Y")
             weekday_name = WEEKDAYS_RU[current_date.weekday()]
             
             # Получаем информацию о графике для этой даты
             schedule_type_str = ""
             schedule_time_str = ""
-            if schedule:
-                schedule_type_str = SCHEDULE_TYPE_MAP.get(schedule.schedule_type, "")
-                scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, current_date)
+            if day_schedule:
+                schedule_type_str = SCHEDULE_TYPE_MAP.get(day_schedule.schedule_type, "")
+                scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(day_schedule, current_date)
                 if scheduled_times:
                     scheduled_start, scheduled_end = scheduled_times
-                    if schedule.schedule_type == 'round_the_clock':
+                    if day_schedule.schedule_type == 'round_the_clock':
                         schedule_time_str = "Круглосуточно"
                     else:
                         scheduled_start_local = timezone.localtime(scheduled_start)
@@ -2288,7 +1985,7 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                         else:
                             entry_time_local = timezone.localtime(first_entry)
                         # Для круглосуточных графиков: вход всегда только время
-                        if schedule and schedule.schedule_type == 'round_the_clock':
+                        if day_schedule and day_schedule.schedule_type == 'round_the_clock':
                             entry_time_str = entry_time_local.strftime("%H:%M:%S")
                         else:
                             entry_time_str = entry_time_local.strftime("%H:%M:%S")
@@ -2306,7 +2003,7 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                         else:
                             exit_time_local = timezone.localtime(last_exit)
                         # Для круглосуточных графиков: если выход на следующий день, показываем с датой
-                        if schedule and schedule.schedule_type == 'round_the_clock':
+                        if day_schedule and day_schedule.schedule_type == 'round_the_clock':
                             exit_date = exit_time_local.date()
                             if exit_date > current_date:
                                 # Выход на следующий день - показываем с полной датой
@@ -2365,8 +2062,8 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                         late_departure_str = f"{late_dep_mins}м"
                 
                 # Суммируем время по графику для этого дня
-                if schedule:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, current_date)
+                if day_schedule:
+                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(day_schedule, current_date)
                     if scheduled_times:
                         scheduled_start, scheduled_end = scheduled_times
                         scheduled_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
@@ -2455,8 +2152,8 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
                         cell.fill = red_fill
                 
                 # Для пустых дней также проверяем график
-                if schedule:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, current_date)
+                if day_schedule:
+                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(day_schedule, current_date)
                     if scheduled_times:
                         scheduled_start, scheduled_end = scheduled_times
                         scheduled_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
@@ -2475,68 +2172,20 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
         schedule_time_display = ""
         
         if schedule:
+            # Часы по графику считаются по версии, действующей в каждый день периода
+            recalculated_scheduled_hours, first_floating_shift = ScheduleMatcher.get_scheduled_hours_for_period(
+                schedules, start_date_obj, end_date_obj
+            )
             if schedule.schedule_type == 'regular' and schedule.start_time and schedule.end_time:
                 start_str = schedule.start_time.strftime('%H:%M')
                 end_str = schedule.end_time.strftime('%H:%M')
                 schedule_time_display = f"{start_str}-{end_str}"
-                
-                start_datetime = datetime.combine(start_date_obj, schedule.start_time)
-                end_datetime = datetime.combine(start_date_obj, schedule.end_time)
-                if schedule.end_time < schedule.start_time:
-                    end_datetime += timedelta(days=1)
-                shift_duration_hours = (end_datetime - start_datetime).total_seconds() / 3600.0
-                
-                working_days_count = 0
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        working_days_count += 1
-                    check_date += timedelta(days=1)
-                
-                recalculated_scheduled_hours = shift_duration_hours * working_days_count
-            elif schedule.schedule_type == 'floating':
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        scheduled_start, scheduled_end = scheduled_times
-                        shift_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
-                        recalculated_scheduled_hours += shift_duration
-                        
-                        if not schedule_time_display:
-                            scheduled_start_local = timezone.localtime(scheduled_start)
-                            scheduled_end_local = timezone.localtime(scheduled_end)
-                            start_str = scheduled_start_local.strftime('%H:%M')
-                            end_str = scheduled_end_local.strftime('%H:%M')
-                            schedule_time_display = f"{start_str}-{end_str}"
-                    check_date += timedelta(days=1)
+            elif schedule.schedule_type == 'floating' and first_floating_shift:
+                # Время графика из первой найденной смены
+                scheduled_start_local = timezone.localtime(first_floating_shift[0])
+                scheduled_end_local = timezone.localtime(first_floating_shift[1])
+                schedule_time_display = f"{scheduled_start_local.strftime('%H:%M')}-{scheduled_end_local.strftime('%H:%M')}"
             elif schedule.schedule_type == 'round_the_clock':
-                # Для круглосуточных графиков используем правильную формулу расчета:
-                # Каждая рабочая смена = 24 часа (сутки)
-                # Считаем количество дней с запланированными сменами
-                
-                # Определяем время начала смены (по умолчанию 09:00, но может быть другое)
-                shift_start_time = schedule.start_time if schedule.start_time else time(9, 0)
-                
-                # Для круглосуточных графиков считаем уникальные смены
-                # Смена определяется по дате начала (дню, когда она начинается)
-                shifts_dates = set()  # Множество для хранения дат начала смен
-                
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        scheduled_start, scheduled_end = scheduled_times
-                        # Дата начала смены определяет уникальную смену
-                        shift_start_date = scheduled_start.date()
-                        shifts_dates.add(shift_start_date)
-                    check_date += timedelta(days=1)
-                
-                # Количество уникальных смен (каждая смена = 24 часа)
-                # Формула: количество смен × 24 часа
-                number_of_shifts = len(shifts_dates)
-                recalculated_scheduled_hours = 24.0 * number_of_shifts
                 schedule_time_display = "Круглосуточно"
         
         final_scheduled_hours = recalculated_scheduled_hours if recalculated_scheduled_hours > 0 else total_scheduled_hours
@@ -2726,12 +2375,13 @@ class EntryExitViewSet(viewsets.ReadOnlyModelViewSet):
 # DepartmentViewSet вынесен в viewsets/department.py
 # Импортируется выше
 
-class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
+class AttendanceStatsViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для экспорта статистики посещаемости по подразделениям.
     """
     queryset = Employee.objects.none()  # Не используется для стандартных операций
     permission_classes = [AllowAny]
+    replica_actions = ("list", "retrieve", "export_excel")
     
     def list(self, request, *args, **kwargs):
         """
@@ -2781,21 +2431,14 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         # Фильтр по отделам
         department_filter = Q()
         if department_ids:
-            all_department_ids = []
+            valid_department_ids = []
             for dept_id in department_ids:
                 try:
-                    dept_id_int = int(dept_id)
-                    dept = Department.objects.filter(id=dept_id_int).first()
-                    if dept:
-                        # Функция для получения всех дочерних подразделений
-                        def get_all_children(dept_obj):
-                            children = [dept_obj.id]
-                            for child in dept_obj.children.all():
-                                children.extend(get_all_children(child))
-                            return children
-                        all_department_ids.extend(get_all_children(dept))
+                    valid_department_ids.append(int(dept_id))
                 except (ValueError, TypeError):
                     continue
+            # Подразделения вместе со всеми дочерними (несуществующие id пропускаются)
+            all_department_ids = get_descendant_ids(valid_department_ids)
             if all_department_ids:
                 department_filter = Q(department_id__in=all_department_ids)
         
@@ -2810,6 +2453,19 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
             employees_query = employees_query.filter(department_filter)
         
         employees = employees_query.select_related('department').prefetch_related('work_schedules', 'attendance_stats').distinct()
+        department_paths = get_department_paths()
+        
+        # Рабочее время всех сотрудников за период одним запросом с группировкой
+        worked_seconds_by_id = dict(
+            EntryExit.objects.filter(
+                normalized_id__in=employees_query.values('hikvision_id'),
+                entry_time__gte=start_datetime,
+                entry_time__lte=end_datetime,
+                exit_time__isnull=False
+            ).order_by().values('normalized_id').annotate(
+                total=Sum('work_duration_seconds')
+            ).values_list('normalized_id', 'total')
+        )
         
         # Вычисляем общие KPI
         total_worked_seconds = 0
@@ -2820,18 +2476,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         employees_data = []
         
         for employee in employees:
-            # Получаем записи входов/выходов для сотрудника за период
-            entry_exits = EntryExit.objects.filter(
-                hikvision_id=employee.hikvision_id,
-                entry_time__gte=start_datetime,
-                entry_time__lte=end_datetime,
-                exit_time__isnull=False
-            )
-            
-            # Считаем общее рабочее время
-            worked_seconds = entry_exits.aggregate(
-                total=Sum('work_duration_seconds')
-            )['total'] or 0
+            # Общее рабочее время по записям входов/выходов за период
+            worked_seconds = worked_seconds_by_id.get(employee.hikvision_id) or 0
             
             # Временно используем упрощенную логику для продуктивности/простоя/отвлечений
             # TODO: Заменить на реальные данные из системы мониторинга
@@ -2861,8 +2507,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
             
             # Получаем название отдела
             department_name = ""
-            if employee.department:
-                full_path = employee.department.get_full_path()
+            if employee.department_id in department_paths:
+                full_path = department_paths[employee.department_id]
                 # Убираем "АУП" из начала
                 if full_path.startswith("АУП > "):
                     department_name = full_path[6:]
@@ -2954,6 +2600,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(response_data)
     
     @action(detail=False, methods=["get"], url_path="export-excel")
+    @export_control.heavy_export("attendance_stats")
+    @metrics.track_export("attendance_stats")
     def export_excel(self, request):
         """
         Экспорт статистики посещаемости по подразделениям в Excel.
@@ -2998,26 +2646,14 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         # Получаем исключаемые ID
         excluded_hikvision_ids = get_excluded_hikvision_ids()
         
-        # Функция для получения всех дочерних подразделений
-        def get_all_children(dept_obj):
-            children = [dept_obj.id]
-            for child in dept_obj.children.all():
-                children.extend(get_all_children(child))
-            return children
-        
-        # Собираем все ID подразделений (включая дочерние)
-        all_department_ids = []
+        # Собираем все ID подразделений (включая дочерние, без дубликатов)
+        valid_department_ids = []
         for dept_id in department_ids:
             try:
-                dept_id_int = int(dept_id)
-                dept = Department.objects.filter(id=dept_id_int).first()
-                if dept:
-                    all_department_ids.extend(get_all_children(dept))
+                valid_department_ids.append(int(dept_id))
             except (ValueError, TypeError):
                 continue
-        
-        # Убираем дубликаты
-        all_department_ids = list(set(all_department_ids))
+        all_department_ids = get_descendant_ids(valid_department_ids)
         
         if not all_department_ids:
             # Если не найдено подразделений, возвращаем пустой Excel файл
@@ -3069,18 +2705,23 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         if wb.worksheets:
             wb.remove(wb.worksheets[0])
         
+        # Данные всех сотрудников одним запросом, затем раскладываем по сотрудникам
+        all_results, start_date_obj, end_date_obj = generate_comprehensive_attendance_report_sql(
+            start_date=start_date_str,
+            end_date=end_date_str,
+            device_name=None,
+            excluded_hikvision_ids=excluded_hikvision_ids,
+            hikvision_ids=[employee.hikvision_id for employee in employees_to_export]
+        )
+        results_by_employee = group_report_by_employee(all_results)
+        department_paths = get_department_paths()
+        
         # Для каждого сотрудника создаем отдельный лист
         for employee in employees_to_export:
             emp_hikvision_id = employee.hikvision_id
             
             # Получаем данные для этого сотрудника
-            results, start_date_obj, end_date_obj = generate_comprehensive_attendance_report_sql(
-                hikvision_id=emp_hikvision_id,
-                start_date=start_date_str,
-                end_date=end_date_str,
-                device_name=None,
-                excluded_hikvision_ids=excluded_hikvision_ids
-            )
+            results = results_by_employee.get(employee_id_lookup(emp_hikvision_id), [])
             
             # Создаем лист для сотрудника
             # Ограничиваем длину имени листа (Excel ограничение - 31 символ)
@@ -3090,7 +2731,7 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
             # Используем метод из EntryExitViewSet для заполнения листа
             # Создаем временный экземпляр для вызова метода
             entry_exit_viewset = EntryExitViewSet()
-            entry_exit_viewset._fill_employee_sheet(ws, employee, results, start_date_obj, end_date_obj)
+            entry_exit_viewset._fill_employee_sheet(ws, employee, results, start_date_obj, end_date_obj, department_paths)
         
         # Если нет ни одного листа, создаем пустой
         if len(wb.worksheets) == 0:
@@ -3149,6 +2790,7 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         # Получаем информацию о сотруднике и его графике для всех строк
         employee = None
         schedule = None
+        schedules = []
         employee_name = ""
         department_name = ""
         position = ""
@@ -3162,7 +2804,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
                     # Пробуем найти без clean_id (на случай если в БД хранится с ведущими нулями)
                     employee = Employee.objects.filter(hikvision_id=main_employee_id).first()
                 if employee:
-                    schedule = employee.work_schedules.first()
+                    schedules = list(employee.work_schedules.all())
+                    schedule = schedules[0] if schedules else None
                     employee_name = employee.name if employee.name else ""
                     
                     # Получаем название подразделения
@@ -3203,6 +2846,9 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         total_scheduled_hours = 0.0  # Общее время по графику (должен отработать)
         
         while current_date <= end_date_obj:
+            # Версия графика, действующая на эту дату
+            day_schedule = select_schedule_version(schedules, current_date)
+            
             date_str = current_date.strftime("%d-%m-%Y")
             
             # Ищем данные для текущей даты
@@ -3236,7 +2882,7 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
                         else:
                             entry_time_local = timezone.localtime(first_entry)
                         # Для круглосуточных графиков: вход всегда только время
-                        if schedule and schedule.schedule_type == 'round_the_clock':
+                        if day_schedule and day_schedule.schedule_type == 'round_the_clock':
                             entry_time_str = entry_time_local.strftime("%H:%M:%S")
                         else:
                             entry_time_str = entry_time_local.strftime("%H:%M:%S")
@@ -3257,7 +2903,7 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
                         else:
                             exit_time_local = timezone.localtime(last_exit)
                         # Для круглосуточных графиков: если выход на следующий день, показываем с датой
-                        if schedule and schedule.schedule_type == 'round_the_clock':
+                        if day_schedule and day_schedule.schedule_type == 'round_the_clock':
                             exit_date = exit_time_local.date()
                             if exit_date > current_date:
                                 # Выход на следующий день - показываем с полной датой
@@ -3282,8 +2928,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
                 total_duration_hours += duration_hours_float
                 
                 # Суммируем время по графику для этого дня
-                if schedule:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, current_date)
+                if day_schedule:
+                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(day_schedule, current_date)
                     if scheduled_times:
                         scheduled_start, scheduled_end = scheduled_times
                         scheduled_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
@@ -3352,8 +2998,8 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
                         cell.fill = red_fill
                 
                 # Для пустых дней также проверяем график
-                if schedule:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, current_date)
+                if day_schedule:
+                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(day_schedule, current_date)
                     if scheduled_times:
                         scheduled_start, scheduled_end = scheduled_times
                         scheduled_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
@@ -3372,76 +3018,20 @@ class AttendanceStatsViewSet(viewsets.ReadOnlyModelViewSet):
         schedule_time_display = ""
         
         if schedule:
-            # Определяем формат времени графика
+            # Часы по графику считаются по версии, действующей в каждый день периода
+            recalculated_scheduled_hours, first_floating_shift = ScheduleMatcher.get_scheduled_hours_for_period(
+                schedules, start_date_obj, end_date_obj
+            )
             if schedule.schedule_type == 'regular' and schedule.start_time and schedule.end_time:
                 start_str = schedule.start_time.strftime('%H:%M')
                 end_str = schedule.end_time.strftime('%H:%M')
                 schedule_time_display = f"{start_str}-{end_str}"
-                
-                # Рассчитываем продолжительность одной смены
-                start_datetime = datetime.combine(start_date_obj, schedule.start_time)
-                end_datetime = datetime.combine(start_date_obj, schedule.end_time)
-                if schedule.end_time < schedule.start_time:
-                    # Ночная смена - добавляем день
-                    end_datetime += timedelta(days=1)
-                shift_duration_hours = (end_datetime - start_datetime).total_seconds() / 3600.0
-                
-                # Подсчитываем количество рабочих дней в периоде
-                working_days_count = 0
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        working_days_count += 1
-                    check_date += timedelta(days=1)
-                
-                recalculated_scheduled_hours = shift_duration_hours * working_days_count
-                
-            elif schedule.schedule_type == 'floating':
-                # Для плавающего графика суммируем время по каждой смене
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        scheduled_start, scheduled_end = scheduled_times
-                        shift_duration = (scheduled_end - scheduled_start).total_seconds() / 3600.0
-                        recalculated_scheduled_hours += shift_duration
-                        
-                        # Формируем строку времени графика из первой найденной смены
-                        if not schedule_time_display:
-                            scheduled_start_local = timezone.localtime(scheduled_start)
-                            scheduled_end_local = timezone.localtime(scheduled_end)
-                            start_str = scheduled_start_local.strftime('%H:%M')
-                            end_str = scheduled_end_local.strftime('%H:%M')
-                            schedule_time_display = f"{start_str}-{end_str}"
-                    check_date += timedelta(days=1)
-                
+            elif schedule.schedule_type == 'floating' and first_floating_shift:
+                # Время графика из первой найденной смены
+                scheduled_start_local = timezone.localtime(first_floating_shift[0])
+                scheduled_end_local = timezone.localtime(first_floating_shift[1])
+                schedule_time_display = f"{scheduled_start_local.strftime('%H:%M')}-{scheduled_end_local.strftime('%H:%M')}"
             elif schedule.schedule_type == 'round_the_clock':
-                # Для круглосуточных графиков используем правильную формулу расчета:
-                # Каждая рабочая смена = 24 часа (сутки)
-                # Считаем количество уникальных смен (по дате начала смены)
-                
-                # Определяем время начала смены (по умолчанию 09:00, но может быть другое)
-                shift_start_time = schedule.start_time if schedule.start_time else time(9, 0)
-                
-                # Для круглосуточных графиков считаем уникальные смены
-                # Смена определяется по дате начала (дню, когда она начинается)
-                shifts_dates = set()  # Множество для хранения дат начала смен
-                
-                check_date = start_date_obj
-                while check_date <= end_date_obj:
-                    scheduled_times = ScheduleMatcher.get_scheduled_time_for_date(schedule, check_date)
-                    if scheduled_times:
-                        scheduled_start, scheduled_end = scheduled_times
-                        # Дата начала смены определяет уникальную смену
-                        shift_start_date = scheduled_start.date()
-                        shifts_dates.add(shift_start_date)
-                    check_date += timedelta(days=1)
-                
-                # Количество уникальных смен (каждая смена = 24 часа)
-                # Формула: количество смен × 24 часа
-                number_of_shifts = len(shifts_dates)
-                recalculated_scheduled_hours = 24.0 * number_of_shifts
                 schedule_time_display = "Круглосуточно"
         
         # Используем пересчитанное время, если оно есть и больше 0
@@ -1,11 +1,14 @@
 """
 ViewSet для отделов.
 """
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
 from ..models import Department
 from ..serializers import DepartmentSerializer
 from ..utils import EXCLUDED_DEPARTMENTS
+from ..department_tree import get_department_tree_json
 
 
 class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
@@ -15,7 +18,7 @@ class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Department.objects.filter(parent=None).order_by("name")
     permission_classes = [AllowAny]
     serializer_class = DepartmentSerializer
-    
+
     def get_queryset(self):
         """Возвращает только корневые отделы (без родителя), исключая указанные подразделения."""
         queryset = Department.objects.filter(parent=None).order_by("name")
@@ -23,18 +26,22 @@ class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = queryset.exclude(name__in=EXCLUDED_DEPARTMENTS)
         return queryset
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает дерево подразделений.
+
+        Дерево строится из трех плоских запросов и кэшируется (см. department_tree.py).
+        Поддерживает If-None-Match: если данные не изменились, возвращает 304.
+        """
+        content, etag = get_department_tree_json()
+
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type="application/json; charset=utf-8")
+
+        response["ETag"] = etag
+        # Клиент должен каждый раз перепроверять ETag, но может использовать свою копию
+        patch_cache_control(response, no_cache=True)
+        return response
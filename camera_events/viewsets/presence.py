@@ -0,0 +1,39 @@
+"""
+ViewSet табло присутствия (кто сейчас на территории).
+"""
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from rest_framework import viewsets
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from ..presence import presence_index
+
+
+class PresenceViewSet(viewsets.ViewSet):
+    """
+    Сотрудники с открытой сессией входа по подразделениям.
+
+    Данные берутся из индекса в памяти (см. presence.py), запрос не
+    обращается к БД, кроме периодической пересборки индекса.
+    """
+    permission_classes = [AllowAny]
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает табло присутствия.
+
+        Параметры:
+        - department_id - только подразделение и его дочерние подразделения
+        """
+        department_id = request.query_params.get("department_id")
+        if department_id is not None:
+            try:
+                department_id = int(department_id)
+            except ValueError:
+                return Response({"error": "department_id должен быть числом"}, status=400)
+
+        content = presence_index.board_json(department_id=department_id)
+        response = HttpResponse(content, content_type="application/json; charset=utf-8")
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -4,11 +4,12 @@ ViewSet для получения сотрудников с наибольшим
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from hikvision_project.db_router import ReplicaReadMixin
 from ..models import Employee, EmployeeAttendanceStats
 from ..utils import get_excluded_hikvision_ids
 
 
-class TopLateEmployeesViewSet(viewsets.ReadOnlyModelViewSet):
+class TopLateEmployeesViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для получения сотрудников с наибольшим количеством опозданий.
     """
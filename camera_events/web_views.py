@@ -5,13 +5,17 @@ import tempfile
 from datetime import datetime
 from typing import Optional
 
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.http import require_http_methods
 
 from camera_events.import_employees import export_employees_to_excel, import_employees_from_excel
+from camera_events import metrics
 from camera_events.models import Department
+from camera_events.profiling import profile_buffer
+from hikvision_project.db_router import replica_reads
 
 
 def _is_xlsx_filename(filename: str) -> bool:
@@ -78,6 +82,8 @@ def add_employees_page(request: HttpRequest) -> HttpResponse:
 
 @staff_member_required
 @require_http_methods(["GET"])
+@replica_reads
+@metrics.track_export("employees")
 def export_employees_excel(request: HttpRequest) -> HttpResponse:
     """
     Экспорт сотрудников в Excel и выдача файла на скачивание.
@@ -114,3 +120,37 @@ def export_employees_excel(request: HttpRequest) -> HttpResponse:
     finally:
         _safe_remove_file(tmp_path)
 
+
+@staff_member_required
+@require_http_methods(["GET"])
+def profiling_requests(request: HttpRequest) -> HttpResponse:
+    """
+    Последние профили запросов (PROFILING_ENABLED).
+    Параметры: `view` - имя маршрута, `over_budget=1` - только превысившие
+    бюджет SQL, `min_ms` - не быстрее указанного времени.
+    """
+    records = profile_buffer.snapshot()
+    view_name = request.GET.get("view")
+    if view_name:
+        records = [record for record in records if record["view"] == view_name]
+    if request.GET.get("over_budget") == "1":
+        records = [record for record in records if record["over_budget"]]
+    try:
+        min_ms = float(request.GET.get("min_ms") or 0)
+    except ValueError:
+        return HttpResponse("min_ms должен быть числом.", status=400)
+    if min_ms:
+        records = [record for record in records if record["total_ms"] >= min_ms]
+    return JsonResponse({"count": len(records), "requests": records}, json_dumps_params={"ensure_ascii": False})
+
+
+@require_http_methods(["GET"])
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Метрики в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, нужен заголовок Authorization: Bearer <token>.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.META.get("HTTP_AUTHORIZATION") != f"Bearer {token}":
+        return HttpResponse("Unauthorized", status=401)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,6 +10,9 @@ done
 echo "Выполнение миграций..."
 python manage.py migrate --noinput
 
+echo "Секции событий камер на ближайшие месяцы..."
+python manage.py partition_camera_events || true
+
 echo "Сборка статических файлов..."
 python manage.py collectstatic --noinput || true
 
@@ -0,0 +1,95 @@
+"""
+Режимы соединений с PostgreSQL для веб-процессов, отчетов и фоновых задач.
+
+DB_POOL_MODE:
+  none        - новое соединение на каждый запрос (поведение Django по умолчанию)
+  persistent  - постоянные соединения (CONN_MAX_AGE) с проверкой перед
+                повторным использованием (CONN_HEALTH_CHECKS)
+  pool        - пул соединений psycopg 3 (Django 5.1+, пакет psycopg[pool]);
+                без него используется режим persistent
+
+DB_ROLE задает размеры для процесса:
+  ingest   - прием событий камер и веб-интерфейс (по умолчанию для сервера)
+  reports  - отдельные процессы отчетов и выгрузок
+  jobs     - команды manage.py и скрипты (по умолчанию для команд, кроме runserver)
+
+Размеры роли можно переопределить: DB_CONN_MAX_AGE, DB_POOL_MIN_SIZE,
+DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT.
+
+Встроенный runserver создает поток на каждый запрос, поэтому режим
+persistent действует только с runserver --nothreading или многопроцессным
+сервером (gunicorn/uwsgi); пул работает и с потоками.
+"""
+import os
+import sys
+import warnings
+
+POOL_MODES = ("none", "persistent", "pool")
+ROLE_DEFAULTS = {
+    "ingest": {"conn_max_age": 600, "min_size": 2, "max_size": 10, "timeout": 5},
+    "reports": {"conn_max_age": 300, "min_size": 1, "max_size": 4, "timeout": 30},
+    "jobs": {"conn_max_age": 60, "min_size": 1, "max_size": 2, "timeout": 60},
+}
+SERVER_COMMANDS = ("runserver",)
+
+
+def detect_role(argv=None):
+    """Роль процесса: DB_ROLE или по командной строке."""
+    role = os.getenv("DB_ROLE")
+    if role:
+        if role not in ROLE_DEFAULTS:
+            raise ValueError(f"Неизвестная роль DB_ROLE={role}, допустимо: {', '.join(ROLE_DEFAULTS)}")
+        return role
+    argv = sys.argv if argv is None else argv
+    if argv and os.path.basename(argv[0]) == "manage.py" and len(argv) > 1 and argv[1] not in SERVER_COMMANDS:
+        return "jobs"
+    return "ingest"
+
+
+def _pool_available():
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def apply_pool_settings(database, mode=None, role=None):
+    """
+    Дополняет настройки БД параметрами режима соединений.
+
+    Args:
+        database: Словарь DATABASES["default"] (изменяется на месте)
+        mode: Режим (по умолчанию DB_POOL_MODE)
+        role: Роль процесса (по умолчанию detect_role())
+
+    Returns:
+        (mode, role) - фактически примененные режим и роль.
+    """
+    mode = mode or os.getenv("DB_POOL_MODE", "none")
+    if mode not in POOL_MODES:
+        raise ValueError(f"Неизвестный режим DB_POOL_MODE={mode}, допустимо: {', '.join(POOL_MODES)}")
+    role = role or detect_role()
+    sizes = dict(ROLE_DEFAULTS[role])
+    for key, env in (("conn_max_age", "DB_CONN_MAX_AGE"), ("min_size", "DB_POOL_MIN_SIZE"),
+                     ("max_size", "DB_POOL_MAX_SIZE"), ("timeout", "DB_POOL_TIMEOUT")):
+        if os.getenv(env):
+            sizes[key] = int(os.getenv(env))
+
+    if mode == "pool" and not _pool_available():
+        warnings.warn("DB_POOL_MODE=pool требует psycopg[pool] (psycopg 3), используются постоянные соединения")
+        mode = "persistent"
+
+    if mode == "persistent":
+        database["CONN_MAX_AGE"] = sizes["conn_max_age"]
+        database["CONN_HEALTH_CHECKS"] = True
+    elif mode == "pool":
+        # Django не допускает CONN_MAX_AGE вместе с пулом
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": sizes["min_size"],
+            "max_size": sizes["max_size"],
+            "timeout": sizes["timeout"],
+        }
+    return mode, role
@@ -0,0 +1,176 @@
+"""
+Маршрутизация чтения отчетов на реплику PostgreSQL.
+
+Реплика подключается переменными DB_REPLICA_* (см. settings.py) и
+используется только внутри use_replica(): отчеты, выгрузки, статистика и
+списки. Прием событий, пересчет и все записи остаются на основной БД.
+
+Внутри use_replica() чтение возвращается на основную БД, если:
+  - реплика не настроена или недоступна;
+  - отставание реплики больше DB_REPLICA_MAX_LAG_SECONDS (проверка не чаще
+    раза в DB_REPLICA_CHECK_INTERVAL секунд на процесс);
+  - в этом же контексте уже выполнялась запись (чтение своих изменений);
+  - открыта транзакция на основной БД.
+"""
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = "replica"
+
+# Отставание реплики в секундах, 0 - реплика догнала основную БД.
+# На простаивающей основной БД pg_last_xact_replay_timestamp() не меняется,
+# поэтому при совпадении принятого и примененного WAL отставание считается нулевым.
+REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class _ReplicaContext:
+    __slots__ = ("pinned",)
+
+    def __init__(self):
+        self.pinned = False
+
+
+_replica_context = contextvars.ContextVar("replica_context", default=None)
+
+
+@contextmanager
+def use_replica():
+    """Контекст, в котором чтение может выполняться на реплике."""
+    token = _replica_context.set(_ReplicaContext())
+    try:
+        yield
+    finally:
+        _replica_context.reset(token)
+
+
+def replica_reads(func):
+    """Декоратор функции/метода view: чтение внутри вызова - на реплике."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """
+    Mixin для ViewSet: действия из replica_actions читают с реплики.
+
+    Покрывает и унаследованные действия (list, retrieve), которые нельзя
+    пометить декоратором.
+    """
+    replica_actions = ("list", "retrieve")
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, "action_map", {}).get(request.method.lower())
+        if action in self.replica_actions:
+            with use_replica():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class _ReplicaHealth:
+    """Кэшируемая проверка отставания реплики."""
+
+    def __init__(self):
+        self._checked_at = None
+        self._healthy = False
+        self._lag = None
+        self._lock = threading.Lock()
+
+    def is_healthy(self):
+        interval = getattr(settings, "DB_REPLICA_CHECK_INTERVAL", 5)
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < interval:
+            return self._healthy
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < interval:
+                return self._healthy
+            healthy, self._lag = self._check()
+            if healthy != self._healthy:
+                if healthy:
+                    logger.info(f"Реплика БД доступна (отставание {self._lag:.1f}s), отчеты читаются с реплики")
+                else:
+                    logger.warning(f"Реплика БД не используется (отставание: {self._lag}), чтение с основной БД")
+            self._healthy = healthy
+            self._checked_at = time.monotonic()
+            return healthy
+
+    def _check(self):
+        max_lag = getattr(settings, "DB_REPLICA_MAX_LAG_SECONDS", 30)
+        try:
+            with connections[REPLICA_ALIAS].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError as e:
+            logger.warning(f"Реплика БД недоступна: {e}")
+            connections[REPLICA_ALIAS].close()
+            return False, None
+        return lag <= max_lag, lag
+
+    @property
+    def lag(self):
+        return self._lag
+
+    def reset(self):
+        self._checked_at = None
+
+
+replica_health = _ReplicaHealth()
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def read_alias():
+    """Псевдоним БД для чтения в текущем контексте."""
+    context = _replica_context.get()
+    if context is None or context.pinned or not replica_configured():
+        return DEFAULT_DB_ALIAS
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return REPLICA_ALIAS if replica_health.is_healthy() else DEFAULT_DB_ALIAS
+
+
+def read_connection():
+    """Соединение для raw SQL отчетов (sql_reports.py)."""
+    return connections[read_alias()]
+
+
+class ReplicaRouter:
+    """Чтение внутри use_replica() - на реплике, запись - всегда на основной БД."""
+
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        context = _replica_context.get()
+        if context is not None:
+            context.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика получает схему через репликацию
+        if db == REPLICA_ALIAS:
+            return False
+        return None
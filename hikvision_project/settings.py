@@ -5,6 +5,8 @@ Django settings for Hikvision Camera Integration Project.
 import os
 from pathlib import Path
 
+from .db_pool import apply_pool_settings
+
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -38,6 +40,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Ранний ответ камерам на heartbeat и события без сотрудника (до остальных middleware)
+    "camera_events.middleware.CameraIngestFilterMiddleware",
+    # Профилирование SQL/времени/памяти запросов, только при PROFILING_ENABLED
+    "camera_events.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS middleware должен быть как можно выше
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,8 +84,35 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD", "postgres"),
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        "OPTIONS": {
+            # Ограничивает ожидание недоступной БД при приеме событий камер
+            "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+        },
     }
 }
+# Постоянные соединения или пул по роли процесса (см. db_pool.py)
+DB_POOL_MODE, DB_ROLE = apply_pool_settings(DATABASES["default"])
+
+# Необязательная реплика для отчетов и выгрузок (см. db_router.py)
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv("DB_REPLICA_NAME", DATABASES["default"]["NAME"]),
+        "USER": os.getenv("DB_REPLICA_USER", DATABASES["default"]["USER"]),
+        "PASSWORD": os.getenv("DB_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "HOST": os.getenv("DB_REPLICA_HOST"),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "OPTIONS": {
+            "connect_timeout": int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2")),
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+    apply_pool_settings(DATABASES["replica"], mode=DB_POOL_MODE, role="reports")
+DATABASE_ROUTERS = ["hikvision_project.db_router.ReplicaRouter"]
+# Максимальное отставание реплики (с), при большем отчеты читают основную БД
+DB_REPLICA_MAX_LAG_SECONDS = int(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+# Как часто проверять отставание реплики (с)
+DB_REPLICA_CHECK_INTERVAL = int(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -117,6 +150,88 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Прием событий от камер Hikvision
+CAMERA_INGEST_PATH = "/api/v1/camera-events/"
+# Отбрасывать heartbeat и события без имени сотрудника до разбора запроса
+CAMERA_INGEST_FILTER_ENABLED = os.getenv("CAMERA_INGEST_FILTER_ENABLED", "True") == "True"
+# Сколько байт от начала тела запроса просматривается при классификации
+CAMERA_INGEST_FILTER_SCAN_BYTES = 64 * 1024
+# Сколько последних ключей дедупликации хранить в памяти процесса
+CAMERA_INGEST_DEDUP_CACHE_SIZE = 10000
+# В каком окне (часы) искать записанное событие для повтора без времени в данных
+CAMERA_INGEST_UNTIMED_DEDUP_HOURS = 24
+# Локальный spool событий при недоступной или медленной БД (drain_camera_spool)
+CAMERA_INGEST_SPOOL_ENABLED = os.getenv("CAMERA_INGEST_SPOOL_ENABLED", "True") == "True"
+CAMERA_INGEST_SPOOL_DIR = os.getenv("CAMERA_INGEST_SPOOL_DIR", str(BASE_DIR / "spool"))
+# Бюджет времени записи события в БД (мс), при превышении события идут в spool
+CAMERA_INGEST_SPOOL_LATENCY_BUDGET_MS = int(os.getenv("CAMERA_INGEST_SPOOL_LATENCY_BUDGET_MS", "2000"))
+# Сколько секунд после ошибки БД писать события сразу в spool
+CAMERA_INGEST_SPOOL_BREAKER_SECONDS = 30
+# fsync сегмента не чаще раза в указанное число секунд (0 - после каждой записи)
+CAMERA_INGEST_SPOOL_FSYNC_INTERVAL = 0.2
+CAMERA_INGEST_SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024
+# Как часто (по времени событий) обновлять last_seen ID в SeenIdentity
+CAMERA_SEEN_IDENTITY_REFRESH_SECONDS = 15 * 60
+
+# Секционирование и хранение событий камер (partition_camera_events,
+# apply_camera_event_retention)
+CAMERA_EVENT_PARTITION_MONTHS_AHEAD = 3
+# Срок хранения фото и полного raw_data в днях (0 - без ограничения)
+CAMERA_EVENT_RETENTION_PICTURE_DAYS = int(os.getenv("CAMERA_EVENT_RETENTION_PICTURE_DAYS", "90"))
+CAMERA_EVENT_RETENTION_RAW_DATA_DAYS = int(os.getenv("CAMERA_EVENT_RETENTION_RAW_DATA_DAYS", "365"))
+# Архив событий камер (archive_camera_events, rehydrate_camera_events)
+CAMERA_EVENT_ARCHIVE_DIR = os.getenv("CAMERA_EVENT_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+CAMERA_EVENT_ARCHIVE_AFTER_MONTHS = 13
+
+# Профилирование запросов (camera_events/profiling.py, /debug/profiling/)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+PROFILING_RING_SIZE = 200
+# Сколько самых медленных SQL запроса хранить в профиле
+PROFILING_TOP_QUERIES = 5
+# Порог медленного запроса (мс): в лог пишутся все его SQL
+PROFILING_SLOW_REQUEST_MS = int(os.getenv("PROFILING_SLOW_REQUEST_MS", "1000"))
+# tracemalloc заметно замедляет Python, включается отдельно
+PROFILING_TRACE_MEMORY = os.getenv("PROFILING_TRACE_MEMORY", "False") == "True"
+PROFILING_EXCLUDED_PATHS = ["/debug/profiling/", "/static/"]
+# Допустимое число SQL на запрос по имени маршрута, превышение - предупреждение в лог.
+# Те же бюджеты проверяют тесты camera_events/tests/test_query_counts.py и
+# benchmarks/query_counts.py на данных разного объема
+PROFILING_QUERY_BUDGETS = {
+    "attendance-stats-list": 10,
+    "attendance-stats-export-excel": 10,
+    "entries-exits-list": 10,
+    "entries-exits-employees-list": 10,
+    "entries-exits-departments-list": 10,
+    "entries-exits-check-date": 10,
+    "entries-exits-export-excel": 10,
+    "camera-events-export-excel": 10,
+    "departments-list": 5,
+    "top-late-employees-list": 10,
+    "addemployees-export": 10,
+    # Табло отдается из памяти, запросы только при пересборке индекса
+    "presence-list": 5,
+}
+
+# Метрики Prometheus (camera_events/metrics.py, /metrics)
+# Общий каталог снимков для нескольких процессов (gunicorn, drain_camera_spool)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = 5
+# Если задан, /metrics требует Authorization: Bearer <token>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Табло присутствия (/api/v1/presence/): как часто процесс пересобирает
+# индекс из БД, чтобы увидеть события, обработанные другими процессами
+PRESENCE_REFRESH_SECONDS = int(os.getenv("PRESENCE_REFRESH_SECONDS", "15"))
+
+# Тяжелые выгрузки Excel (camera_events/export_control.py): одинаковые запросы
+# объединяются, одновременно выполняется не больше EXPORT_MAX_CONCURRENT
+# выгрузок на процесс, до EXPORT_QUEUE_SIZE ждут до EXPORT_QUEUE_TIMEOUT секунд,
+# остальные получают 429
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "4"))
+EXPORT_QUEUE_TIMEOUT = int(os.getenv("EXPORT_QUEUE_TIMEOUT", "30"))
+EXPORT_RETRY_AFTER = int(os.getenv("EXPORT_RETRY_AFTER", "30"))
+
 # CORS настройки для работы с React frontend
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -4,7 +4,7 @@ URL configuration for Hikvision Camera Integration Project.
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
-from camera_events.web_views import add_employees_page, export_employees_excel
+from camera_events.web_views import add_employees_page, export_employees_excel, metrics_view, profiling_requests
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -21,5 +21,7 @@ urlpatterns = [
     ),
     path("addemployees/", add_employees_page, name="addemployees"),
     path("addemployees/export/", export_employees_excel, name="addemployees-export"),
+    path("debug/profiling/", profiling_requests, name="profiling-requests"),
+    path("metrics", metrics_view, name="metrics"),
 ]
 